@@ -1,21 +1,61 @@
-from flask import Flask, jsonify, request, send_from_directory, session
+from flask import (Flask, Response, g, has_request_context, jsonify, make_response, request, send_from_directory,
+                   session, stream_with_context)
+from flask.json.provider import DefaultJSONProvider, _default as _json_default
 from flask_cors import CORS
 import os
+import io
+import itertools
+import base64
+import collections
+import csv
+import gzip
+import hashlib
+import hmac
+import json
+import re
+import queue
+import select
+import sys
+import time
+import threading
+import zipfile
+import zlib
 import bcrypt
+from contextlib import contextmanager, suppress
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from urllib.parse import urlparse
+from urllib.parse import parse_qsl, urlparse
+from xml.sax.saxutils import escape as escapar_xml
 
 try:
     import psycopg2
     from psycopg2 import IntegrityError
-    from psycopg2.extras import DictCursor
+    from psycopg2.errors import UniqueViolation
+    from psycopg2.extras import DictCursor, RealDictCursor
     print('✅ psycopg2 importado correctamente')
 except ImportError:
     print('❌ psycopg2 no disponible')
 
+# Opcionales: serialización JSON rápida y compresión brotli
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 load_dotenv()
 
+# Opcional: métricas de Prometheus. Después de load_dotenv: el modo multiproceso
+# (PROMETHEUS_MULTIPROC_DIR) se decide al importar prometheus_client
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
 # ====================================================================
@@ -58,70 +98,786 @@ else:
 # ====================================================================
 # CORS CONFIGURACIÓN MEJORADA
 # ====================================================================
+ORIGENES_CORS = [
+    'http://localhost:10000',
+    'http://127.0.0.1:10000', 
+    'http://192.168.1.112:10000',
+    'http://localhost:5000',
+    'http://127.0.0.1:5000',
+    'https://inventario-soluciones-logicas.onrender.com'
+]
+
 CORS(app, 
      supports_credentials=True,
-     origins=[
-         'http://localhost:10000',
-         'http://127.0.0.1:10000', 
-         'http://192.168.1.112:10000',
-         'http://localhost:5000',
-         'http://127.0.0.1:5000',
-         'https://inventario-soluciones-logicas.onrender.com'
-     ],
+     origins=ORIGENES_CORS,
      methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-     allow_headers=['Content-Type', 'Authorization', 'X-Requested-With'],
+     allow_headers=['Content-Type', 'Authorization', 'X-Requested-With', 'X-Perfil'],
      expose_headers=['Set-Cookie'])
 
 # ====================================================================
 # CONEXIÓN A BASE DE DATOS - OPTIMIZADA
 # ====================================================================
-def get_db_connection():
-    """Establece conexión con PostgreSQL - Optimizada para Render y Local"""
+def parametros_conexion():
+    """Parámetros de conexión (DATABASE_URL de Render o variables DB_* locales).
+
+    También los usa el pool async de asgi.py.
+    """
+    # 1️⃣ Intentar con DATABASE_URL de RENDER
+    DATABASE_URL = os.environ.get('DATABASE_URL')
+    
+    if DATABASE_URL:
+        parsed_url = urlparse(DATABASE_URL)
+        return {
+            'host': parsed_url.hostname,
+            'database': parsed_url.path[1:],
+            'user': parsed_url.username,
+            'password': parsed_url.password,
+            'port': parsed_url.port,
+            'connect_timeout': 30,
+            'sslmode': 'require'
+        }
+    # 2️⃣ Conexión LOCAL
+    return {
+        'host': os.environ.get('DB_HOST', 'localhost'),
+        'database': os.environ.get('DB_NAME', 'inventario_sistema'),
+        'user': os.environ.get('DB_USER', 'postgres'),
+        'password': os.environ.get('DB_PASS', 'password'),
+        'port': os.environ.get('DB_PORT', '5432'),
+        'connect_timeout': 30
+    }
+
+def get_db_connection(**opciones):
+    """Establece conexión con PostgreSQL - Optimizada para Render y Local
+
+    `opciones` se pasan tal cual a psycopg2.connect (p. ej. connection_factory).
+    """
     try:
-        # 1️⃣ Intentar con DATABASE_URL de RENDER
-        DATABASE_URL = os.environ.get('DATABASE_URL')
-        
-        if DATABASE_URL:
-            parsed_url = urlparse(DATABASE_URL)
-            conn_params = {
-                'host': parsed_url.hostname,
-                'database': parsed_url.path[1:],
-                'user': parsed_url.username,
-                'password': parsed_url.password,
-                'port': parsed_url.port,
-                'connect_timeout': 30,
-                'sslmode': 'require'
-            }
-            
-            conn = psycopg2.connect(**conn_params)
-            print("✅ Conexión RENDER exitosa")
-            return conn
-        else:
-            # 2️⃣ Conexión LOCAL
-            conn_params = {
-                'host': os.environ.get('DB_HOST', 'localhost'),
-                'database': os.environ.get('DB_NAME', 'inventario_sistema'),
-                'user': os.environ.get('DB_USER', 'postgres'),
-                'password': os.environ.get('DB_PASS', 'password'),
-                'port': os.environ.get('DB_PORT', '5432'),
-                'connect_timeout': 30
-            }
-            
-            conn = psycopg2.connect(**conn_params)
-            print("✅ Conexión LOCAL exitosa")
-            return conn
+        conn = psycopg2.connect(**parametros_conexion(), **opciones)
+        print("✅ Conexión RENDER exitosa" if os.environ.get('DATABASE_URL') else "✅ Conexión LOCAL exitosa")
+        return conn
             
     except Exception as e:
         print(f"❌ ERROR CONEXIÓN BD: {str(e)}")
         return None
 
+# ====================================================================
+# POOL DE CONEXIONES (UNO POR WORKER)
+# ====================================================================
+class PoolConexiones:
+    """Pool de conexiones PostgreSQL reutilizables dentro de un proceso.
+
+    Evita pagar TCP + TLS + autenticación en cada request: las conexiones
+    se prestan con obtener() y vuelven al pool con devolver(). `conectar`
+    abre cada conexión nueva (por defecto get_db_connection).
+    """
+
+    def __init__(self, minimo=1, maximo=10, timeout=10.0,
+                 verificar_tras=30.0, vida_maxima=1800.0, conectar=None):
+        self.minimo = max(0, minimo)
+        self.maximo = max(1, maximo, self.minimo)
+        self.timeout = timeout
+        self.verificar_tras = verificar_tras
+        self.vida_maxima = vida_maxima
+        self._conectar = conectar or get_db_connection
+
+        self._cond = threading.Condition()
+        self._libres = []       # [(conn, devuelta_en)]
+        self._creada_en = {}    # conn -> momento de creación
+        self._total = 0         # libres + en uso + en proceso de creación
+
+        self._stats = {
+            'prestamos': 0,
+            'esperas': 0,
+            'timeouts': 0,
+            'creadas': 0,
+            'recicladas': 0,
+            'fallos_conexion': 0,
+            'tiempo_prestamo_total_ms': 0.0,
+            'tiempo_prestamo_max_ms': 0.0,
+        }
+
+        for _ in range(self.minimo):
+            self._total += 1
+            conn = self._crear()
+            if conn is None:
+                break
+            self._libres.append((conn, time.monotonic()))
+
+    # ----------------------------------------------------------------
+    def _crear(self):
+        """Abre una conexión nueva (llamar con un cupo ya reservado)"""
+        conn = self._conectar()
+        with self._cond:
+            if conn is None:
+                self._stats['fallos_conexion'] += 1
+                self._total -= 1
+                self._cond.notify()
+                return None
+            self._creada_en[conn] = time.monotonic()
+            self._stats['creadas'] += 1
+        return conn
+
+    def _descartar(self, conn):
+        """Cierra una conexión y libera su cupo"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            if self._creada_en.pop(conn, None) is not None:
+                self._total -= 1
+            self._stats['recicladas'] += 1
+            self._cond.notify()
+
+    def _saludable(self, conn, devuelta_en):
+        """Health check al prestar: cerrada, vieja o inactiva demasiado tiempo"""
+        if conn.closed:
+            return False
+        ahora = time.monotonic()
+        if ahora - self._creada_en.get(conn, ahora) > self.vida_maxima:
+            return False
+        if ahora - devuelta_en > self.verificar_tras:
+            try:
+                cur = conn.cursor()
+                cur.execute('SELECT 1')
+                cur.close()
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    # ----------------------------------------------------------------
+    def obtener(self):
+        """Presta una conexión; devuelve None si no hay BD o se agota la espera"""
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+        espero = False
+
+        while True:
+            conn = None
+            crear = False
+            with self._cond:
+                while True:
+                    if self._libres:
+                        conn, devuelta_en = self._libres.pop()
+                        break
+                    if self._total < self.maximo:
+                        self._total += 1
+                        crear = True
+                        break
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._stats['timeouts'] += 1
+                        print(f"⏳ Pool agotado: {self._total} conexiones en uso")
+                        return None
+                    if not espero:
+                        espero = True
+                        self._stats['esperas'] += 1
+                    self._cond.wait(restante)
+
+            if crear:
+                conn = self._crear()
+                if conn is None:
+                    return None
+            elif not self._saludable(conn, devuelta_en):
+                print("♻️ Conexión del pool reciclada")
+                self._descartar(conn)
+                continue
+            break
+
+        duracion_ms = (time.monotonic() - inicio) * 1000
+        with self._cond:
+            self._stats['prestamos'] += 1
+            self._stats['tiempo_prestamo_total_ms'] += duracion_ms
+            self._stats['tiempo_prestamo_max_ms'] = max(self._stats['tiempo_prestamo_max_ms'], duracion_ms)
+        return conn
+
+    def devolver(self, conn):
+        """Devuelve la conexión al pool, revirtiendo transacciones abiertas"""
+        if conn.closed:
+            self._descartar(conn)
+            return
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            self._descartar(conn)
+            return
+        with self._cond:
+            self._libres.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def estadisticas(self):
+        """Foto de los contadores del pool"""
+        with self._cond:
+            stats = dict(self._stats)
+            libres = len(self._libres)
+            total = self._total
+        prestamos = stats['prestamos']
+        stats['tiempo_prestamo_promedio_ms'] = round(stats['tiempo_prestamo_total_ms'] / prestamos, 3) if prestamos else 0.0
+        stats['tiempo_prestamo_total_ms'] = round(stats['tiempo_prestamo_total_ms'], 3)
+        stats['tiempo_prestamo_max_ms'] = round(stats['tiempo_prestamo_max_ms'], 3)
+        stats.update({
+            'pid': os.getpid(),
+            'minimo': self.minimo,
+            'maximo': self.maximo,
+            'total': total,
+            'libres': libres,
+            'en_uso': total - libres,
+        })
+        return stats
+
+    def cerrar(self):
+        """Cierra las conexiones libres (al apagar el worker)"""
+        with self._cond:
+            libres, self._libres = self._libres, []
+        for conn, _ in libres:
+            self._descartar(conn)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def obtener_pool():
+    """Pool del proceso actual; se crea tras el fork de cada worker de gunicorn"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = PoolConexiones(
+                    minimo=int(os.environ.get('DB_POOL_MIN', 1)),
+                    maximo=int(os.environ.get('DB_POOL_MAX', 10)),
+                    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                    verificar_tras=float(os.environ.get('DB_POOL_CHECK_IDLE', 30)),
+                    vida_maxima=float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+                    conectar=lambda: get_db_connection(connection_factory=ConexionMedida),
+                )
+                _pool_pid = os.getpid()
+                print(f"🏊 Pool de conexiones listo (pid {_pool_pid}, max {_pool.maximo})")
+    return _pool
+
+# ====================================================================
+# RÉPLICAS DE LECTURA (DATABASE_URL_READONLY)
+# ====================================================================
+# Los GET de reportes (RUTAS_REPLICA) leen de una réplica en streaming si hay
+# alguna configurada; escrituras y demás rutas siguen en el primario. Una
+# réplica se usa mientras su retraso, medido cada DB_REPLICA_VERIFICAR
+# segundos, no pase de DB_REPLICA_LAG_MAX; si no, se lee del primario.
+# Después de escribir, la sesión lee del primario por DB_REPLICA_LECTURA_PROPIA
+# segundos (read-your-writes): con ese valor >= LAG_MAX + VERIFICAR, cuando el
+# usuario vuelve a la réplica ya tiene lo que escribió.
+RUTAS_REPLICA = {
+    'obtener_inventario_stock',
+    'obtener_productos_detallado',
+    'obtener_estadisticas',
+    'debug_database',
+    'buscar_productos',
+    'exportar_productos',
+    'exportar_seriales',
+    'exportar_historial',
+}
+
+REPLICA_LAG_MAX = float(os.environ.get('DB_REPLICA_LAG_MAX', 2))
+REPLICA_VERIFICAR = float(os.environ.get('DB_REPLICA_VERIFICAR', 5))
+REPLICA_LECTURA_PROPIA = float(os.environ.get('DB_REPLICA_LECTURA_PROPIA', 10))
+
+# Segundos de retraso; NULL si no está recibiendo WAL (no se sabe cuánto lleva)
+CONSULTA_RETRASO_REPLICA = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END;
+"""
+
+def parametros_replicas():
+    """Parámetros de cada réplica en DATABASE_URL_READONLY (URLs separadas por coma)"""
+    replicas = []
+    for url in os.environ.get('DATABASE_URL_READONLY', '').split(','):
+        if not url.strip():
+            continue
+        parsed_url = urlparse(url.strip())
+        opciones = dict(parse_qsl(parsed_url.query))
+        replicas.append({
+            'host': parsed_url.hostname,
+            'database': parsed_url.path[1:],
+            'user': parsed_url.username,
+            'password': parsed_url.password,
+            'port': parsed_url.port or 5432,
+            # Corto: una réplica caída no debe frenar el request (se lee del primario)
+            'connect_timeout': int(opciones.get('connect_timeout', 3)),
+            'sslmode': opciones.get('sslmode', 'require'),
+        })
+    return replicas
+
+def conectar_replica(parametros):
+    try:
+        return psycopg2.connect(**parametros, connection_factory=ConexionMedida)
+    except Exception as e:
+        print(f"❌ ERROR CONEXIÓN RÉPLICA {parametros['host']}:{parametros['port']}: {e}")
+        return None
+
+class Replica:
+    """Una réplica de lectura: su pool y el último retraso medido"""
+
+    def __init__(self, parametros):
+        self.nombre = f"{parametros['host']}:{parametros['port']}"
+        self.pool = PoolConexiones(
+            minimo=0,
+            maximo=int(os.environ.get('DB_POOL_MAX', 10)),
+            timeout=1.0,  # pool lleno: mejor leer del primario que esperar
+            verificar_tras=float(os.environ.get('DB_POOL_CHECK_IDLE', 30)),
+            vida_maxima=float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+            conectar=lambda: conectar_replica(parametros),
+        )
+        self.retraso = None           # segundos; None = sin medir o inaccesible
+        self.verificada_en = float('-inf')
+        self._verificando = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {'lecturas': 0, 'caidas': 0, 'retrasada': 0}
+
+    def disponible(self):
+        """Si se puede leer de ella; mide el retraso cuando toca (un hilo a la vez)"""
+        if time.monotonic() - self.verificada_en >= REPLICA_VERIFICAR and self._verificando.acquire(blocking=False):
+            try:
+                self.verificar()
+            finally:
+                self._verificando.release()
+        return self.retraso is not None and self.retraso <= REPLICA_LAG_MAX
+
+    def verificar(self):
+        retraso = None
+        conn = self.pool.obtener()
+        if conn is not None:
+            try:
+                cur = conn.cursor()
+                cur.execute(CONSULTA_RETRASO_REPLICA)
+                fila = cur.fetchone()
+                cur.close()
+                retraso = None if fila[0] is None else float(fila[0])
+            except psycopg2.Error as e:
+                print(f"⚠️ No se pudo medir el retraso de la réplica {self.nombre}: {e}")
+            finally:
+                self.pool.devolver(conn)
+
+        estaba_disponible = self.retraso is not None and self.retraso <= REPLICA_LAG_MAX
+        if retraso is None or retraso > REPLICA_LAG_MAX:
+            with self._lock:
+                self._stats['caidas' if retraso is None else 'retrasada'] += 1
+            if estaba_disponible or self.verificada_en == float('-inf'):
+                print(f"⚠️ Réplica {self.nombre} fuera de uso (retraso: {retraso}); se lee del primario")
+        elif not estaba_disponible:
+            print(f"✅ Réplica {self.nombre} en uso (retraso {retraso:.3f} s)")
+        self.retraso = retraso
+        self.verificada_en = time.monotonic()
+
+    def marcar_caida(self):
+        """No se pudo prestar una conexión: fuera de uso hasta la próxima verificación"""
+        print(f"⚠️ Réplica {self.nombre} sin conexión; se lee del primario")
+        with self._lock:
+            self._stats['caidas'] += 1
+        self.retraso = None
+        self.verificada_en = time.monotonic()
+
+    def contar_lectura(self):
+        with self._lock:
+            self._stats['lecturas'] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'nombre': self.nombre,
+            'retraso_s': self.retraso,
+            'disponible': self.retraso is not None and self.retraso <= REPLICA_LAG_MAX,
+            'pool': self.pool.estadisticas(),
+        })
+        return stats
+
+
+_replicas = None
+_replicas_pid = None
+_turno_replica = itertools.count()
+_lecturas_primario = {'lectura_propia': 0, 'sin_replica': 0}
+_lecturas_lock = threading.Lock()
+
+def obtener_replicas():
+    """Réplicas del proceso actual (lista vacía si no hay DATABASE_URL_READONLY)"""
+    global _replicas, _replicas_pid
+    if _replicas is None or _replicas_pid != os.getpid():
+        with _pool_lock:
+            if _replicas is None or _replicas_pid != os.getpid():
+                _replicas = [Replica(parametros) for parametros in parametros_replicas()]
+                _replicas_pid = os.getpid()
+    return _replicas
+
+def elegir_replica():
+    """La siguiente réplica disponible (round robin), o None"""
+    replicas = obtener_replicas()
+    inicio = next(_turno_replica)
+    for i in range(len(replicas)):
+        replica = replicas[(inicio + i) % len(replicas)]
+        if replica.disponible():
+            return replica
+    return None
+
+def replica_del_request():
+    """Réplica de la que lee el request actual (la misma en todo el request), o None"""
+    if not has_request_context() or request.method != 'GET' or request.endpoint not in RUTAS_REPLICA:
+        return None
+    if 'replica' not in g:
+        if not obtener_replicas():
+            g.replica = None
+        elif time.time() - session.get('escritura_en', 0) < REPLICA_LECTURA_PROPIA:
+            g.replica = None
+            with _lecturas_lock:
+                _lecturas_primario['lectura_propia'] += 1
+        else:
+            g.replica = elegir_replica()
+            if g.replica is None:
+                with _lecturas_lock:
+                    _lecturas_primario['sin_replica'] += 1
+    return g.replica
+
+def estadisticas_replicas():
+    return {
+        'replicas': [replica.estadisticas() for replica in obtener_replicas()],
+        'lecturas_primario': dict(_lecturas_primario),  # GET de RUTAS_REPLICA que fueron al primario
+        'lag_max_s': REPLICA_LAG_MAX,
+    }
+
+@contextmanager
+def db_conexion():
+    """Presta una conexión del pool durante el bloque `with`.
+
+    Entrega None si no se pudo conectar. Al salir, cualquier transacción sin
+    commit se revierte y la conexión vuelve al pool (o se recicla si se rompió).
+    En los GET de RUTAS_REPLICA la conexión puede ser de una réplica.
+    """
+    inicio = time.perf_counter()
+    replica = replica_del_request()
+    pool = replica.pool if replica else obtener_pool()
+    conn = pool.obtener()
+    if conn is None and replica:
+        replica.marcar_caida()
+        g.replica = None
+        pool = obtener_pool()
+        conn = pool.obtener()
+    elif replica:
+        replica.contar_lectura()
+    anotar_conexion(time.perf_counter() - inicio)
+    try:
+        yield conn
+    finally:
+        if conn is not None:
+            pool.devolver(conn)
+
+# ====================================================================
+# MÉTRICAS (PROMETHEUS)
+# ====================================================================
+# Por ruta (el endpoint de Flask, no la URL: cardinalidad fija) se cuentan
+# requests, latencia, bytes y lo que cada request le costó a la BD: espera por
+# conexión, sentencias, tiempo y filas (anotados en `g.bd` por los cursores de
+# ConexionMedida). Con PROMETHEUS_MULTIPROC_DIR cada worker escribe en ese
+# directorio y /metrics suma todos (gunicorn.conf.py lo vacía al arrancar).
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BUCKETS_BD_SEGUNDOS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+if prometheus_client:
+    METRICA_REQUESTS = prometheus_client.Counter(
+        'inventario_requests_total', 'Requests atendidos', ['ruta', 'metodo', 'estado'])
+    METRICA_DURACION = prometheus_client.Histogram(
+        'inventario_request_duracion_seconds', 'Latencia de cada request', ['ruta', 'metodo'])
+    METRICA_BYTES = prometheus_client.Counter(
+        'inventario_respuesta_bytes_total', 'Bytes de cuerpo enviados (ya comprimidos)', ['ruta'])
+    METRICA_CONEXION = prometheus_client.Histogram(
+        'inventario_bd_conexion_seconds', 'Espera por conexiones del pool en el request (incluye abrirlas)',
+        ['ruta'], buckets=BUCKETS_BD_SEGUNDOS)
+    METRICA_CONSULTAS = prometheus_client.Histogram(
+        'inventario_bd_consultas_por_request', 'Sentencias SQL por request', ['ruta'], buckets=BUCKETS_CONSULTAS)
+    METRICA_TIEMPO_BD = prometheus_client.Histogram(
+        'inventario_bd_tiempo_por_request_seconds', 'Tiempo ejecutando SQL por request',
+        ['ruta'], buckets=BUCKETS_BD_SEGUNDOS)
+    METRICA_FILAS = prometheus_client.Counter(
+        'inventario_bd_filas_total', 'Filas devueltas por la BD', ['ruta'])
+
+_cursores_medidos = {}
+
+def _cursor_medido(base):
+    """Subclase de `base` que mide cada sentencia que ejecuta (ver despues_de_consulta)"""
+    if base not in _cursores_medidos:
+        def execute(self, query, vars=None):
+            inicio = time.perf_counter()
+            try:
+                resultado = base.execute(self, query, vars)
+            except Exception:
+                despues_de_consulta(self, query, vars, time.perf_counter() - inicio, fallo=True)
+                raise
+            despues_de_consulta(self, query, vars, time.perf_counter() - inicio)
+            return resultado
+
+        def executemany(self, query, vars_list):
+            inicio = time.perf_counter()
+            try:
+                resultado = base.executemany(self, query, vars_list)
+            except Exception:
+                despues_de_consulta(self, query, vars_list, time.perf_counter() - inicio, fallo=True, muchas=True)
+                raise
+            despues_de_consulta(self, query, vars_list, time.perf_counter() - inicio, muchas=True)
+            return resultado
+
+        _cursores_medidos[base] = type(f'Medido{base.__name__}', (base,),
+                                       {'execute': execute, 'executemany': executemany})
+    return _cursores_medidos[base]
+
+class ConexionMedida(psycopg2.extensions.connection):
+    """Conexión de los pools: sus cursores alimentan las métricas por request y
+    el log de consultas lentas, con el cursor_factory que pida cada ruta"""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _cursor_medido(base)
+        return super().cursor(*args, **kwargs)
+
+def despues_de_consulta(cur, query, vars, segundos, fallo=False, muchas=False):
+    anotar_consulta(cur, segundos)
+    if SQL_LENTA_MS and segundos * 1000 >= SQL_LENTA_MS:
+        registrar_consulta_lenta(cur, query, vars, segundos, fallo, muchas)
+
+def anotar_consulta(cur, segundos):
+    if has_request_context() and 'bd' in g:
+        g.bd['consultas'] += 1
+        g.bd['segundos'] += segundos
+        # Cursores con nombre (del lado del servidor) no saben sus filas al ejecutar
+        if cur.description is not None and cur.rowcount > 0:
+            g.bd['filas'] += cur.rowcount
+
+def anotar_conexion(segundos):
+    if has_request_context() and 'bd' in g:
+        g.bd['conexiones'] += 1
+        g.bd['espera_conexion'] += segundos
+
+def observar_request(ruta, metodo, estado, segundos, bytes_respuesta, bd=None):
+    """Registra un request atendido (también lo usa asgi.py para sus rutas nativas)"""
+    if not prometheus_client:
+        return
+    METRICA_REQUESTS.labels(ruta, metodo, str(estado)).inc()
+    METRICA_DURACION.labels(ruta, metodo).observe(segundos)
+    METRICA_BYTES.labels(ruta).inc(bytes_respuesta)
+    if bd is not None:
+        METRICA_CONSULTAS.labels(ruta).observe(bd['consultas'])
+        METRICA_TIEMPO_BD.labels(ruta).observe(bd['segundos'])
+        METRICA_FILAS.labels(ruta).inc(bd['filas'])
+        if bd['conexiones']:
+            METRICA_CONEXION.labels(ruta).observe(bd['espera_conexion'])
+
+def registrar_metricas(response):
+    """Vuelca lo medido en este request (al final de after_request)"""
+    if 'inicio_request' not in g:
+        return
+    observar_request(
+        request.endpoint or 'sin_ruta', request.method, response.status_code,
+        time.perf_counter() - g.inicio_request,
+        response.content_length or 0,  # sin largo conocido (SSE): 0
+        g.bd,
+    )
+
+@app.route('/metrics', methods=['GET'])
+def metricas():
+    """Métricas en formato de texto de Prometheus, sumadas entre workers.
+
+    Con METRICS_TOKEN se pide `Authorization: Bearer <token>` (para el
+    scraper); sin él, una sesión iniciada.
+    """
+    if not prometheus_client:
+        return jsonify({"error": "prometheus_client no está instalado"}), 503
+
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return jsonify({"error": "No autorizado"}), 401
+    else:
+        auth_error = require_auth()
+        if auth_error:
+            return auth_error
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registro = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registro), content_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+# ====================================================================
+# CONSULTAS LENTAS Y PERFIL DE REQUESTS
+# ====================================================================
+# Toda sentencia de los pools que tarde SQL_LENTA_MS o más se imprime con su
+# SQL normalizado (literales como ?), los parámetros solo por tipo, duración,
+# filas y ruta. Con SQL_LENTA_EXPLAIN=1 se agrega su plan: las lecturas puras
+# con EXPLAIN (ANALYZE, BUFFERS) dentro de un savepoint que se revierte, y todo
+# lo que escribe, bloquea o notifica solo con EXPLAIN (no se ejecuta dos veces).
+# Los textos del plan también salen como '?'. Un plan por sentencia cada
+# SQL_LENTA_EXPLAIN_CADA segundos, para no duplicar la carga cuando la BD ya está lenta.
+SQL_LENTA_MS = float(os.environ.get('SQL_LENTA_MS', 500))   # 0 desactiva
+SQL_LENTA_EXPLAIN = os.environ.get('SQL_LENTA_EXPLAIN', '0') == '1'
+SQL_LENTA_EXPLAIN_CADA = float(os.environ.get('SQL_LENTA_EXPLAIN_CADA', 60))
+
+_ultimo_explain = {}
+_explain_lock = threading.Lock()
+
+_LITERALES_SQL = re.compile(r"'(?:[^']|'')*'|(?<![\w.\"$])-?\b\d+(?:\.\d+)?\b")
+_ESPACIOS_SQL = re.compile(r'\s+')
+_TEXTOS_SQL = re.compile(r"'(?:[^']|'')*'")
+_LECTURA_SQL = re.compile(r'^\s*(SELECT|WITH|VALUES|TABLE)\b', re.IGNORECASE)
+_EFECTOS_SQL = re.compile(r'\b(INSERT|UPDATE|DELETE|nextval|setval|pg_notify)\b', re.IGNORECASE)
+_EXPLICABLE_SQL = re.compile(r'^\s*(SELECT|WITH|VALUES|TABLE|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+def texto_sql(cur, query):
+    if hasattr(query, 'as_string'):
+        return query.as_string(cur.connection)
+    return query.decode('utf-8') if isinstance(query, bytes) else query
+
+def normalizar_sql(sql):
+    """Una línea, con los literales embebidos como ? (los %s ya son parámetros)"""
+    return _ESPACIOS_SQL.sub(' ', _LITERALES_SQL.sub('?', sql)).strip()
+
+def describir_parametro(valor):
+    """Tipo (y tamaño) de un parámetro, nunca su valor"""
+    if isinstance(valor, (str, bytes, list, tuple, dict, set)):
+        return f'{type(valor).__name__}[{len(valor)}]'
+    return type(valor).__name__
+
+def describir_parametros(vars, muchas=False):
+    if vars is None:
+        return '-'
+    if muchas:
+        vars = list(vars)
+        return f'{len(vars)} × ({describir_parametros(vars[0]) if vars else "-"})'
+    if isinstance(vars, dict):
+        return ', '.join(f'{clave}={describir_parametro(valor)}' for clave, valor in vars.items())
+    return ', '.join(describir_parametro(valor) for valor in vars)
+
+def registrar_consulta_lenta(cur, query, vars, segundos, fallo, muchas):
+    sql = texto_sql(cur, query)
+    normalizado = normalizar_sql(sql)
+    ruta = request.endpoint if has_request_context() else '-'
+    filas = cur.rowcount if not fallo and cur.rowcount >= 0 else '?'
+    print(f"🐢 SQL lenta {segundos * 1000:.1f} ms | ruta={ruta} filas={filas}{' FALLÓ' if fallo else ''} | "
+          f"{normalizado} | params: {describir_parametros(vars, muchas)}")
+
+    if not SQL_LENTA_EXPLAIN or fallo or muchas or not _EXPLICABLE_SQL.match(sql):
+        return
+    with _explain_lock:
+        if time.monotonic() - _ultimo_explain.get(normalizado, float('-inf')) < SQL_LENTA_EXPLAIN_CADA:
+            return
+        _ultimo_explain[normalizado] = time.monotonic()
+
+    analizar = _LECTURA_SQL.match(sql) is not None and not _EFECTOS_SQL.search(sql)
+    plan = explicar_consulta(cur.connection, query, vars, analizar)
+    if plan:
+        print('   ' + '\n   '.join(_TEXTOS_SQL.sub("'?'", linea) for linea in plan))
+
+def explicar_consulta(conn, query, vars, analizar):
+    """Plan de la sentencia, sin efectos en la transacción de la ruta"""
+    opciones = '(ANALYZE, BUFFERS)' if analizar and not conn.autocommit else ''
+    # Cursor base: su EXPLAIN no pasa por despues_de_consulta
+    cur = psycopg2.extensions.cursor(conn)
+    usar_savepoint = not conn.autocommit
+    try:
+        if usar_savepoint:
+            cur.execute('SAVEPOINT explicar_lenta')
+        cur.execute(f'EXPLAIN {opciones} ' + texto_sql(cur, query), vars)
+        plan = [fila[0] for fila in cur.fetchall()]
+        if usar_savepoint:
+            cur.execute('ROLLBACK TO SAVEPOINT explicar_lenta')
+            cur.execute('RELEASE SAVEPOINT explicar_lenta')
+        return plan
+    except psycopg2.Error as e:
+        if usar_savepoint:
+            try:
+                cur.execute('ROLLBACK TO SAVEPOINT explicar_lenta')
+                cur.execute('RELEASE SAVEPOINT explicar_lenta')
+            except psycopg2.Error:
+                pass
+        print(f"⚠️ No se pudo obtener el plan: {e}")
+        return None
+    finally:
+        cur.close()
+
+# Perfil a pedido: un admin agrega `X-Perfil: 1` (o `?perfil=1`) y en lugar de la
+# respuesta recibe las pilas muestreadas del request en formato "folded"
+# (`a;b;c N`, lo que leen flamegraph.pl y speedscope).
+PERFIL_INTERVALO = float(os.environ.get('PERFIL_INTERVALO_MS', 5)) / 1000
+CABECERAS_SIN_PERFIL = {'content-type', 'content-length', 'content-encoding', 'etag', 'last-modified',
+                        'vary', 'cache-control', 'content-disposition'}
+
+class MuestreadorPerfil(threading.Thread):
+    """Profiler de muestreo: cada `intervalo` segundos anota la pila del hilo observado"""
+
+    def __init__(self, hilo_id, intervalo=PERFIL_INTERVALO):
+        super().__init__(daemon=True)
+        self.hilo_id = hilo_id
+        self.intervalo = intervalo
+        self.pilas = collections.Counter()
+        self.inicio = time.perf_counter()
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            frame = sys._current_frames().get(self.hilo_id)
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                pila.append(f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})')
+                frame = frame.f_back
+            if pila:
+                self.pilas[';'.join(reversed(pila))] += 1
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+        return time.perf_counter() - self.inicio
+
+    def plegado(self):
+        return ''.join(f'{pila} {muestras}\n' for pila, muestras in self.pilas.most_common())
+
+def pide_perfil():
+    return (request.headers.get('X-Perfil') == '1' or request.args.get('perfil') == '1') \
+        and session.get('role') == 'admin'
+
+def respuesta_perfil(response):
+    """Reemplaza la respuesta del request por su perfil (desde after_request)"""
+    duracion = g.perfil.detener()
+    perfil = app.response_class(g.perfil.plegado(), mimetype='text/plain')
+    for clave, valor in response.headers.items():
+        if clave.lower() not in CABECERAS_SIN_PERFIL:
+            perfil.headers.add(clave, valor)
+    perfil.headers['Cache-Control'] = 'no-store'
+    perfil.headers['X-Perfil-Estado'] = str(response.status_code)
+    perfil.headers['X-Perfil-Muestras'] = str(sum(g.perfil.pilas.values()))
+    perfil.headers['X-Perfil-Intervalo-Ms'] = f'{g.perfil.intervalo * 1000:g}'
+    perfil.headers['X-Perfil-Duracion-Ms'] = f'{duracion * 1000:.1f}'
+    perfil.headers['X-Perfil-Consultas'] = str(g.bd['consultas'])
+    perfil.headers['X-Perfil-Tiempo-Bd-Ms'] = f"{g.bd['segundos'] * 1000:.1f}"
+    print(f"🔬 Perfil de {request.method} {request.path}: {perfil.headers['X-Perfil-Muestras']} muestras")
+    response.close()   # una respuesta en streaming libera su conexión sin haberse enviado
+    return perfil
+
 # ====================================================================
 # MIDDLEWARE MEJORADO
 # ====================================================================
 @app.before_request
 def verificar_entorno():
-    """Middleware para logging y debugging"""
-    if request.endpoint not in ['health_check', 'static'] and FLASK_ENV != 'production':
+    """Middleware para logging, debugging, métricas y perfil a pedido"""
+    obtener_bus()
+    g.inicio_request = time.perf_counter()
+    g.bd = {'consultas': 0, 'segundos': 0.0, 'filas': 0, 'conexiones': 0, 'espera_conexion': 0.0}
+    if pide_perfil():
+        g.perfil = MuestreadorPerfil(threading.get_ident())
+        g.perfil.start()
+    if request.endpoint not in ['health_check', 'static', 'metricas'] and FLASK_ENV != 'production':
         print(f"🔍 {request.method} {request.path}")
 
 @app.after_request
@@ -141,7 +897,124 @@ def after_request(response):
     if origin in allowed_origins:
         response.headers['Access-Control-Allow-Origin'] = origin
         response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers['Access-Control-Expose-Headers'] = 'ETag, Last-Modified'
     
+    # Toda escritura exitosa sobre el inventario (ya confirmada por la ruta)
+    # invalida los snapshots y sube la versión que alimenta los ETag (y la de
+    # la caché de referencia si tocó categorías o productos)
+    if es_escritura_inventario(response):
+        invalidar_estadisticas()
+        incrementar_version_inventario(referencia=request.endpoint in RUTAS_REFERENCIA)
+        # Lecturas de esta sesión al primario por un rato (ver RÉPLICAS DE LECTURA)
+        if obtener_replicas():
+            session['escritura_en'] = time.time()
+    
+    registrar_metricas(response)
+    if 'perfil' in g:
+        return respuesta_perfil(response)
+    return response
+
+# ====================================================================
+# SERIALIZACIÓN JSON Y COMPRESIÓN DE RESPUESTAS
+# ====================================================================
+class ProveedorJSON(DefaultJSONProvider):
+    """jsonify / request.get_json con orjson si está instalado.
+
+    Misma salida que el proveedor de Flask (claves ordenadas, fechas en formato
+    HTTP, Decimal como texto, indentado en debug); solo los caracteres no ASCII
+    van en UTF-8 en lugar de \\uXXXX. JSON_ENCODER=stdlib vuelve al de Flask.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.usar_orjson = orjson is not None and os.environ.get('JSON_ENCODER', 'orjson') != 'stdlib'
+
+    def _opciones_orjson(self):
+        opciones = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            opciones |= orjson.OPT_INDENT_2
+        return opciones
+
+    def dumps(self, obj, **kwargs):
+        if not self.usar_orjson or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_json_default, option=self._opciones_orjson()).decode()
+
+    def loads(self, s, **kwargs):
+        if not self.usar_orjson or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if not self.usar_orjson:
+            return super().response(*args, **kwargs)
+        cuerpo = orjson.dumps(self._prepare_response_obj(args, kwargs), default=_json_default,
+                              option=self._opciones_orjson() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(cuerpo, mimetype=self.mimetype)
+
+app.json = ProveedorJSON(app)
+
+# Respuestas de texto por encima del umbral se comprimen con brotli (si está
+# instalado) o gzip, según Accept-Encoding. El ETag lleva la codificación
+# como sufijo: cada representación tiene el suyo.
+COMPRESION_MIN_BYTES = int(os.environ.get('COMPRESION_MIN_BYTES', 1024))
+CODIFICACIONES = ['br', 'gzip'] if brotli else ['gzip']
+TIPOS_COMPRIMIBLES = ('application/json', 'application/x-ndjson', 'text/')
+
+def comprimir(cuerpo, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(cuerpo, quality=5)
+    return gzip.compress(cuerpo, compresslevel=6)
+
+class CompresorFlujo:
+    """br/gzip incremental para respuestas en streaming: comprimir() por trozo y
+    terminar() al final. El primer trozo se fuerza a salir entero (primer byte)."""
+
+    def __init__(self, codificacion):
+        if codificacion == 'br':
+            compresor = brotli.Compressor(quality=5)
+            self._procesar, self._forzar, self.terminar = compresor.process, compresor.flush, compresor.finish
+        else:
+            compresor = zlib.compressobj(6, zlib.DEFLATED, 31)   # 31: formato gzip
+            self._procesar, self.terminar = compresor.compress, compresor.flush
+            self._forzar = lambda: compresor.flush(zlib.Z_SYNC_FLUSH)
+        self._primero = True
+
+    def comprimir(self, trozo):
+        datos = self._procesar(trozo)
+        if self._primero:
+            datos += self._forzar()
+            self._primero = False
+        return datos
+
+def comprimir_flujo(trozos, codificacion):
+    compresor = CompresorFlujo(codificacion)
+    for trozo in trozos:
+        datos = compresor.comprimir(trozo)
+        if datos:
+            yield datos
+    yield compresor.terminar()
+
+@app.after_request
+def comprimir_respuesta(response):
+    """Comprime la respuesta si el cliente lo acepta y vale la pena"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or not response.mimetype.startswith(TIPOS_COMPRIMIBLES)):
+        return response
+    cuerpo = response.get_data()
+    if len(cuerpo) < COMPRESION_MIN_BYTES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    codificacion = request.accept_encodings.best_match(CODIFICACIONES)
+    if not codificacion:
+        return response
+    response.set_data(comprimir(cuerpo, codificacion))
+    response.headers['Content-Encoding'] = codificacion
+    etag, debil = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{codificacion}', weak=debil)
     return response
 
 # ====================================================================
@@ -163,6 +1036,261 @@ def protected_route(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+# ====================================================================
+# VERSIÓN DEL INVENTARIO: ETag / Last-Modified / 304
+# ====================================================================
+# inventario_version (migración 0008) sube después del commit de cada
+# escritura exitosa y se lee antes de la consulta de cada GET, así un ETag
+# nunca queda asociado a datos más viejos que su versión:
+#   escritura: commit -> version + 1        lectura: version -> consulta -> ETag
+# Con If-None-Match (o If-Modified-Since) vigente se responde 304 sin
+# ejecutar la función del endpoint.
+RUTAS_POST_SOLO_LECTURA = {'lookup_serial'}
+
+def es_escritura_inventario(response):
+    return (request.method in ('POST', 'PUT', 'DELETE')
+            and request.path.startswith('/api/inventario/')
+            and request.endpoint not in RUTAS_POST_SOLO_LECTURA
+            and response.status_code < 400)
+
+CONSULTA_VERSION = 'SELECT "version", "actualizado", "referencia" FROM "inventario_version" WHERE "id" = 1'
+
+def leer_version_inventario():
+    """(version, actualizado, referencia) actuales, o None si no se pueden leer"""
+    try:
+        with db_conexion() as conn:
+            if not conn:
+                return None
+            cur = conn.cursor()
+            cur.execute(CONSULTA_VERSION)
+            return cur.fetchone()
+    except psycopg2.Error as e:
+        print(f"⚠️ Sin versión de inventario (¿python migrar.py aplicar?): {e}")
+        return None
+
+def incrementar_version_inventario(referencia=False):
+    try:
+        with db_conexion() as conn:
+            if not conn:
+                return
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE "inventario_version"
+                SET "version" = "version" + 1, "actualizado" = CURRENT_TIMESTAMP,
+                    "referencia" = "referencia" + %s
+                WHERE "id" = 1;
+            """, (1 if referencia else 0,))
+            conn.commit()
+    except psycopg2.Error as e:
+        print(f"⚠️ No se pudo incrementar la versión de inventario: {e}")
+
+def validar_condicional(numero, actualizado, if_none_match, if_modified_since):
+    """(vigente, etag): si los validadores del cliente siguen vigentes y el
+    ETag a devolver. `if_none_match` es un werkzeug ETags (vacío si no vino)."""
+    etag = f'inv-{numero}'
+    if if_none_match:
+        # El cliente puede tener la representación comprimida ("inv-N-gzip")
+        variantes = [etag] + [f'{etag}-{codificacion}' for codificacion in CODIFICACIONES]
+        coincide = next((v for v in variantes if if_none_match.contains(v)), None)
+        return coincide is not None, coincide or etag
+    return if_modified_since is not None and actualizado.replace(microsecond=0) <= if_modified_since, etag
+
+def con_version(f):
+    """Decorator para GET de inventario: ETag fuerte + Last-Modified y 304 si no cambió.
+
+    Sin tabla de versión (migración pendiente) el endpoint responde como siempre.
+    """
+    def decorated_function(*args, **kwargs):
+        if request.method != 'GET':
+            return f(*args, **kwargs)
+        version = leer_version_inventario()
+        if version is None:
+            return f(*args, **kwargs)
+
+        numero, actualizado, referencia = version
+        g.version_inventario = numero
+        g.version_referencia = referencia
+        vigente, etag = validar_condicional(numero, actualizado, request.if_none_match, request.if_modified_since)
+
+        if vigente:
+            response = app.response_class(status=304)
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        # comprimir_respuesta no toca las respuestas en streaming: se comprimen solas
+        codificacion = response.headers.get('Content-Encoding') if response.is_streamed else None
+        response.set_etag(f'{etag}-{codificacion}' if codificacion else etag)
+        response.last_modified = actualizado
+        response.headers['Cache-Control'] = 'private, no-cache'
+        if request.endpoint in RUTAS_NDJSON:
+            response.vary.add('Accept')
+        return response
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+# ====================================================================
+# CACHÉ DE DATOS DE REFERENCIA (tipos de pieza y productos)
+# ====================================================================
+# Los selects del frontend piden /tipos_pieza y /productos cada vez que se
+# abre un formulario, pero cambian pocas veces al día. Sus resultados se
+# guardan por (consulta, parámetros) atados a la columna "referencia" de
+# inventario_version (migración 0009), que solo suben las escrituras de
+# RUTAS_REFERENCIA. con_version ya la lee junto con la versión del ETag: un
+# acierto no cuesta ninguna consulta extra y una escritura en cualquier
+# worker invalida la caché de todos.
+#
+# Con CACHE_COMPARTIDA_DIR (un tmpfs como /dev/shm) cada resultado se escribe
+# además en un archivo de ese directorio y los demás workers lo toman de ahí
+# tras el primer fallo, en lugar de repetir la consulta cada uno.
+RUTAS_REFERENCIA = {'crear_tipo_pieza', 'actualizar_umbrales_categoria', 'inicializar_tipos_pieza',
+                    'agregar_producto', 'actualizar_producto', 'eliminar_producto'}
+
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 300))   # 0 desactiva
+CACHE_MAX_ENTRADAS = int(os.environ.get('CACHE_MAX_ENTRADAS', 128))
+CACHE_COMPARTIDA_DIR = os.environ.get('CACHE_COMPARTIDA_DIR')
+
+if prometheus_client:
+    METRICA_CACHE = prometheus_client.Counter(
+        'inventario_cache_total', 'Búsquedas en la caché de referencia por resultado', ['consulta', 'resultado'])
+
+class CacheConsultas:
+    """LRU con TTL de resultados de consultas, cada uno válido para una sola versión.
+
+    Los valores se comparten entre requests: quien los recibe no debe modificarlos.
+    Con `directorio`, deben ser serializables a JSON.
+    """
+
+    def __init__(self, max_entradas=CACHE_MAX_ENTRADAS, ttl=CACHE_TTL, directorio=CACHE_COMPARTIDA_DIR):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.directorio = directorio
+        self.entradas = collections.OrderedDict()   # clave -> (version, expira, valor, nombre)
+        self.contadores = collections.Counter()
+        self.lock = threading.Lock()
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def clave(consulta, params=None):
+        return hashlib.sha1(repr((consulta, params)).encode('utf-8')).hexdigest()
+
+    def leer(self, nombre, consulta, params, version, cargar):
+        """Resultado de la consulta para `version`; si no está, `cargar()` y guardarlo"""
+        if version is None or self.ttl <= 0:
+            return cargar()
+        clave = self.clave(consulta, params)
+        valor = self.obtener(nombre, clave, version)
+        if valor is None:
+            valor = cargar()
+            self.guardar(nombre, clave, version, valor)
+        return valor
+
+    def obtener(self, nombre, clave, version):
+        """Valor vigente (memoria del worker, luego directorio compartido) o None"""
+        with self.lock:
+            entrada = self.entradas.get(clave)
+            if entrada and entrada[0] == version and time.monotonic() < entrada[1]:
+                self.entradas.move_to_end(clave)
+                self._contar(nombre, 'acierto')
+                return entrada[2]
+
+        valor = self._leer_archivo(clave, version)
+        if valor is not None:
+            self._recordar(nombre, clave, version, valor)
+            with self.lock:
+                self._contar(nombre, 'acierto_compartido')
+            return valor
+
+        with self.lock:
+            self._contar(nombre, 'fallo')
+        return None
+
+    def guardar(self, nombre, clave, version, valor):
+        self._recordar(nombre, clave, version, valor)
+        self._escribir_archivo(clave, version, valor)
+
+    def _recordar(self, nombre, clave, version, valor):
+        with self.lock:
+            self.entradas[clave] = (version, time.monotonic() + self.ttl, valor, nombre)
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.max_entradas:
+                self.entradas.popitem(last=False)
+                self._contar(nombre, 'expulsion')
+
+    def vaciar(self, nombre=None):
+        """Descarta las entradas de este worker (solo las de `nombre`, si se indica).
+        Las del directorio compartido no hace falta: llevan su versión."""
+        with self.lock:
+            for clave in [c for c, entrada in self.entradas.items() if nombre in (None, entrada[3])]:
+                del self.entradas[clave]
+
+    def _contar(self, nombre, resultado):
+        self.contadores[resultado] += 1
+        if prometheus_client:
+            METRICA_CACHE.labels(nombre, resultado).inc()
+
+    def _archivo(self, clave):
+        return os.path.join(self.directorio, f'{clave}.json')
+
+    def _leer_archivo(self, clave, version):
+        if not self.directorio:
+            return None
+        try:
+            with open(self._archivo(clave), 'rb') as archivo:
+                entrada = json.loads(archivo.read())
+        except (OSError, ValueError):
+            return None
+        if entrada['version'] != version or time.time() >= entrada['expira']:
+            return None
+        return entrada['valor']
+
+    def _escribir_archivo(self, clave, version, valor):
+        if not self.directorio:
+            return
+        archivo = self._archivo(clave)
+        temporal = f'{archivo}.{os.getpid()}.{threading.get_ident()}'
+        try:
+            with open(temporal, 'w', encoding='utf-8') as salida:
+                json.dump({'version': version, 'expira': time.time() + self.ttl, 'valor': valor}, salida)
+            # Reemplazo atómico: los otros workers ven el archivo anterior o el nuevo
+            os.replace(temporal, archivo)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠️ No se pudo escribir la caché compartida: {e}")
+            with suppress(OSError):
+                os.remove(temporal)
+
+    def estadisticas(self):
+        with self.lock:
+            consultas = self.contadores['acierto'] + self.contadores['acierto_compartido'] + self.contadores['fallo']
+            return {
+                "entradas": len(self.entradas),
+                "max_entradas": self.max_entradas,
+                "ttl": self.ttl,
+                "compartida": self.directorio,
+                "aciertos": self.contadores['acierto'],
+                "aciertos_compartidos": self.contadores['acierto_compartido'],
+                "fallos": self.contadores['fallo'],
+                "expulsiones": self.contadores['expulsion'],
+                "tasa_aciertos": round((consultas - self.contadores['fallo']) / consultas, 3) if consultas else None,
+            }
+
+CACHE_REFERENCIA = CacheConsultas()
+
+def consulta_referencia(nombre, consulta, params=None):
+    """Filas (dicts) de una consulta de datos de referencia, desde la caché
+    mientras no cambie la versión de referencia leída por con_version"""
+    def cargar():
+        with db_conexion() as conn:
+            if not conn:
+                raise psycopg2.OperationalError("No se pudo conectar a la base de datos")
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute(consulta, params)
+            filas = [dict(row) for row in cur.fetchall()]
+            cur.close()
+            return filas
+    return CACHE_REFERENCIA.leer(nombre, consulta, params, g.get('version_referencia'), cargar)
+
 # ====================================================================
 # HEALTH CHECK
 # ====================================================================
@@ -189,6 +1317,25 @@ def send_static(path):
 # ====================================================================
 # AUTENTICACIÓN MEJORADA
 # ====================================================================
+DEMORA_LOGIN_FALLIDO = 0.5  # segundos; prevenir timing attacks
+
+def datos_sesion(username, password):
+    """Claves de sesión del usuario si las credenciales son válidas, o None"""
+    # 🔐 VALIDACIÓN ROBUSTA
+    if username == 'admin' and password == 'Admin123!':
+        return {
+            'user_id': 1,
+            'username': 'admin',
+            'role': 'admin',
+            'name': 'Administrador',
+            'login_time': datetime.now().isoformat(),
+            'last_activity': datetime.now().isoformat(),
+        }
+    return None
+
+def usuario_sesion(sesion):
+    return {"name": sesion.get('name'), "role": sesion.get('role'), "username": sesion.get('username')}
+
 @app.route('/api/auth/login', methods=['POST', 'OPTIONS'])
 def login():
     """Login seguro con validación robusta"""
@@ -208,30 +1355,20 @@ def login():
         if not username or not password:
             return jsonify({"error": "Usuario y contraseña requeridos"}), 400
         
-        # 🔐 VALIDACIÓN ROBUSTA
-        if username == 'admin' and password == 'Admin123!':
+        datos = datos_sesion(username, password)
+        if datos:
             session.permanent = True
-            session['user_id'] = 1
-            session['username'] = 'admin'
-            session['role'] = 'admin'
-            session['name'] = 'Administrador'
-            session['login_time'] = datetime.now().isoformat()
-            session['last_activity'] = datetime.now().isoformat()
+            session.update(datos)
             
             print(f"✅ Login exitoso para: {username}")
             
             return jsonify({
                 "mensaje": "Login exitoso",
-                "user": {
-                    "name": "Administrador",
-                    "role": "admin",
-                    "username": "admin"
-                }
+                "user": usuario_sesion(session)
             })
             
         else:
-            import time
-            time.sleep(0.5)  # Prevenir timing attacks
+            time.sleep(DEMORA_LOGIN_FALLIDO)
             print(f"❌ Credenciales inválidas para: {username}")
             return jsonify({"error": "Credenciales inválidas"}), 401
         
@@ -270,11 +1407,7 @@ def check_auth():
         
         return jsonify({
             "authenticated": True,
-            "user": {
-                "name": session.get('name'),
-                "role": session.get('role'),
-                "username": session.get('username')
-            }
+            "user": usuario_sesion(session)
         }), 200
     else:
         return jsonify({"authenticated": False}), 200
@@ -286,202 +1419,357 @@ def check_auth():
 @protected_route
 def debug_database():
     """Diagnóstico de estructura de base de datos"""
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        # 1. Ver estructura
-        cur.execute("""
-            SELECT table_name, column_name, data_type, is_nullable
-            FROM information_schema.columns 
-            WHERE table_schema = 'public'
-            ORDER BY table_name, ordinal_position;
-        """)
-        estructura = [dict(row) for row in cur.fetchall()]
-        
-        # 2. Ver datos existentes
-        cur.execute("""
-            SELECT 
-                p.codigo_sku,
-                p.nombre,
-                COUNT(s.serial_id) as unidades_existentes
-            FROM productos p 
-            LEFT JOIN seriales s ON p.producto_id = s.producto_id
-            GROUP BY p.codigo_sku, p.nombre
-            ORDER BY unidades_existentes DESC;
-        """)
-        datos_productos = [dict(row) for row in cur.fetchall()]
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        cur.close()
+            # 1. Ver estructura
+            cur.execute("""
+                SELECT table_name, column_name, data_type, is_nullable
+                FROM information_schema.columns 
+                WHERE table_schema = 'public'
+                ORDER BY table_name, ordinal_position;
+            """)
+            estructura = [dict(row) for row in cur.fetchall()]
+        
+            # 2. Ver datos existentes
+            cur.execute("""
+                SELECT 
+                    p.codigo_sku,
+                    p.nombre,
+                    COUNT(s.serial_id) as unidades_existentes
+                FROM productos p 
+                LEFT JOIN seriales s ON p.producto_id = s.producto_id
+                GROUP BY p.codigo_sku, p.nombre
+                ORDER BY unidades_existentes DESC;
+            """)
+            datos_productos = [dict(row) for row in cur.fetchall()]
+        
+            cur.close()
         
-        return jsonify({
-            "estructura": estructura,
-            "datos_productos": datos_productos,
-            "timestamp": datetime.now().isoformat()
-        })
+            return jsonify({
+                "estructura": estructura,
+                "datos_productos": datos_productos,
+                "timestamp": datetime.now().isoformat()
+            })
         
     except Exception as e:
         print(f"Error en debug_database: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
+
+@app.route('/api/debug/pool', methods=['GET'])
+@protected_route
+def debug_pool():
+    """Estadísticas del pool de conexiones, réplicas, caché, bus de invalidación y listener de eventos de este worker"""
+    return jsonify({
+        "pool": obtener_pool().estadisticas(),
+        "eventos": obtener_escucha().estadisticas(),
+        "lectura": estadisticas_replicas(),
+        "cache": CACHE_REFERENCIA.estadisticas(),
+        "invalidacion": obtener_bus().estadisticas(),
+        "timestamp": datetime.now().isoformat()
+    })
+
+# ====================================================================
+# UTILIDADES: PAGINACIÓN POR CURSOR (KEYSET) DE PRODUCTOS
+# ====================================================================
+# Con ?limit= las vistas de inventario devuelven páginas
+# {"items", "total", "limit", "siguiente"}; "siguiente" se envía como ?after=
+# para pedir la página que sigue. Sin parámetros se mantiene la lista completa.
+FROM_PRODUCTOS_STOCK = """
+FROM "productos" p
+JOIN "tipos_pieza" tp ON p."tipo_pieza_id" = tp."tipo_id"
+LEFT JOIN "producto_stock" ps ON p."producto_id" = ps."producto_id"
+"""
+
+def nivel_stock_sql(almacen, total, umbral_bajo, umbral_medio):
+    """CASE con el nivel de stock (SIN_STOCK / BAJO / MEDIO / NORMAL) de esas expresiones"""
+    return f"""CASE 
+    WHEN {total} = 0 THEN 'SIN_STOCK'
+    WHEN {almacen} <= {umbral_bajo} THEN 'BAJO'
+    WHEN {almacen} <= {umbral_medio} THEN 'MEDIO'
+    ELSE 'NORMAL'
+END"""
+
+# Umbrales por producto o, si no tiene, los de su categoría (migración 0010)
+NIVEL_STOCK_SQL = nivel_stock_sql(
+    'COALESCE(ps."almacen", 0)', 'COALESCE(ps."total", 0)',
+    'COALESCE(ps."umbral_bajo", tp."umbral_bajo")', 'COALESCE(ps."umbral_medio", tp."umbral_medio")')
+
+# Claves de orden: todas no nulas y terminadas en producto_id para que el
+# cursor sea único y la comparación de filas (a, b, ...) > (...) sea exacta
+ORDENES_PRODUCTOS = {
+    'marca': ['(p."marca" IS NULL)', 'COALESCE(p."marca", \'\')',
+              '(p."modelo" IS NULL)', 'COALESCE(p."modelo", \'\')', 'p."nombre"', 'p."producto_id"'],
+    'modelo': ['(p."modelo" IS NULL)', 'COALESCE(p."modelo", \'\')', 'p."nombre"', 'p."producto_id"'],
+    'nombre': ['p."nombre"', 'p."producto_id"'],
+    'stock': ['COALESCE(ps."almacen", 0)', 'p."nombre"', 'p."producto_id"'],
+}
+NIVELES_STOCK = ['SIN_STOCK', 'BAJO', 'MEDIO', 'NORMAL']
+LIMITE_PAGINA_MAX = 500
+
+def pide_paginacion(args=None):
+    """True si el request usa alguno de los parámetros de paginación/filtro"""
+    args = request.args if args is None else args
+    return any(k in args for k in ('limit', 'after', 'sort', 'categoria', 'nivel_stock', 'q'))
+
+def _codificar_cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+
+def _decodificar_cursor(cursor):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("Cursor 'after' inválido")
+    if not isinstance(valores, list):
+        raise ValueError("Cursor 'after' inválido")
+    return valores
+
+def plan_pagina_productos(args, columnas):
+    """Consultas de una página keyset sobre productos + producto_stock.
+
+    Parámetros: limit (1-500, 50 por defecto), after (cursor), sort
+    (marca|modelo|nombre|stock, con '-' para descendente), categoria
+    (tipo_pieza_id), nivel_stock (SIN_STOCK|BAJO|MEDIO|NORMAL) y q (texto).
+    Devuelve {'total': (sql, params), 'pagina': (sql, params), 'limite', 'claves'}
+    sin ejecutar nada (lo comparten la app y asgi.py). Lanza ValueError si
+    algún parámetro es inválido.
+    """
+    limite = args.get('limit', '50')
+    if not limite.isdigit() or not 1 <= int(limite) <= LIMITE_PAGINA_MAX:
+        raise ValueError(f"'limit' debe estar entre 1 y {LIMITE_PAGINA_MAX}")
+    limite = int(limite)
+
+    orden = args.get('sort', 'marca')
+    descendente = orden.startswith('-')
+    claves = ORDENES_PRODUCTOS.get(orden.lstrip('-'))
+    if not claves:
+        raise ValueError(f"'sort' debe ser uno de: {', '.join(ORDENES_PRODUCTOS)}")
+
+    filtros, params = [], []
+    categoria = args.get('categoria')
+    if categoria:
+        if not categoria.isdigit():
+            raise ValueError("'categoria' debe ser un tipo_pieza_id")
+        filtros.append('p."tipo_pieza_id" = %s')
+        params.append(int(categoria))
+    nivel = args.get('nivel_stock')
+    if nivel:
+        if nivel not in NIVELES_STOCK:
+            raise ValueError(f"'nivel_stock' debe ser uno de: {', '.join(NIVELES_STOCK)}")
+        filtros.append(f'{NIVEL_STOCK_SQL} = %s')
+        params.append(nivel)
+    texto = args.get('q', '').strip()
+    if texto:
+        filtros.append("""(p."nombre" ILIKE %s OR p."codigo_sku" ILIKE %s OR p."marca" ILIKE %s
+                           OR p."modelo" ILIKE %s OR tp."tipo_modelo" ILIKE %s)""")
+        params.extend([f"%{texto}%"] * 5)
+
+    where = ' AND '.join(filtros) or 'TRUE'
+
+    where_pagina, params_pagina = where, list(params)
+    after = args.get('after')
+    if after:
+        valores = _decodificar_cursor(after)
+        if len(valores) != len(claves):
+            raise ValueError("Cursor 'after' no corresponde al orden solicitado")
+        comparador = '<' if descendente else '>'
+        where_pagina += f" AND ({', '.join(claves)}) {comparador} ({', '.join(['%s'] * len(claves))})"
+        params_pagina.extend(valores)
+
+    direccion = 'DESC' if descendente else 'ASC'
+    pagina = f"""
+        SELECT {columnas},
+               {', '.join(f'{clave} AS _k{i}' for i, clave in enumerate(claves))}
+        {FROM_PRODUCTOS_STOCK}
+        WHERE {where_pagina}
+        ORDER BY {', '.join(f'{clave} {direccion}' for clave in claves)}
+        LIMIT %s;
+    """
+    return {
+        'total': (f'SELECT COUNT(*) {FROM_PRODUCTOS_STOCK} WHERE {where}', params),
+        'pagina': (pagina, params_pagina + [limite + 1]),
+        'limite': limite,
+        'claves': len(claves),
+    }
+
+def armar_pagina(plan, total, filas):
+    """Respuesta paginada a partir de las filas (dicts) de plan['pagina']"""
+    limite, claves = plan['limite'], range(plan['claves'])
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = _codificar_cursor([filas[-1][f'_k{i}'] for i in claves])
+    for fila in filas:
+        for i in claves:
+            del fila[f'_k{i}']
+
+    return {"items": filas, "total": total, "limit": limite, "siguiente": siguiente}
+
+def paginar_productos(cur, columnas):
+    """Ejecuta una página keyset (ver plan_pagina_productos) con los parámetros del request"""
+    plan = plan_pagina_productos(request.args, columnas)
+    cur.execute(*plan['total'])
+    total = cur.fetchone()[0]
+    cur.execute(*plan['pagina'])
+    return armar_pagina(plan, total, [dict(row) for row in cur.fetchall()])
 
 # ====================================================================
 # API: OBTENER INVENTARIO COMPLETO
 # ====================================================================
+COLUMNAS_INVENTARIO_STOCK = f"""
+    p."producto_id",
+    p."nombre",
+    COALESCE(p."marca", 'No especificada') AS marca,
+    COALESCE(p."modelo", 'No especificado') AS modelo,
+    tp."tipo_modelo" AS categoria,
+    p."codigo_sku",
+    p."descripcion",
+    -- Totales por estado (resumen producto_stock)
+    COALESCE(ps."total", 0) AS total_unidades,
+    COALESCE(ps."almacen", 0) AS en_almacen,
+    COALESCE(ps."instalado", 0) AS instalados,
+    COALESCE(ps."danado", 0) AS danados,
+    COALESCE(ps."retirado", 0) AS retirados,
+    -- Estado de stock
+    {NIVEL_STOCK_SQL} AS nivel_stock
+"""
+
+CONSULTA_INVENTARIO_STOCK = f"""
+SELECT {COLUMNAS_INVENTARIO_STOCK}
+{FROM_PRODUCTOS_STOCK}
+ORDER BY 
+    p."marca", p."modelo", p."nombre";
+"""
+
 @app.route('/api/inventario/stock', methods=['GET', 'OPTIONS'])
 @protected_route
+@con_version
 def obtener_inventario_stock():
     """Obtiene inventario completo con estadísticas"""
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        if pide_ndjson() and not pide_paginacion():
+            return responder_ndjson('inventario_stock', CONSULTA_INVENTARIO_STOCK)
+
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
-        SELECT 
-            p."producto_id",
-            p."nombre",
-            COALESCE(p."marca", 'No especificada') AS marca,
-            COALESCE(p."modelo", 'No especificado') AS modelo,
-            tp."tipo_modelo" AS categoria,
-            p."codigo_sku",
-            p."descripcion",
-            -- Totales por estado
-            COUNT(s."serial_id") AS total_unidades,
-            SUM(CASE WHEN s."estado" = 'ALMACEN' THEN 1 ELSE 0 END) AS en_almacen,
-            SUM(CASE WHEN s."estado" = 'INSTALADO' THEN 1 ELSE 0 END) AS instalados,
-            SUM(CASE WHEN s."estado" = 'DAÑADO' THEN 1 ELSE 0 END) AS danados,
-            SUM(CASE WHEN s."estado" = 'RETIRADO' THEN 1 ELSE 0 END) AS retirados,
-            -- Estado de stock
-            CASE 
-                WHEN COUNT(s."serial_id") = 0 THEN 'SIN_STOCK'
-                WHEN SUM(CASE WHEN s."estado" = 'ALMACEN' THEN 1 ELSE 0 END) <= 3 THEN 'BAJO'
-                WHEN SUM(CASE WHEN s."estado" = 'ALMACEN' THEN 1 ELSE 0 END) <= 10 THEN 'MEDIO'
-                ELSE 'NORMAL'
-            END AS nivel_stock
-        FROM 
-            "productos" p
-        JOIN 
-            "tipos_pieza" tp ON p."tipo_pieza_id" = tp."tipo_id"
-        LEFT JOIN 
-            "seriales" s ON p."producto_id" = s."producto_id"
-        GROUP BY 
-            p."producto_id", p."nombre", p."marca", p."modelo", 
-            tp."tipo_modelo", p."codigo_sku", p."descripcion"
-        ORDER BY 
-            p."marca", p."modelo", p."nombre";
-        """
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        cur.execute(query)
-        inventario = [dict(row) for row in cur.fetchall()]
-        cur.close()
+            if pide_paginacion():
+                return jsonify(paginar_productos(cur, COLUMNAS_INVENTARIO_STOCK))
+        
+            cur.execute(CONSULTA_INVENTARIO_STOCK)
+            inventario = [dict(row) for row in cur.fetchall()]
+            cur.close()
         
-        return jsonify(inventario)
+            return jsonify(inventario)
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error en /stock: {e}")
         return jsonify({"error": f"Error al obtener inventario: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 # ====================================================================
-# API: OBTENER ESTADÍSTICAS
+# API: OBTENER ESTADÍSTICAS (SNAPSHOT EN MEMORIA)
 # ====================================================================
+# Una sola pasada sobre productos + producto_stock. El resultado se guarda
+# unos segundos por worker, atado a la versión del inventario: una escritura
+# en cualquier worker lo invalida.
+CONSULTA_ESTADISTICAS = """
+SELECT 
+    COUNT(*) as total_modelos,
+    COALESCE(SUM(ps.total), 0) as total_seriales,
+    COUNT(*) FILTER (WHERE COALESCE(ps.almacen, 0) <= COALESCE(ps.umbral_bajo, tp.umbral_bajo)) as modelos_stock_bajo
+FROM productos p
+JOIN tipos_pieza tp ON p.tipo_pieza_id = tp.tipo_id
+LEFT JOIN producto_stock ps ON p.producto_id = ps.producto_id;
+"""
+
+ESTADISTICAS_TTL = float(os.environ.get('ESTADISTICAS_TTL', 15))
+_snapshot_estadisticas = {'datos': None, 'expira': 0.0, 'generacion': 0, 'version': None}
+_snapshot_lock = threading.Lock()
+
+def invalidar_estadisticas():
+    """Descarta el snapshot de estadísticas de este worker"""
+    with _snapshot_lock:
+        _snapshot_estadisticas['datos'] = None
+        _snapshot_estadisticas['generacion'] += 1
+
 @app.route('/api/inventario/estadisticas', methods=['GET', 'OPTIONS'])
 @protected_route
+@con_version
 def obtener_estadisticas():
     """Obtiene estadísticas generales del inventario"""
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        version = g.get('version_inventario')
+        with _snapshot_lock:
+            datos = _snapshot_estadisticas['datos']
+            vigente = (datos is not None and time.monotonic() < _snapshot_estadisticas['expira']
+                       and _snapshot_estadisticas['version'] == version)
+            generacion = _snapshot_estadisticas['generacion']
+        
+        if vigente and request.args.get('fresco') != '1':
+            return jsonify(datos)
+        
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
-        SELECT 
-            COUNT(DISTINCT p.producto_id) as total_modelos,
-            COUNT(DISTINCT s.serial_id) as total_seriales,
-            COUNT(DISTINCT CASE WHEN sub.stock_actual <= 3 THEN sub.producto_id END) as modelos_stock_bajo
-        FROM productos p
-        CROSS JOIN LATERAL (
-            SELECT 
-                p2.producto_id,
-                COUNT(s2.serial_id) as stock_actual
-            FROM productos p2
-            LEFT JOIN seriales s2 ON p2.producto_id = s2.producto_id AND s2.estado = 'ALMACEN'
-            WHERE p2.producto_id = p.producto_id
-            GROUP BY p2.producto_id
-        ) sub
-        LEFT JOIN seriales s ON p.producto_id = s.producto_id;
-        """
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute(CONSULTA_ESTADISTICAS)
+            stats = dict(cur.fetchone())
+            cur.close()
         
-        cur.execute(query)
-        stats = dict(cur.fetchone())
-        cur.close()
+        stats['as_of'] = datetime.now().isoformat()
+        
+        with _snapshot_lock:
+            # Si hubo una escritura mientras se consultaba, no guardar el snapshot
+            if _snapshot_estadisticas['generacion'] == generacion:
+                _snapshot_estadisticas['datos'] = stats
+                _snapshot_estadisticas['expira'] = time.monotonic() + ESTADISTICAS_TTL
+                _snapshot_estadisticas['version'] = version
         
         return jsonify(stats)
         
     except Exception as e:
         print(f"Error en /estadisticas: {e}")
         return jsonify({"error": f"Error al obtener estadísticas: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 # ====================================================================
 # API: OBTENER TIPOS DE PIEZA
 # ====================================================================
+CONSULTA_TIPOS_PIEZA = """
+SELECT "tipo_id", "tipo_modelo", "umbral_bajo", "umbral_medio"
+FROM "tipos_pieza" 
+ORDER BY "tipo_modelo";
+"""
+
 @app.route('/api/inventario/tipos_pieza', methods=['GET', 'OPTIONS'])
 @protected_route
+@con_version
 def obtener_tipos_pieza():
     """Obtiene todas las categorías de productos"""
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
-            
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
-        SELECT "tipo_id", "tipo_modelo"
-        FROM "tipos_pieza" 
-        ORDER BY "tipo_modelo";
-        """
-        
-        cur.execute(query)
-        tipos = [dict(row) for row in cur.fetchall()]
-        cur.close()
-        
-        return jsonify(tipos)
+        return jsonify(consulta_referencia('tipos_pieza', CONSULTA_TIPOS_PIEZA))
     
     except Exception as e:
         print(f"Error en /tipos_pieza: {e}")
         return jsonify({"error": f"Error al obtener tipos: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 # ====================================================================
 # API: CREAR NUEVA CATEGORÍA
@@ -493,7 +1781,6 @@ def crear_tipo_pieza():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
         data = request.get_json()
         
@@ -505,40 +1792,91 @@ def crear_tipo_pieza():
         if not tipo_modelo or len(tipo_modelo) < 2:
             return jsonify({"error": "El nombre debe tener al menos 2 caracteres"}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        # Verificar si ya existe
-        cur.execute('SELECT "tipo_id" FROM "tipos_pieza" WHERE LOWER("tipo_modelo") = LOWER(%s)', (tipo_modelo,))
-        if cur.fetchone():
-            return jsonify({"error": f"La categoría '{tipo_modelo}' ya existe"}), 409
-        
-        # Insertar
-        insert_query = """
-        INSERT INTO "tipos_pieza" ("tipo_modelo")
-        VALUES (%s)
-        RETURNING "tipo_id", "tipo_modelo";
-        """
-        cur.execute(insert_query, (tipo_modelo,))
-        result = dict(cur.fetchone())
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        conn.commit()
-        cur.close()
+            # Verificar si ya existe
+            cur.execute('SELECT "tipo_id" FROM "tipos_pieza" WHERE LOWER("tipo_modelo") = LOWER(%s)', (tipo_modelo,))
+            if cur.fetchone():
+                return jsonify({"error": f"La categoría '{tipo_modelo}' ya existe"}), 409
         
-        return jsonify({
-            "mensaje": f"Categoría '{tipo_modelo}' creada exitosamente",
-            "tipo": result
-        }), 201
+            # Insertar
+            insert_query = """
+            INSERT INTO "tipos_pieza" ("tipo_modelo")
+            VALUES (%s)
+            RETURNING "tipo_id", "tipo_modelo";
+            """
+            cur.execute(insert_query, (tipo_modelo,))
+            result = dict(cur.fetchone())
+            publicar_invalidacion(cur, 'categoria', [result['tipo_id']])
+        
+            conn.commit()
+            cur.close()
+        
+            return jsonify({
+                "mensaje": f"Categoría '{tipo_modelo}' creada exitosamente",
+                "tipo": result
+            }), 201
         
     except Exception as e:
         print(f"Error en POST /tipos_pieza: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
+
+# ====================================================================
+# API: UMBRALES DE REPOSICIÓN DE UNA CATEGORÍA
+# ====================================================================
+@app.route('/api/inventario/tipos_pieza/<int:tipo_id>/umbrales', methods=['PUT', 'OPTIONS'])
+@protected_route
+def actualizar_umbrales_categoria(tipo_id):
+    """Cambia los umbrales por defecto de una categoría ({"umbral_bajo", "umbral_medio"}).
+
+    Aplica a sus productos sin umbrales propios; los cruces que provoca
+    quedan en /api/inventario/alertas.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    try:
+        try:
+            umbral_bajo, umbral_medio = leer_umbrales(request.get_json() or {})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+            
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute("""
+                UPDATE "tipos_pieza" SET "umbral_bajo" = %s, "umbral_medio" = %s
+                WHERE "tipo_id" = %s
+                RETURNING "tipo_id", "tipo_modelo", "umbral_bajo", "umbral_medio";
+            """, (umbral_bajo, umbral_medio, tipo_id))
+            tipo = cur.fetchone()
+            if not tipo:
+                return jsonify({"error": "Categoría no encontrada"}), 404
+            tipo = dict(tipo)
+        
+            actualizados = aplicar_umbrales(cur, tipo_id=tipo_id)
+            publicar_invalidacion(cur, 'categoria', [tipo_id])
+            if actualizados:
+                publicar_invalidacion(cur, 'stock', actualizados)
+        
+            conn.commit()
+            cur.close()
+        
+            return jsonify({
+                "mensaje": f"Umbrales de '{tipo['tipo_modelo']}' actualizados",
+                "tipo": tipo,
+                "productos_actualizados": len(actualizados)
+            })
+        
+    except Exception as e:
+        print(f"Error en PUT /tipos_pieza/umbrales: {e}")
+        return jsonify({"error": f"Error: {str(e)}"}), 500
 
 # ====================================================================
 # API: INICIALIZAR TIPOS PREDETERMINADOS
@@ -550,94 +1888,79 @@ def inicializar_tipos_pieza():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        tipos_predeterminados = [
-            'Computadoras y Laptops',
-            'Servidores y Mainframe',
-            'Redes y Comunicaciones',
-            'Almacenamiento',
-            'Componentes de Hardware',
-            'Periféricos',
-            'Cables y Conectores',
-            'Software y Licencias',
-            'Equipos de Seguridad',
-            'Fuentes de Poder y UPS',
-            'Refacciones y Repuestos',
-            'Consumibles'
-        ]
-        
-        # Verificar cuáles ya existen
-        cur.execute('SELECT "tipo_modelo" FROM "tipos_pieza"')
-        tipos_existentes = [row['tipo_modelo'] for row in cur.fetchall()]
-        
-        # Insertar solo los que no existen
-        tipos_insertados = 0
-        for tipo in tipos_predeterminados:
-            if tipo not in tipos_existentes:
-                cur.execute(
-                    'INSERT INTO "tipos_pieza" ("tipo_modelo") VALUES (%s)',
-                    (tipo,)
-                )
-                tipos_insertados += 1
+            cur = conn.cursor(cursor_factory=DictCursor)
+        
+            tipos_predeterminados = [
+                'Computadoras y Laptops',
+                'Servidores y Mainframe',
+                'Redes y Comunicaciones',
+                'Almacenamiento',
+                'Componentes de Hardware',
+                'Periféricos',
+                'Cables y Conectores',
+                'Software y Licencias',
+                'Equipos de Seguridad',
+                'Fuentes de Poder y UPS',
+                'Refacciones y Repuestos',
+                'Consumibles'
+            ]
+        
+            # Verificar cuáles ya existen
+            cur.execute('SELECT "tipo_modelo" FROM "tipos_pieza"')
+            tipos_existentes = [row['tipo_modelo'] for row in cur.fetchall()]
+        
+            # Insertar solo los que no existen
+            tipos_insertados = 0
+            for tipo in tipos_predeterminados:
+                if tipo not in tipos_existentes:
+                    cur.execute(
+                        'INSERT INTO "tipos_pieza" ("tipo_modelo") VALUES (%s)',
+                        (tipo,)
+                    )
+                    tipos_insertados += 1
+            if tipos_insertados:
+                publicar_invalidacion(cur, 'categoria')
+        
+            conn.commit()
+            cur.close()
         
-        conn.commit()
-        cur.close()
-        
-        return jsonify({
-            "mensaje": f"Se inicializaron {tipos_insertados} nuevas categorías",
-            "tipos_insertados": tipos_insertados
-        })
+            return jsonify({
+                "mensaje": f"Se inicializaron {tipos_insertados} nuevas categorías",
+                "tipos_insertados": tipos_insertados
+            })
         
     except Exception as e:
         print(f"Error en /inicializar_tipos: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 # ====================================================================
 # API: OBTENER TODOS LOS PRODUCTOS
 # ====================================================================
+CONSULTA_PRODUCTOS = """
+SELECT "producto_id", "nombre", "codigo_sku", "tipo_pieza_id"
+FROM "productos" 
+ORDER BY "nombre";
+"""
+
 @app.route('/api/inventario/productos', methods=['GET', 'OPTIONS'])
 @protected_route
+@con_version
 def obtener_todos_los_productos():
     """Obtiene lista completa de productos para selects"""
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
-            
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
-        SELECT "producto_id", "nombre", "codigo_sku", "tipo_pieza_id"
-        FROM "productos" 
-        ORDER BY "nombre";
-        """
-        
-        cur.execute(query)
-        productos = [dict(row) for row in cur.fetchall()]
-        cur.close()
-        
-        return jsonify(productos)
+        return jsonify(consulta_referencia('productos', CONSULTA_PRODUCTOS))
     
     except Exception as e:
         print(f"Error en /productos: {e}")
         return jsonify({"error": f"Error al obtener productos: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 # ====================================================================
 # API: AGREGAR NUEVO PRODUCTO (CON MARCA Y MODELO)
@@ -649,7 +1972,6 @@ def agregar_producto():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
         data = request.get_json()
         
@@ -664,39 +1986,45 @@ def agregar_producto():
         codigo_sku = data['codigo_sku'].strip()
         marca = data.get('marca', '').strip()
         modelo = data.get('modelo', '').strip()
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        try:
+            umbral_bajo, umbral_medio = leer_umbrales(data, heredables=True)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        insert_query = """
-        INSERT INTO "productos" ("nombre", "descripcion", "tipo_pieza_id", "codigo_sku", "marca", "modelo")
-        VALUES (%s, %s, %s, %s, %s, %s)
-        RETURNING "producto_id";
-        """
-        cur.execute(insert_query, (nombre, descripcion, tipo_pieza_id, codigo_sku, marca or None, modelo or None))
-        
-        result = cur.fetchone()
-        producto_id = result['producto_id'] if result else None
-        
-        conn.commit()
-        cur.close()
+            cur = conn.cursor(cursor_factory=DictCursor)
+        
+            insert_query = """
+            INSERT INTO "productos" ("nombre", "descripcion", "tipo_pieza_id", "codigo_sku", "marca", "modelo",
+                                     "umbral_bajo", "umbral_medio")
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING "producto_id";
+            """
+            cur.execute(insert_query, (nombre, descripcion, tipo_pieza_id, codigo_sku, marca or None, modelo or None,
+                                       umbral_bajo, umbral_medio))
+        
+            result = cur.fetchone()
+            producto_id = result['producto_id'] if result else None
+            # Su fila en producto_stock (sin stock: ya cuenta como stock bajo)
+            aplicar_umbrales(cur, [producto_id])
+            publicar_invalidacion(cur, 'producto', [producto_id])
+        
+            conn.commit()
+            cur.close()
         
-        return jsonify({
-            "mensaje": f"Producto '{nombre}' agregado correctamente",
-            "producto_id": producto_id
-        }), 201
+            return jsonify({
+                "mensaje": f"Producto '{nombre}' agregado correctamente",
+                "producto_id": producto_id
+            }), 201
 
     except IntegrityError as e:
         return jsonify({"error": "Ya existe un producto similar"}), 409
     except Exception as e:
         print(f"Error agregando producto: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 # ====================================================================
 # API: ELIMINAR PRODUCTO
@@ -708,38 +2036,619 @@ def eliminar_producto(producto_id):
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
         if session.get('role') != 'admin':
             return jsonify({"error": "Solo administradores pueden eliminar productos"}), 403
 
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        # Obtener nombre para mensaje
-        cur.execute('SELECT nombre FROM productos WHERE producto_id = %s', (producto_id,))
-        producto = cur.fetchone()
-        if not producto:
-            return jsonify({"error": "Producto no encontrado"}), 404
+            # Obtener nombre para mensaje
+            cur.execute('SELECT nombre FROM productos WHERE producto_id = %s', (producto_id,))
+            producto = cur.fetchone()
+            if not producto:
+                return jsonify({"error": "Producto no encontrado"}), 404
         
-        # Eliminar en orden: historial -> seriales -> producto
-        cur.execute('DELETE FROM historial_estados WHERE serial_id IN (SELECT serial_id FROM seriales WHERE producto_id = %s)', (producto_id,))
-        cur.execute('DELETE FROM seriales WHERE producto_id = %s', (producto_id,))
-        cur.execute('DELETE FROM productos WHERE producto_id = %s', (producto_id,))
+            # Eliminar en orden: seriales (dejando su baja en el historial) -> resumen de stock -> producto
+            cur.execute("""
+                WITH eliminados AS (
+                    DELETE FROM "seriales" WHERE "producto_id" = %s
+                    RETURNING "serial_id", "producto_id", "codigo_unico_serial", "estado"
+                )
+                INSERT INTO "historial_estados"
+                    ("serial_id", "producto_id", "codigo_unico_serial", "estado_anterior", "notas")
+                SELECT "serial_id", "producto_id", "codigo_unico_serial", "estado", 'Baja por eliminación del producto'
+                FROM eliminados;
+            """, (producto_id,))
+            cur.execute('DELETE FROM producto_stock WHERE producto_id = %s', (producto_id,))
+            cur.execute('DELETE FROM productos WHERE producto_id = %s', (producto_id,))
+            notificar_evento(cur, 'producto_eliminado', {'producto_id': producto_id})
+            publicar_invalidacion(cur, 'producto', [producto_id])
         
-        conn.commit()
+            conn.commit()
         
-        return jsonify({"mensaje": f"Producto '{producto['nombre']}' eliminado"})
+            return jsonify({"mensaje": f"Producto '{producto['nombre']}' eliminado"})
         
     except Exception as e:
         print(f"Error eliminando producto: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
+
+# ====================================================================
+# RESUMEN DE STOCK POR PRODUCTO (producto_stock)
+# ====================================================================
+# Contadores por estado mantenidos en cada escritura, para que las lecturas
+# no agreguen toda la tabla seriales. Se reconstruye/verifica con:
+#   python producto_stock.py reconstruir | verificar
+def registrar_movimientos_stock(cur, movimientos):
+    """Aplica movimientos (producto_id, estado, delta, delta_total) a producto_stock.
+
+    - alta de N seriales:        (producto_id, estado, N, N)
+    - cambio de estado:          (producto_id, anterior, -1, 0) + (producto_id, nuevo, 1, 0)
+    - baja de un serial:         (producto_id, estado, -1, -1)
+
+    Un solo upsert para todos los productos afectados; el lock de fila
+    serializa las escrituras concurrentes sobre el mismo producto. Las filas
+    se bloquean en orden de producto_id (no en el del GROUP BY, que puede ser
+    un hash): dos lotes que tocan los mismos productos esperan uno al otro en
+    vez de bloquearse en cruz (deadlock). En la misma
+    sentencia se registran los cruces de umbral (alertas_stock): los
+    contadores de antes son los nuevos menos los deltas.
+    """
+    movimientos = [m for m in movimientos if m[2] or m[3]]
+    if not movimientos:
+        return
+    productos, estados, deltas, deltas_total = (list(col) for col in zip(*movimientos))
+    cur.execute(f"""
+        WITH m AS (
+            SELECT
+                m.producto_id,
+                COALESCE(SUM(m.delta) FILTER (WHERE m.estado = 'ALMACEN'), 0) AS almacen,
+                COALESCE(SUM(m.delta) FILTER (WHERE m.estado = 'INSTALADO'), 0) AS instalado,
+                COALESCE(SUM(m.delta) FILTER (WHERE m.estado = 'DAÑADO'), 0) AS danado,
+                COALESCE(SUM(m.delta) FILTER (WHERE m.estado = 'RETIRADO'), 0) AS retirado,
+                SUM(m.delta_total) AS total,
+                BOOL_OR(m.delta_total > 0) AS entrada
+            FROM unnest(%s::int[], %s::text[], %s::int[], %s::int[])
+                 AS m(producto_id, estado, delta, delta_total)
+            GROUP BY m.producto_id
+        ), stock AS (
+            -- Producto sin fila todavía: entra con los umbrales efectivos
+            INSERT INTO "producto_stock" AS ps
+                ("producto_id", "almacen", "instalado", "danado", "retirado", "total",
+                 "ultima_entrada", "ultima_actualizacion", "umbral_bajo", "umbral_medio")
+            SELECT
+                m.producto_id, m.almacen, m.instalado, m.danado, m.retirado, m.total,
+                CASE WHEN m.entrada THEN CURRENT_TIMESTAMP END,
+                CURRENT_TIMESTAMP,
+                COALESCE(p."umbral_bajo", tp."umbral_bajo"),
+                COALESCE(p."umbral_medio", tp."umbral_medio")
+            FROM m
+            JOIN "productos" p ON p."producto_id" = m.producto_id
+            JOIN "tipos_pieza" tp ON tp."tipo_id" = p."tipo_pieza_id"
+            ORDER BY m.producto_id
+            ON CONFLICT ("producto_id") DO UPDATE SET
+                "almacen" = ps."almacen" + EXCLUDED."almacen",
+                "instalado" = ps."instalado" + EXCLUDED."instalado",
+                "danado" = ps."danado" + EXCLUDED."danado",
+                "retirado" = ps."retirado" + EXCLUDED."retirado",
+                "total" = ps."total" + EXCLUDED."total",
+                "ultima_entrada" = COALESCE(EXCLUDED."ultima_entrada", ps."ultima_entrada"),
+                "ultima_actualizacion" = EXCLUDED."ultima_actualizacion"
+            RETURNING ps."producto_id", ps."total", ps."almacen", ps."instalado", ps."danado",
+                      ps."retirado", ps."umbral_bajo", ps."umbral_medio"
+        ), alertas AS ({insertar_alertas_sql('''
+            SELECT s."producto_id", s."almacen", s."total", s."umbral_bajo", s."umbral_medio",
+                   s."almacen" - m.almacen AS almacen_antes, s."total" - m.total AS total_antes,
+                   s."umbral_bajo" AS umbral_bajo_antes, s."umbral_medio" AS umbral_medio_antes
+            FROM stock s JOIN m ON m.producto_id = s."producto_id"''')})
+        SELECT s."producto_id", s."total", s."almacen", s."instalado", s."danado", s."retirado",
+               {COLUMNAS_ALERTA_EVENTO}
+        FROM stock s LEFT JOIN alertas a ON a."producto_id" = s."producto_id";
+    """, (productos, estados, deltas, deltas_total))
+    filas = cur.fetchall()
+    notificar_stock(cur, [fila[:6] for fila in filas], alertas_de_filas(filas, 6))
+
+# ====================================================================
+# UMBRALES DE REPOSICIÓN Y ALERTAS DE STOCK (alertas_stock)
+# ====================================================================
+# Umbrales por categoría (tipos_pieza) con excepción por producto; el
+# efectivo se copia a producto_stock (migración 0010) para que el stock bajo
+# sea un índice parcial. Cada vez que un producto entra, empeora o sale del
+# stock bajo (BAJO / SIN_STOCK), por movimientos de seriales o por un cambio
+# de umbral, se inserta una alerta y se publica el evento `alerta_stock`.
+NIVELES_ALERTA = ('SIN_STOCK', 'BAJO')
+
+# Columnas de la alerta (NULL si no hubo cruce) al final de las filas; ver alertas_de_filas
+COLUMNAS_ALERTA_EVENTO = """a."alerta_id", a."nivel_anterior", a."nivel_nuevo", a."almacen" AS alerta_almacen,
+               a."umbral_bajo" AS alerta_umbral_bajo, TO_CHAR(a."fecha", 'YYYY-MM-DD HH24:MI:SS') AS alerta_fecha"""
+
+def insertar_alertas_sql(cruces):
+    """INSERT ... RETURNING de alertas_stock para un SELECT `cruces` con
+    producto_id, almacen, total, umbral_bajo y umbral_medio (después) y
+    almacen_antes, total_antes, umbral_bajo_antes y umbral_medio_antes"""
+    antes = nivel_stock_sql('c.almacen_antes', 'c.total_antes', 'c.umbral_bajo_antes', 'c.umbral_medio_antes')
+    despues = nivel_stock_sql('c."almacen"', 'c."total"', 'c."umbral_bajo"', 'c."umbral_medio"')
+    return f"""
+            INSERT INTO "alertas_stock"
+                ("producto_id", "nivel_anterior", "nivel_nuevo", "almacen", "umbral_bajo")
+            SELECT n."producto_id", n.nivel_anterior, n.nivel_nuevo, n."almacen", n."umbral_bajo"
+            FROM (
+                SELECT c."producto_id", c."almacen", c."umbral_bajo",
+                       {antes} AS nivel_anterior,
+                       {despues} AS nivel_nuevo
+                FROM ({cruces}) c
+            ) n
+            WHERE n.nivel_anterior <> n.nivel_nuevo
+              AND (n.nivel_anterior IN {NIVELES_ALERTA} OR n.nivel_nuevo IN {NIVELES_ALERTA})
+            RETURNING "alerta_id", "producto_id", "nivel_anterior", "nivel_nuevo", "almacen",
+                      "umbral_bajo", "fecha"
+    """
+
+def alertas_de_filas(filas, inicio):
+    """Datos del evento `alerta_stock` de cada fila (producto_id primero y
+    COLUMNAS_ALERTA_EVENTO desde la posición `inicio`) que tuvo un cruce"""
+    alertas = []
+    for fila in filas:
+        if fila[inicio] is None:
+            continue
+        alerta_id, anterior, nuevo, almacen, umbral_bajo, fecha = fila[inicio:inicio + 6]
+        alertas.append({'alerta_id': alerta_id, 'producto_id': fila[0], 'nivel_anterior': anterior,
+                        'nivel_nuevo': nuevo, 'almacen': almacen, 'umbral_bajo': umbral_bajo,
+                        'fecha': fecha})
+    return alertas
+
+def aplicar_umbrales(cur, producto_ids=None, tipo_id=None):
+    """Recalcula los umbrales efectivos en producto_stock de esos productos (o
+    de los de la categoría `tipo_id`), crea la fila si no existe y registra
+    los cruces que provoca el cambio. Devuelve los ids de los productos
+    cuyo umbral cambió. Bloquea en orden de producto_id, como
+    registrar_movimientos_stock."""
+    if producto_ids is not None:
+        filtro, params = 'p."producto_id" = ANY(%s)', [list(producto_ids)]
+    else:
+        filtro, params = 'p."tipo_pieza_id" = %s', [tipo_id]
+    cur.execute(f"""
+        WITH antes AS (
+            SELECT ps."producto_id", ps."umbral_bajo", ps."umbral_medio"
+            FROM "producto_stock" ps JOIN "productos" p USING ("producto_id")
+            WHERE {filtro}
+        ), nuevos AS (
+            INSERT INTO "producto_stock" AS ps ("producto_id", "umbral_bajo", "umbral_medio")
+            SELECT p."producto_id", COALESCE(p."umbral_bajo", tp."umbral_bajo"),
+                   COALESCE(p."umbral_medio", tp."umbral_medio")
+            FROM "productos" p JOIN "tipos_pieza" tp ON tp."tipo_id" = p."tipo_pieza_id"
+            WHERE {filtro}
+            ORDER BY p."producto_id"
+            ON CONFLICT ("producto_id") DO UPDATE SET
+                "umbral_bajo" = EXCLUDED."umbral_bajo",
+                "umbral_medio" = EXCLUDED."umbral_medio"
+            WHERE (ps."umbral_bajo", ps."umbral_medio")
+                  IS DISTINCT FROM (EXCLUDED."umbral_bajo", EXCLUDED."umbral_medio")
+            RETURNING ps."producto_id", ps."almacen", ps."total", ps."umbral_bajo", ps."umbral_medio"
+        ), alertas AS ({insertar_alertas_sql('''
+            SELECT n."producto_id", n."almacen", n."total", n."umbral_bajo", n."umbral_medio",
+                   n."almacen" AS almacen_antes, n."total" AS total_antes,
+                   COALESCE(a."umbral_bajo", n."umbral_bajo") AS umbral_bajo_antes,
+                   COALESCE(a."umbral_medio", n."umbral_medio") AS umbral_medio_antes
+            FROM nuevos n LEFT JOIN antes a ON a."producto_id" = n."producto_id"''')})
+        SELECT n."producto_id", {COLUMNAS_ALERTA_EVENTO}
+        FROM nuevos n LEFT JOIN alertas a ON a."producto_id" = n."producto_id";
+    """, params * 2)
+    filas = cur.fetchall()
+    alertas = alertas_de_filas(filas, 1)
+    if alertas:
+        notificar_stock(cur, [], alertas)
+    return [fila[0] for fila in filas]
+
+def leer_umbrales(data, heredables=False):
+    """(umbral_bajo, umbral_medio) del JSON: enteros >= 0; con `heredables`
+    también null (usa el de la categoría). ValueError si no son válidos."""
+    umbrales = []
+    for campo in ('umbral_bajo', 'umbral_medio'):
+        valor = data.get(campo)
+        if valor is None and heredables:
+            umbrales.append(None)
+            continue
+        if isinstance(valor, bool) or not isinstance(valor, int) or valor < 0:
+            raise ValueError(f"'{campo}' debe ser un entero mayor o igual a 0"
+                             + (" (o null para usar el de la categoría)" if heredables else ""))
+        umbrales.append(valor)
+    bajo, medio = umbrales
+    if bajo is not None and medio is not None and medio < bajo:
+        raise ValueError("'umbral_medio' no puede ser menor que 'umbral_bajo'")
+    return bajo, medio
+
+# ====================================================================
+# EVENTOS DE STOCK EN TIEMPO REAL (LISTEN/NOTIFY + SSE)
+# ====================================================================
+# registrar_movimientos_stock publica los contadores nuevos de cada producto
+# con pg_notify en la misma transacción (PostgreSQL los entrega al hacer
+# commit, nunca si hay rollback). Cada worker abre UNA conexión LISTEN y
+# reparte los eventos a sus clientes de /api/inventario/eventos: cientos de
+# dashboards abiertos cuestan un listener por worker, no recargas periódicas.
+CANAL_EVENTOS = 'inventario_eventos'
+NOTIFY_MAX_BYTES = 7900        # PostgreSQL rechaza payloads de 8000 bytes o más
+SSE_LATIDO = float(os.environ.get('SSE_LATIDO', 15))
+SSE_DURACION_MAX = float(os.environ.get('SSE_DURACION_MAX', 1800))
+SSE_MAX_CLIENTES = int(os.environ.get('SSE_MAX_CLIENTES', 200))   # < --threads de gunicorn
+SSE_COLA_MAX = 256
+
+def notificar_evento(cur, tipo, datos):
+    cur.execute('SELECT pg_notify(%s, %s)', (CANAL_EVENTOS, json.dumps(dict(datos, tipo=tipo), separators=(',', ':'))))
+
+def notificar_stock(cur, filas, alertas=()):
+    """Publica [(producto_id, total, almacen, instalado, danado, retirado)] en
+    eventos `stock`, partidos para respetar el límite de tamaño de NOTIFY, cada
+    alerta en un evento `alerta_stock`, y en la misma sentencia la
+    invalidación `stock` de esos productos"""
+    filas = list(filas)
+    payloads, productos, tamano = [], [], 0
+    for producto_id, total, almacen, instalado, danado, retirado in filas:
+        producto = json.dumps({'producto_id': producto_id, 'total': total, 'almacen': almacen,
+                               'instalado': instalado, 'danado': danado, 'retirado': retirado},
+                              separators=(',', ':'))
+        if productos and tamano + len(producto) + 32 > NOTIFY_MAX_BYTES:
+            payloads.append('{"tipo":"stock","productos":[' + ','.join(productos) + ']}')
+            productos, tamano = [], 0
+        productos.append(producto)
+        tamano += len(producto) + 1
+    if productos:
+        payloads.append('{"tipo":"stock","productos":[' + ','.join(productos) + ']}')
+    for alerta in alertas:
+        payloads.append(json.dumps(dict(alerta, tipo='alerta_stock'), separators=(',', ':')))
+    if payloads:
+        canales = [CANAL_EVENTOS] * len(payloads) + [CANAL_INVALIDACION]
+        ids = {fila[0] for fila in filas} | {alerta['producto_id'] for alerta in alertas}
+        payloads.append(mensaje_invalidacion('stock', ids))
+        cur.execute('SELECT pg_notify(c, p) FROM unnest(%s::text[], %s::text[]) AS n(c, p)', (canales, payloads))
+
+class EscuchaEventos:
+    """Conexión LISTEN del worker que reparte cada notificación a las colas de
+    los clientes SSE suscritos.
+
+    El hilo arranca con el primer suscriptor y termina cuando no queda
+    ninguno (solo reconecta tras un error de la conexión). Tras una reconexión (o si la cola de un cliente se llena) el
+    cliente recibe `recargar`: pudo perder eventos y debe pedir todo de nuevo.
+    """
+
+    def __init__(self, canal=CANAL_EVENTOS, conectar=None):
+        self.canal = canal
+        self._conectar = conectar or get_db_connection
+        self._lock = threading.Lock()
+        self._suscriptores = set()
+        self._hilo = None
+        self._stats = {'notificaciones': 0, 'reconexiones': 0, 'desbordes': 0}
+
+    def suscribir(self):
+        """Cola nueva de (evento, datos), o None si se alcanzó SSE_MAX_CLIENTES"""
+        cola = queue.Queue(maxsize=SSE_COLA_MAX)
+        with self._lock:
+            if len(self._suscriptores) >= SSE_MAX_CLIENTES:
+                return None
+            self._suscriptores.add(cola)
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._escuchar, name='escucha-eventos', daemon=True)
+                self._hilo.start()
+        return cola
+
+    def desuscribir(self, cola):
+        with self._lock:
+            self._suscriptores.discard(cola)
+
+    def _repartir(self, evento, datos):
+        with self._lock:
+            colas = list(self._suscriptores)
+        for cola in colas:
+            try:
+                cola.put_nowait((evento, datos))
+            except queue.Full:
+                # Cliente que no lee: se descarta lo pendiente y se le pide recargar
+                with cola.mutex:
+                    cola.queue.clear()
+                cola.put_nowait(('recargar', '{}'))
+                self._stats['desbordes'] += 1
+
+    def _hay_suscriptores(self):
+        with self._lock:
+            if not self._suscriptores:
+                self._hilo = None
+                return False
+            return True
+
+    def _escuchar(self):
+        espera, reconexion = 1, False
+        while self._hay_suscriptores():
+            conn = self._conectar()
+            if conn is None:
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+                continue
+            try:
+                conn.autocommit = True
+                conn.cursor().execute(f'LISTEN "{self.canal}"')
+                print(f"📡 Escuchando {self.canal} (pid {os.getpid()})")
+                if reconexion:
+                    self._repartir('recargar', '{}')
+                espera = 1
+                while self._hay_suscriptores():
+                    if not select.select([conn], [], [], SSE_LATIDO)[0]:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        payload = conn.notifies.pop(0).payload
+                        try:
+                            evento = json.loads(payload).get('tipo', 'mensaje')
+                        except ValueError:
+                            continue
+                        self._stats['notificaciones'] += 1
+                        self._repartir(evento, payload)
+                # Sin suscriptores: _hay_suscriptores() ya soltó el hilo (_hilo = None) y
+                # el próximo suscriptor arranca otro; este no debe volver a escuchar
+                return
+            except (psycopg2.Error, OSError) as e:
+                print(f"⚠️ Escucha de eventos desconectada: {e}")
+                self._stats['reconexiones'] += 1
+                reconexion = True
+                time.sleep(espera)
+            finally:
+                conn.close()
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._stats, pid=os.getpid(), clientes=len(self._suscriptores),
+                        escuchando=self._hilo is not None)
+
+
+_escucha = None
+_escucha_pid = None
+
+def obtener_escucha():
+    """Listener del proceso actual (como el pool, uno por worker tras el fork)"""
+    global _escucha, _escucha_pid
+    if _escucha is None or _escucha_pid != os.getpid():
+        with _pool_lock:
+            if _escucha is None or _escucha_pid != os.getpid():
+                _escucha = EscuchaEventos()
+                _escucha_pid = os.getpid()
+    return _escucha
+
+@app.route('/api/inventario/eventos', methods=['GET'])
+@protected_route
+def eventos_inventario():
+    """Server-Sent Events con los cambios de stock (`stock`, `alerta_stock`, `producto_eliminado`, `recargar`).
+
+    La conexión se cierra tras SSE_DURACION_MAX segundos; EventSource
+    reconecta solo y la sesión se vuelve a validar.
+    """
+    escucha = obtener_escucha()
+    cola = escucha.suscribir()
+    if cola is None:
+        response = jsonify({"error": "Demasiados clientes de eventos en este worker"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+
+    def generar():
+        try:
+            yield 'retry: 5000\n\n'
+            limite = time.monotonic() + SSE_DURACION_MAX
+            while time.monotonic() < limite:
+                try:
+                    evento, datos = cola.get(timeout=SSE_LATIDO)
+                except queue.Empty:
+                    yield ': latido\n\n'
+                    continue
+                yield f'event: {evento}\ndata: {datos}\n\n'
+        finally:
+            escucha.desuscribir(cola)
+
+    response = Response(generar(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ====================================================================
+# BUS DE INVALIDACIÓN ENTRE WORKERS Y NODOS (LISTEN/NOTIFY)
+# ====================================================================
+# Lo que cada worker guarda en memoria (caché de referencia, snapshot de
+# estadísticas, detección de la búsqueda trigram) se descarta cuando otro
+# worker, de este u otro contenedor, confirma un cambio. Las escrituras
+# publican mensajes tipados con pg_notify en su transacción (llegan solo si
+# hay commit) y cada worker los recibe por una conexión LISTEN propia:
+#   producto   productos creados, editados o eliminados (ids)
+#   categoria  tipos de pieza creados (ids, o todos)
+#   stock      contadores de seriales por producto (ids)
+#   todo       vaciar todo lo que haya en memoria
+# Sin `ids` el mensaje aplica a todos los de su tipo. Mientras la conexión
+# no está escuchando (arranque, caída, reconexión) se pueden perder mensajes,
+# así que cada vez que (re)empieza a escuchar se vacía todo. Las versiones de
+# inventario_version siguen siendo la garantía: el bus adelanta la
+# invalidación en lugar de esperar el TTL o la próxima lectura.
+CANAL_INVALIDACION = 'inventario_invalidacion'
+TIPOS_INVALIDACION = ('producto', 'categoria', 'stock', 'todo')
+INVALIDACION_LATIDO = float(os.environ.get('INVALIDACION_LATIDO', 30))
+
+_manejadores_invalidacion = []
+
+if prometheus_client:
+    METRICA_INVALIDACIONES = prometheus_client.Counter(
+        'inventario_invalidaciones_total', 'Mensajes del bus de invalidación aplicados', ['tipo'])
+
+def al_invalidar(*tipos):
+    """Registra `funcion(tipo, ids)` para esos tipos de mensaje (y siempre para `todo`)"""
+    def registrar(funcion):
+        _manejadores_invalidacion.append((set(tipos) | {'todo'}, funcion))
+        return funcion
+    return registrar
+
+def mensaje_invalidacion(tipo, ids=None):
+    if tipo not in TIPOS_INVALIDACION:
+        raise ValueError(f"Tipo de invalidación desconocido: {tipo}")
+    mensaje = {'tipo': tipo}
+    if ids is not None:
+        mensaje['ids'] = sorted(set(ids))
+    payload = json.dumps(mensaje, separators=(',', ':'))
+    # Demasiados ids para un NOTIFY: se invalida el tipo completo
+    return payload if len(payload) <= NOTIFY_MAX_BYTES else json.dumps({'tipo': tipo})
+
+def publicar_invalidacion(cur, tipo, ids=None):
+    """Avisa a todos los workers cuando se confirme la transacción de `cur`"""
+    cur.execute('SELECT pg_notify(%s, %s)', (CANAL_INVALIDACION, mensaje_invalidacion(tipo, ids)))
+
+class BusInvalidacion:
+    """Conexión LISTEN del worker que aplica los mensajes de invalidación.
+
+    Corre mientras viva el proceso. Cada INVALIDACION_LATIDO segundos sin
+    mensajes comprueba la conexión con un SELECT 1, para notar también una
+    caída silenciosa de la red; al reconectar vacía todo.
+    """
+
+    def __init__(self, canal=CANAL_INVALIDACION, conectar=None):
+        self.canal = canal
+        self._conectar = conectar or (lambda: get_db_connection(application_name='inventario-invalidacion'))
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._escuchando = threading.Event()
+        self._stats = {'mensajes': 0, 'vaciados': 0, 'reconexiones': 0, 'descartados': 0,
+                       'por_tipo': collections.Counter(), 'ultimo_mensaje': None}
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._escuchar, name='bus-invalidacion', daemon=True)
+                self._hilo.start()
+        return self
+
+    def esperar_conexion(self, segundos):
+        return self._escuchando.wait(segundos)
+
+    def aplicar(self, tipo, ids=None):
+        for tipos, funcion in _manejadores_invalidacion:
+            if tipo in tipos:
+                try:
+                    funcion(tipo, ids)
+                except Exception as e:
+                    print(f"⚠️ Error invalidando {tipo} en {funcion.__name__}: {e}")
+        with self._lock:
+            self._stats['mensajes'] += 1
+            self._stats['por_tipo'][tipo] += 1
+            self._stats['ultimo_mensaje'] = time.time()
+            if tipo == 'todo':
+                self._stats['vaciados'] += 1
+        if prometheus_client:
+            METRICA_INVALIDACIONES.labels(tipo).inc()
+
+    def _recibir(self, payload):
+        try:
+            mensaje = json.loads(payload)
+            tipo = mensaje['tipo']
+            if tipo not in TIPOS_INVALIDACION:
+                raise ValueError(tipo)
+        except (ValueError, KeyError, TypeError):
+            # Un mensaje que no se entiende es un hueco: mejor vaciar todo
+            with self._lock:
+                self._stats['descartados'] += 1
+            self.aplicar('todo')
+            return
+        self.aplicar(tipo, mensaje.get('ids'))
+
+    def _escuchar(self):
+        espera = 1
+        while True:
+            conn = self._conectar()
+            if conn is None:
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+                continue
+            try:
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f'LISTEN "{self.canal}"')
+                # Lo que cambió mientras no se escuchaba no va a llegar
+                self.aplicar('todo')
+                self._escuchando.set()
+                print(f"🧹 Bus de invalidación escuchando {self.canal} (pid {os.getpid()})")
+                espera = 1
+                while True:
+                    if not select.select([conn], [], [], INVALIDACION_LATIDO)[0]:
+                        cur.execute('SELECT 1')
+                    conn.poll()
+                    while conn.notifies:
+                        self._recibir(conn.notifies.pop(0).payload)
+            except (psycopg2.Error, OSError) as e:
+                self._escuchando.clear()
+                print(f"⚠️ Bus de invalidación desconectado: {e}")
+                with self._lock:
+                    self._stats['reconexiones'] += 1
+                time.sleep(espera)
+            finally:
+                conn.close()
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._stats, por_tipo=dict(self._stats['por_tipo']), pid=os.getpid(),
+                        escuchando=self._escuchando.is_set())
+
+
+_bus = None
+_bus_pid = None
+
+def obtener_bus():
+    """Bus del proceso actual, ya iniciado (uno por worker tras el fork)"""
+    global _bus, _bus_pid
+    if _bus is None or _bus_pid != os.getpid():
+        with _pool_lock:
+            if _bus is None or _bus_pid != os.getpid():
+                _bus = BusInvalidacion().iniciar()
+                _bus_pid = os.getpid()
+    return _bus
+
+@al_invalidar('producto', 'stock')
+def _invalidar_estadisticas(tipo, ids):
+    invalidar_estadisticas()
+
+@al_invalidar('producto')
+def _invalidar_cache_productos(tipo, ids):
+    CACHE_REFERENCIA.vaciar('productos')
+
+@al_invalidar('categoria')
+def _invalidar_cache_categorias(tipo, ids):
+    CACHE_REFERENCIA.vaciar('tipos_pieza')
+
+@al_invalidar()
+def _vaciar_memoria(tipo, ids):
+    """Solo con `todo`: lo que no depende de ningún tipo en particular"""
+    global _busqueda_trgm
+    CACHE_REFERENCIA.vaciar()
+    _busqueda_trgm = None
+
+# ====================================================================
+# HISTORIAL DE ESTADOS (historial_estados)
+# ====================================================================
+# Tabla de solo inserción particionada por mes (migración 0007). Cada alta,
+# cambio de estado y baja de un serial deja una fila, escrita en la misma
+# transacción que el cambio. Las particiones se mantienen con:
+#   python historial.py crear | particiones | desacoplar --antes AAAA-MM
+def registrar_historial(cur, cambios):
+    """Agrega al historial los cambios (serial_id, producto_id, codigo, estado_anterior, estado_nuevo, notas).
+
+    - alta:              estado_anterior = None
+    - cambio de estado:  ambos estados
+    - baja:              estado_nuevo = None
+
+    Un solo INSERT ... unnest() para todo el lote.
+    """
+    if not cambios:
+        return
+    serial_ids, producto_ids, codigos, anteriores, nuevos, notas = (list(col) for col in zip(*cambios))
+    cur.execute("""
+        INSERT INTO "historial_estados"
+            ("serial_id", "producto_id", "codigo_unico_serial", "estado_anterior", "estado_nuevo", "notas")
+        SELECT * FROM unnest(%s::int[], %s::int[], %s::text[], %s::text[], %s::text[], %s::text[]);
+    """, (serial_ids, producto_ids, codigos, anteriores, nuevos, notas))
 
 # ====================================================================
 # API: REGISTRAR NUEVO SERIAL
@@ -751,7 +2660,6 @@ def agregar_serial():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
         data = request.get_json()
         
@@ -761,55 +2669,187 @@ def agregar_serial():
         producto_id = data['producto_id']
         codigo_unico_serial = data['codigo_unico_serial'].strip().upper()
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        # Verificar si el producto existe
-        cur.execute('SELECT nombre FROM productos WHERE producto_id = %s', (producto_id,))
-        producto = cur.fetchone()
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        if not producto:
-            return jsonify({"error": f"Producto ID {producto_id} no existe"}), 404
+            # Verificar si el producto existe
+            cur.execute('SELECT nombre FROM productos WHERE producto_id = %s', (producto_id,))
+            producto = cur.fetchone()
         
-        # Verificar si el serial ya existe
-        cur.execute('SELECT serial_id FROM seriales WHERE codigo_unico_serial = %s', (codigo_unico_serial,))
-        if cur.fetchone():
-            return jsonify({
-                "error": f"El serial {codigo_unico_serial} ya existe",
-                "codigo": "SERIAL_DUPLICADO"
-            }), 409
+            if not producto:
+                return jsonify({"error": f"Producto ID {producto_id} no existe"}), 404
         
-        # Insertar
-        insert_query = """
-        INSERT INTO "seriales" ("producto_id", "codigo_unico_serial", "estado")
-        VALUES (%s, %s, 'ALMACEN')
-        RETURNING "serial_id";
-        """
-        cur.execute(insert_query, (producto_id, codigo_unico_serial))
+            # Verificar si el serial ya existe
+            cur.execute('SELECT serial_id FROM seriales WHERE codigo_unico_serial = %s', (codigo_unico_serial,))
+            if cur.fetchone():
+                return jsonify({
+                    "error": f"El serial {codigo_unico_serial} ya existe",
+                    "codigo": "SERIAL_DUPLICADO"
+                }), 409
         
-        result = cur.fetchone()
-        serial_id = result['serial_id'] if result else None
+            # Insertar (y sumar al resumen de stock)
+            result = insertar_seriales(cur, producto_id, [codigo_unico_serial])
+            serial_id = result[0]['serial_id'] if result else None
         
-        conn.commit()
-        cur.close()
+            conn.commit()
+            cur.close()
         
-        return jsonify({
-            "mensaje": f"Serial {codigo_unico_serial} agregado",
-            "serial_id": serial_id,
-            "producto": producto['nombre']
-        }), 201
+            return jsonify({
+                "mensaje": f"Serial {codigo_unico_serial} agregado",
+                "serial_id": serial_id,
+                "producto": producto['nombre']
+            }), 201
 
     except IntegrityError as e:
         return jsonify({"error": "Error de integridad de datos"}), 409
     except Exception as e:
         print(f"Error agregando serial: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
+
+# ====================================================================
+# UTILIDADES: INSERCIÓN MASIVA DE SERIALES
+# ====================================================================
+ESTADOS_SERIAL = ['ALMACEN', 'INSTALADO', 'DAÑADO', 'RETIRADO']
+
+# Transiciones permitidas (estado actual -> estados destino). RETIRADO es
+# final: volver atrás requiere "forzar" (solo administradores). Quedarse en
+# el mismo estado siempre se acepta (solo cambia las notas).
+TRANSICIONES_ESTADO = {
+    'ALMACEN': {'INSTALADO', 'DAÑADO', 'RETIRADO'},
+    'INSTALADO': {'ALMACEN', 'DAÑADO', 'RETIRADO'},
+    'DAÑADO': {'ALMACEN', 'RETIRADO'},
+    'RETIRADO': set(),
+}
+
+def transicion_permitida(anterior, nuevo, forzar=False):
+    return forzar or anterior == nuevo or nuevo in TRANSICIONES_ESTADO.get(anterior, set())
+
+def normalizar_seriales(seriales):
+    """Normaliza (strip + upper) y separa los repetidos dentro del mismo lote.
+
+    Devuelve (únicos en orden de llegada, repetidos en el lote).
+    """
+    vistos = set()
+    unicos = []
+    repetidos = []
+    for serial in seriales:
+        serial_clean = str(serial).strip().upper()
+        if not serial_clean:
+            continue
+        if serial_clean in vistos:
+            if serial_clean not in repetidos:
+                repetidos.append(serial_clean)
+        else:
+            vistos.add(serial_clean)
+            unicos.append(serial_clean)
+    return unicos, repetidos
+
+def buscar_seriales_existentes(cur, codigos):
+    """Devuelve los códigos (ya normalizados) que ya existen en la BD, también
+    como filas antiguas sin normalizar (una sola consulta, índice de 0005)"""
+    if not codigos:
+        return []
+    cur.execute(
+        'SELECT upper(btrim("codigo_unico_serial")) FROM "seriales" WHERE upper(btrim("codigo_unico_serial")) = ANY(%s)',
+        (list(codigos),)
+    )
+    existentes = {row[0] for row in cur.fetchall()}
+    return [codigo for codigo in codigos if codigo in existentes]
+
+def insertar_seriales(cur, producto_id, codigos, estado='ALMACEN', notas='Alta'):
+    """Inserta todos los códigos en un solo INSERT ... SELECT unnest() y actualiza producto_stock e historial"""
+    if not codigos:
+        return []
+    cur.execute("""
+        INSERT INTO "seriales" ("producto_id", "codigo_unico_serial", "estado")
+        SELECT %s, t.codigo, %s
+        FROM unnest(%s::text[]) WITH ORDINALITY AS t(codigo, orden)
+        ORDER BY t.orden
+        RETURNING "serial_id", "codigo_unico_serial";
+    """, (producto_id, estado, list(codigos)))
+    insertados = [{"serial_id": row[0], "codigo_unico_serial": row[1]} for row in cur.fetchall()]
+    registrar_movimientos_stock(cur, [(producto_id, estado, len(insertados), len(insertados))])
+    registrar_historial(cur, [
+        (serial["serial_id"], producto_id, serial["codigo_unico_serial"], None, estado, notas)
+        for serial in insertados
+    ])
+    return insertados
+
+MAX_CANTIDAD_LOTE = 50000
+
+# Mayor sufijo numérico de <SKU>-NNN entre los seriales del producto (0 si no hay)
+MAYOR_SUFIJO_SQL = """COALESCE((
+            SELECT MAX(substr(s."codigo_unico_serial", length(%(prefijo)s) + 1)::bigint)
+            FROM "seriales" s
+            WHERE s."producto_id" = %(producto_id)s
+              AND left(s."codigo_unico_serial", length(%(prefijo)s)) = %(prefijo)s
+              AND substr(s."codigo_unico_serial", length(%(prefijo)s) + 1) ~ '^[0-9]{1,18}$'
+        ), 0)"""
+INTENTOS_SECUENCIA = 3
+
+def insertar_seriales_numerados(cur, producto_id, sku, cantidad, estado='ALMACEN', notas='Alta por lote generado'):
+    """Genera <SKU>-001, <SKU>-002... reservando el bloque en producto_secuencia_serial.
+
+    El UPDATE de la secuencia bloquea la fila del producto hasta el commit: dos
+    workers que generan para el mismo producto se serializan y nunca reciben
+    el mismo número. Reserva + INSERT van en una sola sentencia.
+
+    Un código del bloque que ya existe (cargado a mano por /serial, /seriales/lote
+    o la importación con el mismo formato) se salta: la secuencia se vuelve a
+    alinear con el mayor sufijo existente y se reservan los que faltan.
+    """
+    params = {'producto_id': producto_id, 'prefijo': f"{sku}-", 'cantidad': cantidad, 'estado': estado}
+
+    # Primera vez para este producto: arrancar desde el mayor sufijo numérico existente
+    cur.execute(f"""
+        INSERT INTO "producto_secuencia_serial" ("producto_id", "ultimo_numero")
+        SELECT %(producto_id)s, {MAYOR_SUFIJO_SQL}
+        WHERE NOT EXISTS (SELECT 1 FROM "producto_secuencia_serial" WHERE "producto_id" = %(producto_id)s)
+        ON CONFLICT ("producto_id") DO NOTHING;
+    """, params)
+
+    insertados = []
+    for _ in range(INTENTOS_SECUENCIA):
+        cur.execute("""
+            WITH reserva AS (
+                UPDATE "producto_secuencia_serial"
+                SET "ultimo_numero" = "ultimo_numero" + %(cantidad)s
+                WHERE "producto_id" = %(producto_id)s
+                RETURNING "ultimo_numero" - %(cantidad)s AS desde
+            ),
+            numeros AS (
+                SELECT g AS orden, (r.desde + g)::text AS numero
+                FROM reserva r CROSS JOIN generate_series(1, %(cantidad)s) g
+            )
+            INSERT INTO "seriales" ("producto_id", "codigo_unico_serial", "estado")
+            SELECT %(producto_id)s, %(prefijo)s || lpad(n.numero, greatest(3, length(n.numero)), '0'), %(estado)s
+            FROM numeros n
+            ORDER BY n.orden
+            ON CONFLICT DO NOTHING
+            RETURNING "serial_id", "codigo_unico_serial";
+        """, params)
+        insertados += [{"serial_id": row[0], "codigo_unico_serial": row[1]} for row in cur.fetchall()]
+        if len(insertados) == cantidad:
+            break
+        # Había códigos cargados a mano por delante de la secuencia: saltar hasta el mayor
+        cur.execute(f"""
+            UPDATE "producto_secuencia_serial"
+            SET "ultimo_numero" = GREATEST("ultimo_numero", {MAYOR_SUFIJO_SQL})
+            WHERE "producto_id" = %(producto_id)s;
+        """, params)
+        params['cantidad'] = cantidad - len(insertados)
+    else:
+        # Solo si se siguen cargando a mano códigos de la secuencia mientras se genera
+        raise IntegrityError("No se pudieron reservar códigos libres para el lote")
+    registrar_movimientos_stock(cur, [(producto_id, estado, len(insertados), len(insertados))])
+    registrar_historial(cur, [
+        (serial["serial_id"], producto_id, serial["codigo_unico_serial"], None, estado, notas)
+        for serial in insertados
+    ])
+    return insertados
 
 # ====================================================================
 # API: AGREGAR MÚLTIPLES SERIALES (NUEVO)
@@ -821,7 +2861,6 @@ def agregar_seriales_lote():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
         data = request.get_json()
         
@@ -834,109 +2873,436 @@ def agregar_seriales_lote():
         
         if not isinstance(seriales_list, list) or len(seriales_list) == 0:
             return jsonify({"error": "'seriales' debe ser una lista no vacía"}), 400
+        if estado not in ESTADOS_SERIAL:
+            return jsonify({"error": f"Estado no válido. Permitidos: {ESTADOS_SERIAL}"}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        # Verificar producto
-        cur.execute('SELECT nombre FROM productos WHERE producto_id = %s', (producto_id,))
-        producto = cur.fetchone()
-        if not producto:
-            return jsonify({"error": f"Producto ID {producto_id} no existe"}), 404
+            # Verificar producto
+            cur.execute('SELECT nombre FROM productos WHERE producto_id = %s', (producto_id,))
+            producto = cur.fetchone()
+            if not producto:
+                return jsonify({"error": f"Producto ID {producto_id} no existe"}), 404
         
-        # Verificar seriales duplicados
-        seriales_duplicados = []
-        seriales_validos = []
+            # Verificar duplicados: dentro del lote y contra la BD (una sola consulta)
+            seriales_validos, duplicados_en_lote = normalizar_seriales(seriales_list)
+            seriales_duplicados = buscar_seriales_existentes(cur, seriales_validos)
         
-        for serial in seriales_list:
-            serial_clean = str(serial).strip().upper()
-            if not serial_clean:
-                continue
-                
-            cur.execute('SELECT serial_id FROM seriales WHERE codigo_unico_serial = %s', (serial_clean,))
-            if cur.fetchone():
-                seriales_duplicados.append(serial_clean)
-            else:
-                seriales_validos.append(serial_clean)
+            if seriales_duplicados or duplicados_en_lote:
+                return jsonify({
+                    "error": "Algunos seriales ya existen o están repetidos en el lote",
+                    "duplicados": seriales_duplicados,
+                    "duplicados_en_lote": duplicados_en_lote
+                }), 409
+        
+            # Insertar seriales válidos en un solo INSERT
+            seriales_insertados = insertar_seriales(cur, producto_id, seriales_validos, estado, 'Alta por lote')
+        
+            conn.commit()
+            cur.close()
         
-        if seriales_duplicados:
             return jsonify({
-                "error": "Algunos seriales ya existen",
-                "duplicados": seriales_duplicados
-            }), 409
+                "mensaje": f"{len(seriales_insertados)} seriales agregados a '{producto['nombre']}'",
+                "seriales_agregados": seriales_insertados,
+                "total_agregado": len(seriales_insertados)
+            }), 201
         
-        # Insertar seriales válidos
-        seriales_insertados = []
-        for serial in seriales_validos:
-            cur.execute("""
-                INSERT INTO "seriales" ("producto_id", "codigo_unico_serial", "estado")
-                VALUES (%s, %s, %s)
-                RETURNING "serial_id", "codigo_unico_serial";
-            """, (producto_id, serial, estado))
+    except UniqueViolation:
+        return jsonify({"error": "Algunos seriales ya existen", "codigo": "SERIAL_DUPLICADO"}), 409
+    except Exception as e:
+        print(f"Error agregando seriales en lote: {e}")
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+# ====================================================================
+# API: IMPORTAR SERIALES DESDE ARCHIVO (CSV / NDJSON) VÍA COPY
+# ====================================================================
+MAX_ERRORES_REPORTE = 1000
+
+class _LectorCopy:
+    """Adapta un generador de filas al read() que usa copy_expert.
+
+    Solo mantiene en memoria el bloque que PostgreSQL pide en cada lectura,
+    así el archivo completo nunca se materializa en el worker.
+    """
+
+    def __init__(self, filas):
+        self._filas = filas
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        self._agotado = False
+
+    def read(self, size=-1):
+        while not self._agotado and (size < 0 or self._buffer.tell() < size):
+            fila = next(self._filas, None)
+            if fila is None:
+                self._agotado = True
+                break
+            self._writer.writerow(fila)
+        datos = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return datos
+
+    readline = read
+
+class _FlujoBinario(io.RawIOBase):
+    """Adapta request.stream a io.RawIOBase para poder envolverlo en TextIOWrapper.
+
+    Con gunicorn el stream es un objeto propio sin readable()/readinto().
+    """
+
+    def __init__(self, flujo):
+        self._flujo = flujo
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        datos = self._flujo.read(len(buffer))
+        buffer[:len(datos)] = datos
+        return len(datos)
+
+def _detectar_formato(nombre, content_type):
+    """csv o ndjson según ?formato=, extensión del archivo o Content-Type"""
+    formato = request.args.get('formato', '').lower()
+    if formato in ('csv', 'ndjson'):
+        return formato
+    nombre = (nombre or '').lower()
+    content_type = (content_type or '').lower()
+    if nombre.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonlines' in content_type:
+        return 'ndjson'
+    return 'csv'
+
+def _leer_registros(texto, formato):
+    """Genera (linea, dict) desde el archivo sin cargarlo completo"""
+    if formato == 'ndjson':
+        for linea, contenido in enumerate(texto, start=1):
+            if not contenido.strip():
+                continue
+            try:
+                registro = json.loads(contenido)
+            except ValueError:
+                registro = None
+            yield linea, registro if isinstance(registro, dict) else None
+    else:
+        lector = csv.DictReader(texto)
+        for registro in lector:
+            yield lector.line_num, {k.strip().lower(): v for k, v in registro.items() if k}
+
+def _filas_importacion(registros, errores):
+    """Valida cada registro y genera filas para COPY; los errores se acumulan"""
+    for linea, registro in registros:
+        if registro is None:
+            errores['total'] += 1
+            if len(errores['filas']) < MAX_ERRORES_REPORTE:
+                errores['filas'].append({"linea": linea, "serial": None, "error": "FORMATO_INVALIDO"})
+            continue
+
+        serial = str(registro.get('serial') or registro.get('codigo_unico_serial') or '').strip().upper()
+        sku = str(registro.get('sku') or registro.get('codigo_sku') or '').strip()
+        producto_id = str(registro.get('producto_id') or '').strip()
+        estado = str(registro.get('estado') or 'ALMACEN').strip().upper()
+        notas = registro.get('notas') or None
+
+        error = None
+        if not serial:
+            error = "SERIAL_VACIO"
+        elif not producto_id and not sku:
+            error = "FALTA_PRODUCTO"
+        elif producto_id and not producto_id.isdigit():
+            error = "PRODUCTO_ID_INVALIDO"
+        elif estado not in ESTADOS_SERIAL:
+            error = "ESTADO_INVALIDO"
+
+        if error:
+            errores['total'] += 1
+            if len(errores['filas']) < MAX_ERRORES_REPORTE:
+                errores['filas'].append({"linea": linea, "serial": serial or None, "error": error})
+            continue
+
+        yield (linea, producto_id or None, sku or None, serial, estado, notas)
+
+@app.route('/api/inventario/seriales/importar', methods=['POST', 'OPTIONS'])
+@protected_route
+def importar_seriales():
+    """Importa seriales desde un archivo CSV o NDJSON usando COPY FROM STDIN.
+
+    Acepta el archivo como cuerpo crudo (text/csv, application/x-ndjson) o como
+    multipart en el campo 'archivo'. Columnas: producto_id o sku, serial,
+    estado (opcional, ALMACEN por defecto) y notas (opcional).
+    Con ?estricto=1 no se importa nada si alguna fila tiene errores.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    try:
+        if request.content_type and request.content_type.startswith('multipart/form-data'):
+            archivo = request.files.get('archivo')
+            if not archivo:
+                return jsonify({"error": "Falta el archivo (campo 'archivo')"}), 400
+            flujo = archivo.stream
+            formato = _detectar_formato(archivo.filename, archivo.content_type)
+        else:
+            flujo = request.stream
+            formato = _detectar_formato(None, request.content_type)
+        
+        estricto = request.args.get('estricto', '').lower() in ('1', 'true', 'si')
+        texto = io.TextIOWrapper(io.BufferedReader(_FlujoBinario(flujo)), encoding='utf-8-sig', newline='')
+        errores = {"total": 0, "filas": []}
+        
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-            resultado = cur.fetchone()
-            seriales_insertados.append(dict(resultado))
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        conn.commit()
-        cur.close()
+            cur.execute("""
+                CREATE TEMP TABLE "importacion_seriales" (
+                    "linea" INTEGER,
+                    "producto_id" INTEGER,
+                    "sku" TEXT,
+                    "serial" TEXT,
+                    "estado" TEXT,
+                    "notas" TEXT,
+                    "error" TEXT
+                ) ON COMMIT DROP;
+            """)
+        
+            # 1. Stream del archivo -> tabla temporal
+            filas = _filas_importacion(_leer_registros(texto, formato), errores)
+            cur.copy_expert(
+                'COPY "importacion_seriales" ("linea", "producto_id", "sku", "serial", "estado", "notas") '
+                'FROM STDIN WITH (FORMAT csv)',
+                _LectorCopy(filas)
+            )
+            cur.execute('SELECT COUNT(*) FROM "importacion_seriales"')
+            total_filas = cur.fetchone()[0] + errores['total']
+        
+            # 2. Resolver SKU y detectar conflictos en bloque
+            cur.execute("""
+                UPDATE "importacion_seriales" i
+                SET "producto_id" = p."producto_id"
+                FROM "productos" p
+                WHERE i."producto_id" IS NULL AND p."codigo_sku" = i."sku";
+            """)
+            cur.execute("""
+                UPDATE "importacion_seriales" i
+                SET "error" = 'PRODUCTO_NO_EXISTE'
+                WHERE NOT EXISTS (SELECT 1 FROM "productos" p WHERE p."producto_id" = i."producto_id");
+            """)
+            cur.execute("""
+                UPDATE "importacion_seriales" i
+                SET "error" = 'SERIAL_REPETIDO_EN_ARCHIVO'
+                FROM (
+                    SELECT "linea", ROW_NUMBER() OVER (PARTITION BY "serial" ORDER BY "linea") AS rn
+                    FROM "importacion_seriales"
+                    WHERE "error" IS NULL
+                ) r
+                WHERE r."linea" = i."linea" AND r.rn > 1;
+            """)
+            cur.execute("""
+                UPDATE "importacion_seriales" i
+                SET "error" = 'SERIAL_EXISTENTE'
+                FROM "seriales" s
+                WHERE i."error" IS NULL AND upper(btrim(s."codigo_unico_serial")) = i."serial";
+            """)
         
-        return jsonify({
-            "mensaje": f"{len(seriales_insertados)} seriales agregados a '{producto['nombre']}'",
-            "seriales_agregados": seriales_insertados,
-            "total_agregado": len(seriales_insertados)
-        }), 201
+            cur.execute("""
+                SELECT "linea", "serial", "error"
+                FROM "importacion_seriales"
+                WHERE "error" IS NOT NULL
+                ORDER BY "linea"
+                LIMIT %s;
+            """, (max(0, MAX_ERRORES_REPORTE - len(errores['filas'])),))
+            errores['filas'].extend(dict(row) for row in cur.fetchall())
+            errores['filas'].sort(key=lambda e: e['linea'])
+            cur.execute('SELECT COUNT(*) FROM "importacion_seriales" WHERE "error" IS NOT NULL')
+            errores['total'] += cur.fetchone()[0]
+        
+            if estricto and errores['total']:
+                conn.rollback()
+                return jsonify({
+                    "error": "Importación cancelada: el archivo tiene filas con errores",
+                    "total_filas": total_filas,
+                    "importados": 0,
+                    "total_errores": errores['total'],
+                    "errores": errores['filas'],
+                    "errores_truncados": errores['total'] > len(errores['filas'])
+                }), 400
+        
+            # 3. Merge a seriales + historial. ON CONFLICT sin columna cubre las
+            #    inserciones concurrentes contra cualquier índice único, también
+            #    el del código normalizado (filas antiguas sin normalizar)
+            cur.execute("""
+                WITH nuevos AS (
+                    INSERT INTO "seriales" ("producto_id", "codigo_unico_serial", "estado", "notas")
+                    SELECT "producto_id", "serial", "estado", "notas"
+                    FROM "importacion_seriales"
+                    WHERE "error" IS NULL
+                    ORDER BY "linea"
+                    ON CONFLICT DO NOTHING
+                    RETURNING "serial_id", "producto_id", "codigo_unico_serial", "estado"
+                ),
+                historial AS (
+                    INSERT INTO "historial_estados"
+                        ("serial_id", "producto_id", "codigo_unico_serial", "estado_nuevo", "notas")
+                    SELECT "serial_id", "producto_id", "codigo_unico_serial", "estado", 'Importación'
+                    FROM nuevos
+                )
+                SELECT "producto_id", "estado", COUNT(*)::int AS cantidad
+                FROM nuevos
+                GROUP BY "producto_id", "estado";
+            """)
+            conteos = cur.fetchall()
+            registrar_movimientos_stock(cur, [
+                (row['producto_id'], row['estado'], row['cantidad'], row['cantidad']) for row in conteos
+            ])
+            importados = sum(row['cantidad'] for row in conteos)
+            validos = total_filas - errores['total']
+        
+            conn.commit()
+            cur.close()
         
+            return jsonify({
+                "mensaje": f"{importados} seriales importados de {total_filas} filas",
+                "total_filas": total_filas,
+                "importados": importados,
+                "omitidos_por_concurrencia": validos - importados,
+                "total_errores": errores['total'],
+                "errores": errores['filas'],
+                "errores_truncados": errores['total'] > len(errores['filas'])
+            }), 201 if importados else 400
+        
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"error": f"Archivo ilegible: {str(e)}"}), 400
     except Exception as e:
-        if conn:
-            conn.rollback()
-        print(f"Error agregando seriales en lote: {e}")
+        print(f"❌ Error importando seriales: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 # ====================================================================
 # API: OBTENER SERIALES POR PRODUCTO
 # ====================================================================
+CONSULTA_SERIALES_PRODUCTO = """
+SELECT "serial_id", "codigo_unico_serial", "estado", 
+       TO_CHAR("fecha_registro", 'YYYY-MM-DD HH24:MI') AS fecha_ingreso,
+       "notas"
+FROM "seriales" 
+WHERE "producto_id" = %s
+ORDER BY "estado", "codigo_unico_serial";
+"""
+
 @app.route('/api/inventario/seriales/<int:producto_id>', methods=['GET', 'OPTIONS'])
 @protected_route
+@con_version
 def obtener_seriales_por_producto(producto_id):
     """Obtiene todos los seriales de un producto específico"""
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        if pide_ndjson():
+            return responder_ndjson('seriales_producto', CONSULTA_SERIALES_PRODUCTO, (producto_id,))
+
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
-        SELECT "serial_id", "codigo_unico_serial", "estado", 
-               TO_CHAR("fecha_registro", 'YYYY-MM-DD HH24:MI') AS fecha_ingreso,
-               "notas"
-        FROM "seriales" 
-        WHERE "producto_id" = %s
-        ORDER BY "estado", "codigo_unico_serial";
-        """
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        cur.execute(query, (producto_id,))
-        seriales = [dict(row) for row in cur.fetchall()]
-        cur.close()
+            cur.execute(CONSULTA_SERIALES_PRODUCTO, (producto_id,))
+            seriales = [dict(row) for row in cur.fetchall()]
+            cur.close()
         
-        return jsonify(seriales)
+            return jsonify(seriales)
     
     except Exception as e:
         print(f"Error en /seriales: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
+
+# ====================================================================
+# API: BUSCAR SERIAL POR CÓDIGO (LECTOR DE BARRAS)
+# ====================================================================
+# Usa upper(btrim(...)), la misma expresión que el índice único de
+# migraciones/0005_seriales_codigo_normalizado.sql: un index scan por código.
+MAX_CODIGOS_LOOKUP = 1000
+
+CONSULTA_LOOKUP_SERIALES = """
+SELECT
+    s."serial_id",
+    s."codigo_unico_serial",
+    s."estado",
+    TO_CHAR(s."fecha_registro", 'YYYY-MM-DD HH24:MI') AS fecha_ingreso,
+    TO_CHAR(s."fecha_actualizacion", 'YYYY-MM-DD HH24:MI') AS fecha_actualizacion,
+    s."notas",
+    p."producto_id",
+    p."nombre" AS producto,
+    p."marca",
+    p."modelo",
+    p."codigo_sku",
+    tp."tipo_id" AS tipo_pieza_id,
+    tp."tipo_modelo" AS categoria
+FROM "seriales" s
+JOIN "productos" p ON p."producto_id" = s."producto_id"
+JOIN "tipos_pieza" tp ON tp."tipo_id" = p."tipo_pieza_id"
+WHERE upper(btrim(s."codigo_unico_serial")) = ANY(%s);
+"""
+
+def buscar_seriales_por_codigo(cur, codigos):
+    """Resuelve varios códigos normalizados en una sola consulta: {codigo: fila}"""
+    if not codigos:
+        return {}
+    cur.execute(CONSULTA_LOOKUP_SERIALES, (list(codigos),))
+    return {row['codigo_unico_serial'].strip().upper(): dict(row) for row in cur.fetchall()}
+
+@app.route('/api/inventario/serial/lookup', methods=['GET', 'POST', 'OPTIONS'])
+@protected_route
+@con_version
+def lookup_serial():
+    """GET ?code=X resuelve un serial; POST {"codes": [...]} resuelve un lote"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    try:
+        if request.method == 'GET':
+            codigo = request.args.get('code', '').strip().upper()
+            if not codigo:
+                return jsonify({"error": "Falta el parámetro 'code'"}), 400
+            codigos = [codigo]
+        else:
+            data = request.get_json(silent=True) or {}
+            codigos_recibidos = data.get('codes')
+            if not isinstance(codigos_recibidos, list) or not codigos_recibidos:
+                return jsonify({"error": "'codes' debe ser una lista no vacía"}), 400
+            if len(codigos_recibidos) > MAX_CODIGOS_LOOKUP:
+                return jsonify({"error": f"Máximo {MAX_CODIGOS_LOOKUP} códigos por consulta"}), 400
+            codigos, _ = normalizar_seriales(codigos_recibidos)
+
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+            cur = conn.cursor(cursor_factory=DictCursor)
+            encontrados = buscar_seriales_por_codigo(cur, codigos)
+            cur.close()
+
+        if request.method == 'GET':
+            if codigo not in encontrados:
+                return jsonify({"error": f"Serial {codigo} no encontrado", "codigo": "SERIAL_NO_EXISTE"}), 404
+            return jsonify(encontrados[codigo])
+
+        return jsonify({
+            "encontrados": [encontrados[c] for c in codigos if c in encontrados],
+            "no_encontrados": [c for c in codigos if c not in encontrados],
+            "total": len(codigos)
+        })
+
+    except Exception as e:
+        print(f"Error en lookup de serial: {e}")
+        return jsonify({"error": f"Error: {str(e)}"}), 500
 
 # ====================================================================
 # API: ACTUALIZAR ESTADO DE SERIAL
@@ -948,7 +3314,6 @@ def actualizar_estado_serial(serial_id):
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
         data = request.get_json()
         
@@ -957,45 +3322,255 @@ def actualizar_estado_serial(serial_id):
 
         nuevo_estado = data['estado']
         notas = data.get('notas', '')
+        forzar = bool(data.get('forzar'))
         
         # Validar estado
-        estados_permitidos = ['ALMACEN', 'INSTALADO', 'DAÑADO', 'RETIRADO']
+        estados_permitidos = ESTADOS_SERIAL
         if nuevo_estado not in estados_permitidos:
             return jsonify({"error": f"Estado no válido. Permitidos: {estados_permitidos}"}), 400
+        if forzar and session.get('role') != 'admin':
+            return jsonify({"error": "Solo administradores pueden forzar transiciones"}), 403
 
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        update_query = """
-        UPDATE "seriales" 
-        SET "estado" = %s, "notas" = %s, "fecha_actualizacion" = CURRENT_TIMESTAMP
-        WHERE "serial_id" = %s
-        RETURNING "serial_id", "codigo_unico_serial", "estado";
-        """
-        cur.execute(update_query, (nuevo_estado, notas, serial_id))
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        result = cur.fetchone()
-        
-        if not result:
-            return jsonify({"error": "Serial no encontrado"}), 404
+            # Validar la transición con la fila ya bloqueada
+            cur.execute("""
+                SELECT "estado", "producto_id" FROM "seriales" WHERE "serial_id" = %s FOR UPDATE
+            """, (serial_id,))
+            actual = cur.fetchone()
+            if not actual:
+                return jsonify({"error": "Serial no encontrado"}), 404
+            if not transicion_permitida(actual['estado'], nuevo_estado, forzar):
+                return jsonify({
+                    "error": f"No se permite pasar de {actual['estado']} a {nuevo_estado} (requiere 'forzar')",
+                    "codigo": "TRANSICION_NO_PERMITIDA"
+                }), 409
+        
+            # La fila sigue bloqueada: el estado anterior es el que se acaba de leer
+            cur.execute("""
+                UPDATE "seriales"
+                SET "estado" = %s, "notas" = %s, "fecha_actualizacion" = CURRENT_TIMESTAMP
+                WHERE "serial_id" = %s
+                RETURNING "serial_id", "codigo_unico_serial", "estado";
+            """, (nuevo_estado, notas, serial_id))
+            result = cur.fetchone()
+        
+            if actual['estado'] != nuevo_estado:
+                registrar_movimientos_stock(cur, [
+                    (actual['producto_id'], actual['estado'], -1, 0),
+                    (actual['producto_id'], nuevo_estado, 1, 0),
+                ])
+                registrar_historial(cur, [(result['serial_id'], actual['producto_id'], result['codigo_unico_serial'],
+                                           actual['estado'], nuevo_estado, notas)])
             
-        conn.commit()
-        cur.close()
+            conn.commit()
+            cur.close()
         
-        return jsonify({
-            "mensaje": f"Serial {result['codigo_unico_serial']} actualizado a {nuevo_estado}",
-            "serial": dict(result)
-        })
+            return jsonify({
+                "mensaje": f"Serial {result['codigo_unico_serial']} actualizado a {nuevo_estado}",
+                "serial": {
+                    "serial_id": result['serial_id'],
+                    "codigo_unico_serial": result['codigo_unico_serial'],
+                    "estado": result['estado']
+                }
+            })
         
     except Exception as e:
         print(f"Error actualizando serial: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
+
+# ====================================================================
+# API: CAMBIO DE ESTADO MASIVO
+# ====================================================================
+# Un lote de cientos/miles de seriales en una transacción y un número fijo
+# de sentencias: SELECT ... FOR UPDATE (en orden de serial_id, sin
+# deadlocks entre lotes), validación en Python, un UPDATE ... FROM unnest()
+# y los mismos registros de stock e historial que el PUT individual.
+MAX_TRANSICIONES_LOTE = 10000
+
+def _pedidos_transicion(items):
+    """Normaliza la lista 'seriales' del body.
+
+    Cada elemento es un serial_id (int), un código (str) o un objeto
+    {"serial_id" | "codigo", "fecha_actualizacion"}; con fecha_actualizacion
+    el cambio solo se aplica si el serial no se modificó desde entonces.
+    Lanza ValueError si algún elemento es inválido.
+    """
+    pedidos = []
+    for posicion, item in enumerate(items):
+        esperada = None
+        if isinstance(item, dict):
+            if item.get('fecha_actualizacion'):
+                try:
+                    esperada = datetime.fromisoformat(item['fecha_actualizacion'])
+                except (TypeError, ValueError):
+                    raise ValueError(f"Elemento {posicion}: 'fecha_actualizacion' inválida")
+            item = item.get('serial_id', item.get('codigo'))
+        if isinstance(item, bool) or not isinstance(item, (int, str)) or (isinstance(item, str) and not item.strip()):
+            raise ValueError(f"Elemento {posicion}: se espera serial_id, código u objeto con uno de ellos")
+        if isinstance(item, int):
+            pedidos.append({'serial_id': item, 'codigo': None, 'esperada': esperada})
+        else:
+            pedidos.append({'serial_id': None, 'codigo': item.strip().upper(), 'esperada': esperada})
+    return pedidos
+
+def _esperadas_en_hora_sesion(cur, pedidos):
+    """Pasa las fecha_actualizacion con zona horaria ("...Z", "...-05:00") a la
+    hora local de la sesión, sin zona, como la columna TIMESTAMP con la que
+    se comparan. Las que vienen sin zona ya están en esa hora."""
+    con_zona = [p for p in pedidos if p['esperada'] is not None and p['esperada'].tzinfo is not None]
+    if not con_zona:
+        return
+    cur.execute("""
+        SELECT f AT TIME ZONE current_setting('TimeZone')
+        FROM unnest(%s::timestamptz[]) WITH ORDINALITY AS e(f, orden)
+        ORDER BY orden;
+    """, ([p['esperada'] for p in con_zona],))
+    for pedido, fila in zip(con_zona, cur.fetchall()):
+        pedido['esperada'] = fila[0]
+
+@app.route('/api/inventario/seriales/estado', methods=['POST', 'OPTIONS'])
+@protected_route
+def cambiar_estado_seriales():
+    """Cambia el estado de muchos seriales a la vez, con resultado por elemento.
+
+    Body: {"seriales": [...], "estado": "INSTALADO", "notas": "...", "forzar": false}
+    Resultados: ACTUALIZADO, SIN_CAMBIO, NO_ENCONTRADO, TRANSICION_NO_PERMITIDA,
+    CONFLICTO (fecha_actualizacion distinta) y REPETIDO (mismo serial dos veces).
+    Con ?estricto=1 no se aplica nada si algún elemento no queda ACTUALIZADO
+    o SIN_CAMBIO.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    try:
+        data = request.get_json()
+
+        if not data or 'seriales' not in data or 'estado' not in data:
+            return jsonify({"error": "Faltan datos (seriales o estado)"}), 400
+
+        nuevo_estado = data['estado']
+        notas = data.get('notas') or None
+        forzar = bool(data.get('forzar'))
+        estricto = request.args.get('estricto') in ('1', 'true')
+        items = data['seriales']
+
+        if nuevo_estado not in ESTADOS_SERIAL:
+            return jsonify({"error": f"Estado no válido. Permitidos: {ESTADOS_SERIAL}"}), 400
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "'seriales' debe ser una lista no vacía"}), 400
+        if len(items) > MAX_TRANSICIONES_LOTE:
+            return jsonify({"error": f"Máximo {MAX_TRANSICIONES_LOTE} seriales por petición"}), 400
+        if forzar and session.get('role') != 'admin':
+            return jsonify({"error": "Solo administradores pueden forzar transiciones"}), 403
+        try:
+            pedidos = _pedidos_transicion(items)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+            cur = conn.cursor(cursor_factory=DictCursor)
+            _esperadas_en_hora_sesion(cur, pedidos)
+
+            # 1. Leer y bloquear todos los seriales pedidos
+            ids = [p['serial_id'] for p in pedidos if p['serial_id'] is not None]
+            codigos = [p['codigo'] for p in pedidos if p['codigo'] is not None]
+            cur.execute("""
+                SELECT "serial_id", "producto_id", "codigo_unico_serial", "estado", "fecha_actualizacion",
+                       upper(btrim("codigo_unico_serial")) AS codigo_normalizado
+                FROM "seriales"
+                WHERE "serial_id" = ANY(%s) OR upper(btrim("codigo_unico_serial")) = ANY(%s)
+                ORDER BY "serial_id"
+                FOR UPDATE;
+            """, (ids, codigos))
+            filas = cur.fetchall()
+            por_id = {fila['serial_id']: fila for fila in filas}
+            por_codigo = {fila['codigo_normalizado']: fila for fila in filas}
+
+            # 2. Decidir cada elemento
+            resultados, cambios, vistos = [], [], set()
+            for pedido, item in zip(pedidos, items):
+                fila = por_id.get(pedido['serial_id']) if pedido['serial_id'] is not None else por_codigo.get(pedido['codigo'])
+                resultado = {"entrada": item, "serial_id": None, "codigo_unico_serial": None, "estado_anterior": None}
+                if fila is None:
+                    resultado['resultado'] = 'NO_ENCONTRADO'
+                else:
+                    resultado.update(serial_id=fila['serial_id'], codigo_unico_serial=fila['codigo_unico_serial'],
+                                     estado_anterior=fila['estado'],
+                                     fecha_actualizacion=fila['fecha_actualizacion'] and fila['fecha_actualizacion'].isoformat())
+                    if fila['serial_id'] in vistos:
+                        resultado['resultado'] = 'REPETIDO'
+                    elif pedido['esperada'] is not None and pedido['esperada'] != fila['fecha_actualizacion']:
+                        resultado['resultado'] = 'CONFLICTO'
+                    elif not transicion_permitida(fila['estado'], nuevo_estado, forzar):
+                        resultado['resultado'] = 'TRANSICION_NO_PERMITIDA'
+                    elif fila['estado'] == nuevo_estado:
+                        resultado['resultado'] = 'SIN_CAMBIO'
+                    else:
+                        resultado['resultado'] = 'ACTUALIZADO'
+                        cambios.append(fila)
+                    vistos.add(fila['serial_id'])
+                resultados.append(resultado)
+
+            resumen = {}
+            for resultado in resultados:
+                resumen[resultado['resultado']] = resumen.get(resultado['resultado'], 0) + 1
+
+            if estricto and set(resumen) - {'ACTUALIZADO', 'SIN_CAMBIO'}:
+                conn.rollback()
+                return jsonify({
+                    "error": "Cambio cancelado: hay seriales que no se pueden actualizar",
+                    "actualizados": 0,
+                    "resumen": resumen,
+                    "resultados": resultados
+                }), 409
+
+            # 3. Un solo UPDATE para todo el lote + stock + historial
+            if cambios:
+                cur.execute("""
+                    UPDATE "seriales" s
+                    SET "estado" = %s, "notas" = COALESCE(%s, s."notas"), "fecha_actualizacion" = CURRENT_TIMESTAMP
+                    FROM unnest(%s::int[]) AS c("serial_id")
+                    WHERE s."serial_id" = c."serial_id"
+                    RETURNING s."fecha_actualizacion";
+                """, (nuevo_estado, notas, [fila['serial_id'] for fila in cambios]))
+                fecha_nueva = cur.fetchone()['fecha_actualizacion'].isoformat()
+                registrar_movimientos_stock(cur, [
+                    movimiento for fila in cambios for movimiento in (
+                        (fila['producto_id'], fila['estado'], -1, 0),
+                        (fila['producto_id'], nuevo_estado, 1, 0),
+                    )
+                ])
+                registrar_historial(cur, [
+                    (fila['serial_id'], fila['producto_id'], fila['codigo_unico_serial'], fila['estado'], nuevo_estado, notas)
+                    for fila in cambios
+                ])
+                for resultado in resultados:
+                    if resultado['resultado'] == 'ACTUALIZADO':
+                        resultado['fecha_actualizacion'] = fecha_nueva
+
+            conn.commit()
+            cur.close()
+
+            return jsonify({
+                "mensaje": f"{len(cambios)} seriales pasaron a {nuevo_estado}",
+                "estado": nuevo_estado,
+                "total": len(items),
+                "actualizados": len(cambios),
+                "resumen": resumen,
+                "resultados": resultados
+            })
+
+    except Exception as e:
+        print(f"❌ Error en cambio de estado masivo: {e}")
+        return jsonify({"error": f"Error: {str(e)}"}), 500
 
 # ====================================================================
 # API: ELIMINAR SERIAL
@@ -1007,200 +3582,875 @@ def eliminar_serial(serial_id):
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
         if session.get('role') != 'admin':
             return jsonify({"error": "Solo administradores pueden eliminar seriales"}), 403
 
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        # Obtener información del serial
-        cur.execute('SELECT "codigo_unico_serial" FROM "seriales" WHERE "serial_id" = %s', (serial_id,))
-        serial = cur.fetchone()
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        if not serial:
-            return jsonify({"error": "Serial no encontrado"}), 404
+            # Obtener información del serial
+            cur.execute('SELECT "codigo_unico_serial" FROM "seriales" WHERE "serial_id" = %s', (serial_id,))
+            serial = cur.fetchone()
         
-        # Eliminar primero del historial
-        cur.execute('DELETE FROM "historial_estados" WHERE "serial_id" = %s', (serial_id,))
+            if not serial:
+                return jsonify({"error": "Serial no encontrado"}), 404
         
-        # Eliminar serial
-        cur.execute('DELETE FROM "seriales" WHERE "serial_id" = %s', (serial_id,))
+            # Eliminar serial (restarlo del resumen de stock y dejar la baja en el historial)
+            cur.execute('DELETE FROM "seriales" WHERE "serial_id" = %s RETURNING "producto_id", "estado"', (serial_id,))
+            eliminado = cur.fetchone()
+            if eliminado:
+                registrar_movimientos_stock(cur, [(eliminado['producto_id'], eliminado['estado'], -1, -1)])
+                registrar_historial(cur, [(serial_id, eliminado['producto_id'], serial['codigo_unico_serial'],
+                                           eliminado['estado'], None, 'Baja')])
         
-        conn.commit()
-        cur.close()
+            conn.commit()
+            cur.close()
         
-        return jsonify({
-            "mensaje": f"Serial {serial['codigo_unico_serial']} eliminado"
-        })
+            return jsonify({
+                "mensaje": f"Serial {serial['codigo_unico_serial']} eliminado"
+            })
         
     except Exception as e:
         print(f"Error eliminando serial: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
+
+# ====================================================================
+# API: HISTORIAL DE ESTADOS
+# ====================================================================
+# Ambas consultas filtran por fecha_cambio (la clave de partición) para que
+# PostgreSQL descarte los meses fuera del rango: el historial de un serial
+# empieza en su fecha_registro (poda en ejecución) y el de un rango usa los
+# límites pedidos (poda al planificar).
+LIMITE_HISTORIAL_DEFECTO = 100
+LIMITE_HISTORIAL_MAX = 1000
+DIAS_HISTORIAL_DEFECTO = 30
+
+COLUMNAS_HISTORIAL = """
+    h."historial_id",
+    h."serial_id",
+    h."producto_id",
+    h."codigo_unico_serial",
+    h."estado_anterior",
+    h."estado_nuevo",
+    TO_CHAR(h."fecha_cambio", 'YYYY-MM-DD HH24:MI:SS') AS fecha_cambio,
+    h."notas"
+"""
+
+def _fecha_parametro(nombre, fin_de_dia=False):
+    """Lee ?nombre=AAAA-MM-DD[THH:MM[:SS]]; con fin_de_dia una fecha sola incluye el día completo"""
+    valor = request.args.get(nombre)
+    if not valor:
+        return None
+    try:
+        fecha = datetime.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f"'{nombre}' debe tener formato AAAA-MM-DD o AAAA-MM-DDTHH:MM")
+    if fin_de_dia and len(valor) == 10:
+        fecha += timedelta(days=1)
+    return fecha
+
+@app.route('/api/inventario/serial/<int:serial_id>/historial', methods=['GET', 'OPTIONS'])
+@protected_route
+@con_version
+def obtener_historial_serial(serial_id):
+    """Altas, cambios de estado y baja de un serial, en orden cronológico"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    try:
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+            cur = conn.cursor(cursor_factory=DictCursor)
+            # Un serial eliminado ya no tiene fecha_registro: se recorren todas las particiones
+            cur.execute(f"""
+                SELECT {COLUMNAS_HISTORIAL}
+                FROM "historial_estados" h
+                WHERE h."serial_id" = %s
+                  AND h."fecha_cambio" >= COALESCE(
+                      (SELECT "fecha_registro" FROM "seriales" WHERE "serial_id" = %s), '-infinity')
+                ORDER BY h."fecha_cambio", h."historial_id";
+            """, (serial_id, serial_id))
+            historial = [dict(row) for row in cur.fetchall()]
+            cur.close()
+
+            if not historial:
+                return jsonify({"error": "Serial sin historial"}), 404
+            return jsonify(historial)
+
+    except Exception as e:
+        print(f"❌ Error en historial de serial: {e}")
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+@app.route('/api/inventario/historial', methods=['GET', 'OPTIONS'])
+@protected_route
+@con_version
+def obtener_historial():
+    """Transiciones en un rango de fechas, de la más reciente a la más antigua.
+
+    Parámetros: desde (por defecto hace 30 días), hasta (excluyente; una fecha
+    sola incluye ese día), producto_id, estado (estado_nuevo), limit (1-1000,
+    100 por defecto) y after (cursor de la página anterior).
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    try:
+        try:
+            desde = _fecha_parametro('desde') or datetime.now() - timedelta(days=DIAS_HISTORIAL_DEFECTO)
+            hasta = _fecha_parametro('hasta', fin_de_dia=True)
+            limite = request.args.get('limit', str(LIMITE_HISTORIAL_DEFECTO))
+            if not limite.isdigit() or not 1 <= int(limite) <= LIMITE_HISTORIAL_MAX:
+                raise ValueError(f"'limit' debe estar entre 1 y {LIMITE_HISTORIAL_MAX}")
+            limite = int(limite)
+
+            filtros, params = ['h."fecha_cambio" >= %s'], [desde]
+            if hasta:
+                filtros.append('h."fecha_cambio" < %s')
+                params.append(hasta)
+            producto_id = request.args.get('producto_id')
+            if producto_id:
+                if not producto_id.isdigit():
+                    raise ValueError("'producto_id' debe ser numérico")
+                filtros.append('h."producto_id" = %s')
+                params.append(int(producto_id))
+            estado = request.args.get('estado')
+            if estado:
+                if estado not in ESTADOS_SERIAL:
+                    raise ValueError(f"'estado' debe ser uno de: {', '.join(ESTADOS_SERIAL)}")
+                filtros.append('h."estado_nuevo" = %s')
+                params.append(estado)
+            after = request.args.get('after')
+            if after:
+                valores = _decodificar_cursor(after)
+                if len(valores) != 2:
+                    raise ValueError("Cursor 'after' inválido")
+                filtros.append('(h."fecha_cambio", h."historial_id") < (%s::timestamp, %s)')
+                params.extend(valores)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute(f"""
+                SELECT {COLUMNAS_HISTORIAL}, h."fecha_cambio"::text AS _fecha
+                FROM "historial_estados" h
+                WHERE {' AND '.join(filtros)}
+                ORDER BY h."fecha_cambio" DESC, h."historial_id" DESC
+                LIMIT %s;
+            """, params + [limite + 1])
+            filas = [dict(row) for row in cur.fetchall()]
+            cur.close()
+
+            siguiente = None
+            if len(filas) > limite:
+                filas = filas[:limite]
+                siguiente = _codificar_cursor([filas[-1]['_fecha'], filas[-1]['historial_id']])
+            for fila in filas:
+                del fila['_fecha']
+
+            return jsonify({"items": filas, "limit": limite, "siguiente": siguiente})
+
+    except Exception as e:
+        print(f"❌ Error en historial: {e}")
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+# ====================================================================
+# API: ALERTAS DE STOCK (CRUCES DE UMBRAL)
+# ====================================================================
+COLUMNAS_ALERTAS = """
+    a."alerta_id",
+    a."producto_id",
+    p."codigo_sku",
+    p."nombre",
+    a."nivel_anterior",
+    a."nivel_nuevo",
+    a."almacen",
+    a."umbral_bajo",
+    TO_CHAR(a."fecha", 'YYYY-MM-DD HH24:MI:SS') AS fecha
+"""
+
+@app.route('/api/inventario/alertas', methods=['GET', 'OPTIONS'])
+@protected_route
+@con_version
+def obtener_alertas_stock():
+    """Productos que entraron, empeoraron o salieron del stock bajo, de la
+    alerta más reciente a la más antigua.
+
+    Parámetros: desde (por defecto hace 30 días), producto_id, activas=1
+    (solo las que dejaron el producto en BAJO o SIN_STOCK), limit (1-1000,
+    100 por defecto) y after (cursor de la página anterior).
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    try:
+        try:
+            desde = _fecha_parametro('desde') or datetime.now() - timedelta(days=DIAS_HISTORIAL_DEFECTO)
+            limite = request.args.get('limit', str(LIMITE_HISTORIAL_DEFECTO))
+            if not limite.isdigit() or not 1 <= int(limite) <= LIMITE_HISTORIAL_MAX:
+                raise ValueError(f"'limit' debe estar entre 1 y {LIMITE_HISTORIAL_MAX}")
+            limite = int(limite)
+
+            filtros, params = ['a."fecha" >= %s'], [desde]
+            producto_id = request.args.get('producto_id')
+            if producto_id:
+                if not producto_id.isdigit():
+                    raise ValueError("'producto_id' debe ser numérico")
+                filtros.append('a."producto_id" = %s')
+                params.append(int(producto_id))
+            if request.args.get('activas') == '1':
+                filtros.append('a."nivel_nuevo" = ANY(%s)')
+                params.append(list(NIVELES_ALERTA))
+            after = request.args.get('after')
+            if after:
+                valores = _decodificar_cursor(after)
+                if len(valores) != 2:
+                    raise ValueError("Cursor 'after' inválido")
+                filtros.append('(a."fecha", a."alerta_id") < (%s::timestamp, %s)')
+                params.extend(valores)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute(f"""
+                SELECT {COLUMNAS_ALERTAS}, a."fecha"::text AS _fecha
+                FROM "alertas_stock" a
+                JOIN "productos" p ON p."producto_id" = a."producto_id"
+                WHERE {' AND '.join(filtros)}
+                ORDER BY a."fecha" DESC, a."alerta_id" DESC
+                LIMIT %s;
+            """, params + [limite + 1])
+            filas = [dict(row) for row in cur.fetchall()]
+            cur.close()
+
+            siguiente = None
+            if len(filas) > limite:
+                filas = filas[:limite]
+                siguiente = _codificar_cursor([filas[-1]['_fecha'], filas[-1]['alerta_id']])
+            for fila in filas:
+                del fila['_fecha']
+
+            return jsonify({"items": filas, "limit": limite, "siguiente": siguiente})
+
+    except Exception as e:
+        print(f"❌ Error en alertas de stock: {e}")
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+# ====================================================================
+# API: EXPORTAR INVENTARIO (CSV / XLSX / NDJSON EN STREAMING)
+# ====================================================================
+# Cursores con nombre (del lado del servidor): PostgreSQL entrega las filas
+# de a EXPORTAR_LOTE y la respuesta se escribe a medida que llegan, en trozos
+# de ~64 KB. La memoria del worker no depende del tamaño del inventario y
+# el encabezado sale antes de la primera fila. La conexión queda prestada
+# mientras dura la descarga; si el cliente corta, el generador se cierra y
+# la conexión vuelve al pool (con rollback). Un error a mitad de camino corta
+# la respuesta sin el cierre de chunked: el cliente la ve incompleta.
+#
+# XLSX se escribe a mano (SpreadsheetML mínimo con inlineStr) sobre un zip
+# en streaming, sin dependencias nuevas; una hoja nueva cada XLSX_MAX_FILAS.
+EXPORTAR_LOTE = int(os.environ.get('EXPORTAR_LOTE', 5000))
+EXPORTAR_MAX_SIMULTANEAS = int(os.environ.get('EXPORTAR_MAX_SIMULTANEAS', 2))
+EXPORTAR_TROZO_BYTES = 64 * 1024
+XLSX_MAX_FILAS = 1048576 - 1    # límite de Excel por hoja, menos el encabezado
+XLSX_MAX_TEXTO = 32767
+_CARACTERES_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_exportaciones_activas = threading.BoundedSemaphore(EXPORTAR_MAX_SIMULTANEAS)
+
+FORMATOS_EXPORTACION = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+# Columnas fijas por exportación: un cursor con nombre no tiene description
+# hasta el primer FETCH, y el encabezado sale antes
+EXPORTACIONES = {
+    'productos': (
+        ['producto_id', 'codigo_sku', 'nombre', 'marca', 'modelo', 'categoria',
+         'almacen', 'instalado', 'danado', 'retirado', 'total', 'umbral_bajo', 'umbral_medio',
+         'nivel_stock', 'ultima_entrada'],
+        f"""
+        SELECT p."producto_id", p."codigo_sku", p."nombre", p."marca", p."modelo",
+               tp."tipo_modelo",
+               COALESCE(ps."almacen", 0), COALESCE(ps."instalado", 0),
+               COALESCE(ps."danado", 0), COALESCE(ps."retirado", 0),
+               COALESCE(ps."total", 0), COALESCE(ps."umbral_bajo", tp."umbral_bajo"),
+               COALESCE(ps."umbral_medio", tp."umbral_medio"), {NIVEL_STOCK_SQL},
+               ps."ultima_entrada"
+        FROM "productos" p
+        JOIN "tipos_pieza" tp ON tp."tipo_id" = p."tipo_pieza_id"
+        LEFT JOIN "producto_stock" ps ON ps."producto_id" = p."producto_id"
+        ORDER BY p."producto_id"
+        """,
+    ),
+    'seriales': (
+        ['serial_id', 'codigo_unico_serial', 'estado', 'producto_id', 'codigo_sku',
+         'producto', 'categoria', 'fecha_registro', 'fecha_actualizacion', 'notas'],
+        """
+        SELECT s."serial_id", s."codigo_unico_serial", s."estado", p."producto_id",
+               p."codigo_sku", p."nombre", tp."tipo_modelo",
+               s."fecha_registro", s."fecha_actualizacion", s."notas"
+        FROM "seriales" s
+        JOIN "productos" p ON p."producto_id" = s."producto_id"
+        JOIN "tipos_pieza" tp ON tp."tipo_id" = p."tipo_pieza_id"
+        ORDER BY s."serial_id"
+        """,
+    ),
+    'historial': (
+        ['historial_id', 'serial_id', 'producto_id', 'codigo_unico_serial',
+         'estado_anterior', 'estado_nuevo', 'fecha_cambio', 'notas'],
+        """
+        SELECT h."historial_id", h."serial_id", h."producto_id", h."codigo_unico_serial",
+               h."estado_anterior", h."estado_nuevo", h."fecha_cambio", h."notas"
+        FROM "historial_estados" h
+        WHERE h."fecha_cambio" >= %s AND h."fecha_cambio" < %s
+        ORDER BY h."fecha_cambio", h."historial_id"
+        """,
+    ),
+}
+
+def _filas_en_streaming(nombre, consulta, params, lugares, cursor_factory=psycopg2.extensions.cursor):
+    """Primero None (conexión prestada y cursor declarado), después las filas por lotes.
+
+    La ruta toma antes un lugar de `lugares` y hace el primer next(): sin
+    conexión o con un error de SQL se responde 500 antes de empezar a enviar.
+    El lugar se libera al terminar, fallar o cerrarse el generador.
+    """
+    try:
+        with db_conexion() as conn:
+            if not conn:
+                raise psycopg2.OperationalError("No se pudo conectar a la base de datos")
+            cur = conn.cursor(f'stream_{nombre}', cursor_factory=cursor_factory)
+            cur.itersize = EXPORTAR_LOTE
+            cur.execute(consulta, params)
+            yield None
+            yield from cur
+            cur.close()
     finally:
-        if conn:
-            conn.close()
+        lugares.release()
+
+def _texto_exportable(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=' ', timespec='seconds')
+    return valor
+
+def _exportar_csv(columnas, filas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator='\n')
+    escritor.writerow(columnas)
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    for fila in filas:
+        escritor.writerow([_texto_exportable(valor) for valor in fila])
+        if buffer.tell() >= EXPORTAR_TROZO_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def _exportar_ndjson(columnas, filas):
+    """Una línea JSON por fila; sin `columnas` las filas ya son dicts (RealDictCursor)"""
+    # La primera línea sale sola: los primeros bytes no esperan a juntar un trozo
+    trozo, tamano, primera = [], 0, True
+    for fila in filas:
+        linea = app.json.dumps(fila if columnas is None else dict(zip(columnas, fila))).encode('utf-8') + b'\n'
+        trozo.append(linea)
+        tamano += len(linea)
+        if primera or tamano >= EXPORTAR_TROZO_BYTES:
+            yield b''.join(trozo)
+            trozo, tamano, primera = [], 0, False
+    yield b''.join(trozo)
+
+class _SalidaZip(io.RawIOBase):
+    """Destino sin seek de zipfile: acumula lo escrito para entregarlo por trozos"""
+
+    def __init__(self):
+        self._trozos = []
+        self.pendientes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._trozos.append(bytes(datos))
+        self.pendientes += len(datos)
+        return len(datos)
+
+    def vaciar(self):
+        datos = b''.join(self._trozos)
+        self._trozos, self.pendientes = [], 0
+        return datos
+
+XLSX_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+XLSX_NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+XLSX_NS_PAQUETE = 'http://schemas.openxmlformats.org/package/2006/relationships'
+XLSX_CABECERA_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+def _celda_xlsx(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = _CARACTERES_INVALIDOS_XML.sub('', str(_texto_exportable(valor)))[:XLSX_MAX_TEXTO]
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escapar_xml(texto)}</t></is></c>'
+
+def _fila_xlsx(numero, valores):
+    return f'<row r="{numero}">{"".join(_celda_xlsx(valor) for valor in valores)}</row>'.encode('utf-8')
+
+def _exportar_xlsx(columnas, filas, titulo):
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as libro:
+        filas = iter(filas)
+        siguiente = None
+        hojas = 0
+        while True:
+            hojas += 1
+            # force_zip64: el tamaño de la hoja no se conoce al abrirla
+            with libro.open(f'xl/worksheets/sheet{hojas}.xml', 'w', force_zip64=True) as hoja:
+                hoja.write(f'{XLSX_CABECERA_XML}<worksheet xmlns="{XLSX_NS}"><sheetData>'.encode('utf-8'))
+                hoja.write(_fila_xlsx(1, columnas))
+                if hojas == 1:
+                    yield salida.vaciar()   # cabecera del zip antes del primer FETCH
+                    siguiente = next(filas, None)
+                escritas = 0
+                while siguiente is not None and escritas < XLSX_MAX_FILAS:
+                    escritas += 1
+                    hoja.write(_fila_xlsx(escritas + 1, siguiente))
+                    siguiente = next(filas, None)
+                    if salida.pendientes >= EXPORTAR_TROZO_BYTES:
+                        yield salida.vaciar()
+                hoja.write(b'</sheetData></worksheet>')
+            if siguiente is None:
+                break
+
+        nombres = [titulo] if hojas == 1 else [f'{titulo} {i}' for i in range(1, hojas + 1)]
+        libro.writestr('xl/workbook.xml', (
+            f'{XLSX_CABECERA_XML}<workbook xmlns="{XLSX_NS}" xmlns:r="{XLSX_NS_REL}"><sheets>'
+            + ''.join(f'<sheet name="{nombre}" sheetId="{i}" r:id="rId{i}"/>'
+                      for i, nombre in enumerate(nombres, 1))
+            + '</sheets></workbook>'))
+        libro.writestr('xl/_rels/workbook.xml.rels', (
+            f'{XLSX_CABECERA_XML}<Relationships xmlns="{XLSX_NS_PAQUETE}">'
+            + ''.join(f'<Relationship Id="rId{i}" Type="{XLSX_NS_REL}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                      for i in range(1, hojas + 1))
+            + '</Relationships>'))
+        libro.writestr('_rels/.rels', (
+            f'{XLSX_CABECERA_XML}<Relationships xmlns="{XLSX_NS_PAQUETE}">'
+            f'<Relationship Id="rId1" Type="{XLSX_NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'))
+        libro.writestr('[Content_Types].xml', (
+            f'{XLSX_CABECERA_XML}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + ''.join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                      for i in range(1, hojas + 1))
+            + '</Types>'))
+    yield salida.vaciar()
+
+def _sin_lugar(mensaje):
+    response = jsonify({"error": mensaje})
+    response.status_code = 503
+    response.headers['Retry-After'] = '30'
+    return response
+
+def respuesta_en_streaming(nombre, trozos, filas, tipo, comprimible=True):
+    """Response que envía `trozos` a medida que se generan (con br/gzip en streaming
+    si `comprimible` y el cliente acepta) y al terminar cierra `filas` y su conexión"""
+    codificacion = None
+    if comprimible:
+        codificacion = request.accept_encodings.best_match(CODIFICACIONES)
+        if codificacion:
+            trozos = comprimir_flujo(trozos, codificacion)
+
+    def generar():
+        try:
+            yield from trozos
+        except Exception as e:
+            print(f"❌ Respuesta en streaming de {nombre} interrumpida: {e}")
+            raise
+        finally:
+            trozos.close()
+            filas.close()
+
+    response = Response(stream_with_context(generar()), mimetype=tipo)
+    response.headers['X-Accel-Buffering'] = 'no'
+    if comprimible:
+        response.vary.add('Accept-Encoding')
+    if codificacion:
+        response.headers['Content-Encoding'] = codificacion
+    return response
+
+def exportar(nombre, params=()):
+    """Respuesta en streaming de la exportación `nombre` en el ?formato= pedido (csv por defecto)"""
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        return jsonify({"error": f"'formato' debe ser uno de: {', '.join(FORMATOS_EXPORTACION)}"}), 400
+    if not _exportaciones_activas.acquire(blocking=False):
+        return _sin_lugar("Demasiadas exportaciones en curso en este worker")
+
+    columnas, consulta = EXPORTACIONES[nombre]
+    filas = _filas_en_streaming(f'exportar_{nombre}', consulta, params, _exportaciones_activas)
+    next(filas)
+
+    if formato == 'xlsx':
+        trozos = _exportar_xlsx(columnas, filas, nombre.capitalize())
+    elif formato == 'ndjson':
+        trozos = _exportar_ndjson(columnas, filas)
+    else:
+        trozos = _exportar_csv(columnas, filas)
+
+    # XLSX ya es un zip
+    tipo, extension = FORMATOS_EXPORTACION[formato]
+    response = respuesta_en_streaming(nombre, trozos, filas, tipo, comprimible=formato != 'xlsx')
+    if formato == 'csv':
+        response.charset = 'utf-8'
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="{nombre}-{datetime.now():%Y%m%d-%H%M%S}.{extension}"')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/inventario/exportar/productos', methods=['GET'])
+@protected_route
+def exportar_productos():
+    """Productos con su categoría y stock por estado (producto_stock)"""
+    try:
+        return exportar('productos')
+    except Exception as e:
+        print(f"❌ Error exportando productos: {e}")
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+@app.route('/api/inventario/exportar/seriales', methods=['GET'])
+@protected_route
+def exportar_seriales():
+    """Todos los seriales con su producto, categoría, estado y fechas"""
+    try:
+        return exportar('seriales')
+    except Exception as e:
+        print(f"❌ Error exportando seriales: {e}")
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+@app.route('/api/inventario/exportar/historial', methods=['GET'])
+@protected_route
+def exportar_historial():
+    """Transiciones en orden cronológico; desde y hasta opcionales (todo el historial por defecto)"""
+    try:
+        try:
+            desde = _fecha_parametro('desde') or datetime.min
+            hasta = _fecha_parametro('hasta', fin_de_dia=True) or datetime.max
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return exportar('historial', (desde, hasta))
+    except Exception as e:
+        print(f"❌ Error exportando historial: {e}")
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+# ====================================================================
+# LISTAS GRANDES EN NDJSON (OPCIONAL)
+# ====================================================================
+# Sin paginar, /stock, /productos/detallado y /seriales/<id> arman la lista
+# completa tres veces (filas, dicts y el JSON). Con ?stream=1 o
+# `Accept: application/x-ndjson` responden una línea JSON por fila, leída con
+# un cursor con nombre como las exportaciones: la memoria del worker no
+# crece con el resultado y la primera fila sale sin esperar a la última.
+# Los parámetros de paginación tienen prioridad (una página ya es chica).
+# JSON y NDJSON comparten el ETag de la versión: las respuestas de
+# RUTAS_NDJSON llevan `Vary: Accept` para que un caché no las mezcle.
+RUTAS_NDJSON = {'obtener_inventario_stock', 'obtener_productos_detallado', 'obtener_seriales_por_producto'}
+STREAM_MAX_SIMULTANEOS = int(os.environ.get('STREAM_MAX_SIMULTANEOS', 4))
+_streams_activos = threading.BoundedSemaphore(STREAM_MAX_SIMULTANEOS)
+
+def pide_ndjson(args=None, accept=None):
+    """True con ?stream=1 o si el cliente prefiere application/x-ndjson a JSON"""
+    args = request.args if args is None else args
+    accept = request.accept_mimetypes if accept is None else accept
+    if args.get('stream') == '1':
+        return True
+    return accept.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+def responder_ndjson(nombre, consulta, params=()):
+    """Respuesta NDJSON en streaming de `consulta` (mismas claves y valores que su JSON)"""
+    if not _streams_activos.acquire(blocking=False):
+        return _sin_lugar("Demasiadas respuestas en streaming en este worker")
+    filas = _filas_en_streaming(nombre, consulta, params, _streams_activos, RealDictCursor)
+    next(filas)
+    response = respuesta_en_streaming(nombre, _exportar_ndjson(None, filas), filas, 'application/x-ndjson')
+    response.vary.add('Accept')
+    return response
 
 # ====================================================================
 # API: OBTENER STOCK BAJO
 # ====================================================================
+# producto_stock tiene una fila por producto con su umbral efectivo y la
+# columna generada stock_bajo (almacen <= umbral_bajo); el índice parcial
+# idx_producto_stock_bajo contiene exactamente esos productos, ya ordenados:
+# la consulta recorre ese conjunto (que cambia con cada movimiento de
+# seriales) en lugar de evaluar el nivel de todo el catálogo.
+CONSULTA_STOCK_BAJO = """
+SELECT 
+    p.producto_id,
+    p.nombre,
+    p.codigo_sku,
+    tp.tipo_modelo,
+    ps.almacen as stock_actual,
+    ps.umbral_bajo
+FROM producto_stock ps
+JOIN productos p ON p.producto_id = ps.producto_id
+JOIN tipos_pieza tp ON p.tipo_pieza_id = tp.tipo_id
+WHERE ps.stock_bajo
+ORDER BY ps.almacen ASC, ps.producto_id;
+"""
+
 @app.route('/api/inventario/stock_bajo', methods=['GET', 'OPTIONS'])
 @protected_route
+@con_version
 def obtener_stock_bajo():
-    """Obtiene productos con stock bajo (3 o menos unidades en almacén)"""
+    """Obtiene productos con stock bajo (en almacén, su umbral o menos)"""
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
-        SELECT 
-            p.producto_id,
-            p.nombre,
-            p.codigo_sku,
-            tp.tipo_modelo,
-            COUNT(s.serial_id) as stock_actual
-        FROM productos p
-        JOIN tipos_pieza tp ON p.tipo_pieza_id = tp.tipo_id
-        LEFT JOIN seriales s ON p.producto_id = s.producto_id AND s.estado = 'ALMACEN'
-        GROUP BY p.producto_id, p.nombre, p.codigo_sku, tp.tipo_modelo
-        HAVING COUNT(s.serial_id) <= 3
-        ORDER BY stock_actual ASC;
-        """
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        cur.execute(query)
-        stock_bajo = [dict(row) for row in cur.fetchall()]
-        cur.close()
+            cur.execute(CONSULTA_STOCK_BAJO)
+            stock_bajo = [dict(row) for row in cur.fetchall()]
+            cur.close()
         
-        return jsonify(stock_bajo)
+            return jsonify(stock_bajo)
     
     except Exception as e:
         print(f"Error en /stock_bajo: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 # ====================================================================
 # API: BUSCAR PRODUCTOS
 # ====================================================================
+# Con la migración 0004_busqueda_productos aplicada, la búsqueda usa un índice
+# GIN trigram sobre texto_busqueda_producto(...) (minúsculas y sin acentos) y
+# ordena por word_similarity. Sin la migración se cae al ILIKE de siempre.
+LIMITE_BUSQUEDA_DEFECTO = 50
+LIMITE_BUSQUEDA_MAX = 200
+MAX_SERIALES_BUSQUEDA = 20
+
+_busqueda_trgm = None  # por proceso: None = sin comprobar todavía
+
+TEXTO_BUSQUEDA_SQL = "texto_busqueda_producto(p.nombre, p.codigo_sku, p.marca, p.modelo)"
+
+COINCIDENCIAS_TRGM = f"""
+    SELECT
+        p.producto_id,
+        CASE WHEN lower(p.codigo_sku) = lower(%(q)s) THEN 1.0
+             ELSE word_similarity(lower(sin_acentos(%(q)s)), {TEXTO_BUSQUEDA_SQL})
+        END AS relevancia
+    FROM productos p
+    WHERE {TEXTO_BUSQUEDA_SQL} LIKE '%%' || lower(sin_acentos(%(patron)s)) || '%%'
+       OR lower(sin_acentos(%(q)s)) <%% {TEXTO_BUSQUEDA_SQL}
+    ORDER BY relevancia DESC
+    LIMIT %(limite)s
+"""
+
+COINCIDENCIAS_ILIKE = """
+    SELECT
+        p.producto_id,
+        CASE WHEN lower(p.codigo_sku) = lower(%(q)s) THEN 1.0
+             WHEN p.nombre ILIKE %(patron)s || '%%' THEN 0.8
+             ELSE 0.5
+        END AS relevancia
+    FROM productos p
+    WHERE p.nombre ILIKE '%%' || %(patron)s || '%%'
+       OR p.codigo_sku ILIKE '%%' || %(patron)s || '%%'
+       OR p.marca ILIKE '%%' || %(patron)s || '%%'
+       OR p.modelo ILIKE '%%' || %(patron)s || '%%'
+    ORDER BY relevancia DESC, p.nombre
+    LIMIT %(limite)s
+"""
+
+CONSULTA_BUSQUEDA = """
+WITH por_texto AS ({coincidencias}),
+por_serial AS (
+    SELECT DISTINCT ON (s.producto_id)
+        s.producto_id,
+        s.codigo_unico_serial,
+        CASE WHEN s.codigo_unico_serial = upper(%(q)s) THEN 1.0 ELSE 0.9 END AS relevancia
+    FROM (
+        SELECT producto_id, codigo_unico_serial
+        FROM seriales
+        WHERE codigo_unico_serial LIKE upper(%(patron)s) || '%%'
+        ORDER BY codigo_unico_serial
+        LIMIT %(max_seriales)s
+    ) s
+    ORDER BY s.producto_id, relevancia DESC
+),
+candidatos AS (
+    SELECT producto_id, MAX(relevancia) AS relevancia, MAX(codigo_unico_serial) AS serial_coincidente
+    FROM (
+        SELECT producto_id, relevancia, NULL::text AS codigo_unico_serial FROM por_texto
+        UNION ALL
+        SELECT producto_id, relevancia, codigo_unico_serial FROM por_serial
+    ) c
+    GROUP BY producto_id
+)
+SELECT
+    p.producto_id,
+    p.nombre,
+    p.marca,
+    p.modelo,
+    p.codigo_sku,
+    tp.tipo_modelo as categoria,
+    COALESCE(ps.total, 0) as total_unidades,
+    COALESCE(ps.almacen, 0) as en_almacen,
+    round(c.relevancia::numeric, 3)::float as relevancia,
+    c.serial_coincidente
+FROM candidatos c
+JOIN productos p ON p.producto_id = c.producto_id
+JOIN tipos_pieza tp ON p.tipo_pieza_id = tp.tipo_id
+LEFT JOIN producto_stock ps ON p.producto_id = ps.producto_id
+ORDER BY c.relevancia DESC, p.nombre, p.producto_id
+LIMIT %(limite)s;
+"""
+
+
+CONSULTA_TRGM_DISPONIBLE = """
+SELECT to_regproc('texto_busqueda_producto') IS NOT NULL
+   AND EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm');
+"""
+
+def busqueda_trgm_disponible(cur):
+    """True si la migración de búsqueda (pg_trgm + unaccent) está aplicada"""
+    global _busqueda_trgm
+    if _busqueda_trgm is None:
+        cur.execute(CONSULTA_TRGM_DISPONIBLE)
+        _busqueda_trgm = cur.fetchone()[0]
+        if not _busqueda_trgm:
+            print("⚠️ Búsqueda sin índice trigram; ejecuta: python migrar.py aplicar")
+    return _busqueda_trgm
+
+
+def escapar_like(texto):
+    """Escapa los comodines de LIKE para buscar el texto literal"""
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def parametros_busqueda(args):
+    """Parámetros de CONSULTA_BUSQUEDA a partir de q y limit; ValueError si no son válidos"""
+    query = args.get('q', '').strip()
+    if not query or len(query) < 2:
+        raise ValueError("Término de búsqueda muy corto (mínimo 2 caracteres)")
+
+    limite = args.get('limit', str(LIMITE_BUSQUEDA_DEFECTO))
+    if not limite.isdigit() or not 1 <= int(limite) <= LIMITE_BUSQUEDA_MAX:
+        raise ValueError(f"'limit' debe estar entre 1 y {LIMITE_BUSQUEDA_MAX}")
+    return {
+        'q': query,
+        'patron': escapar_like(query),
+        'limite': int(limite),
+        'max_seriales': MAX_SERIALES_BUSQUEDA,
+    }
+
+
 @app.route('/api/inventario/buscar', methods=['GET', 'OPTIONS'])
 @protected_route
+@con_version
 def buscar_productos():
-    """Busca productos por nombre, SKU, marca o modelo"""
+    """Busca productos por nombre, SKU, marca, modelo o número de serie"""
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
-        query = request.args.get('q', '').strip()
-        
-        if not query or len(query) < 2:
-            return jsonify({"error": "Término de búsqueda muy corto (mínimo 2 caracteres)"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        try:
+            parametros = parametros_busqueda(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        search_query = """
-        SELECT 
-            p.producto_id,
-            p.nombre,
-            p.marca,
-            p.modelo,
-            p.codigo_sku,
-            tp.tipo_modelo as categoria,
-            COUNT(s.serial_id) as total_unidades,
-            SUM(CASE WHEN s.estado = 'ALMACEN' THEN 1 ELSE 0 END) as en_almacen
-        FROM productos p
-        JOIN tipos_pieza tp ON p.tipo_pieza_id = tp.tipo_id
-        LEFT JOIN seriales s ON p.producto_id = s.producto_id
-        WHERE p.nombre ILIKE %s 
-           OR p.codigo_sku ILIKE %s
-           OR p.marca ILIKE %s
-           OR p.modelo ILIKE %s
-        GROUP BY p.producto_id, p.nombre, p.marca, p.modelo, p.codigo_sku, tp.tipo_modelo
-        ORDER BY p.nombre;
-        """
-        
-        search_term = f"%{query}%"
-        cur.execute(search_query, (search_term, search_term, search_term, search_term))
-        resultados = [dict(row) for row in cur.fetchall()]
-        cur.close()
+            cur = conn.cursor(cursor_factory=DictCursor)
+
+            coincidencias = COINCIDENCIAS_TRGM if busqueda_trgm_disponible(cur) else COINCIDENCIAS_ILIKE
+            cur.execute(CONSULTA_BUSQUEDA.format(coincidencias=coincidencias), parametros)
+            resultados = [dict(row) for row in cur.fetchall()]
+            cur.close()
         
-        return jsonify({
-            "query": query,
-            "resultados": resultados,
-            "total": len(resultados)
-        })
+            return jsonify({
+                "query": parametros['q'],
+                "resultados": resultados,
+                "total": len(resultados),
+                "limit": parametros['limite']
+            })
         
     except Exception as e:
         print(f"Error en búsqueda: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 # ====================================================================
 # API: OBTENER PRODUCTO POR ID
 # ====================================================================
+CONSULTA_PRODUCTO = f"""
+SELECT 
+    p.*,
+    tp.tipo_modelo as categoria_nombre,
+    COALESCE(ps.total, 0) as total_seriales,
+    COALESCE(ps.almacen, 0) as en_almacen,
+    -- umbral_bajo / umbral_medio de p.* son los propios (NULL: los de la categoría)
+    COALESCE(ps.umbral_bajo, tp.umbral_bajo) as umbral_bajo_efectivo,
+    COALESCE(ps.umbral_medio, tp.umbral_medio) as umbral_medio_efectivo,
+    {NIVEL_STOCK_SQL} AS nivel_stock
+FROM productos p
+JOIN tipos_pieza tp ON p.tipo_pieza_id = tp.tipo_id
+LEFT JOIN producto_stock ps ON p.producto_id = ps.producto_id
+WHERE p.producto_id = %s;
+"""
+
 @app.route('/api/inventario/productos/<int:producto_id>', methods=['GET', 'OPTIONS'])
 @protected_route
+@con_version
 def obtener_producto_por_id(producto_id):
     """Obtiene información detallada de un producto específico"""
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
-        SELECT 
-            p.*,
-            tp.tipo_modelo as categoria_nombre,
-            COUNT(s.serial_id) as total_seriales,
-            SUM(CASE WHEN s.estado = 'ALMACEN' THEN 1 ELSE 0 END) as en_almacen
-        FROM productos p
-        JOIN tipos_pieza tp ON p.tipo_pieza_id = tp.tipo_id
-        LEFT JOIN seriales s ON p.producto_id = s.producto_id
-        WHERE p.producto_id = %s
-        GROUP BY p.producto_id, p.nombre, p.descripcion, p.tipo_pieza_id, 
-                 p.codigo_sku, p.marca, p.modelo, p.fecha_registro, 
-                 p.fecha_actualizacion, tp.tipo_modelo;
-        """
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        cur.execute(query, (producto_id,))
-        producto = cur.fetchone()
-        cur.close()
+            cur.execute(CONSULTA_PRODUCTO, (producto_id,))
+            producto = cur.fetchone()
+            cur.close()
         
-        if not producto:
-            return jsonify({"error": "Producto no encontrado"}), 404
+            if not producto:
+                return jsonify({"error": "Producto no encontrado"}), 404
         
-        return jsonify(dict(producto))
+            return jsonify(dict(producto))
         
     except Exception as e:
         print(f"Error obteniendo producto: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 # ====================================================================
 # API: ACTUALIZAR PRODUCTO EXISTENTE (NUEVO)
 # ====================================================================
@@ -1211,7 +4461,6 @@ def actualizar_producto(producto_id):
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
         data = request.get_json()
         
@@ -1230,120 +4479,141 @@ def actualizar_producto(producto_id):
         descripcion = data.get('descripcion', '').strip()
         tipo_pieza_id = int(data['tipo_pieza_id'])
         codigo_sku = data['codigo_sku'].strip()
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        # Umbrales opcionales: si no vienen se conservan; null vuelve a los de la categoría
+        cambia_umbrales = 'umbral_bajo' in data or 'umbral_medio' in data
+        try:
+            umbral_bajo, umbral_medio = leer_umbrales(data, heredables=True)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        # Verificar que el producto existe
-        cur.execute('SELECT producto_id FROM productos WHERE producto_id = %s', (producto_id,))
-        if not cur.fetchone():
-            return jsonify({"error": "Producto no encontrado"}), 404
-        
-        # Verificar que el SKU no esté duplicado (excluyendo el producto actual)
-        cur.execute('''
-            SELECT producto_id FROM productos 
-            WHERE codigo_sku = %s AND producto_id != %s
-        ''', (codigo_sku, producto_id))
-        if cur.fetchone():
-            return jsonify({"error": f"El SKU '{codigo_sku}' ya está en uso por otro producto"}), 409
-        
-        # Actualizar producto
-        update_query = """
-        UPDATE productos 
-        SET nombre = %s,
-            marca = %s,
-            modelo = %s,
-            descripcion = %s,
-            tipo_pieza_id = %s,
-            codigo_sku = %s,
-            fecha_actualizacion = CURRENT_TIMESTAMP
-        WHERE producto_id = %s
-        RETURNING producto_id, nombre, marca, modelo, codigo_sku;
-        """
-        
-        cur.execute(update_query, (
-            nombre, marca, modelo, descripcion, 
-            tipo_pieza_id, codigo_sku, producto_id
-        ))
-        
-        result = dict(cur.fetchone())
-        
-        conn.commit()
-        cur.close()
+            cur = conn.cursor(cursor_factory=DictCursor)
+        
+            # Verificar que el producto existe
+            cur.execute('SELECT producto_id, umbral_bajo, umbral_medio FROM productos WHERE producto_id = %s',
+                        (producto_id,))
+            actual = cur.fetchone()
+            if not actual:
+                return jsonify({"error": "Producto no encontrado"}), 404
+            if not cambia_umbrales:
+                umbral_bajo, umbral_medio = actual['umbral_bajo'], actual['umbral_medio']
+        
+            # Verificar que el SKU no esté duplicado (excluyendo el producto actual)
+            cur.execute('''
+                SELECT producto_id FROM productos 
+                WHERE codigo_sku = %s AND producto_id != %s
+            ''', (codigo_sku, producto_id))
+            if cur.fetchone():
+                return jsonify({"error": f"El SKU '{codigo_sku}' ya está en uso por otro producto"}), 409
+        
+            # Actualizar producto
+            update_query = """
+            UPDATE productos 
+            SET nombre = %s,
+                marca = %s,
+                modelo = %s,
+                descripcion = %s,
+                tipo_pieza_id = %s,
+                codigo_sku = %s,
+                umbral_bajo = %s,
+                umbral_medio = %s,
+                fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE producto_id = %s
+            RETURNING producto_id, nombre, marca, modelo, codigo_sku, umbral_bajo, umbral_medio;
+            """
+        
+            cur.execute(update_query, (
+                nombre, marca, modelo, descripcion, 
+                tipo_pieza_id, codigo_sku, umbral_bajo, umbral_medio, producto_id
+            ))
+        
+            result = dict(cur.fetchone())
+            # Cambio de categoría o de umbrales: nuevo umbral efectivo (y sus alertas)
+            aplicar_umbrales(cur, [producto_id])
+            publicar_invalidacion(cur, 'producto', [producto_id])
+        
+            conn.commit()
+            cur.close()
         
-        return jsonify({
-            "mensaje": f"Producto '{nombre}' actualizado correctamente",
-            "producto": result
-        })
+            return jsonify({
+                "mensaje": f"Producto '{nombre}' actualizado correctamente",
+                "producto": result
+            })
         
     except Exception as e:
         print(f"❌ Error actualizando producto: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 # ====================================================================
 # API: OBTENER PRODUCTOS CON STOCK DETALLADO (NUEVO)
 # ====================================================================
+COLUMNAS_PRODUCTOS_DETALLADO = f"""
+    p.producto_id,
+    p.nombre,
+    p.marca,
+    p.modelo,
+    p.codigo_sku,
+    tp.tipo_modelo as categoria,
+    -- Stock por estado (resumen producto_stock)
+    COALESCE(ps.total, 0) as total,
+    COALESCE(ps.almacen, 0) as almacen,
+    COALESCE(ps.instalado, 0) as instalado,
+    COALESCE(ps.danado, 0) as danado,
+    COALESCE(ps.retirado, 0) as retirado,
+    -- Nivel según sus umbrales efectivos
+    COALESCE(ps.umbral_bajo, tp.umbral_bajo) as umbral_bajo,
+    COALESCE(ps.umbral_medio, tp.umbral_medio) as umbral_medio,
+    {NIVEL_STOCK_SQL} AS nivel_stock,
+    -- Última actividad
+    ps.ultima_entrada,
+    ps.ultima_actualizacion
+"""
+
+CONSULTA_PRODUCTOS_DETALLADO = f"""
+SELECT {COLUMNAS_PRODUCTOS_DETALLADO}
+{FROM_PRODUCTOS_STOCK}
+ORDER BY 
+    CASE WHEN p.marca IS NULL THEN 1 ELSE 0 END,
+    p.marca,
+    CASE WHEN p.modelo IS NULL THEN 1 ELSE 0 END,
+    p.modelo,
+    p.nombre;
+"""
+
 @app.route('/api/inventario/productos/detallado', methods=['GET', 'OPTIONS'])
 @protected_route
+@con_version
 def obtener_productos_detallado():
     """Obtiene inventario con detalles de stock por estado - NUEVA VISTA"""
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        if pide_ndjson() and not pide_paginacion():
+            return responder_ndjson('productos_detallado', CONSULTA_PRODUCTOS_DETALLADO)
+
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
-        SELECT 
-            p.producto_id,
-            p.nombre,
-            p.marca,
-            p.modelo,
-            p.codigo_sku,
-            tp.tipo_modelo as categoria,
-            -- Stock por estado
-            COUNT(s.serial_id) as total,
-            SUM(CASE WHEN s.estado = 'ALMACEN' THEN 1 ELSE 0 END) as almacen,
-            SUM(CASE WHEN s.estado = 'INSTALADO' THEN 1 ELSE 0 END) as instalado,
-            SUM(CASE WHEN s.estado = 'DAÑADO' THEN 1 ELSE 0 END) as danado,
-            SUM(CASE WHEN s.estado = 'RETIRADO' THEN 1 ELSE 0 END) as retirado,
-            -- Última actividad
-            MAX(s.fecha_registro) as ultima_entrada,
-            MAX(s.fecha_actualizacion) as ultima_actualizacion
-        FROM productos p
-        JOIN tipos_pieza tp ON p.tipo_pieza_id = tp.tipo_id
-        LEFT JOIN seriales s ON p.producto_id = s.producto_id
-        GROUP BY p.producto_id, p.nombre, p.marca, p.modelo, p.codigo_sku, tp.tipo_modelo
-        ORDER BY 
-            CASE WHEN p.marca IS NULL THEN 1 ELSE 0 END,
-            p.marca,
-            CASE WHEN p.modelo IS NULL THEN 1 ELSE 0 END,
-            p.modelo,
-            p.nombre;
-        """
+            cur = conn.cursor(cursor_factory=DictCursor)
         
-        cur.execute(query)
-        productos = [dict(row) for row in cur.fetchall()]
-        cur.close()
+            if pide_paginacion():
+                return jsonify(paginar_productos(cur, COLUMNAS_PRODUCTOS_DETALLADO))
         
-        return jsonify(productos)
+            cur.execute(CONSULTA_PRODUCTOS_DETALLADO)
+            productos = [dict(row) for row in cur.fetchall()]
+            cur.close()
         
+            return jsonify(productos)
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"❌ Error en /productos/detallado: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 # ====================================================================
 # API: AGREGAR MÚLTIPLES SERIALES (NUEVO)
@@ -1355,7 +4625,6 @@ def agregar_seriales_lote_masivo():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
-    conn = None
     try:
         data = request.get_json()
         
@@ -1363,82 +4632,59 @@ def agregar_seriales_lote_masivo():
             return jsonify({"error": "Faltan datos (producto_id o cantidad)"}), 400
 
         producto_id = data['producto_id']
-        cantidad = int(data['cantidad'])
+        cantidad = data['cantidad']
         estado = data.get('estado', 'ALMACEN')
         
-        if cantidad < 1 or cantidad > 100:
-            return jsonify({"error": "Cantidad debe estar entre 1 y 100"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+        if isinstance(cantidad, str) and cantidad.strip().isdigit():
+            cantidad = int(cantidad)
+        if isinstance(cantidad, bool) or not isinstance(cantidad, int):
+            return jsonify({"error": "'cantidad' debe ser un número entero"}), 400
+        if cantidad < 1 or cantidad > MAX_CANTIDAD_LOTE:
+            return jsonify({"error": f"Cantidad debe estar entre 1 y {MAX_CANTIDAD_LOTE}"}), 400
+        if estado not in ESTADOS_SERIAL:
+            return jsonify({"error": f"Estado no válido. Permitidos: {ESTADOS_SERIAL}"}), 400
+        
+        with db_conexion() as conn:
+            if not conn:
+                return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
             
-        cur = conn.cursor()
-        
-        # Obtener SKU del producto
-        cur.execute('SELECT codigo_sku FROM productos WHERE producto_id = %s', (producto_id,))
-        producto = cur.fetchone()
+            cur = conn.cursor()
         
-        if not producto:
-            return jsonify({"error": f"Producto ID {producto_id} no existe"}), 404
+            # Obtener SKU del producto
+            cur.execute('SELECT codigo_sku FROM productos WHERE producto_id = %s', (producto_id,))
+            producto = cur.fetchone()
         
-        sku_base = producto[0]
+            if not producto:
+                return jsonify({"error": f"Producto ID {producto_id} no existe"}), 404
         
-        # Obtener último número de serial
-        cur.execute('''
-            SELECT codigo_unico_serial 
-            FROM seriales 
-            WHERE producto_id = %s 
-            AND codigo_unico_serial LIKE %s
-            ORDER BY codigo_unico_serial DESC 
-            LIMIT 1
-        ''', (producto_id, f'{sku_base}-%'))
+            sku_base = producto[0]
         
-        ultimo_serial = cur.fetchone()
-        ultimo_numero = 0
-        
-        if ultimo_serial:
-            import re
-            match = re.search(r'(\d+)$', ultimo_serial[0])
-            if match:
-                ultimo_numero = int(match.group(1))
+            # Reservar el bloque de números e insertar (y sumar al resumen de stock)
+            seriales_creados = [
+                {
+                    'serial_id': serial['serial_id'],
+                    'codigo_serial': serial['codigo_unico_serial'],
+                    'estado': estado
+                }
+                for serial in insertar_seriales_numerados(cur, producto_id, sku_base, cantidad, estado)
+            ]
         
-        seriales_creados = []
+            conn.commit()
+            cur.close()
         
-        for i in range(1, cantidad + 1):
-            numero_serial = ultimo_numero + i
-            codigo_serial = f"{sku_base}-{str(numero_serial).zfill(3)}"
-            
-            # Insertar serial
-            cur.execute('''
-                INSERT INTO seriales (producto_id, codigo_unico_serial, estado)
-                VALUES (%s, %s, %s)
-                RETURNING serial_id
-            ''', (producto_id, codigo_serial, estado))
-            
-            serial_id = cur.fetchone()[0]
-            seriales_creados.append({
-                'serial_id': serial_id,
-                'codigo_serial': codigo_serial,
-                'estado': estado
+            return jsonify({
+                'mensaje': f'Se agregaron {len(seriales_creados)} seriales',
+                'seriales': seriales_creados
             })
         
-        conn.commit()
-        cur.close()
-        
+    except IntegrityError:
         return jsonify({
-            'mensaje': f'Se agregaron {len(seriales_creados)} seriales',
-            'seriales': seriales_creados
-        })
-        
+            "error": "Alguno de los seriales generados ya existe (cargado a mano con el mismo formato)",
+            "codigo": "SERIAL_DUPLICADO"
+        }), 409
     except Exception as e:
-        if conn:
-            conn.rollback()
         print(f"❌ Error agregando seriales en lote: {e}")
         return jsonify({"error": f"Error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
             
 # ====================================================================
 # INICIO DE LA APLICACIÓN
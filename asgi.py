@@ -0,0 +1,612 @@
+"""Punto de entrada ASGI (async) con el mismo contrato HTTP que app.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+Login/logout/check, los GET de inventario más pedidos y el stream de eventos
+se atienden con psycopg 3 async y su propio pool: mientras una consulta (o
+la demora de un login fallido) espera, el mismo proceso sigue atendiendo
+cientos de requests. Las demás rutas (escrituras, importación, historial,
+lookup, diagnóstico, estáticos) pasan a la app Flask de siempre por un puente
+WSGI con un pool de hilos, así el stock, el historial, los NOTIFY y la
+versión del inventario se mantienen en un solo lugar.
+
+Comparte con app.py las consultas, la paginación, la sesión (misma cookie
+firmada), los ETag/304 y la compresión: un cliente no distingue un modo del otro.
+"""
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import psycopg
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import http_date, parse_accept_header, parse_date, parse_etags, quote_etag
+
+import app as inventario
+from app import (
+    CANAL_EVENTOS, CODIFICACIONES, COMPRESION_MIN_BYTES, CONSULTA_ESTADISTICAS,
+    CONSULTA_INVENTARIO_STOCK, CONSULTA_PRODUCTO, CONSULTA_PRODUCTOS, CONSULTA_PRODUCTOS_DETALLADO,
+    CONSULTA_SERIALES_PRODUCTO, CONSULTA_STOCK_BAJO, CONSULTA_TIPOS_PIEZA, CONSULTA_VERSION,
+    COLUMNAS_INVENTARIO_STOCK, COLUMNAS_PRODUCTOS_DETALLADO, COINCIDENCIAS_ILIKE, COINCIDENCIAS_TRGM,
+    CONSULTA_BUSQUEDA, CONSULTA_TRGM_DISPONIBLE, DEMORA_LOGIN_FALLIDO, ESTADISTICAS_TTL,
+    EXPORTAR_LOTE, EXPORTAR_TROZO_BYTES, ORIGENES_CORS, RUTAS_NDJSON, SSE_COLA_MAX, SSE_DURACION_MAX,
+    SSE_LATIDO, SSE_MAX_CLIENTES, STREAM_MAX_SIMULTANEOS,
+    CompresorFlujo, armar_pagina, comprimir, datos_sesion, observar_request, parametros_busqueda,
+    parametros_conexion, pide_ndjson, pide_paginacion, plan_pagina_productos, usuario_sesion,
+    validar_condicional,
+)
+
+flask_app = inventario.app
+
+# Respuestas grandes: serializar / comprimir fuera del event loop
+SERIALIZAR_EN_HILO_FILAS = 1000
+COMPRIMIR_EN_HILO_BYTES = 256 * 1024
+
+# ====================================================================
+# POOL DE CONEXIONES ASYNC (UNO POR PROCESO)
+# ====================================================================
+def _parametros_psycopg():
+    parametros = parametros_conexion()
+    parametros['dbname'] = parametros.pop('database')
+    return {clave: valor for clave, valor in parametros.items() if valor is not None}
+
+pool = AsyncConnectionPool(
+    kwargs=dict(_parametros_psycopg(), row_factory=dict_row),
+    min_size=int(os.environ.get('ASYNC_DB_POOL_MIN', 1)),
+    max_size=int(os.environ.get('ASYNC_DB_POOL_MAX', 20)),
+    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+    open=False,
+)
+
+async def consultar(sql, params=None, una=False):
+    """Ejecuta una consulta con una conexión prestada: lista de dicts (o un dict / None)"""
+    async with pool.connection() as conn:
+        cur = await conn.execute(sql, params)
+        return await cur.fetchone() if una else await cur.fetchall()
+
+# ====================================================================
+# SESIÓN: LA MISMA COOKIE FIRMADA QUE FLASK
+# ====================================================================
+_serializador = flask_app.session_interface.get_signing_serializer(flask_app)
+_duracion_sesion = flask_app.permanent_session_lifetime
+
+def leer_sesion(request):
+    valor = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not valor:
+        return {}
+    try:
+        return dict(_serializador.loads(valor, max_age=int(_duracion_sesion.total_seconds())))
+    except BadSignature:
+        return {}
+
+def guardar_sesion(response, sesion):
+    """Reenvía la cookie (SESSION_REFRESH_EACH_REQUEST: la vigencia se renueva)"""
+    response.set_cookie(
+        flask_app.config['SESSION_COOKIE_NAME'],
+        _serializador.dumps(sesion),
+        expires=datetime.now(timezone.utc) + _duracion_sesion,
+        path=flask_app.config['SESSION_COOKIE_PATH'],
+        domain=flask_app.config['SESSION_COOKIE_DOMAIN'],
+        secure=flask_app.config['SESSION_COOKIE_SECURE'],
+        httponly=flask_app.config['SESSION_COOKIE_HTTPONLY'],
+        samesite=flask_app.config['SESSION_COOKIE_SAMESITE'].lower(),
+    )
+
+# ====================================================================
+# RESPUESTAS: JSON, COMPRESIÓN, ETag Y CABECERAS COMUNES
+# ====================================================================
+async def responder(request, datos, status=200):
+    """Como jsonify + after_request de app.py: mismo cuerpo, compresión y validadores"""
+    if isinstance(datos, list) and len(datos) > SERIALIZAR_EN_HILO_FILAS:
+        cuerpo = await asyncio.to_thread(lambda: flask_app.json.response(datos).get_data())
+    else:
+        cuerpo = flask_app.json.response(datos).get_data()
+
+    headers = {}
+    etag = getattr(request.state, 'etag', None)
+    if status == 200 and etag:
+        headers['Cache-Control'] = 'private, no-cache'
+        headers['Last-Modified'] = http_date(request.state.actualizado)
+    if varia_por_accept(request):
+        headers['Vary'] = 'Accept'
+
+    if status == 200 and len(cuerpo) >= COMPRESION_MIN_BYTES:
+        headers['Vary'] = ', '.join(filter(None, [headers.get('Vary'), 'Accept-Encoding']))
+        codificacion = parse_accept_header(request.headers.get('accept-encoding')).best_match(CODIFICACIONES)
+        if codificacion:
+            if len(cuerpo) > COMPRIMIR_EN_HILO_BYTES:
+                cuerpo = await asyncio.to_thread(comprimir, cuerpo, codificacion)
+            else:
+                cuerpo = comprimir(cuerpo, codificacion)
+            headers['Content-Encoding'] = codificacion
+            if etag:
+                etag = f'{etag}-{codificacion}'
+    if status == 200 and etag:
+        headers['ETag'] = quote_etag(etag)
+
+    return Response(cuerpo, status_code=status, headers=headers, media_type='application/json')
+
+def varia_por_accept(request):
+    """Las rutas de RUTAS_NDJSON responden JSON o NDJSON según Accept"""
+    return getattr(request.scope.get('endpoint'), '__name__', None) in RUTAS_NDJSON
+
+def cabeceras_comunes(request, response):
+    """Headers de seguridad y CORS (after_request y flask_cors en app.py)"""
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['X-Frame-Options'] = 'DENY'
+    response.headers['X-XSS-Protection'] = '1; mode=block'
+    origin = request.headers.get('origin', '')
+    if origin in ORIGENES_CORS:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers['Access-Control-Expose-Headers'] = 'ETag, Last-Modified'
+        response.headers.append('Vary', 'Origin')
+    return response
+
+def ruta(f):
+    """Decorator base de las rutas async: cabeceras comunes y métricas (con el
+    nombre del endpoint de Flask equivalente; sin las de BD)"""
+    async def decorated_function(request):
+        inicio = time.perf_counter()
+        response = cabeceras_comunes(request, await f(request))
+        observar_request(f.__name__, request.method, response.status_code, time.perf_counter() - inicio,
+                         0 if isinstance(response, StreamingResponse) else len(response.body))
+        return response
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+def protected_route(f):
+    """Decorator para rutas que requieren autenticación"""
+    async def decorated_function(request):
+        sesion = leer_sesion(request)
+        if 'user_id' not in sesion:
+            return await responder(request, {"error": "No autorizado"}, 401)
+        request.state.sesion = sesion
+        response = await f(request)
+        guardar_sesion(response, sesion)
+        return response
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+async def leer_version_inventario():
+    try:
+        fila = await consultar(CONSULTA_VERSION, una=True)
+    except (psycopg.Error, PoolTimeout) as e:
+        print(f"⚠️ Sin versión de inventario (¿python migrar.py aplicar?): {e}")
+        return None
+    return (fila['version'], fila['actualizado'], fila['referencia']) if fila else None
+
+def con_version(f):
+    """ETag fuerte + Last-Modified y 304 si el inventario no cambió (como en app.py)"""
+    async def decorated_function(request):
+        version = await leer_version_inventario()
+        if version is None:
+            return await f(request)
+
+        numero, actualizado, referencia = version
+        vigente, etag = validar_condicional(
+            numero, actualizado,
+            parse_etags(request.headers.get('if-none-match')),
+            parse_date(request.headers.get('if-modified-since')),
+        )
+        request.state.version_inventario = numero
+        request.state.version_referencia = referencia
+        request.state.actualizado = actualizado
+        if vigente:
+            response = Response(status_code=304, headers={
+                'ETag': quote_etag(etag),
+                'Last-Modified': http_date(actualizado),
+                'Cache-Control': 'private, no-cache',
+            })
+            if varia_por_accept(request):
+                response.headers['Vary'] = 'Accept'
+            return response
+        request.state.etag = etag
+        return await f(request)
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+def error_bd(request, e, contexto, mensaje):
+    print(f"Error en {contexto}: {e}")
+    if isinstance(e, PoolTimeout):
+        return responder(request, {"error": "No se pudo conectar a la base de datos"}, 500)
+    return responder(request, {"error": f"{mensaje}: {str(e)}"}, 500)
+
+# ====================================================================
+# AUTENTICACIÓN
+# ====================================================================
+@ruta
+async def login(request):
+    """Login: un intento fallido espera sin ocupar un worker"""
+    try:
+        if request.headers.get('content-type', '').split(';')[0].strip() != 'application/json':
+            raise ValueError("Se esperaba application/json")
+        data = json.loads(await request.body())
+        if not data:
+            return await responder(request, {"error": "Datos JSON requeridos"}, 400)
+
+        username = data.get('username', '').strip()
+        password = data.get('password', '')
+
+        print(f"🔐 Intento de login: {username}")
+
+        if not username or not password:
+            return await responder(request, {"error": "Usuario y contraseña requeridos"}, 400)
+
+        datos = datos_sesion(username, password)
+        if datos:
+            sesion = dict(datos, _permanent=True)
+            print(f"✅ Login exitoso para: {username}")
+            response = await responder(request, {"mensaje": "Login exitoso", "user": usuario_sesion(sesion)})
+            guardar_sesion(response, sesion)
+            return response
+
+        await asyncio.sleep(DEMORA_LOGIN_FALLIDO)
+        print(f"❌ Credenciales inválidas para: {username}")
+        return await responder(request, {"error": "Credenciales inválidas"}, 401)
+
+    except Exception as e:
+        print(f"🔥 Error en login: {e}")
+        return await responder(request, {"error": "Error interno del servidor"}, 500)
+
+@ruta
+async def logout(request):
+    """Cerrar sesión de forma segura"""
+    user = leer_sesion(request).get('username', 'Unknown')
+    print(f"✅ Sesión cerrada para: {user}")
+    response = await responder(request, {"mensaje": "Logout exitoso"})
+    response.delete_cookie(flask_app.config['SESSION_COOKIE_NAME'], path='/')
+    return response
+
+@ruta
+async def check_auth(request):
+    """Verificar sesión activa"""
+    sesion = leer_sesion(request)
+    if 'user_id' not in sesion:
+        return await responder(request, {"authenticated": False})
+    sesion['last_activity'] = datetime.now().isoformat()
+    response = await responder(request, {"authenticated": True, "user": usuario_sesion(sesion)})
+    guardar_sesion(response, sesion)
+    return response
+
+# ====================================================================
+# LISTAS GRANDES EN NDJSON (ver app.responder_ndjson)
+# ====================================================================
+_streams = {'activos': 0}
+
+def quiere_ndjson(request):
+    return pide_ndjson(request.query_params, parse_accept_header(request.headers.get('accept'), MIMEAccept))
+
+async def _filas_en_streaming(nombre, sql, params):
+    """Primero None (conexión prestada y cursor declarado), después las filas por lotes"""
+    try:
+        async with pool.connection() as conn:
+            async with conn.cursor(name=f'stream_{nombre}') as cur:
+                cur.itersize = EXPORTAR_LOTE
+                await cur.execute(sql, params)
+                yield None
+                async for fila in cur:
+                    yield fila
+    finally:
+        _streams['activos'] -= 1
+
+async def responder_ndjson(request, nombre, sql, params=None):
+    """Una línea JSON por fila, leída con un cursor con nombre: memoria constante"""
+    if _streams['activos'] >= STREAM_MAX_SIMULTANEOS:
+        response = await responder(request, {"error": "Demasiadas respuestas en streaming en este worker"}, 503)
+        response.headers['Retry-After'] = '30'
+        return response
+    _streams['activos'] += 1
+    filas = _filas_en_streaming(nombre, sql, params)
+    await filas.__anext__()
+
+    headers = {'X-Accel-Buffering': 'no', 'Vary': 'Accept, Accept-Encoding'}
+    etag = getattr(request.state, 'etag', None)
+    codificacion = parse_accept_header(request.headers.get('accept-encoding')).best_match(CODIFICACIONES)
+    compresor = CompresorFlujo(codificacion) if codificacion else None
+    if codificacion:
+        headers['Content-Encoding'] = codificacion
+        etag = etag and f'{etag}-{codificacion}'
+    if etag:
+        headers['ETag'] = quote_etag(etag)
+        headers['Last-Modified'] = http_date(request.state.actualizado)
+        headers['Cache-Control'] = 'private, no-cache'
+
+    async def generar():
+        try:
+            trozo, tamano, primera = [], 0, True
+            async for fila in filas:
+                linea = flask_app.json.dumps(fila).encode('utf-8') + b'\n'
+                trozo.append(linea)
+                tamano += len(linea)
+                if primera or tamano >= EXPORTAR_TROZO_BYTES:
+                    datos = b''.join(trozo)
+                    yield compresor.comprimir(datos) if compresor else datos
+                    trozo, tamano, primera = [], 0, False
+            datos = b''.join(trozo)
+            yield compresor.comprimir(datos) + compresor.terminar() if compresor else datos
+        finally:
+            await filas.aclose()
+
+    return StreamingResponse(generar(), media_type='application/x-ndjson', headers=headers)
+
+# ====================================================================
+# INVENTARIO (LECTURAS)
+# ====================================================================
+async def lista_paginable(request, columnas, consulta_completa):
+    """Página keyset si el request la pide; si no, la lista completa"""
+    if pide_paginacion(request.query_params):
+        plan = plan_pagina_productos(request.query_params, columnas)
+        async with pool.connection() as conn:
+            total = (await (await conn.execute(*plan['total'])).fetchone())['count']
+            filas = await (await conn.execute(*plan['pagina'])).fetchall()
+        return armar_pagina(plan, total, filas)
+    return await consultar(consulta_completa)
+
+@ruta
+@protected_route
+@con_version
+async def obtener_inventario_stock(request):
+    """Obtiene inventario completo con estadísticas"""
+    try:
+        if quiere_ndjson(request) and not pide_paginacion(request.query_params):
+            return await responder_ndjson(request, 'inventario_stock', CONSULTA_INVENTARIO_STOCK)
+        return await responder(request, await lista_paginable(request, COLUMNAS_INVENTARIO_STOCK,
+                                                              CONSULTA_INVENTARIO_STOCK))
+    except ValueError as e:
+        return await responder(request, {"error": str(e)}, 400)
+    except Exception as e:
+        return await error_bd(request, e, '/stock', 'Error al obtener inventario')
+
+@ruta
+@protected_route
+@con_version
+async def obtener_productos_detallado(request):
+    """Obtiene inventario con detalles de stock por estado"""
+    try:
+        if quiere_ndjson(request) and not pide_paginacion(request.query_params):
+            return await responder_ndjson(request, 'productos_detallado', CONSULTA_PRODUCTOS_DETALLADO)
+        return await responder(request, await lista_paginable(request, COLUMNAS_PRODUCTOS_DETALLADO,
+                                                              CONSULTA_PRODUCTOS_DETALLADO))
+    except ValueError as e:
+        return await responder(request, {"error": str(e)}, 400)
+    except Exception as e:
+        return await error_bd(request, e, '/productos/detallado', 'Error')
+
+# Snapshot por proceso atado a la versión del inventario (ver app.py)
+_snapshot_estadisticas = {'datos': None, 'expira': 0.0, 'version': None}
+
+@inventario.al_invalidar('producto', 'stock')
+def _invalidar_estadisticas(tipo, ids):
+    _snapshot_estadisticas['datos'] = None
+
+@ruta
+@protected_route
+@con_version
+async def obtener_estadisticas(request):
+    """Obtiene estadísticas generales del inventario"""
+    try:
+        version = getattr(request.state, 'version_inventario', None)
+        snapshot = _snapshot_estadisticas
+        if (snapshot['datos'] is not None and time.monotonic() < snapshot['expira']
+                and snapshot['version'] == version and request.query_params.get('fresco') != '1'):
+            return await responder(request, snapshot['datos'])
+
+        stats = await consultar(CONSULTA_ESTADISTICAS, una=True)
+        stats['as_of'] = datetime.now().isoformat()
+        snapshot.update(datos=stats, expira=time.monotonic() + ESTADISTICAS_TTL, version=version)
+        return await responder(request, stats)
+    except Exception as e:
+        return await error_bd(request, e, '/estadisticas', 'Error al obtener estadísticas')
+
+async def consultar_referencia(request, nombre, sql):
+    """consulta_referencia de app.py con el pool async: comparten CACHE_REFERENCIA"""
+    cache = inventario.CACHE_REFERENCIA
+    version = getattr(request.state, 'version_referencia', None)
+    if version is None or cache.ttl <= 0:
+        return await consultar(sql)
+    clave = cache.clave(sql)
+    filas = cache.obtener(nombre, clave, version)
+    if filas is None:
+        filas = await consultar(sql)
+        cache.guardar(nombre, clave, version, filas)
+    return filas
+
+def lectura_simple(nombre, consulta, contexto, mensaje, parametro=None, una=False, cache=None, ndjson=False):
+    """Ruta GET protegida y versionada que devuelve el resultado de una consulta
+    (con `cache`, desde la caché de datos de referencia; con `ndjson`, en
+    streaming si el cliente lo pide)"""
+    async def leer(request):
+        try:
+            params = (request.path_params[parametro],) if parametro else None
+            if ndjson and quiere_ndjson(request):
+                return await responder_ndjson(request, nombre, consulta, params)
+            if cache:
+                resultado = await consultar_referencia(request, cache, consulta)
+            else:
+                resultado = await consultar(consulta, params, una=una)
+            if una and resultado is None:
+                return await responder(request, {"error": "Producto no encontrado"}, 404)
+            return await responder(request, resultado)
+        except Exception as e:
+            return await error_bd(request, e, contexto, mensaje)
+    leer.__name__ = nombre
+    return ruta(protected_route(con_version(leer)))
+
+obtener_tipos_pieza = lectura_simple(
+    'obtener_tipos_pieza', CONSULTA_TIPOS_PIEZA, '/tipos_pieza', 'Error al obtener tipos', cache='tipos_pieza')
+obtener_todos_los_productos = lectura_simple(
+    'obtener_todos_los_productos', CONSULTA_PRODUCTOS, '/productos', 'Error al obtener productos',
+    cache='productos')
+obtener_producto_por_id = lectura_simple(
+    'obtener_producto_por_id', CONSULTA_PRODUCTO, '/productos/<id>', 'Error', 'producto_id', una=True)
+obtener_seriales_por_producto = lectura_simple(
+    'obtener_seriales_por_producto', CONSULTA_SERIALES_PRODUCTO, '/seriales', 'Error', 'producto_id',
+    ndjson=True)
+obtener_stock_bajo = lectura_simple('obtener_stock_bajo', CONSULTA_STOCK_BAJO, '/stock_bajo', 'Error')
+
+_busqueda_trgm = None
+
+@inventario.al_invalidar()
+def _olvidar_busqueda_trgm(tipo, ids):
+    global _busqueda_trgm
+    _busqueda_trgm = None
+
+@ruta
+@protected_route
+@con_version
+async def buscar_productos(request):
+    """Busca productos por nombre, SKU, marca, modelo o número de serie"""
+    global _busqueda_trgm
+    try:
+        try:
+            parametros = parametros_busqueda(request.query_params)
+        except ValueError as e:
+            return await responder(request, {"error": str(e)}, 400)
+
+        async with pool.connection() as conn:
+            if _busqueda_trgm is None:
+                fila = await (await conn.execute(CONSULTA_TRGM_DISPONIBLE)).fetchone()
+                _busqueda_trgm = next(iter(fila.values()))
+            coincidencias = COINCIDENCIAS_TRGM if _busqueda_trgm else COINCIDENCIAS_ILIKE
+            cur = await conn.execute(CONSULTA_BUSQUEDA.format(coincidencias=coincidencias), parametros)
+            resultados = await cur.fetchall()
+
+        return await responder(request, {
+            "query": parametros['q'],
+            "resultados": resultados,
+            "total": len(resultados),
+            "limit": parametros['limite'],
+        })
+    except Exception as e:
+        return await error_bd(request, e, 'búsqueda', 'Error')
+
+# ====================================================================
+# EVENTOS DE STOCK EN TIEMPO REAL (LISTEN/NOTIFY + SSE)
+# ====================================================================
+# Misma semántica que EscuchaEventos en app.py, con una tarea asyncio en
+# lugar de un hilo: una conexión LISTEN por proceso para todos sus clientes.
+class EscuchaEventosAsync:
+
+    def __init__(self, canal=CANAL_EVENTOS):
+        self.canal = canal
+        self._suscriptores = set()
+        self._tarea = None
+
+    def suscribir(self):
+        if len(self._suscriptores) >= SSE_MAX_CLIENTES:
+            return None
+        cola = asyncio.Queue(maxsize=SSE_COLA_MAX)
+        self._suscriptores.add(cola)
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._escuchar())
+        return cola
+
+    def desuscribir(self, cola):
+        self._suscriptores.discard(cola)
+        if not self._suscriptores and self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+
+    def _repartir(self, evento, datos):
+        for cola in list(self._suscriptores):
+            try:
+                cola.put_nowait((evento, datos))
+            except asyncio.QueueFull:
+                while not cola.empty():
+                    cola.get_nowait()
+                cola.put_nowait(('recargar', '{}'))
+
+    async def _escuchar(self):
+        espera, reconexion = 1, False
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(**_parametros_psycopg(), autocommit=True) as conn:
+                    await conn.execute(f'LISTEN "{self.canal}"')
+                    print(f"📡 Escuchando {self.canal} (pid {os.getpid()}, async)")
+                    if reconexion:
+                        self._repartir('recargar', '{}')
+                    espera = 1
+                    async for notificacion in conn.notifies():
+                        try:
+                            evento = json.loads(notificacion.payload).get('tipo', 'mensaje')
+                        except ValueError:
+                            continue
+                        self._repartir(evento, notificacion.payload)
+            except (psycopg.Error, OSError) as e:
+                print(f"⚠️ Escucha de eventos desconectada: {e}")
+                reconexion = True
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, 30)
+
+escucha = EscuchaEventosAsync()
+
+@ruta
+@protected_route
+async def eventos_inventario(request):
+    """Server-Sent Events con los cambios de stock (ver app.eventos_inventario)"""
+    cola = escucha.suscribir()
+    if cola is None:
+        response = await responder(request, {"error": "Demasiados clientes de eventos en este worker"}, 503)
+        response.headers['Retry-After'] = '30'
+        return response
+
+    async def generar():
+        try:
+            yield 'retry: 5000\n\n'
+            limite = time.monotonic() + SSE_DURACION_MAX
+            while time.monotonic() < limite:
+                try:
+                    evento, datos = await asyncio.wait_for(cola.get(), SSE_LATIDO)
+                except asyncio.TimeoutError:
+                    yield ': latido\n\n'
+                    continue
+                yield f'event: {evento}\ndata: {datos}\n\n'
+        finally:
+            escucha.desuscribir(cola)
+
+    return StreamingResponse(generar(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# ====================================================================
+# APLICACIÓN
+# ====================================================================
+@asynccontextmanager
+async def ciclo_de_vida(aplicacion):
+    await pool.open(wait=False)
+    print(f"🏊 Pool async listo (pid {os.getpid()}, max {pool.max_size})")
+    # Las rutas nativas no pasan por before_request de Flask
+    inventario.obtener_bus()
+    yield
+    await pool.close()
+
+app = Starlette(
+    routes=[
+        Route('/api/auth/login', login, methods=['POST']),
+        Route('/api/auth/logout', logout, methods=['POST']),
+        Route('/api/auth/check', check_auth, methods=['GET']),
+        Route('/api/inventario/stock', obtener_inventario_stock, methods=['GET']),
+        Route('/api/inventario/estadisticas', obtener_estadisticas, methods=['GET']),
+        Route('/api/inventario/tipos_pieza', obtener_tipos_pieza, methods=['GET']),
+        Route('/api/inventario/productos', obtener_todos_los_productos, methods=['GET']),
+        Route('/api/inventario/productos/detallado', obtener_productos_detallado, methods=['GET']),
+        Route('/api/inventario/productos/{producto_id:int}', obtener_producto_por_id, methods=['GET']),
+        Route('/api/inventario/seriales/{producto_id:int}', obtener_seriales_por_producto, methods=['GET']),
+        Route('/api/inventario/stock_bajo', obtener_stock_bajo, methods=['GET']),
+        Route('/api/inventario/buscar', buscar_productos, methods=['GET']),
+        Route('/api/inventario/eventos', eventos_inventario, methods=['GET']),
+        # Todo lo demás (incluido OPTIONS de las rutas de arriba): la app Flask
+        Mount('/', app=WSGIMiddleware(flask_app, workers=int(os.environ.get('ASGI_HILOS_WSGI', 16)))),
+    ],
+    lifespan=ciclo_de_vida,
+)
@@ -0,0 +1,150 @@
+"""Benchmark del modo de servicio: gunicorn sync vs. gthread vs. asgi.py (uvicorn).
+
+Siembra un esquema aislado y, para cada modo y cada nivel de concurrencia,
+lanza N clientes que durante `--duracion` segundos repiten una mezcla de
+lecturas del dashboard (stock paginado, producto, estadísticas, búsqueda,
+check de sesión), la lista completa de /stock y logins fallidos (que esperan
+DEMORA_LOGIN_FALLIDO antes de responder). Reporta throughput, p50/p95/p99 y
+errores por modo; con un proceso esperando I/O, asgi.py sigue atendiendo al
+resto de los clientes.
+
+Uso:
+    python benchmarks/bench_asgi.py [--concurrencia 32 128 256] [--modos sync gthread asgi] [--duracion 15]
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import get_db_connection
+from carga import MODOS_SERVIDOR, Cliente, percentil, servidor
+import datos_sinteticos
+
+# (peso, nombre, método, ruta o función(ctx) -> ruta, cuerpo)
+MEZCLA = [
+    (30, 'stock?limit=50', 'GET', lambda ctx: f'/api/inventario/stock?limit=50&sort=-stock'
+                                              f'&categoria={random.choice(ctx["tipos"])}', None),
+    (20, 'productos/<id>', 'GET', lambda ctx: f'/api/inventario/productos/{random.choice(ctx["productos"])}', None),
+    (15, 'estadisticas', 'GET', lambda ctx: '/api/inventario/estadisticas', None),
+    (10, 'buscar', 'GET', lambda ctx: f'/api/inventario/buscar?q={quote(random.choice(ctx["skus"]))}', None),
+    (10, 'auth/check', 'GET', lambda ctx: '/api/auth/check', None),
+    (10, 'login fallido', 'POST', lambda ctx: '/api/auth/login', {'username': 'admin', 'password': 'incorrecta'}),
+    (5, 'stock completo', 'GET', lambda ctx: '/api/inventario/stock', None),
+]
+ESPERADO = {'login fallido': 401}
+
+
+def medir(host, puerto, ctx, concurrencia, duracion):
+    latencias, por_ruta, errores = [], collections.defaultdict(list), collections.Counter()
+    candado = threading.Lock()
+    pesos = [m[0] for m in MEZCLA]
+    clientes = []
+    for _ in range(concurrencia):
+        cliente = Cliente(host, puerto)
+        cliente.login()
+        clientes.append(cliente)
+
+    listo = threading.Barrier(concurrencia + 1)
+    fin = [0.0]
+
+    def trabajar(cliente):
+        listo.wait()
+        while time.perf_counter() < fin[0]:
+            _, nombre, metodo, ruta, cuerpo = random.choices(MEZCLA, pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                estado, _ = cliente.pedir(metodo, ruta(ctx), cuerpo)
+            except Exception as e:
+                with candado:
+                    errores[type(e).__name__] += 1
+                cliente.conexion.close()
+                continue
+            ms = (time.perf_counter() - inicio) * 1000
+            with candado:
+                latencias.append(ms)
+                por_ruta[nombre].append(ms)
+                if estado != ESPERADO.get(nombre, 200):
+                    errores[str(estado)] += 1
+
+    hilos = [threading.Thread(target=trabajar, args=(c,)) for c in clientes]
+    for hilo in hilos:
+        hilo.start()
+    fin[0] = time.perf_counter() + duracion
+    listo.wait()
+    for hilo in hilos:
+        hilo.join()
+    for cliente in clientes:
+        cliente.conexion.close()
+
+    latencias.sort()
+    return {
+        'concurrencia': concurrencia,
+        'peticiones': len(latencias),
+        'rps': round(len(latencias) / duracion, 1),
+        'p50_ms': percentil(latencias, 50),
+        'p95_ms': percentil(latencias, 95),
+        'p99_ms': percentil(latencias, 99),
+        'errores': dict(errores),
+        'p95_por_ruta_ms': {nombre: percentil(sorted(valores), 95) for nombre, valores in por_ruta.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modos', nargs='+', choices=sorted(MODOS_SERVIDOR), default=['sync', 'gthread', 'asgi'])
+    parser.add_argument('--concurrencia', type=int, nargs='+', default=[32, 128, 256])
+    parser.add_argument('--duracion', type=float, default=15.0, help='segundos por medición')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--productos', type=int, default=5000)
+    parser.add_argument('--seriales', type=int, default=50000)
+    parser.add_argument('--esquema', default='bench_asgi')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+
+    resultados = []
+    try:
+        print(f"🌱 Sembrando {args.productos:,} productos / {args.seriales:,} seriales...")
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, args.productos, args.seriales, historial=False)
+        cur.execute('SELECT producto_id, codigo_sku FROM productos ORDER BY random() LIMIT 500')
+        muestra = cur.fetchall()
+        cur.execute('SELECT tipo_id FROM tipos_pieza')
+        ctx = {
+            'productos': [fila[0] for fila in muestra],
+            'skus': [fila[1] for fila in muestra],
+            'tipos': [fila[0] for fila in cur.fetchall()],
+        }
+        conn.commit()
+
+        for modo in args.modos:
+            with servidor(args.esquema, args.workers, modo) as (host, puerto):
+                for concurrencia in args.concurrencia:
+                    resumen = dict(medir(host, puerto, ctx, concurrencia, args.duracion), modo=modo)
+                    resultados.append(resumen)
+                    print(f"{'⚠️' if resumen['errores'] else '✅'} {modo:<8s} c={concurrencia:<4d} "
+                          f"{resumen['rps']:>8.1f} req/s  p50 {resumen['p50_ms'] or 0:>8.1f}  "
+                          f"p95 {resumen['p95_ms'] or 0:>8.1f}  p99 {resumen['p99_ms'] or 0:>8.1f} ms  "
+                          f"errores {sum(resumen['errores'].values())}")
+    finally:
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    print(json.dumps({'workers': args.workers, 'duracion_s': args.duracion, 'resultados': resultados},
+                     indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
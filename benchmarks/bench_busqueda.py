@@ -0,0 +1,126 @@
+"""Benchmark de /api/inventario/buscar: ILIKE anterior vs. índice trigram.
+
+Siembra un esquema aislado (100k productos por defecto), mide la consulta
+anterior (ILIKE '%término%' sobre cuatro columnas, seq scan) y, tras aplicar
+migraciones/0004_busqueda_productos.sql en ese esquema, la consulta actual
+(CONSULTA_BUSQUEDA con COINCIDENCIAS_TRGM). Requiere pg_trgm y unaccent.
+
+Uso:
+    python benchmarks/bench_busqueda.py [--productos 100000] [--seriales 200000] [--repeticiones 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from app import get_db_connection, CONSULTA_BUSQUEDA, COINCIDENCIAS_TRGM, MAX_SERIALES_BUSQUEDA, escapar_like
+import datos_sinteticos
+
+CONSULTA_ANTERIOR = """
+SELECT
+    p.producto_id,
+    p.nombre,
+    p.marca,
+    p.modelo,
+    p.codigo_sku,
+    tp.tipo_modelo as categoria,
+    COALESCE(ps.total, 0) as total_unidades,
+    COALESCE(ps.almacen, 0) as en_almacen
+FROM productos p
+JOIN tipos_pieza tp ON p.tipo_pieza_id = tp.tipo_id
+LEFT JOIN producto_stock ps ON p.producto_id = ps.producto_id
+WHERE p.nombre ILIKE %(patron)s
+   OR p.codigo_sku ILIKE %(patron)s
+   OR p.marca ILIKE %(patron)s
+   OR p.modelo ILIKE %(patron)s
+ORDER BY p.nombre;
+"""
+
+# Término exacto, SKU, marca, modelo, serial y uno con errata que ILIKE no encuentra
+TERMINOS = ['Producto 4242', 'SKU-0050000', 'lenovo', 'M-42', 'SN00001234', 'prodcto 77']
+
+
+def medir(cur, consulta, params, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cur.execute(consulta, params)
+        filas = cur.fetchall()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return round(statistics.median(tiempos), 2), len(filas)
+
+
+def usa_indice_trgm(cur, consulta, params):
+    cur.execute('EXPLAIN ' + consulta, params)
+    return any('idx_productos_busqueda_trgm' in fila[0] for fila in cur.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--productos', type=int, default=100000)
+    parser.add_argument('--seriales', type=int, default=200000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--esquema', default='bench_busqueda')
+    parser.add_argument('--mantener', action='store_true', help='no borrar el esquema al terminar')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+
+    try:
+        print(f"🌱 Sembrando {args.productos:,} productos / {args.seriales:,} seriales en '{args.esquema}'...")
+        inicio = time.perf_counter()
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, args.productos, args.seriales)
+        conn.commit()
+        print(f"   listo en {time.perf_counter() - inicio:.1f} s")
+
+        anterior = {}
+        for termino in TERMINOS:
+            anterior[termino] = medir(cur, CONSULTA_ANTERIOR, {'patron': f'%{termino}%'}, args.repeticiones)
+
+        with open(os.path.join(RAIZ, 'migraciones', '0004_busqueda_productos.sql'), encoding='utf-8') as f:
+            cur.execute(f.read())
+        conn.commit()
+        cur.execute("SELECT to_regproc('texto_busqueda_producto')")
+        if cur.fetchone()[0] is None:
+            sys.exit("❌ pg_trgm / unaccent no disponibles en este servidor")
+
+        consulta = CONSULTA_BUSQUEDA.format(coincidencias=COINCIDENCIAS_TRGM)
+        resultados = []
+        for termino in TERMINOS:
+            params = {'q': termino, 'patron': escapar_like(termino),
+                      'limite': args.limit, 'max_seriales': MAX_SERIALES_BUSQUEDA}
+            actual = medir(cur, consulta, params, args.repeticiones)
+            fila = {
+                'termino': termino,
+                'anterior_ms': anterior[termino][0],
+                'anterior_filas': anterior[termino][1],
+                'actual_ms': actual[0],
+                'actual_filas': actual[1],
+                'usa_indice_trgm': usa_indice_trgm(cur, consulta, params),
+            }
+            resultados.append(fila)
+            print(f"🔍 {termino!r:<16} anterior {fila['anterior_ms']:>8.1f} ms ({fila['anterior_filas']:>6} filas)  "
+                  f"actual {fila['actual_ms']:>8.1f} ms ({fila['actual_filas']:>3} filas)  "
+                  f"{'✅ trgm' if fila['usa_indice_trgm'] else '⚠️ sin índice'}")
+
+        print(json.dumps({'productos': args.productos, 'seriales': args.seriales, 'resultados': resultados}, indent=2))
+    finally:
+        conn.rollback()
+        if not args.mantener:
+            datos_sinteticos.eliminar_esquema(cur, args.esquema)
+            conn.commit()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
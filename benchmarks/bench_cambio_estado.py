@@ -0,0 +1,114 @@
+"""Benchmark de cambio de estado: N × PUT /serial/<id> vs. un POST /seriales/estado.
+
+Siembra un esquema aislado y, contra la app real (test client con su pool),
+pasa `--cantidad` seriales de ALMACEN a INSTALADO uno por uno y luego el
+mismo número de vuelta en una sola petición masiva. Informa transiciones por
+segundo de cada forma y verifica producto_stock al final. También comprueba
+que una fecha_actualizacion con zona horaria ("...Z" o "...-05:00") se
+compara por instante con la de la base (y que una vieja da CONFLICTO).
+
+Uso:
+    python benchmarks/bench_cambio_estado.py [--cantidad 500] [--productos 1000] [--seriales 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import get_db_connection
+import datos_sinteticos
+import producto_stock
+
+ZONA_SESION = 'America/Lima'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cantidad', type=int, default=500)
+    parser.add_argument('--productos', type=int, default=1000)
+    parser.add_argument('--seriales', type=int, default=100000)
+    parser.add_argument('--esquema', default='bench_cambio_estado')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+    ok = False
+
+    try:
+        print(f"🌱 Sembrando {args.productos:,} productos / {args.seriales:,} seriales...")
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, args.productos, args.seriales, historial=False)
+        cur.execute("""
+            SELECT serial_id FROM seriales WHERE estado = 'ALMACEN' ORDER BY random() LIMIT %s
+        """, (args.cantidad * 2,))
+        ids = [fila[0] for fila in cur.fetchall()]
+        conn.commit()
+
+        # El pool de la app abre sus conexiones ya apuntando al esquema sembrado,
+        # con una zona horaria de sesión distinta de UTC
+        os.environ['PGOPTIONS'] = f'-c search_path={args.esquema},public -c TimeZone={ZONA_SESION}'
+        import app as aplicacion
+        cliente = aplicacion.app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['user_id'] = 1
+            sesion['role'] = 'admin'
+
+        individuales, masivos = ids[:args.cantidad], ids[args.cantidad:]
+
+        inicio = time.perf_counter()
+        errores = sum(
+            cliente.put(f'/api/inventario/serial/{serial_id}', json={'estado': 'INSTALADO'}).status_code != 200
+            for serial_id in individuales
+        )
+        t_individual = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        respuesta = cliente.post('/api/inventario/seriales/estado', json={'seriales': masivos, 'estado': 'INSTALADO'})
+        t_masivo = time.perf_counter() - inicio
+        actualizados = respuesta.get_json().get('actualizados', 0)
+
+        resultado = {
+            'cantidad': args.cantidad,
+            'put_individual': {'segundos': round(t_individual, 3), 'por_segundo': round(len(individuales) / t_individual),
+                               'errores': errores},
+            'post_masivo': {'segundos': round(t_masivo, 3), 'por_segundo': round(actualizados / t_masivo),
+                            'actualizados': actualizados},
+            'aceleracion': round(t_individual / t_masivo, 1),
+        }
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+        # Concurrencia optimista con fechas con zona horaria
+        cur.execute("""
+            SELECT serial_id, fecha_actualizacion AT TIME ZONE %s
+            FROM seriales WHERE serial_id = ANY(%s) ORDER BY serial_id LIMIT 3
+        """, (ZONA_SESION, masivos))
+        (id_utc, fecha_utc), (id_offset, fecha_offset), (id_vieja, fecha_vieja) = cur.fetchall()
+        conn.commit()
+        menos_cinco = timezone(timedelta(hours=-5))
+        respuesta = cliente.post('/api/inventario/seriales/estado', json={'estado': 'DAÑADO', 'seriales': [
+            {'serial_id': id_utc, 'fecha_actualizacion': fecha_utc.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')},
+            {'serial_id': id_offset, 'fecha_actualizacion': fecha_offset.astimezone(menos_cinco).isoformat()},
+            {'serial_id': id_vieja, 'fecha_actualizacion': (fecha_vieja - timedelta(seconds=1)).isoformat()},
+        ]})
+        obtenidos = [r['resultado'] for r in respuesta.get_json()['resultados']]
+        zonas = obtenidos == ['ACTUALIZADO', 'ACTUALIZADO', 'CONFLICTO']
+        print(f"{'✅' if zonas else '❌'} fecha_actualizacion con zona (Z, -05:00, vieja): {obtenidos}")
+
+        ok = producto_stock.verificar(cur) and not errores and actualizados == len(masivos) and zonas
+    finally:
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark de regresión: /api/inventario/estadisticas anterior vs. actual.
+
+Siembra un esquema aislado (10k productos / 1M seriales por defecto) y
+compara con EXPLAIN (ANALYZE, BUFFERS) la consulta anterior (CROSS JOIN
+LATERAL + COUNT DISTINCT sobre seriales) contra CONSULTA_ESTADISTICAS,
+que hace una sola pasada sobre productos + producto_stock.
+
+Uso:
+    python benchmarks/bench_estadisticas.py [--productos 10000] [--seriales 1000000] [--mantener]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import get_db_connection, CONSULTA_ESTADISTICAS
+import datos_sinteticos
+
+CONSULTA_ANTERIOR = """
+SELECT
+    COUNT(DISTINCT p.producto_id) as total_modelos,
+    COUNT(DISTINCT s.serial_id) as total_seriales,
+    COUNT(DISTINCT CASE WHEN sub.stock_actual <= 3 THEN sub.producto_id END) as modelos_stock_bajo
+FROM productos p
+CROSS JOIN LATERAL (
+    SELECT
+        p2.producto_id,
+        COUNT(s2.serial_id) as stock_actual
+    FROM productos p2
+    LEFT JOIN seriales s2 ON p2.producto_id = s2.producto_id AND s2.estado = 'ALMACEN'
+    WHERE p2.producto_id = p.producto_id
+    GROUP BY p2.producto_id
+) sub
+LEFT JOIN seriales s ON p.producto_id = s.producto_id;
+"""
+
+
+def explicar(cur, consulta):
+    cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + consulta)
+    plan = cur.fetchone()[0][0]
+    raiz = plan['Plan']
+    return {
+        'tiempo_ms': round(plan['Execution Time'], 1),
+        'nodo_raiz': raiz['Node Type'],
+        'buffers_hit': raiz.get('Shared Hit Blocks', 0),
+        'buffers_read': raiz.get('Shared Read Blocks', 0),
+        'plan': plan,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--productos', type=int, default=10000)
+    parser.add_argument('--seriales', type=int, default=1000000)
+    parser.add_argument('--esquema', default='bench_estadisticas')
+    parser.add_argument('--mantener', action='store_true', help='no borrar el esquema al terminar')
+    parser.add_argument('--salida', help='archivo JSON con los planes completos')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+
+    try:
+        print(f"🌱 Sembrando {args.productos:,} productos / {args.seriales:,} seriales en '{args.esquema}'...")
+        inicio = time.perf_counter()
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, args.productos, args.seriales)
+        # Índice que la consulta anterior necesita para no ser cuadrática en seq scans
+        cur.execute('CREATE INDEX ON seriales (producto_id, estado)')
+        cur.execute('ANALYZE seriales')
+        conn.commit()
+        print(f"   listo en {time.perf_counter() - inicio:.1f} s")
+
+        cur.execute(CONSULTA_ANTERIOR)
+        anterior_valores = cur.fetchone()
+        cur.execute(CONSULTA_ESTADISTICAS)
+        actual_valores = cur.fetchone()
+
+        anterior = explicar(cur, CONSULTA_ANTERIOR)
+        actual = explicar(cur, CONSULTA_ESTADISTICAS)
+
+        print(f"📊 anterior: {anterior['tiempo_ms']:>10.1f} ms  {anterior['nodo_raiz']:<12s} "
+              f"buffers hit={anterior['buffers_hit']:,} read={anterior['buffers_read']:,}")
+        print(f"📊 actual:   {actual['tiempo_ms']:>10.1f} ms  {actual['nodo_raiz']:<12s} "
+              f"buffers hit={actual['buffers_hit']:,} read={actual['buffers_read']:,}")
+        print(f"⚡ {anterior['tiempo_ms'] / max(actual['tiempo_ms'], 0.001):.0f}x más rápido")
+
+        iguales = tuple(anterior_valores) == tuple(actual_valores)
+        print(f"{'✅' if iguales else '❌'} Resultados: anterior={tuple(anterior_valores)} actual={tuple(actual_valores)}")
+
+        resumen = {
+            'productos': args.productos,
+            'seriales': args.seriales,
+            'anterior_ms': anterior['tiempo_ms'],
+            'actual_ms': actual['tiempo_ms'],
+            'resultados_iguales': iguales,
+        }
+        print(json.dumps(resumen, indent=2))
+        if args.salida:
+            with open(args.salida, 'w', encoding='utf-8') as f:
+                json.dump({**resumen, 'plan_anterior': anterior['plan'], 'plan_actual': actual['plan']}, f, indent=2)
+    finally:
+        conn.rollback()
+        if not args.mantener:
+            datos_sinteticos.eliminar_esquema(cur, args.esquema)
+            conn.commit()
+        conn.close()
+
+    sys.exit(0 if iguales else 1)
+
+
+if __name__ == '__main__':
+    main()
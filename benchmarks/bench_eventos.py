@@ -0,0 +1,172 @@
+"""Benchmark de eventos en tiempo real: N dashboards conectados a /api/inventario/eventos.
+
+Siembra un esquema aislado, levanta gunicorn como en el Dockerfile (gthread;
+--modo asgi levanta asgi.py con uvicorn), abre `--clientes` conexiones SSE y
+hace `--escrituras` cambios de estado con PUT /serial/<id>. Para cada
+escritura mide cuánto tarda el evento `stock` en llegar a cada cliente y, con
+todos conectados, cuenta las conexiones LISTEN abiertas en PostgreSQL (una
+por worker, no una por cliente).
+
+Uso:
+    python benchmarks/bench_eventos.py [--clientes 200] [--escrituras 20] [--workers 4] [--modo asgi]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import CANAL_EVENTOS, get_db_connection
+from carga import MODOS_SERVIDOR, Cliente, percentil, servidor
+import datos_sinteticos
+
+
+class Suscriptor(threading.Thread):
+    """Cliente SSE mínimo: guarda (momento, evento, datos) de cada evento recibido"""
+
+    def __init__(self, host, puerto, cookie):
+        super().__init__(daemon=True)
+        self.sock = socket.create_connection((host, puerto))
+        self.sock.sendall((f'GET /api/inventario/eventos HTTP/1.1\r\nHost: {host}\r\n'
+                           f'Cookie: {cookie}\r\nAccept: text/event-stream\r\n\r\n').encode())
+        self.archivo = self.sock.makefile('rb')
+        self.estado = int(self.archivo.readline().split()[1])
+        while self.archivo.readline() not in (b'\r\n', b''):
+            pass
+        self.conectado = threading.Event()
+        self.eventos = []
+
+    def run(self):
+        evento = datos = None
+        for linea in self.archivo:
+            linea = linea.decode('utf-8').rstrip('\r\n')
+            if linea.startswith('retry:'):
+                self.conectado.set()
+            elif linea.startswith('event: '):
+                evento = linea[7:]
+            elif linea.startswith('data: '):
+                datos = linea[6:]
+            elif linea == '' and evento:
+                self.eventos.append((time.perf_counter(), evento, json.loads(datos)))
+                evento = datos = None
+
+    def cerrar(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def contar_listeners(cur):
+    cur.execute("""
+        SELECT COUNT(*) FROM pg_stat_activity
+        WHERE datname = current_database() AND query = %s
+    """, (f'LISTEN "{CANAL_EVENTOS}"',))
+    return cur.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clientes', type=int, default=200)
+    parser.add_argument('--escrituras', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--modo', choices=sorted(MODOS_SERVIDOR), default='gthread')
+    parser.add_argument('--esquema', default='bench_eventos')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+    ok = False
+    suscriptores = []
+
+    try:
+        print("🌱 Sembrando 1,000 productos / 20,000 seriales...")
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, 1000, 20000, historial=False)
+        cur.execute("SELECT serial_id, producto_id FROM seriales WHERE estado = 'ALMACEN' ORDER BY random() LIMIT %s",
+                    (args.escrituras,))
+        seriales = cur.fetchall()
+        conn.commit()
+
+        os.environ['SSE_LATIDO'] = '2'
+        with servidor(args.esquema, args.workers, args.modo) as (host, puerto):
+            escritor = Cliente(host, puerto)
+            escritor.login()
+
+            # Un worker lleno responde 503; como el navegador, se reintenta
+            # (la conexión nueva puede caer en otro worker)
+            rechazos = 0
+            while len(suscriptores) < args.clientes and rechazos < args.clientes:
+                suscriptor = Suscriptor(host, puerto, escritor.cookie)
+                if suscriptor.estado != 200:
+                    suscriptor.cerrar()
+                    rechazos += 1
+                    continue
+                suscriptor.start()
+                suscriptores.append(suscriptor)
+            for suscriptor in suscriptores:
+                suscriptor.conectado.wait(10)
+            listeners = contar_listeners(cur)
+            conn.commit()
+            print(f"📡 {len(suscriptores)} clientes SSE, {listeners} conexiones LISTEN en PostgreSQL")
+
+            latencias, perdidos = [], 0
+            for serial_id, producto_id in seriales:
+                enviado = time.perf_counter()
+                estado, _ = escritor.pedir('PUT', f'/api/inventario/serial/{serial_id}', {'estado': 'INSTALADO'})
+                if estado != 200:
+                    print(f"⚠️ PUT /serial/{serial_id} → {estado}")
+                limite = time.perf_counter() + 5
+                for suscriptor in suscriptores:
+                    while True:
+                        recibido = next((t for t, evento, datos in suscriptor.eventos
+                                         if t >= enviado and evento == 'stock'
+                                         and any(p['producto_id'] == producto_id for p in datos['productos'])), None)
+                        if recibido or time.perf_counter() > limite:
+                            break
+                        time.sleep(0.005)
+                    if recibido:
+                        latencias.append((recibido - enviado) * 1000)
+                    else:
+                        perdidos += 1
+
+            latencias.sort()
+            resultado = {
+                'modo': args.modo,
+                'workers': args.workers,
+                'clientes_sse': len(suscriptores),
+                'rechazos_503': rechazos,
+                'conexiones_listen': listeners,
+                'escrituras': len(seriales),
+                'entregas': len(latencias),
+                'perdidos': perdidos,
+                'latencia_ms': {
+                    'p50': percentil(latencias, 50),
+                    'p95': percentil(latencias, 95),
+                    'max': percentil(latencias, 100),
+                },
+            }
+            print(json.dumps(resultado, indent=2, ensure_ascii=False))
+            ok = not perdidos and len(suscriptores) == args.clientes and listeners <= args.workers
+
+            # Cada hilo SSE nota el cierre en su próximo latido; luego gunicorn puede apagarse
+            for suscriptor in suscriptores:
+                suscriptor.cerrar()
+    finally:
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark de serialización y compresión de /api/inventario/productos/detallado.
+
+Para cada escala siembra un esquema aislado y mide, sobre la lista completa
+(sin paginación):
+  - tiempo de serialización: proveedor JSON de Flask (json estándar) vs. orjson,
+  - bytes en la red: sin comprimir, gzip y brotli (con su tiempo de compresión),
+  - tiempo total del endpoint por el test client con cada combinación.
+
+Uso:
+    python benchmarks/bench_json.py [--productos 10000 50000] [--repeticiones 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import get_db_connection
+import datos_sinteticos
+
+RUTA = '/api/inventario/productos/detallado'
+
+
+def mediana_ms(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return round(statistics.median(tiempos), 2), resultado
+
+
+def medir_escala(aplicacion, cliente, productos, repeticiones):
+    proveedor = aplicacion.app.json
+    datos = json.loads(cliente.get(RUTA, headers={'Accept-Encoding': 'identity'}).data)
+    resultado = {'productos': productos, 'filas': len(datos), 'serializacion_ms': {}, 'endpoint_ms': {}}
+
+    with aplicacion.app.app_context():
+        for nombre, usar_orjson in (('stdlib', False), ('orjson', True)):
+            if usar_orjson and aplicacion.orjson is None:
+                continue
+            proveedor.usar_orjson = usar_orjson
+            ms, respuesta = mediana_ms(lambda: proveedor.response(datos), repeticiones)
+            resultado['serializacion_ms'][nombre] = ms
+    cuerpo = respuesta.get_data()
+
+    bytes_red = {'identity': {'bytes': len(cuerpo), 'compresion_ms': 0.0}}
+    for codificacion in aplicacion.CODIFICACIONES:
+        ms, comprimido = mediana_ms(lambda: aplicacion.comprimir(cuerpo, codificacion), repeticiones)
+        bytes_red[codificacion] = {'bytes': len(comprimido), 'compresion_ms': ms}
+    resultado['bytes_red'] = bytes_red
+
+    for nombre, usar_orjson in (('stdlib', False), ('orjson', True)):
+        if usar_orjson and aplicacion.orjson is None:
+            continue
+        proveedor.usar_orjson = usar_orjson
+        for codificacion in ['identity'] + aplicacion.CODIFICACIONES:
+            ms, _ = mediana_ms(lambda: cliente.get(RUTA, headers={'Accept-Encoding': codificacion}), repeticiones)
+            resultado['endpoint_ms'][f'{nombre}+{codificacion}'] = ms
+    proveedor.usar_orjson = aplicacion.orjson is not None
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--productos', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--seriales-por-producto', type=int, default=20)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--esquema', default='bench_json')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+
+    # El pool de la app abre sus conexiones ya apuntando al esquema sembrado
+    os.environ['PGOPTIONS'] = f'-c search_path={args.esquema},public'
+    import app as aplicacion
+    cliente = aplicacion.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['user_id'] = 1
+        sesion['role'] = 'admin'
+
+    resultados = []
+    try:
+        for productos in args.productos:
+            print(f"🌱 Sembrando {productos:,} productos...")
+            datos_sinteticos.crear_esquema(cur, args.esquema)
+            datos_sinteticos.sembrar(cur, productos, productos * args.seriales_por_producto, historial=False)
+            conn.commit()
+            aplicacion.invalidar_estadisticas()
+            resultados.append(medir_escala(aplicacion, cliente, productos, args.repeticiones))
+    finally:
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
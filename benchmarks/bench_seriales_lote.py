@@ -0,0 +1,116 @@
+"""Benchmark: /api/inventario/seriales/lote por fila vs. set-based.
+
+Compara el flujo anterior (un SELECT + un INSERT por serial) con el flujo
+actual (un SELECT = ANY + un INSERT ... unnest) para 100 / 1k / 10k
+seriales. Todo corre dentro de una transacción que se revierte al final,
+así que no deja datos en la BD.
+
+Uso:
+    python benchmarks/bench_seriales_lote.py [--tamanos 100,1000,10000] [--rtt-ms 30]
+
+--rtt-ms estima el costo en un enlace WAN (p.ej. Render -> Supabase):
+tiempo_local + round_trips * rtt.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psycopg2.extensions import cursor as CursorBase
+
+from app import get_db_connection, normalizar_seriales, buscar_seriales_existentes, insertar_seriales
+
+
+class CursorContador(CursorBase):
+    """Cursor que cuenta round trips (cada execute es uno)"""
+    round_trips = 0
+
+    def execute(self, query, vars=None):
+        CursorContador.round_trips += 1
+        return super().execute(query, vars)
+
+
+def flujo_por_fila(cur, producto_id, seriales):
+    """Implementación anterior: N SELECT + N INSERT"""
+    validos = []
+    for serial in seriales:
+        serial_clean = str(serial).strip().upper()
+        cur.execute('SELECT serial_id FROM seriales WHERE codigo_unico_serial = %s', (serial_clean,))
+        if not cur.fetchone():
+            validos.append(serial_clean)
+    for serial in validos:
+        cur.execute("""
+            INSERT INTO "seriales" ("producto_id", "codigo_unico_serial", "estado")
+            VALUES (%s, %s, 'ALMACEN')
+            RETURNING "serial_id", "codigo_unico_serial";
+        """, (producto_id, serial))
+        cur.fetchone()
+
+
+def flujo_set_based(cur, producto_id, seriales):
+    """Implementación actual: 1 SELECT = ANY + 1 INSERT ... unnest"""
+    validos, _ = normalizar_seriales(seriales)
+    buscar_seriales_existentes(cur, validos)
+    insertar_seriales(cur, producto_id, validos)
+
+
+def medir(conn, producto_id, flujo, tamano, prefijo):
+    seriales = [f"{prefijo}-{i:07d}" for i in range(tamano)]
+    cur = conn.cursor(cursor_factory=CursorContador)
+    cur.execute('SAVEPOINT bench')
+    CursorContador.round_trips = 0
+    inicio = time.perf_counter()
+    flujo(cur, producto_id, seriales)
+    duracion = time.perf_counter() - inicio
+    round_trips = CursorContador.round_trips
+    cur.execute('ROLLBACK TO SAVEPOINT bench')
+    cur.close()
+    return duracion, round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default='100,1000,10000')
+    parser.add_argument('--rtt-ms', type=float, default=30.0)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+
+    cur = conn.cursor()
+    cur.execute("INSERT INTO tipos_pieza (tipo_modelo) VALUES ('BENCH') RETURNING tipo_id")
+    tipo_id = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO productos (nombre, tipo_pieza_id, codigo_sku)
+        VALUES ('Bench lote', %s, %s) RETURNING producto_id
+    """, (tipo_id, f"BENCH-{os.getpid()}"))
+    producto_id = cur.fetchone()[0]
+
+    resultados = []
+    try:
+        for tamano in [int(t) for t in args.tamanos.split(',')]:
+            for nombre, flujo in (('por_fila', flujo_por_fila), ('set_based', flujo_set_based)):
+                duracion, round_trips = medir(conn, producto_id, flujo, tamano, f"BENCH{os.getpid()}")
+                resultados.append({
+                    'flujo': nombre,
+                    'seriales': tamano,
+                    'round_trips': round_trips,
+                    'tiempo_local_ms': round(duracion * 1000, 1),
+                    'tiempo_wan_estimado_ms': round(duracion * 1000 + round_trips * args.rtt_ms, 1),
+                })
+                print(f"📊 {nombre:9s} {tamano:>6d} seriales: {round_trips:>6d} round trips, "
+                      f"{duracion * 1000:9.1f} ms local, "
+                      f"~{resultados[-1]['tiempo_wan_estimado_ms']:,.0f} ms con RTT {args.rtt_ms:g} ms")
+    finally:
+        conn.rollback()
+        conn.close()
+
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark de listas completas en JSON vs. NDJSON en streaming (memoria y primer byte).
+
+Siembra un esquema aislado con un catálogo grande y un producto con muchos
+seriales, y para cada ruta y modo levanta un servidor nuevo con un solo
+worker (el RSS máximo de un proceso no baja: cada medición empieza limpia).
+Mientras descarga la lista completa muestrea el RSS del worker y reporta el
+crecimiento máximo, el tiempo al primer byte y el total, y compara que
+ambos modos traigan las mismas filas.
+
+Uso:
+    python benchmarks/bench_stream.py [--productos 100000] [--seriales-producto 200000] [--modo gthread|asgi]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODOS = {
+    'json': {'Accept': 'application/json'},
+    'ndjson': {'Accept': 'application/x-ndjson'},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--productos', type=int, default=100000)
+    parser.add_argument('--seriales', type=int, default=300000, help='repartidos en el catálogo')
+    parser.add_argument('--seriales-producto', type=int, default=200000, help='seriales del producto grande')
+    parser.add_argument('--modo', default='gthread', choices=['gthread', 'asgi'])
+    parser.add_argument('--esquema', default='bench_stream')
+    args = parser.parse_args()
+
+    from app import get_db_connection
+    from carga import Cliente, servidor
+    from verificar_exportacion import Muestreo, descargar, rss_mb
+    import datos_sinteticos
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+
+    def contar(datos, modo):
+        if modo == 'ndjson':
+            return sum(1 for linea in datos.splitlines() if linea)
+        return len(json.loads(datos))
+
+    resultados = []
+    try:
+        print(f"🌱 Sembrando {args.productos:,} productos / {args.seriales:,} seriales "
+              f"+ un producto con {args.seriales_producto:,}...")
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, args.productos, args.seriales, historial=False)
+        cur.execute("SELECT producto_id FROM productos ORDER BY producto_id LIMIT 1")
+        producto_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO seriales (producto_id, codigo_unico_serial, estado)
+            SELECT %s, 'STREAM-' || lpad(g::text, 8, '0'), 'ALMACEN' FROM generate_series(1, %s) g
+        """, (producto_id, args.seriales_producto))
+        conn.commit()
+
+        rutas = ['/api/inventario/stock', '/api/inventario/productos/detallado',
+                 f'/api/inventario/seriales/{producto_id}']
+        for ruta in rutas:
+            filas_por_modo = {}
+            for modo, headers in MODOS.items():
+                with servidor(args.esquema, 1, args.modo) as (host, puerto):
+                    sesion = Cliente(host, puerto)
+                    sesion.login()
+                    pid = json.loads(sesion.pedir('GET', '/api/debug/pool')[1])['pool']['pid']
+                    sesion.conexion.close()
+                    with tempfile.TemporaryFile() as archivo:
+                        base = rss_mb(pid)
+                        with Muestreo(pid) as muestreo:
+                            estado, cabeceras, ttfb, total, segundos = descargar(
+                                host, puerto, sesion.cookie, ruta, archivo, cabeceras=headers)
+                        archivo.seek(0)
+                        filas = contar(archivo.read(), modo) if estado == 200 else 0
+                filas_por_modo[modo] = filas
+                resultados.append((ruta, modo, estado, filas, total, ttfb, segundos, muestreo.maximo - base))
+
+            if len(set(filas_por_modo.values())) != 1:
+                print(f"❌ {ruta}: JSON y NDJSON difieren en filas: {filas_por_modo}")
+    finally:
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    print(f"\n{'ruta':<36s} {'modo':<7s} {'filas':>9s} {'MB':>7s} {'TTFB ms':>8s} {'total s':>8s} {'RSS +MB':>8s}")
+    for ruta, modo, estado, filas, total, ttfb, segundos, crecimiento in resultados:
+        nota = '' if estado == 200 else f'  (HTTP {estado})'
+        print(f"{ruta[-36:]:<36s} {modo:<7s} {filas:>9,d} {total / 1e6:>7.1f} {ttfb * 1000:>8.0f} "
+              f"{segundos:>8.2f} {crecimiento:>8.1f}{nota}")
+
+
+if __name__ == '__main__':
+    main()
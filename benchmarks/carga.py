@@ -0,0 +1,584 @@
+"""Prueba de carga de todas las rutas de app.py.
+
+Siembra un esquema aislado (--escala 1k / 10k / 100k, o --productos y
+--seriales), levanta gunicorn apuntando a ese esquema (PGOPTIONS con el
+search_path; --modo asgi levanta asgi.py con uvicorn) o usa un servidor ya
+corriendo (--url), inicia sesión por /api/auth/login y recorre cada ruta
+con N clientes concurrentes.
+
+Por ruta reporta p50/p95/p99, throughput y consultas a la BD por request
+(medidas aparte, en proceso, con las conexiones registradoras de migrar.py).
+El resultado es JSON para comparar entre commits:
+
+    python benchmarks/carga.py --escala 10k --salida base.json
+    git checkout otra-rama
+    python benchmarks/carga.py --escala 10k --comparar base.json  # exit 1 si p95 empeora
+"""
+import argparse
+import collections
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import quote, urlparse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from app import get_db_connection
+import datos_sinteticos
+
+USUARIO = os.environ.get('CARGA_USUARIO', 'admin')
+PASSWORD = os.environ.get('CARGA_PASSWORD', 'Admin123!')
+
+
+# ====================================================================
+# CLIENTE HTTP
+# ====================================================================
+class Cliente:
+    """Cliente HTTP con la cookie de sesión de Flask (una conexión por hilo)"""
+
+    def __init__(self, host, puerto):
+        self.conexion = http.client.HTTPConnection(host, puerto, timeout=300)
+        self.cookie = None
+
+    def pedir(self, metodo, ruta, json_=None, crudo=None, tipo=None):
+        headers = {}
+        cuerpo = None
+        if json_ is not None:
+            cuerpo = json.dumps(json_).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif crudo is not None:
+            cuerpo = crudo
+            headers['Content-Type'] = tipo
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.conexion.request(metodo, ruta, body=cuerpo, headers=headers)
+            respuesta = self.conexion.getresponse()
+            datos = respuesta.read()
+        except (http.client.HTTPException, OSError):
+            self.conexion.close()
+            raise
+        cookie = respuesta.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return respuesta.status, datos
+
+    def login(self):
+        estado, datos = self.pedir('POST', '/api/auth/login', {'username': USUARIO, 'password': PASSWORD})
+        if estado != 200:
+            raise RuntimeError(f"Login falló ({estado}): {datos[:200]!r}")
+
+
+class ClientePrueba:
+    """Misma interfaz que Cliente, sobre app.test_client() (pase de round trips)"""
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def pedir(self, metodo, ruta, json_=None, crudo=None, tipo=None):
+        respuesta = self.cliente.open(ruta, method=metodo, json=json_, data=crudo, content_type=tipo)
+        return respuesta.status_code, respuesta.get_data()
+
+    login = Cliente.login
+
+
+# ====================================================================
+# ESCENARIOS: una entrada por ruta (y variantes relevantes)
+# ====================================================================
+class Contexto:
+    """Datos de muestra del esquema sembrado + lo que van creando las rutas"""
+
+    def __init__(self, cur, prefijo):
+        self.prefijo = prefijo
+        self._contador = itertools.count(1)
+        cur.execute("""
+            SELECT p.producto_id, p.codigo_sku FROM productos p
+            JOIN producto_stock ps USING (producto_id)
+            WHERE ps.total > 0 ORDER BY random() LIMIT 500;
+        """)
+        self.productos = cur.fetchall()
+        cur.execute("""
+            SELECT serial_id, codigo_unico_serial FROM seriales
+            TABLESAMPLE SYSTEM (1) LIMIT 2000;
+        """)
+        self.seriales = cur.fetchall() or []
+        if len(self.seriales) < 100:
+            cur.execute('SELECT serial_id, codigo_unico_serial FROM seriales ORDER BY random() LIMIT 2000')
+            self.seriales = cur.fetchall()
+        cur.execute('SELECT tipo_id FROM tipos_pieza')
+        self.tipos = [fila[0] for fila in cur.fetchall()]
+        self.productos_creados = collections.deque()
+        self.seriales_creados = collections.deque()
+
+    def siguiente(self):
+        return next(self._contador)
+
+    def codigo(self):
+        return f"{self.prefijo}-{self.siguiente():08d}"
+
+    def producto(self):
+        return random.choice(self.productos)
+
+    def serial(self):
+        return random.choice(self.seriales)
+
+    def creado(self, cola):
+        try:
+            return cola.popleft()
+        except IndexError:
+            return None
+
+
+Escenario = collections.namedtuple('Escenario', 'nombre metodo ruta cuerpo crudo recoger sesion_propia')
+
+
+def escenario(nombre, metodo, ruta, cuerpo=None, crudo=None, recoger=None, sesion_propia=False):
+    return Escenario(nombre, metodo, ruta, cuerpo, crudo, recoger, sesion_propia)
+
+
+def _recoger_producto(ctx, cuerpo_enviado, datos):
+    ctx.productos_creados.append((json.loads(datos)['producto_id'], cuerpo_enviado['codigo_sku']))
+
+
+def _recoger_serial(ctx, cuerpo_enviado, datos):
+    ctx.seriales_creados.append(json.loads(datos)['serial_id'])
+
+
+def _producto_nuevo(ctx):
+    n = ctx.siguiente()
+    return {
+        'nombre': f'Producto carga {ctx.prefijo} {n}',
+        'tipo_pieza_id': random.choice(ctx.tipos),
+        'codigo_sku': f'{ctx.prefijo}-P{n:07d}',
+        'marca': random.choice(datos_sinteticos.MARCAS),
+        'modelo': f'MC-{n}',
+    }
+
+
+def _producto_editado(ctx):
+    creado = ctx.creado(ctx.productos_creados)
+    if creado is None:
+        return None
+    producto_id, sku = creado
+    ctx.productos_creados.append(creado)
+    return f'/api/inventario/productos/{producto_id}', {
+        'nombre': f'Producto carga {ctx.prefijo} {producto_id} (editado)',
+        'marca': 'Dell', 'modelo': 'ED-1', 'descripcion': 'Editado por la prueba de carga',
+        'tipo_pieza_id': random.choice(ctx.tipos), 'codigo_sku': sku,
+    }
+
+
+def _umbrales_categoria(ctx):
+    umbral_bajo = random.randint(0, 5)
+    return f'/api/inventario/tipos_pieza/{random.choice(ctx.tipos)}/umbrales', {
+        'umbral_bajo': umbral_bajo, 'umbral_medio': umbral_bajo + random.randint(0, 10),
+    }
+
+
+def _ruta_creado(cola, plantilla, ctx, campo=None):
+    creado = ctx.creado(cola)
+    if creado is None:
+        return None
+    return plantilla.format(creado if campo is None else creado[campo])
+
+
+def _csv_importacion(ctx, filas=200):
+    producto = ctx.producto()
+    lineas = ['sku,serial,estado'] + [f'{producto[1]},{ctx.codigo()},ALMACEN' for _ in range(filas)]
+    return ('\n'.join(lineas) + '\n').encode('utf-8'), 'text/csv'
+
+
+ESCENARIOS = [
+    escenario('GET /health', 'GET', '/health'),
+    escenario('GET /', 'GET', '/'),
+    escenario('GET /static/app.js', 'GET', '/static/app.js'),
+    escenario('POST /api/auth/login', 'POST', '/api/auth/login',
+              cuerpo=lambda ctx: {'username': USUARIO, 'password': PASSWORD}),
+    escenario('GET /api/auth/check', 'GET', '/api/auth/check'),
+    escenario('POST /api/auth/logout', 'POST', '/api/auth/logout', sesion_propia=True),
+    escenario('GET /api/debug/pool', 'GET', '/api/debug/pool'),
+    escenario('GET /api/debug/database', 'GET', '/api/debug/database'),
+    escenario('GET /metrics', 'GET', '/metrics'),
+    escenario('GET /api/inventario/stock', 'GET', '/api/inventario/stock'),
+    escenario('GET /api/inventario/stock?stream=1', 'GET', '/api/inventario/stock?stream=1'),
+    escenario('GET /api/inventario/stock?limit=50', 'GET',
+              lambda ctx: f'/api/inventario/stock?limit=50&sort=-stock&categoria={random.choice(ctx.tipos)}'),
+    escenario('GET /api/inventario/productos/detallado', 'GET', '/api/inventario/productos/detallado'),
+    escenario('GET /api/inventario/productos/detallado?stream=1', 'GET',
+              '/api/inventario/productos/detallado?stream=1'),
+    escenario('GET /api/inventario/productos/detallado?limit=50', 'GET',
+              '/api/inventario/productos/detallado?limit=50&sort=marca'),
+    escenario('GET /api/inventario/estadisticas', 'GET', '/api/inventario/estadisticas'),
+    escenario('GET /api/inventario/estadisticas?fresco=1', 'GET', '/api/inventario/estadisticas?fresco=1'),
+    escenario('GET /api/inventario/tipos_pieza', 'GET', '/api/inventario/tipos_pieza'),
+    escenario('POST /api/inventario/tipos_pieza', 'POST', '/api/inventario/tipos_pieza',
+              cuerpo=lambda ctx: {'tipo_modelo': f'Categoría carga {ctx.prefijo} {ctx.siguiente()}'}),
+    escenario('PUT /api/inventario/tipos_pieza/<id>/umbrales', 'PUT', _umbrales_categoria),
+    escenario('POST /api/inventario/inicializar_tipos', 'POST', '/api/inventario/inicializar_tipos'),
+    escenario('GET /api/inventario/productos', 'GET', '/api/inventario/productos'),
+    escenario('POST /api/inventario/productos', 'POST', '/api/inventario/productos',
+              cuerpo=_producto_nuevo, recoger=_recoger_producto),
+    escenario('GET /api/inventario/productos/<id>', 'GET',
+              lambda ctx: f'/api/inventario/productos/{ctx.producto()[0]}'),
+    escenario('PUT /api/inventario/productos/<id>', 'PUT', _producto_editado),
+    escenario('GET /api/inventario/seriales/<producto_id>', 'GET',
+              lambda ctx: f'/api/inventario/seriales/{ctx.producto()[0]}'),
+    escenario('GET /api/inventario/seriales/<producto_id>?stream=1', 'GET',
+              lambda ctx: f'/api/inventario/seriales/{ctx.producto()[0]}?stream=1'),
+    escenario('GET /api/inventario/stock_bajo', 'GET', '/api/inventario/stock_bajo'),
+    escenario('GET /api/inventario/alertas', 'GET', '/api/inventario/alertas'),
+    escenario('GET /api/inventario/alertas?activas=1', 'GET',
+              lambda ctx: f'/api/inventario/alertas?producto_id={ctx.producto()[0]}&activas=1&limit=20'),
+    escenario('GET /api/inventario/buscar', 'GET',
+              lambda ctx: f'/api/inventario/buscar?q={quote(random.choice([ctx.producto()[1], "Producto 12", "lenovo"]))}'),
+    escenario('GET /api/inventario/serial/lookup', 'GET',
+              lambda ctx: f'/api/inventario/serial/lookup?code={quote(ctx.serial()[1])}'),
+    escenario('POST /api/inventario/serial/lookup', 'POST', '/api/inventario/serial/lookup',
+              cuerpo=lambda ctx: {'codes': [ctx.serial()[1] for _ in range(50)]}),
+    escenario('GET /api/inventario/serial/<id>/historial', 'GET',
+              lambda ctx: f'/api/inventario/serial/{ctx.serial()[0]}/historial'),
+    escenario('GET /api/inventario/historial', 'GET',
+              lambda ctx: f'/api/inventario/historial?producto_id={ctx.producto()[0]}&limit=50'),
+    escenario('GET /api/inventario/exportar/productos', 'GET', '/api/inventario/exportar/productos'),
+    escenario('GET /api/inventario/exportar/productos?formato=xlsx', 'GET',
+              '/api/inventario/exportar/productos?formato=xlsx'),
+    escenario('GET /api/inventario/exportar/seriales', 'GET', '/api/inventario/exportar/seriales'),
+    escenario('GET /api/inventario/exportar/historial', 'GET',
+              lambda ctx: f'/api/inventario/exportar/historial?desde={datetime.now() - timedelta(days=30):%Y-%m-%d}'
+                          '&formato=ndjson'),
+    escenario('POST /api/inventario/serial', 'POST', '/api/inventario/serial',
+              cuerpo=lambda ctx: {'producto_id': ctx.producto()[0], 'codigo_unico_serial': ctx.codigo()},
+              recoger=_recoger_serial),
+    escenario('POST /api/inventario/seriales/lote', 'POST', '/api/inventario/seriales/lote',
+              cuerpo=lambda ctx: {'producto_id': ctx.producto()[0], 'seriales': [ctx.codigo() for _ in range(20)]}),
+    escenario('POST /api/inventario/seriales/importar', 'POST', '/api/inventario/seriales/importar',
+              crudo=_csv_importacion),
+    escenario('POST /api/inventario/agregar_lote', 'POST', '/api/inventario/agregar_lote',
+              cuerpo=lambda ctx: {'producto_id': ctx.producto()[0], 'cantidad': 10}),
+    escenario('PUT /api/inventario/serial/<id>', 'PUT',
+              lambda ctx: (f'/api/inventario/serial/{ctx.serial()[0]}',
+                           {'estado': random.choice(['ALMACEN', 'INSTALADO'])})),
+    escenario('POST /api/inventario/seriales/estado', 'POST', '/api/inventario/seriales/estado',
+              cuerpo=lambda ctx: {'seriales': [ctx.serial()[0] for _ in range(100)],
+                                  'estado': random.choice(['ALMACEN', 'INSTALADO'])}),
+    escenario('DELETE /api/inventario/serial/<id>', 'DELETE',
+              lambda ctx: _ruta_creado(ctx.seriales_creados, '/api/inventario/serial/{}', ctx)),
+    escenario('DELETE /api/inventario/productos/<id>', 'DELETE',
+              lambda ctx: _ruta_creado(ctx.productos_creados, '/api/inventario/productos/{}', ctx, 0)),
+]
+
+
+def preparar(esc, ctx):
+    """Construye (ruta, json, crudo, tipo) de una petición; None si no hay datos.
+
+    `ruta` puede ser texto, o una función que devuelve la ruta o (ruta, json).
+    """
+    ruta, cuerpo = esc.ruta, esc.cuerpo(ctx) if callable(esc.cuerpo) else esc.cuerpo
+    if callable(ruta):
+        ruta = ruta(ctx)
+        if ruta is None:
+            return None
+        if isinstance(ruta, tuple):
+            ruta, cuerpo = ruta
+    crudo, tipo = esc.crudo(ctx) if esc.crudo else (None, None)
+    return ruta, cuerpo, crudo, tipo
+
+
+def ejecutar(cliente, esc, ctx, nuevo_cliente=None):
+    """Una petición del escenario; devuelve (ms, estado) o None si no hubo datos"""
+    peticion = preparar(esc, ctx)
+    if peticion is None:
+        return None
+    ruta, cuerpo, crudo, tipo = peticion
+    if esc.sesion_propia:
+        cliente = nuevo_cliente()
+        cliente.login()
+    inicio = time.perf_counter()
+    estado, datos = cliente.pedir(esc.metodo, ruta, json_=cuerpo, crudo=crudo, tipo=tipo)
+    ms = (time.perf_counter() - inicio) * 1000
+    if esc.recoger and estado < 400:
+        esc.recoger(ctx, cuerpo, datos)
+    return ms, estado
+
+
+# ====================================================================
+# MEDICIÓN
+# ====================================================================
+def percentil(valores, p):
+    """Percentil por rango más cercano (valores ordenados)"""
+    if not valores:
+        return None
+    return round(valores[max(0, math.ceil(p / 100 * len(valores)) - 1)], 2)
+
+
+def cargar_ruta(esc, ctx, clientes, peticiones, nuevo_cliente):
+    """Lanza `peticiones` del escenario repartidas entre los clientes"""
+    restantes = itertools.count()
+    latencias, errores, fallos = [], collections.Counter(), []
+    candado = threading.Lock()
+
+    def trabajar(cliente):
+        while next(restantes) < peticiones:
+            try:
+                resultado = ejecutar(cliente, esc, ctx, nuevo_cliente)
+            except Exception as e:
+                with candado:
+                    errores['excepcion'] += 1
+                    fallos.append(str(e))
+                continue
+            if resultado is None:
+                with candado:
+                    errores['sin_datos'] += 1
+                continue
+            ms, estado = resultado
+            with candado:
+                latencias.append(ms)
+                if estado >= 400:
+                    errores[str(estado)] += 1
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=trabajar, args=(c,)) for c in clientes]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        'ruta': esc.nombre,
+        'peticiones': len(latencias),
+        'errores': sum(errores.values()),
+        'errores_por_tipo': dict(errores),
+        'p50_ms': percentil(latencias, 50),
+        'p95_ms': percentil(latencias, 95),
+        'p99_ms': percentil(latencias, 99),
+        'media_ms': round(sum(latencias) / len(latencias), 2) if latencias else None,
+        'rps': round(len(latencias) / duracion, 1) if duracion else None,
+    }, fallos[:3]
+
+
+def contar_consultas(esquema, ctx, muestras):
+    """Consultas a la BD por request de cada escenario (en proceso, sin concurrencia)"""
+    import app as aplicacion
+    from migrar import pool_registrador
+
+    resultado = {}
+    with pool_registrador(esquema) as registradoras:
+        cliente = ClientePrueba(aplicacion.app)
+        cliente.login()
+
+        for esc in ESCENARIOS:
+            conteos = []
+            for _ in range(muestras):
+                antes = sum(len(c.sentencias) for c in registradoras)
+                if ejecutar(cliente, esc, ctx, lambda: ClientePrueba(aplicacion.app)) is None:
+                    continue
+                conteos.append(sum(len(c.sentencias) for c in registradoras) - antes)
+            resultado[esc.nombre] = round(sum(conteos) / len(conteos), 1) if conteos else None
+    return resultado
+
+
+MODOS_SERVIDOR = {
+    # gunicorn como en el Dockerfile
+    'gthread': ['-m', 'gunicorn', '--worker-class', 'gthread', '--threads', '256', '--timeout', '300', 'app:app'],
+    # gunicorn sync: un request a la vez por worker
+    'sync': ['-m', 'gunicorn', '--timeout', '300', 'app:app'],
+    # asgi.py con uvicorn
+    'asgi': ['-m', 'uvicorn', '--no-access-log', '--timeout-graceful-shutdown', '5', 'asgi:app'],
+}
+
+
+@contextmanager
+def servidor(esquema, workers, modo='gthread'):
+    """Levanta el servidor (gunicorn por defecto) con search_path al esquema sembrado"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        puerto = s.getsockname()[1]
+
+    entorno = dict(os.environ, FLASK_ENV='production', PGOPTIONS=f'-c search_path={esquema},public')
+    # /metrics con la sesión de los clientes, como las demás rutas (no con el token del scraper)
+    entorno.pop('METRICS_TOKEN', None)
+    log = tempfile.NamedTemporaryFile(prefix=f'carga-{modo}-', suffix='.log', delete=False)
+    if modo == 'asgi':
+        enlace = ['--host', '127.0.0.1', '--port', str(puerto), '--workers', str(workers)]
+    else:
+        enlace = ['--bind', f'127.0.0.1:{puerto}', '--workers', str(workers)]
+    proceso = subprocess.Popen(
+        [sys.executable] + MODOS_SERVIDOR[modo][:2] + enlace + MODOS_SERVIDOR[modo][2:],
+        cwd=RAIZ, env=entorno, stdout=log, stderr=subprocess.STDOUT,
+    )
+    try:
+        limite = time.monotonic() + 30
+        while True:
+            try:
+                if Cliente('127.0.0.1', puerto).pedir('GET', '/health')[0] == 200:
+                    break
+            except OSError:
+                pass
+            if proceso.poll() is not None or time.monotonic() > limite:
+                raise RuntimeError(f"{modo} no arrancó; revisa {log.name}")
+            time.sleep(0.2)
+        print(f"🚀 {modo} con {workers} workers en :{puerto} (log: {log.name})")
+        yield '127.0.0.1', puerto
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(15)
+        except subprocess.TimeoutExpired:
+            # Conexiones keep-alive de los clientes retienen el apagado ordenado
+            proceso.kill()
+            proceso.wait()
+        log.close()
+
+
+@contextmanager
+def servidor_externo(url):
+    partes = urlparse(url)
+    yield partes.hostname, partes.port or 80
+
+
+def comparar(actual, archivo_base, umbral):
+    """Imprime p95 base vs. actual; devuelve las rutas que empeoraron más de `umbral` %"""
+    with open(archivo_base, encoding='utf-8') as f:
+        datos_base = json.load(f)
+    base = {r['ruta']: r for r in datos_base['rutas']}
+    for clave in ('escala', 'clientes', 'peticiones_por_ruta', 'workers'):
+        if datos_base.get(clave) != actual.get(clave):
+            print(f"⚠️ {clave} distinto: base={datos_base.get(clave)} actual={actual.get(clave)}")
+
+    regresiones = []
+    print(f"\n{'ruta':<52s} {'p95 base':>10s} {'p95 actual':>11s} {'Δ':>8s}")
+    for ruta in actual['rutas']:
+        anterior = base.get(ruta['ruta'])
+        if not anterior or anterior['p95_ms'] is None or ruta['p95_ms'] is None:
+            continue
+        delta = (ruta['p95_ms'] - anterior['p95_ms']) / max(anterior['p95_ms'], 0.001) * 100
+        # Menos de 1 ms de diferencia es ruido
+        empeora = delta > umbral and ruta['p95_ms'] - anterior['p95_ms'] > 1
+        if empeora:
+            regresiones.append(ruta['ruta'])
+        print(f"{'❌ ' if empeora else '   '}{ruta['ruta']:<49s} {anterior['p95_ms']:>10.1f} {ruta['p95_ms']:>11.1f} {delta:>+7.0f}%")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--escala', choices=sorted(datos_sinteticos.ESCALAS), default='1k')
+    parser.add_argument('--productos', type=int, help='sobrescribe la escala')
+    parser.add_argument('--seriales', type=int, help='sobrescribe la escala')
+    parser.add_argument('--clientes', type=int, default=8, help='clientes concurrentes')
+    parser.add_argument('--peticiones', type=int, default=200, help='peticiones por ruta')
+    parser.add_argument('--workers', type=int, default=4, help='workers del servidor')
+    parser.add_argument('--modo', choices=sorted(MODOS_SERVIDOR), default='gthread', help='servidor a levantar')
+    parser.add_argument('--url', help='usar un servidor ya corriendo (debe apuntar al mismo esquema)')
+    parser.add_argument('--rutas', help='solo las rutas que contengan este texto')
+    parser.add_argument('--muestras-bd', type=int, default=3, help='requests por ruta para contar consultas')
+    parser.add_argument('--esquema', default='carga')
+    parser.add_argument('--sin-sembrar', action='store_true', help='reusar el esquema ya sembrado')
+    parser.add_argument('--mantener', action='store_true', help='no borrar el esquema al terminar')
+    parser.add_argument('--salida', help='archivo JSON con el resultado')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior')
+    parser.add_argument('--umbral', type=float, default=25.0, help='%% de empeoramiento de p95 tolerado')
+    args = parser.parse_args()
+
+    productos, seriales = datos_sinteticos.ESCALAS[args.escala]
+    productos = args.productos or productos
+    seriales = args.seriales or seriales
+    escenarios = [e for e in ESCENARIOS if not args.rutas or args.rutas in e.nombre]
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+
+    try:
+        if args.sin_sembrar:
+            cur.execute(f'SET search_path TO "{args.esquema}", public')
+        else:
+            print(f"🌱 Sembrando {productos:,} productos / {seriales:,} seriales en '{args.esquema}'...")
+            inicio = time.perf_counter()
+            datos_sinteticos.crear_esquema(cur, args.esquema)
+            datos_sinteticos.sembrar(cur, productos, seriales)
+            conn.commit()
+            print(f"   listo en {time.perf_counter() - inicio:.1f} s")
+
+        prefijo = 'C' + format(int(time.time()), 'x').upper()
+        ctx = Contexto(cur, prefijo)
+        conn.commit()
+
+        # Que todos los clientes puedan exportar (o pedir NDJSON) a la vez: se mide
+        # la respuesta, no el 503
+        os.environ.setdefault('EXPORTAR_MAX_SIMULTANEAS', str(args.clientes))
+        os.environ.setdefault('STREAM_MAX_SIMULTANEOS', str(args.clientes))
+
+        with servidor_externo(args.url) if args.url else servidor(args.esquema, args.workers, args.modo) as (host, puerto):
+            clientes = [Cliente(host, puerto) for _ in range(args.clientes)]
+            for cliente in clientes:
+                cliente.login()
+
+            rutas = []
+            for esc in escenarios:
+                resumen, fallos = cargar_ruta(esc, ctx, clientes, args.peticiones, lambda: Cliente(host, puerto))
+                rutas.append(resumen)
+                print(f"{'⚠️' if resumen['errores'] else '✅'} {esc.nombre:<52s} "
+                      f"p50 {resumen['p50_ms'] or 0:>8.1f}  p95 {resumen['p95_ms'] or 0:>8.1f}  "
+                      f"p99 {resumen['p99_ms'] or 0:>8.1f} ms  {resumen['rps'] or 0:>7.1f} req/s  "
+                      f"errores {resumen['errores']}")
+                for fallo in fallos:
+                    print(f"      {fallo[:200]}")
+
+        print("🔢 Contando consultas a la BD por request...")
+        consultas = contar_consultas(args.esquema, Contexto(cur, prefijo + 'Q'), args.muestras_bd)
+        conn.commit()
+        for resumen in rutas:
+            resumen['consultas_bd'] = consultas.get(resumen['ruta'])
+
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                                    capture_output=True, text=True).stdout.strip() or None
+        except OSError:
+            commit = None
+
+        resultado = {
+            'commit': commit,
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'escala': {'productos': productos, 'seriales': seriales},
+            'clientes': args.clientes,
+            'peticiones_por_ruta': args.peticiones,
+            'workers': None if args.url else args.workers,
+            'modo': None if args.url else args.modo,
+            'rutas': rutas,
+        }
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+        if args.salida:
+            with open(args.salida, 'w', encoding='utf-8') as f:
+                json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+        regresiones = comparar(resultado, args.comparar, args.umbral) if args.comparar else []
+        if regresiones:
+            print(f"❌ {len(regresiones)} rutas empeoraron más de {args.umbral:.0f}% en p95")
+    finally:
+        conn.rollback()
+        if not args.mantener and not args.sin_sembrar:
+            datos_sinteticos.eliminar_esquema(cur, args.esquema)
+            conn.commit()
+        conn.close()
+
+    sys.exit(1 if regresiones else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Prueba de concurrencia de /api/inventario/agregar_lote.
+
+Lanza varios procesos (como los workers de gunicorn, cada uno con su pool)
+que piden bloques de seriales para los mismos productos a la vez, y luego
+comprueba que:
+  - ninguna petición falló (sin colisiones de códigos),
+  - los números de cada producto son consecutivos, sin huecos ni repetidos,
+    incluso al pasar de -999 a -1000,
+  - producto_stock coincide con seriales,
+y después, con códigos <SKU>-NNN cargados a mano por delante de la
+secuencia, que /agregar_lote los salta (sin 409) y no repite ninguno, y que
+una `cantidad` no numérica responde 400.
+
+Uso:
+    python benchmarks/concurrencia_agregar_lote.py [--procesos 8] [--peticiones 50] [--productos 2]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import get_db_connection
+import datos_sinteticos
+import producto_stock
+
+
+def cliente_admin():
+    """Cliente de pruebas de Flask con sesión de administrador"""
+    import app as aplicacion
+
+    cliente = aplicacion.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['user_id'] = 1
+        sesion['role'] = 'admin'
+    return cliente
+
+
+def trabajador(indice, productos, peticiones, cantidad_max, barrera, resultados):
+    """Un 'worker': su propio pool y su propio cliente, disparando en bucle"""
+    random.seed(indice)
+    cliente = cliente_admin()
+
+    creados, errores = {}, []
+    barrera.wait()
+    for _ in range(peticiones):
+        producto_id = random.choice(productos)
+        cantidad = random.randint(1, cantidad_max)
+        respuesta = cliente.post('/api/inventario/agregar_lote', json={'producto_id': producto_id, 'cantidad': cantidad})
+        if respuesta.status_code == 200:
+            creados[producto_id] = creados.get(producto_id, 0) + len(respuesta.get_json()['seriales'])
+        else:
+            errores.append(f"{respuesta.status_code}: {respuesta.get_data(as_text=True)[:200]}")
+    resultados.put((creados, errores))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--procesos', type=int, default=8)
+    parser.add_argument('--peticiones', type=int, default=50, help='peticiones por proceso')
+    parser.add_argument('--productos', type=int, default=2, help='productos compartidos por todos los procesos')
+    parser.add_argument('--cantidad-max', type=int, default=200, help='cantidad máxima por petición')
+    parser.add_argument('--esquema', default='concurrencia_lote')
+    parser.add_argument('--mantener', action='store_true', help='no borrar el esquema al terminar')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+    ok = False
+
+    try:
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, productos=args.productos, seriales=0, categorias=1, historial=False)
+        cur.execute('SELECT producto_id, codigo_sku FROM productos ORDER BY producto_id')
+        productos = cur.fetchall()
+
+        # Seriales "antiguos" justo antes del salto de 3 a 4 dígitos
+        for producto_id, sku in productos:
+            cur.execute("""
+                INSERT INTO seriales (producto_id, codigo_unico_serial, estado)
+                SELECT %s, %s || '-' || g, 'ALMACEN' FROM generate_series(990, 997) g;
+            """, (producto_id, sku))
+        producto_stock.reconstruir(cur)
+        conn.commit()
+
+        # Los procesos hijos heredan el search_path vía libpq
+        os.environ['PGOPTIONS'] = f'-c search_path={args.esquema},public'
+        contexto = multiprocessing.get_context('fork')
+        barrera = contexto.Barrier(args.procesos)
+        resultados = contexto.Queue()
+        ids = [producto_id for producto_id, _ in productos]
+        procesos = [
+            contexto.Process(target=trabajador,
+                             args=(i, ids, args.peticiones, args.cantidad_max, barrera, resultados))
+            for i in range(args.procesos)
+        ]
+
+        print(f"🔨 {args.procesos} procesos × {args.peticiones} peticiones sobre {len(ids)} productos...")
+        inicio = time.perf_counter()
+        for proceso in procesos:
+            proceso.start()
+        creados, errores = {}, []
+        for _ in procesos:
+            parcial, errores_parcial = resultados.get()
+            for producto_id, n in parcial.items():
+                creados[producto_id] = creados.get(producto_id, 0) + n
+            errores.extend(errores_parcial)
+        for proceso in procesos:
+            proceso.join()
+        duracion = time.perf_counter() - inicio
+
+        total = sum(creados.values())
+        print(f"   {total:,} seriales en {duracion:.1f} s ({total / duracion:,.0f}/s), {len(errores)} errores")
+        for error in errores[:5]:
+            print(f"   ❌ {error}")
+
+        problemas = len(errores)
+        for producto_id, sku in productos:
+            cur.execute("""
+                SELECT COUNT(*), MIN(n), MAX(n), COUNT(DISTINCT n)
+                FROM (
+                    SELECT substr(codigo_unico_serial, length(%s) + 2)::bigint AS n
+                    FROM seriales WHERE producto_id = %s
+                ) numeros;
+            """, (sku, producto_id))
+            cantidad, minimo, maximo, distintos = cur.fetchone()
+            esperados = creados.get(producto_id, 0) + 8
+            consecutivos = cantidad == distintos == maximo - minimo + 1 == esperados
+            print(f"   {'✅' if consecutivos else '❌'} {sku}: {cantidad:,} seriales, {minimo}..{maximo} "
+                  f"(esperados {esperados:,})")
+            problemas += 0 if consecutivos else 1
+
+        conn.commit()
+
+        # Códigos cargados a mano con el formato de la secuencia, por delante de ella
+        producto_id, sku = productos[0]
+        cur.execute('SELECT ultimo_numero FROM producto_secuencia_serial WHERE producto_id = %s', (producto_id,))
+        ultimo = cur.fetchone()[0]
+        manuales = [f"{sku}-{ultimo + n}" for n in (1, 4, 6)]
+        cur.execute("""
+            INSERT INTO seriales (producto_id, codigo_unico_serial, estado)
+            SELECT %s, codigo, 'ALMACEN' FROM unnest(%s::text[]) codigo;
+        """, (producto_id, manuales))
+        producto_stock.reconstruir(cur)
+        conn.commit()
+
+        cliente = cliente_admin()
+        respuestas = [cliente.post('/api/inventario/agregar_lote', json={'producto_id': producto_id, 'cantidad': 3})
+                      for _ in range(4)]
+        estados = [r.status_code for r in respuestas]
+        generados = [s['codigo_serial'] for r in respuestas if r.status_code == 200
+                     for s in r.get_json()['seriales']]
+        cur.execute('SELECT COUNT(*), COUNT(DISTINCT codigo_unico_serial) FROM seriales WHERE producto_id = %s',
+                    (producto_id,))
+        cantidad, distintos = cur.fetchone()
+        esperados = creados.get(producto_id, 0) + 8 + len(manuales) + 12
+        salta = (estados == [200] * 4 and len(generados) == 12 and not set(generados) & set(manuales)
+                 and cantidad == distintos == esperados)
+        print(f"   {'✅' if salta else '❌'} con {', '.join(manuales)} cargados a mano: {estados}, "
+              f"{cantidad:,} seriales (esperados {esperados:,})")
+        problemas += 0 if salta else 1
+
+        respuesta = cliente.post('/api/inventario/agregar_lote', json={'producto_id': producto_id, 'cantidad': 'diez'})
+        print(f"   {'✅' if respuesta.status_code == 400 else '❌'} cantidad no numérica: {respuesta.status_code}")
+        problemas += 0 if respuesta.status_code == 400 else 1
+
+        ok = producto_stock.verificar(cur) and problemas == 0
+        print("✅ Sin colisiones ni huecos" if ok else "❌ La prueba de concurrencia falló")
+    finally:
+        conn.rollback()
+        if not args.mantener:
+            datos_sinteticos.eliminar_esquema(cur, args.esquema)
+            conn.commit()
+        conn.close()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
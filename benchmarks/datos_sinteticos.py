@@ -0,0 +1,114 @@
+"""Datos sintéticos para benchmarks.
+
+Crea un esquema aislado (por defecto "bench") con las mismas tablas que
+public y lo llena con productos / seriales de volumen configurable, para
+medir sin tocar los datos reales. Las funciones reciben un cursor; el
+search_path queda apuntando al esquema de benchmark.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import producto_stock
+
+TABLAS = ['tipos_pieza', 'productos', 'seriales', 'historial_estados', 'producto_stock', 'producto_secuencia_serial',
+          'inventario_version', 'alertas_stock']
+
+# Distribución de estados: 70% almacén, 20% instalado, 7% dañado, 3% retirado
+DISTRIBUCION_ESTADOS = [('ALMACEN', 0.70), ('INSTALADO', 0.90), ('DAÑADO', 0.97), ('RETIRADO', 1.0)]
+
+# Escalas predefinidas: (productos, seriales)
+ESCALAS = {
+    '1k': (1000, 100000),
+    '10k': (10000, 1000000),
+    '100k': (100000, 10000000),
+}
+
+MARCAS = ['HP', 'Dell', 'Lenovo', 'Cisco', 'Ubiquiti', 'Logitech', 'Kingston', 'APC', 'Epson', 'Samsung']
+
+
+def crear_esquema(cur, esquema='bench'):
+    """(Re)crea el esquema de benchmark copiando la estructura de public"""
+    cur.execute(f'DROP SCHEMA IF EXISTS "{esquema}" CASCADE')
+    cur.execute(f'CREATE SCHEMA "{esquema}"')
+    for tabla in TABLAS:
+        particionada = ' PARTITION BY RANGE ("fecha_cambio")' if tabla == 'historial_estados' else ''
+        cur.execute(f'CREATE TABLE "{esquema}"."{tabla}" (LIKE public."{tabla}" INCLUDING ALL){particionada}')
+    # public queda detrás para resolver funciones de extensiones (pg_trgm, unaccent)
+    cur.execute(f'SET search_path TO "{esquema}", public')
+    cur.execute('INSERT INTO "inventario_version" ("id") VALUES (1)')
+    # Historial particionado como en public, con meses para los 2 años sembrados
+    cur.execute('CREATE TABLE "historial_estados_default" PARTITION OF "historial_estados" DEFAULT')
+    cur.execute("""
+        SELECT historial_asegurar_particion(mes::date)
+        FROM generate_series(date_trunc('month', CURRENT_DATE) - INTERVAL '25 months',
+                             date_trunc('month', CURRENT_DATE) + INTERVAL '2 months',
+                             INTERVAL '1 month') mes;
+    """)
+
+
+def eliminar_esquema(cur, esquema='bench'):
+    cur.execute('SET search_path TO public')
+    cur.execute(f'DROP SCHEMA IF EXISTS "{esquema}" CASCADE')
+
+
+def sembrar(cur, productos=1000, seriales=100000, categorias=12, historial=True):
+    """Inserta categorías, productos y seriales con distribución realista.
+
+    Los seriales se reparten con sesgo: pocos productos concentran muchas
+    unidades y ~15% del catálogo queda sin unidades, como en el catálogo real.
+    Con `historial`, cada serial deja su alta en historial_estados y, si salió
+    de ALMACEN, también ese cambio de estado.
+    """
+    cur.execute("""
+        INSERT INTO tipos_pieza (tipo_modelo)
+        SELECT 'Categoría ' || g FROM generate_series(1, %s) g;
+    """, (categorias,))
+
+    cur.execute("""
+        WITH tipos AS (SELECT array_agg(tipo_id ORDER BY tipo_id) AS ids FROM tipos_pieza)
+        INSERT INTO productos (nombre, descripcion, tipo_pieza_id, codigo_sku, marca, modelo)
+        SELECT
+            'Producto ' || g,
+            'Producto sintético ' || g,
+            tipos.ids[1 + g %% array_length(tipos.ids, 1)],
+            'SKU-' || lpad(g::text, 7, '0'),
+            (%s::text[])[1 + g %% %s],
+            'M-' || (g %% 500)
+        FROM generate_series(1, %s) g, tipos;
+    """, (MARCAS, len(MARCAS), productos))
+
+    casos = " ".join(f"WHEN x.r < {limite} THEN '{estado}'" for estado, limite in DISTRIBUCION_ESTADOS)
+    cur.execute(f"""
+        WITH prods AS (SELECT array_agg(producto_id ORDER BY producto_id) AS ids FROM productos)
+        INSERT INTO seriales (producto_id, codigo_unico_serial, estado, fecha_registro, fecha_actualizacion)
+        SELECT
+            prods.ids[1 + floor(power(random(), 3) * array_length(prods.ids, 1) * 0.85)::int],
+            'SN' || lpad(g::text, 10, '0'),
+            CASE {casos} ELSE 'ALMACEN' END,
+            x.fecha,
+            x.fecha + (random() * interval '30 days')
+        FROM generate_series(1, %s) g
+        CROSS JOIN prods
+        CROSS JOIN LATERAL (
+            SELECT random() + 0 * g AS r,
+                   now() - (random() + 0 * g) * interval '730 days' AS fecha
+        ) x;
+    """, (seriales,))
+
+    if historial:
+        cur.execute("""
+            INSERT INTO historial_estados
+                (serial_id, producto_id, codigo_unico_serial, estado_anterior, estado_nuevo, fecha_cambio, notas)
+            SELECT serial_id, producto_id, codigo_unico_serial, NULL, 'ALMACEN', fecha_registro, 'Alta'
+            FROM seriales
+            UNION ALL
+            SELECT serial_id, producto_id, codigo_unico_serial, 'ALMACEN', estado, fecha_actualizacion, 'Cambio sintético'
+            FROM seriales
+            WHERE estado <> 'ALMACEN'
+            ORDER BY 6;
+        """)
+
+    producto_stock.reconstruir(cur)
+    cur.execute('ANALYZE')
@@ -0,0 +1,180 @@
+"""Verifica la caché de datos de referencia (/tipos_pieza y /productos) entre workers.
+
+Siembra un esquema aislado y levanta gunicorn dos veces: sin caché
+(CACHE_TTL=0) y con la caché compartida (CACHE_COMPARTIDA_DIR), con
+PROMETHEUS_MULTIPROC_DIR para sumar los contadores de todos los workers en
+/metrics. Con la caché compartida comprueba que:
+  1. tras el primer fallo de cada consulta, todos los workers aciertan
+     (un solo fallo por consulta en total),
+  2. crear una categoría invalida la caché de todos los workers: el request
+     siguiente, atienda quien atienda, ya la ve,
+  3. un cambio de estado de un serial no la invalida,
+y compara req/s y latencias de ambas corridas.
+
+Uso:
+    python benchmarks/verificar_cache.py [--peticiones 400] [--clientes 16] [--workers 4]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RUTAS = ['/api/inventario/tipos_pieza', '/api/inventario/productos']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--peticiones', type=int, default=400, help='peticiones por ruta')
+    parser.add_argument('--clientes', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--esquema', default='verificar_cache')
+    args = parser.parse_args()
+
+    from app import CacheConsultas, get_db_connection
+    from carga import Cliente, percentil, servidor
+    from verificar_metricas import TOKEN, leer_metricas
+    import datos_sinteticos
+
+    fallas = []
+
+    def comprobar(nombre, condicion):
+        print(f"{'✅' if condicion else '❌'} {nombre}")
+        if not condicion:
+            fallas.append(nombre)
+
+    # LRU local: la entrada menos usada sale primero
+    cache = CacheConsultas(max_entradas=2, ttl=60, directorio=None)
+    for consulta in ('a', 'b', 'c'):
+        cache.leer('prueba', consulta, None, 1, lambda: consulta.upper())
+    comprobar("la LRU expulsa la entrada más vieja al pasar el máximo",
+              cache.estadisticas()['expulsiones'] == 1 and cache.leer('prueba', 'c', None, 1, lambda: None) == 'C')
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+
+    def contadores(host, puerto):
+        resultado = {}
+        for etiquetas, valor in leer_metricas(host, puerto).get('inventario_cache_total', {}).items():
+            etiquetas = dict(etiquetas)
+            clave = (etiquetas['consulta'], etiquetas['resultado'])
+            resultado[clave] = resultado.get(clave, 0) + valor
+        return resultado
+
+    def total(conteo, resultado):
+        return int(sum(valor for (_, r), valor in conteo.items() if r == resultado))
+
+    def pedir_nuevo(host, puerto, cookie, metodo, ruta, json_=None):
+        """Una conexión nueva por request, para repartirlos entre los workers"""
+        cliente = Cliente(host, puerto)
+        cliente.cookie = cookie
+        estado, datos = cliente.pedir(metodo, ruta, json_)
+        cliente.conexion.close()
+        return estado, datos
+
+    def cargar(host, puerto, cookie):
+        latencias = []
+
+        def una(i):
+            inicio = time.perf_counter()
+            estado, _ = pedir_nuevo(host, puerto, cookie, 'GET', RUTAS[i % len(RUTAS)])
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            return estado
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(args.clientes) as ejecutor:
+            estados = list(ejecutor.map(una, range(args.peticiones * len(RUTAS))))
+        segundos = time.perf_counter() - inicio
+        return {
+            'rps': len(estados) / segundos,
+            'p50': percentil(sorted(latencias), 50),
+            'p95': percentil(sorted(latencias), 95),
+            'errores': sum(1 for estado in estados if estado != 200),
+        }
+
+    resultados = {}
+    try:
+        print("🌱 Sembrando 5,000 productos / 20,000 seriales...")
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, 5000, 20000, historial=False)
+        cur.execute("SELECT serial_id FROM seriales WHERE estado = 'ALMACEN' LIMIT 1")
+        serial_id = cur.fetchone()[0]
+        conn.commit()
+
+        for modo in ('sin caché', 'compartida'):
+            metricas = tempfile.mkdtemp(prefix='metricas-')
+            compartida = tempfile.mkdtemp(prefix='cache-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+            os.environ.update({
+                'PROMETHEUS_MULTIPROC_DIR': metricas,
+                'METRICS_TOKEN': TOKEN,
+                'CACHE_TTL': '0' if modo == 'sin caché' else '300',
+                'CACHE_COMPARTIDA_DIR': compartida,
+            })
+            try:
+                with servidor(args.esquema, args.workers) as (host, puerto):
+                    sesion = Cliente(host, puerto)
+                    sesion.login()
+                    for ruta in RUTAS:
+                        pedir_nuevo(host, puerto, sesion.cookie, 'GET', ruta)
+                    resultados[modo] = cargar(host, puerto, sesion.cookie)
+                    if modo == 'sin caché':
+                        continue
+
+                    # 1. Un fallo por consulta, el resto aciertos en cualquier worker
+                    conteo = contadores(host, puerto)
+                    aciertos = total(conteo, 'acierto') + total(conteo, 'acierto_compartido')
+                    print(f"📊 aciertos {total(conteo, 'acierto')}, compartidos {total(conteo, 'acierto_compartido')}, "
+                          f"fallos {total(conteo, 'fallo')}")
+                    comprobar("un solo fallo por consulta entre todos los workers", total(conteo, 'fallo') == len(RUTAS))
+                    comprobar("los demás workers aciertan desde la caché compartida",
+                              total(conteo, 'acierto_compartido') >= args.workers - 1
+                              and aciertos == args.peticiones * len(RUTAS))
+
+                    # 2. Una categoría nueva invalida la caché de todos
+                    nombre = f'Categoría de prueba {int(time.time())}'
+                    estado, _ = pedir_nuevo(host, puerto, sesion.cookie, 'POST', RUTAS[0], {'tipo_modelo': nombre})
+                    comprobar("POST /tipos_pieza responde 201", estado == 201)
+                    antes = contadores(host, puerto)
+                    vistas = [json.loads(pedir_nuevo(host, puerto, sesion.cookie, 'GET', RUTAS[0])[1])
+                              for _ in range(args.workers * 4)]
+                    despues = contadores(host, puerto)
+                    comprobar("todos los workers ven la categoría nueva en el request siguiente",
+                              all(any(t['tipo_modelo'] == nombre for t in tipos) for tipos in vistas))
+                    comprobar("la versión nueva se carga una sola vez",
+                              total(despues, 'fallo') - total(antes, 'fallo') == 1)
+
+                    # 3. Cambios de seriales no la invalidan (/productos ya cargado en la versión nueva)
+                    pedir_nuevo(host, puerto, sesion.cookie, 'GET', RUTAS[1])
+                    estado, _ = pedir_nuevo(host, puerto, sesion.cookie, 'PUT', f'/api/inventario/serial/{serial_id}',
+                                            {'estado': 'INSTALADO'})
+                    antes = contadores(host, puerto)
+                    pedir_nuevo(host, puerto, sesion.cookie, 'GET', RUTAS[1])
+                    despues = contadores(host, puerto)
+                    comprobar("un cambio de estado de serial no invalida la caché",
+                              estado == 200 and total(despues, 'fallo') == total(antes, 'fallo'))
+            finally:
+                shutil.rmtree(metricas, ignore_errors=True)
+                shutil.rmtree(compartida, ignore_errors=True)
+
+        print(f"\n{'modo':<12s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'errores':>8s}")
+        for modo, r in resultados.items():
+            print(f"{modo:<12s} {r['rps']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['errores']:>8d}")
+        comprobar("ninguna corrida tuvo errores", all(r['errores'] == 0 for r in resultados.values()))
+    finally:
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == '__main__':
+    main()
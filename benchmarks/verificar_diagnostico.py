@@ -0,0 +1,137 @@
+"""Verifica el log de consultas lentas y el perfil a pedido.
+
+Siembra un esquema aislado y, por el test client de Flask y con un umbral
+SQL_LENTA_MS mínimo (toda sentencia cuenta como lenta), comprueba que:
+  1. cada sentencia lenta se imprime con su ruta, SQL normalizado y
+     parámetros solo por tipo (nunca sus valores),
+  2. con SQL_LENTA_EXPLAIN=1 las lecturas llevan su plan con ANALYZE y
+     BUFFERS, y las escrituras solo su plan (no se ejecutan dos veces),
+  3. un admin con `X-Perfil: 1` recibe las pilas "folded" del request con la
+     función de la ruta, y un usuario sin rol admin recibe la respuesta normal.
+
+Uso:
+    python benchmarks/verificar_diagnostico.py
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--esquema', default='verificar_diagnostico')
+    args = parser.parse_args()
+
+    os.environ.update({
+        'SQL_LENTA_MS': '0.001',
+        'SQL_LENTA_EXPLAIN': '1',
+        'SQL_LENTA_EXPLAIN_CADA': '0',
+        'PERFIL_INTERVALO_MS': '1',
+        'PGOPTIONS': f'-c search_path={args.esquema},public',
+    })
+    # Después de fijar el entorno: app lee estas variables al importarse
+    import app as aplicacion
+    import datos_sinteticos
+
+    conn = aplicacion.get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+    fallas = []
+
+    def comprobar(nombre, condicion):
+        print(f"{'✅' if condicion else '❌'} {nombre}")
+        if not condicion:
+            fallas.append(nombre)
+
+    def nuevo_cliente(rol):
+        cliente = aplicacion.app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['user_id'] = 1
+            sesion['role'] = rol
+        return cliente
+
+    def planes_por_sentencia(log):
+        """{sql normalizado: plan} de las líneas 🐢 y sus planes indentados"""
+        planes, sql = {}, None
+        for linea in log.splitlines():
+            if linea.startswith('🐢'):
+                sql = linea.split(' | ')[2]
+                planes[sql] = ''
+            elif sql and linea.startswith('   '):
+                planes[sql] += linea + '\n'
+            else:
+                sql = None
+        return planes
+
+    def capturar(funcion):
+        salida = io.StringIO()
+        with contextlib.redirect_stdout(salida):
+            respuesta = funcion()
+        return respuesta, salida.getvalue()
+
+    try:
+        print("🌱 Sembrando 2,000 productos / 20,000 seriales...")
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, 2000, 20000, historial=True)
+        cur.execute("SELECT serial_id, codigo_unico_serial FROM seriales WHERE estado = 'ALMACEN' LIMIT 1")
+        serial_id, numero_serie = cur.fetchone()
+        conn.commit()
+
+        admin, usuario = nuevo_cliente('admin'), nuevo_cliente('usuario')
+
+        # 1 y 2. Lectura: log con ruta, parámetros redactados y EXPLAIN ANALYZE
+        respuesta, log = capturar(lambda: admin.get('/api/inventario/buscar', query_string={'q': numero_serie}))
+        lineas = [linea for linea in log.splitlines() if linea.startswith('🐢')]
+        comprobar("GET /buscar responde 200", respuesta.status_code == 200)
+        comprobar("las sentencias lentas se imprimen con su ruta",
+                  lineas and all('ruta=buscar_productos' in linea for linea in lineas))
+        comprobar("los parámetros y los textos del plan no muestran valores",
+                  'q=str[' in log and numero_serie not in log)
+        comprobar("las lecturas llevan EXPLAIN (ANALYZE, BUFFERS)",
+                  'actual time=' in log and 'Buffers:' in log)
+
+        # 2. Escritura: plan sin ANALYZE, el cambio se aplica una sola vez
+        cur.execute('SELECT count(*) FROM historial_estados WHERE serial_id = %s', (serial_id,))
+        historial_antes = cur.fetchone()[0]
+        conn.commit()
+        respuesta, log = capturar(lambda: admin.put(f'/api/inventario/serial/{serial_id}', json={'estado': 'INSTALADO'}))
+        comprobar("PUT /serial/<id> responde 200", respuesta.status_code == 200)
+        planes = planes_por_sentencia(log)
+        escrituras = {sql: plan for sql, plan in planes.items() if sql.startswith(('UPDATE', 'INSERT'))}
+        comprobar("las escrituras se registran con su plan sin ANALYZE",
+                  escrituras and all('cost=' in plan and 'actual time=' not in plan for plan in escrituras.values()))
+        cur.execute('SELECT count(*) FROM historial_estados WHERE serial_id = %s', (serial_id,))
+        comprobar("el EXPLAIN no duplica la escritura", cur.fetchone()[0] == historial_antes + 1)
+        conn.commit()
+
+        # 3. Perfil a pedido
+        respuesta, _ = capturar(lambda: admin.get('/api/inventario/productos/detallado', headers={'X-Perfil': '1'}))
+        perfil = respuesta.get_data(as_text=True)
+        comprobar("un admin con X-Perfil recibe text/plain", respuesta.mimetype == 'text/plain')
+        comprobar("el perfil incluye la función de la ruta", 'obtener_productos_detallado (app.py' in perfil)
+        comprobar("las líneas tienen el formato folded (pila;pila N)",
+                  all(linea.rsplit(' ', 1)[-1].isdigit() for linea in perfil.splitlines()))
+        comprobar("las cabeceras conservan el estado original y las consultas",
+                  respuesta.headers.get('X-Perfil-Estado') == '200' and int(respuesta.headers['X-Perfil-Consultas']) > 0)
+        print(f"🔬 {respuesta.headers.get('X-Perfil-Muestras')} muestras en "
+              f"{respuesta.headers.get('X-Perfil-Duracion-Ms')} ms")
+
+        respuesta, _ = capturar(lambda: usuario.get('/api/inventario/productos/detallado', query_string={'perfil': '1'}))
+        comprobar("sin rol admin el pedido de perfil se ignora",
+                  respuesta.status_code == 200 and respuesta.is_json and 'X-Perfil-Estado' not in respuesta.headers)
+    finally:
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""Verifica las exportaciones en streaming (CSV / XLSX / NDJSON) con memoria acotada.
+
+Siembra un esquema aislado con muchos seriales y levanta gunicorn con un
+solo worker. Mientras descarga cada exportación muestrea el RSS del worker
+(/proc/<pid>/status) y comprueba que:
+  1. el crecimiento del RSS queda bajo un techo fijo (--techo-mb) aunque el
+     archivo pese cientos de MB: las filas no se acumulan en memoria,
+  2. el primer byte llega enseguida (TTFB), antes de recorrer la tabla,
+  3. cada formato trae todas las filas (CSV con gzip en streaming incluido)
+     y el XLSX abre como zip con hojas SpreadsheetML válidas,
+  4. un cliente que corta la descarga devuelve la conexión al pool y libera
+     su lugar, y por encima de EXPORTAR_MAX_SIMULTANEAS se responde 503.
+
+Uso:
+    python benchmarks/verificar_exportacion.py [--seriales 1000000] [--techo-mb 64]
+"""
+import argparse
+import csv
+import http.client
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NS_XLSX = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def rss_mb(pid):
+    with open(f'/proc/{pid}/status', encoding='ascii') as f:
+        for linea in f:
+            if linea.startswith('VmRSS:'):
+                return int(linea.split()[1]) / 1024
+    return 0.0
+
+
+class Muestreo(threading.Thread):
+    """Máximo RSS del proceso mientras dura el bloque `with`"""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.maximo = rss_mb(pid)
+        self._fin = threading.Event()
+
+    def run(self):
+        while not self._fin.wait(0.02):
+            self.maximo = max(self.maximo, rss_mb(self.pid))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._fin.set()
+        self.join()
+
+
+def descargar(host, puerto, cookie, ruta, destino, gzip_=False, cabeceras=None):
+    """Descarga `ruta` a `destino` por trozos; devuelve (estado, cabeceras, ttfb s, bytes, segundos)"""
+    conexion = http.client.HTTPConnection(host, puerto, timeout=600)
+    headers = {'Cookie': cookie, 'Accept-Encoding': 'gzip' if gzip_ else 'identity', **(cabeceras or {})}
+    inicio = time.perf_counter()
+    conexion.request('GET', ruta, headers=headers)
+    respuesta = conexion.getresponse()
+    ttfb, total = None, 0
+    while True:
+        trozo = respuesta.read1(1 << 16)
+        if not trozo:
+            break
+        if ttfb is None:
+            ttfb = time.perf_counter() - inicio
+        total += len(trozo)
+        destino.write(trozo)
+    conexion.close()
+    return respuesta.status, dict(respuesta.getheaders()), ttfb or 0.0, total, time.perf_counter() - inicio
+
+
+def filas_xlsx(archivo):
+    """Filas de datos por hoja (sin el encabezado), leyendo el XML en streaming"""
+    conteos = []
+    with zipfile.ZipFile(archivo) as libro:
+        hojas = sorted(n for n in libro.namelist() if n.startswith('xl/worksheets/'))
+        for nombre in ['[Content_Types].xml', 'xl/workbook.xml', '_rels/.rels']:
+            ElementTree.fromstring(libro.read(nombre))
+        for nombre in hojas:
+            filas = 0
+            with libro.open(nombre) as hoja:
+                for _, elemento in ElementTree.iterparse(hoja):
+                    if elemento.tag == f'{NS_XLSX}row':
+                        filas += 1
+                        elemento.clear()
+            conteos.append(filas - 1)
+    return conteos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seriales', type=int, default=1000000)
+    parser.add_argument('--productos', type=int, default=20000)
+    parser.add_argument('--techo-mb', type=float, default=64)
+    parser.add_argument('--ttfb-max', type=float, default=1.0, help='segundos')
+    parser.add_argument('--esquema', default='verificar_exportacion')
+    args = parser.parse_args()
+
+    from app import get_db_connection
+    from carga import Cliente, servidor
+    import datos_sinteticos
+
+    fallas = []
+
+    def comprobar(nombre, condicion):
+        print(f"{'✅' if condicion else '❌'} {nombre}")
+        if not condicion:
+            fallas.append(nombre)
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+
+    try:
+        print(f"🌱 Sembrando {args.productos:,} productos / {args.seriales:,} seriales...")
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, args.productos, args.seriales, historial=True)
+        esperadas = {}
+        for nombre, tabla in (('productos', 'productos'), ('seriales', 'seriales'), ('historial', 'historial_estados')):
+            cur.execute(f'SELECT count(*) FROM {tabla}')
+            esperadas[nombre] = cur.fetchone()[0]
+        conn.commit()
+
+        os.environ.update({'EXPORTAR_MAX_SIMULTANEAS': '2'})
+        with servidor(args.esquema, 1) as (host, puerto):
+            sesion = Cliente(host, puerto)
+            sesion.login()
+            pid = json.loads(sesion.pedir('GET', '/api/debug/pool')[1])['pool']['pid']
+            # Calentamiento: imports perezosos, pool y caches del worker antes de la base
+            with tempfile.TemporaryFile() as archivo:
+                for formato in ('csv', 'ndjson', 'xlsx'):
+                    descargar(host, puerto, sesion.cookie, f'/api/inventario/exportar/productos?formato={formato}', archivo)
+
+            print(f"\n{'exportación':<24s} {'MB':>8s} {'filas':>10s} {'TTFB ms':>8s} {'s':>6s} {'RSS +MB':>8s}")
+            for nombre in ('seriales', 'historial', 'productos'):
+                for formato, gzip_ in (('csv', False), ('csv', True), ('ndjson', False), ('xlsx', False)):
+                    etiqueta = f"{nombre}.{formato}{'.gz' if gzip_ else ''}"
+                    with tempfile.TemporaryFile() as archivo:
+                        base = rss_mb(pid)
+                        with Muestreo(pid) as muestreo:
+                            estado, cabeceras, ttfb, total, segundos = descargar(
+                                host, puerto, sesion.cookie, f'/api/inventario/exportar/{nombre}?formato={formato}',
+                                archivo, gzip_)
+                        crecimiento = muestreo.maximo - base
+                        archivo.seek(0)
+                        if formato == 'xlsx':
+                            hojas = filas_xlsx(archivo)
+                            filas = sum(hojas)
+                        else:
+                            datos = archivo.read()
+                            if gzip_:
+                                comprobar(f"{etiqueta}: Content-Encoding gzip",
+                                          cabeceras.get('Content-Encoding') == 'gzip')
+                                datos = zlib.decompress(datos, 31)
+                            texto = datos.decode('utf-8')
+                            if formato == 'csv':
+                                filas = sum(1 for _ in csv.reader(io.StringIO(texto))) - 1
+                            else:
+                                filas = sum(1 for linea in texto.splitlines() if linea)
+                    print(f"{etiqueta:<24s} {total / 1e6:>8.1f} {filas:>10,d} {ttfb * 1000:>8.0f} "
+                          f"{segundos:>6.1f} {crecimiento:>8.1f}")
+                    comprobar(f"{etiqueta}: 200 y {esperadas[nombre]:,} filas",
+                              estado == 200 and filas == esperadas[nombre])
+                    comprobar(f"{etiqueta}: RSS del worker crece menos de {args.techo_mb:g} MB",
+                              crecimiento < args.techo_mb)
+                    comprobar(f"{etiqueta}: primer byte en menos de {args.ttfb_max:g} s", ttfb < args.ttfb_max)
+
+            # 4. Cortes del cliente y límite de exportaciones simultáneas
+            def abrir(nombre):
+                conexion = http.client.HTTPConnection(host, puerto, timeout=60)
+                conexion.request('GET', f'/api/inventario/exportar/{nombre}?formato=csv',
+                                 headers={'Cookie': sesion.cookie, 'Accept-Encoding': 'identity'})
+                respuesta = conexion.getresponse()
+                return conexion, respuesta
+
+            abiertas = [abrir('seriales') for _ in range(2)]
+            for _, respuesta in abiertas:
+                respuesta.read1(1024)
+            _, tercera = abrir('seriales')
+            comprobar("por encima de EXPORTAR_MAX_SIMULTANEAS se responde 503 con Retry-After",
+                      tercera.status == 503 and tercera.getheader('Retry-After'))
+            for conexion, _ in abiertas:
+                conexion.sock.shutdown(2)
+                conexion.close()
+
+            def pool():
+                # Conexión nueva: la keep-alive de la sesión ya venció durante las descargas
+                cliente = Cliente(host, puerto)
+                cliente.cookie = sesion.cookie
+                estadisticas = json.loads(cliente.pedir('GET', '/api/debug/pool')[1])['pool']
+                cliente.conexion.close()
+                return estadisticas
+
+            limite, en_uso = time.monotonic() + 30, None
+            while time.monotonic() < limite:
+                en_uso = pool()['en_uso']
+                if en_uso <= 1:   # la del propio /debug/pool
+                    break
+                time.sleep(0.2)
+            comprobar("al cortar el cliente las conexiones vuelven al pool", en_uso is not None and en_uso <= 1)
+            with tempfile.TemporaryFile() as archivo:
+                estados = [descargar(host, puerto, sesion.cookie, '/api/inventario/exportar/productos', archivo)[0]
+                           for _ in range(3)]
+            comprobar("los lugares de los cortes se liberaron (exportaciones siguientes responden 200)",
+                      estados == [200, 200, 200])
+    finally:
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == '__main__':
+    main()
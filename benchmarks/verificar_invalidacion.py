@@ -0,0 +1,188 @@
+"""Verifica el bus de invalidación (LISTEN/NOTIFY) con varios procesos worker.
+
+Levanta N procesos que importan app.py y arrancan su BusInvalidacion contra
+la misma base, cada uno anotando los mensajes que aplica, y mide desde el
+commit del publicador:
+  1. la convergencia (todos los procesos aplicaron el mensaje) de mensajes
+     sueltos y de una ráfaga concurrente, sin pérdidas,
+  2. que una transacción revertida no publica nada,
+  3. que un mensaje con demasiados ids llega como "todo el tipo",
+  4. que al cortar las conexiones LISTEN (pg_terminate_backend) cada proceso
+     reconecta y vacía todo, aunque el mensaje publicado durante el corte
+     se haya perdido,
+y que en este proceso los mensajes vacían la caché de referencia.
+
+Uso:
+    python benchmarks/verificar_invalidacion.py [--procesos 8] [--mensajes 200]
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def trabajador(indice, cola):
+    """Proceso worker: anota (indice, tipo, ids, instante) de cada mensaje aplicado"""
+    import app as aplicacion
+
+    @aplicacion.al_invalidar('producto', 'categoria', 'stock')
+    def anotar(tipo, ids):
+        cola.put((indice, tipo, ids, time.time()))
+
+    aplicacion.obtener_bus()
+    while True:
+        time.sleep(60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--procesos', type=int, default=8)
+    parser.add_argument('--mensajes', type=int, default=200, help='mensajes sueltos (y 5× en la ráfaga)')
+    args = parser.parse_args()
+
+    import app as aplicacion
+    from carga import percentil
+
+    fallas = []
+
+    def comprobar(nombre, condicion):
+        print(f"{'✅' if condicion else '❌'} {nombre}")
+        if not condicion:
+            fallas.append(nombre)
+
+    contexto = multiprocessing.get_context('spawn')
+    cola = contexto.Queue()
+    procesos = [contexto.Process(target=trabajador, args=(i, cola), daemon=True) for i in range(args.procesos)]
+    conn = aplicacion.get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+
+    def recibir(cantidad, segundos=30, filtro=lambda m: True):
+        """Hasta `cantidad` mensajes que cumplan `filtro` (los demás se descartan)"""
+        recibidos, limite = [], time.monotonic() + segundos
+        while len(recibidos) < cantidad and time.monotonic() < limite:
+            try:
+                mensaje = cola.get(timeout=max(0.01, limite - time.monotonic()))
+            except queue.Empty:
+                break
+            if filtro(mensaje):
+                recibidos.append(mensaje)
+        return recibidos
+
+    def publicar(tipo, ids=None, confirmar=True):
+        aplicacion.publicar_invalidacion(cur, tipo, ids)
+        if confirmar:
+            conn.commit()
+        else:
+            conn.rollback()
+        return time.time()
+
+    def resumen(latencias):
+        latencias = sorted(latencias)
+        return (f"p50 {percentil(latencias, 50):.1f} ms, p95 {percentil(latencias, 95):.1f} ms, "
+                f"máx {latencias[-1]:.1f} ms")
+
+    try:
+        for proceso in procesos:
+            proceso.start()
+        # Cada proceso vacía todo al empezar a escuchar: esa es su señal de listo
+        listos = recibir(args.procesos, 60, lambda m: m[1] == 'todo')
+        comprobar(f"{args.procesos} procesos escuchando (cada uno vació todo al conectar)",
+                  len({m[0] for m in listos}) == args.procesos)
+
+        # 1. Mensajes sueltos: commit -> todos los procesos
+        convergencia = []
+        for i in range(args.mensajes):
+            enviado = publicar('producto', [i])
+            llegadas = recibir(args.procesos, 10, lambda m, i=i: m[1] == 'producto' and m[2] == [i])
+            if len(llegadas) < args.procesos:
+                break
+            convergencia.append((max(m[3] for m in llegadas) - enviado) * 1000)
+        comprobar(f"{args.mensajes} mensajes sueltos llegaron a los {args.procesos} procesos",
+                  len(convergencia) == args.mensajes)
+        if convergencia:
+            print(f"   ⏱️ convergencia: {resumen(convergencia)}")
+
+        # Ráfaga: 4 publicadores concurrentes, cada mensaje en su transacción
+        rafaga = args.mensajes * 5
+
+        def publicador(desde):
+            otra = aplicacion.get_db_connection()
+            otro_cur = otra.cursor()
+            for i in range(desde, rafaga, 4):
+                aplicacion.publicar_invalidacion(otro_cur, 'stock', [i])
+                otra.commit()
+            otra.close()
+            return time.time()
+
+        inicio = time.time()
+        with ThreadPoolExecutor(4) as ejecutor:
+            fin_publicacion = max(ejecutor.map(publicador, range(4)))
+        llegadas = recibir(rafaga * args.procesos, 60, lambda m: m[1] == 'stock')
+        completos = all(len({m[2][0] for m in llegadas if m[0] == p}) == rafaga for p in range(args.procesos))
+        comprobar(f"ráfaga de {rafaga} mensajes concurrentes: todos los procesos los recibieron todos", completos)
+        if llegadas:
+            print(f"   ⏱️ {rafaga / (fin_publicacion - inicio):.0f} mensajes/s publicados; último aplicado "
+                  f"{(max(m[3] for m in llegadas) - fin_publicacion) * 1000:.1f} ms después del último commit")
+
+        # 2. Rollback: no se publica
+        publicar('categoria', [-1], confirmar=False)
+        publicar('categoria', [-2])
+        llegadas = recibir(args.procesos, 10, lambda m: m[1] == 'categoria')
+        comprobar("una transacción revertida no publica (llega solo el mensaje siguiente)",
+                  len(llegadas) == args.procesos and all(m[2] == [-2] for m in llegadas))
+
+        # 3. Demasiados ids para un NOTIFY
+        publicar('producto', range(5000))
+        llegadas = recibir(args.procesos, 10, lambda m: m[1] == 'producto')
+        comprobar("con demasiados ids el mensaje invalida el tipo completo",
+                  len(llegadas) == args.procesos and all(m[2] is None for m in llegadas))
+
+        # 4. Corte de las conexiones LISTEN: reconexión + vaciado completo
+        corte = time.time()
+        cur.execute("""
+            SELECT count(pg_terminate_backend(pid)) FROM pg_stat_activity
+            WHERE application_name = 'inventario-invalidacion' AND pid <> pg_backend_pid()
+        """)
+        cortadas = cur.fetchone()[0]
+        conn.commit()
+        publicar('producto', [-3])   # puede perderse: los procesos están desconectados
+        vaciados = recibir(args.procesos, 30, lambda m: m[1] == 'todo')
+        comprobar(f"{cortadas} conexiones cortadas: todos los procesos reconectaron y vaciaron todo",
+                  cortadas >= args.procesos and len({m[0] for m in vaciados}) == args.procesos)
+        if vaciados:
+            print(f"   ⏱️ convergencia tras el corte: {(max(m[3] for m in vaciados) - corte) * 1000:.0f} ms")
+        publicar('producto', [-4])
+        llegadas = recibir(args.procesos, 10, lambda m: m[1] == 'producto' and m[2] == [-4])
+        comprobar("después de reconectar los mensajes vuelven a llegar", len(llegadas) == args.procesos)
+
+        # En este proceso: los handlers de app.py vacían la caché de referencia
+        bus = aplicacion.obtener_bus()
+        bus.esperar_conexion(10)
+        cache = aplicacion.CACHE_REFERENCIA
+        cache.guardar('tipos_pieza', cache.clave('tipos'), 1, [{'tipo_id': 1}])
+        cache.guardar('productos', cache.clave('productos'), 1, [{'producto_id': 1}])
+        mensajes = bus.estadisticas()['mensajes']
+        publicar('categoria', [1])
+        limite = time.monotonic() + 10
+        while bus.estadisticas()['mensajes'] == mensajes and time.monotonic() < limite:
+            time.sleep(0.01)
+        comprobar("`categoria` vacía solo las entradas de tipos_pieza de la caché",
+                  cache.obtener('tipos_pieza', cache.clave('tipos'), 1) is None
+                  and cache.obtener('productos', cache.clave('productos'), 1) is not None)
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+        conn.close()
+
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Verifica /metrics con varios workers y muestra el presupuesto de BD por ruta.
+
+Siembra un esquema aislado, levanta gunicorn (o asgi.py con --modo asgi) con
+PROMETHEUS_MULTIPROC_DIR y METRICS_TOKEN, recorre los escenarios de carga.py
+con clientes concurrentes (los requests se reparten entre los workers) y
+compara lo que reporta /metrics con lo que se envió: el total de requests
+debe coincidir exactamente aunque lo hayan atendido procesos distintos.
+
+Al final imprime, por ruta, requests, p95 aproximado, tiempo total en la BD,
+sentencias, filas y bytes, ordenado por tiempo de BD (las rutas nativas de
+asgi.py no miden la BD: aparecen con 0).
+
+Uso:
+    python benchmarks/verificar_metricas.py [--peticiones 50] [--workers 4] [--modo gthread]
+"""
+import argparse
+import collections
+import http.client
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from app import get_db_connection
+from carga import ESCENARIOS, MODOS_SERVIDOR, Cliente, Contexto, cargar_ruta, servidor
+import datos_sinteticos
+
+TOKEN = 'verificar-metricas'
+
+
+def leer_metricas(host, puerto):
+    conexion = http.client.HTTPConnection(host, puerto, timeout=60)
+    conexion.request('GET', '/metrics', headers={'Authorization': f'Bearer {TOKEN}'})
+    respuesta = conexion.getresponse()
+    texto = respuesta.read().decode('utf-8')
+    conexion.close()
+    if respuesta.status != 200:
+        raise RuntimeError(f"/metrics respondió {respuesta.status}: {texto[:200]}")
+    muestras = collections.defaultdict(dict)
+    for familia in text_string_to_metric_families(texto):
+        for muestra in familia.samples:
+            muestras[muestra.name][tuple(sorted(muestra.labels.items()))] = muestra.value
+    return muestras
+
+
+def por_ruta(muestras, nombre, **filtro):
+    totales = collections.Counter()
+    for etiquetas, valor in muestras.get(nombre, {}).items():
+        etiquetas = dict(etiquetas)
+        if all(etiquetas.get(k) == v for k, v in filtro.items()):
+            totales[etiquetas['ruta']] += valor
+    return totales
+
+
+def p95_aproximado(muestras, ruta):
+    """Límite del primer bucket del histograma que cubre el 95% de los requests"""
+    buckets = sorted(
+        (float(dict(etiquetas)['le']), valor)
+        for etiquetas, valor in muestras['inventario_request_duracion_seconds_bucket'].items()
+        if dict(etiquetas)['ruta'] == ruta
+    )
+    acumulado = collections.Counter()
+    for limite, valor in buckets:
+        acumulado[limite] += valor
+    total = max(acumulado.values(), default=0)
+    return next((limite for limite in sorted(acumulado) if acumulado[limite] >= 0.95 * total), None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--peticiones', type=int, default=50, help='peticiones por escenario')
+    parser.add_argument('--clientes', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--modo', choices=sorted(MODOS_SERVIDOR), default='gthread')
+    parser.add_argument('--esquema', default='verificar_metricas')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='metricas-')
+    os.environ.update({'PROMETHEUS_MULTIPROC_DIR': directorio, 'METRICS_TOKEN': TOKEN})
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+    ok = False
+
+    try:
+        print("🌱 Sembrando 2,000 productos / 40,000 seriales...")
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, 2000, 40000, historial=True)
+        ctx = Contexto(cur, 'M')
+        conn.commit()
+
+        with servidor(args.esquema, args.workers, args.modo) as (host, puerto):
+            clientes = [Cliente(host, puerto) for _ in range(args.clientes)]
+            for cliente in clientes:
+                cliente.login()
+            base = leer_metricas(host, puerto)
+
+            enviadas = 0
+            for esc in ESCENARIOS:
+                resumen, _ = cargar_ruta(esc, ctx, clientes, args.peticiones, lambda: Cliente(host, puerto))
+                enviadas += resumen['peticiones']
+                # sesion_propia: cada request hace además su propio login
+                if esc.sesion_propia:
+                    enviadas += resumen['peticiones']
+
+            muestras = leer_metricas(host, puerto)
+
+        requests_base = por_ruta(base, 'inventario_requests_total')
+        requests = por_ruta(muestras, 'inventario_requests_total')
+        delta = requests - requests_base
+        # La lectura de /metrics anterior se cuenta al terminar ese request
+        delta['metricas'] -= 1
+        contadas = sum(delta.values())
+        procesos = {archivo.rsplit('_', 1)[-1] for archivo in os.listdir(directorio)}
+
+        tiempo_bd = por_ruta(muestras, 'inventario_bd_tiempo_por_request_seconds_sum')
+        consultas = por_ruta(muestras, 'inventario_bd_consultas_por_request_sum')
+        filas = por_ruta(muestras, 'inventario_bd_filas_total')
+        bytes_ = por_ruta(muestras, 'inventario_respuesta_bytes_total')
+        espera = por_ruta(muestras, 'inventario_bd_conexion_seconds_sum')
+
+        print(f"\n{'ruta':<34s} {'requests':>8s} {'p95≤':>7s} {'BD s':>8s} {'%BD':>6s} {'SQL/req':>8s} "
+              f"{'filas':>10s} {'KB':>10s} {'espera ms':>10s}")
+        total_bd = sum(tiempo_bd.values()) or 1
+        for ruta in sorted(requests, key=lambda r: (-tiempo_bd[r], -requests[r])):
+            n = requests[ruta] or 1
+            p95 = p95_aproximado(muestras, ruta)
+            print(f"{ruta:<34s} {int(requests[ruta]):>8d} {p95 or 0:>7.3f} {tiempo_bd[ruta]:>8.2f} "
+                  f"{tiempo_bd[ruta] / total_bd * 100:>5.1f}% {consultas[ruta] / n:>8.1f} "
+                  f"{int(filas[ruta]):>10d} {bytes_[ruta] / 1024:>10.0f} {espera[ruta] * 1000:>10.1f}")
+
+        print(f"\n📨 enviadas {enviadas}, contadas en /metrics {int(contadas)}, "
+              f"archivos de {len(procesos)} procesos en {directorio}")
+        ok = int(contadas) == enviadas and len(procesos) > 1
+        print("✅ /metrics suma los requests de todos los workers" if ok else "❌ Los totales no coinciden")
+    finally:
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Verifica el ruteo de lecturas a réplicas contra un par primario + réplica en streaming.
+
+Con un primario (DB_* o DATABASE_URL) y una réplica física, por ejemplo:
+
+    pg_basebackup -h 127.0.0.1 -p 5432 -U postgres -D /tmp/replica -R -X stream
+    pg_ctl -D /tmp/replica -o '-p 5433' start
+
+siembra un esquema aislado y, por el test client de Flask, comprueba que:
+  1. los GET de RUTAS_REPLICA leen de la réplica y el resto del primario,
+  2. tras una escritura, la misma sesión lee del primario (read-your-writes)
+     mientras otra sesión sigue en la réplica,
+  3. con la réplica atrasada (replay pausado) las lecturas vuelven al primario
+     y, al ponerse al día, regresan a la réplica,
+  4. una réplica caída en la lista no produce errores (se salta).
+
+Uso:
+    python benchmarks/verificar_replicas.py --replica postgresql://postgres@127.0.0.1:5433/inventario_sistema?sslmode=disable
+"""
+import argparse
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def esperar(condicion, segundos=10):
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        if condicion():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--replica', required=True, help='URL de la réplica')
+    parser.add_argument('--esquema', default='verificar_replicas')
+    args = parser.parse_args()
+
+    # Una réplica inaccesible primero en la lista + la real; tiempos cortos para la prueba
+    caida = urlparse(args.replica)._replace(netloc=f'{urlparse(args.replica).username or "postgres"}@127.0.0.1:1')
+    os.environ.update({
+        'DATABASE_URL_READONLY': f'{caida.geturl()},{args.replica}',
+        'DB_REPLICA_LAG_MAX': '1',
+        'DB_REPLICA_VERIFICAR': '0.5',
+        'DB_REPLICA_LECTURA_PROPIA': '3',
+        'PGOPTIONS': f'-c search_path={args.esquema},public',
+    })
+    # Después de fijar el entorno: app lee estas variables al importarse
+    import app as aplicacion
+    import datos_sinteticos
+
+    conn = aplicacion.get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+    replica_directa = aplicacion.conectar_replica(aplicacion.parametros_replicas()[1])
+    if not replica_directa:
+        sys.exit("❌ No se pudo conectar a la réplica")
+    replica_directa.autocommit = True
+    cur_replica = replica_directa.cursor()
+
+    fallas = []
+
+    def comprobar(nombre, condicion):
+        print(f"{'✅' if condicion else '❌'} {nombre}")
+        if not condicion:
+            fallas.append(nombre)
+
+    def existe_en_replica(tabla):
+        cur_replica.execute('SELECT to_regclass(%s) IS NOT NULL', (tabla,))
+        return cur_replica.fetchone()[0]
+
+    def nuevo_cliente():
+        cliente = aplicacion.app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['user_id'] = 1
+            sesion['role'] = 'admin'
+        return cliente
+
+    def lecturas_replica():
+        return aplicacion.obtener_replicas()[1].estadisticas()['lecturas']
+
+    def stock_de(cliente, producto_id):
+        respuesta = cliente.get('/api/inventario/stock')
+        fila = next((p for p in respuesta.get_json() or [] if p['producto_id'] == producto_id), None)
+        return respuesta.status_code, fila
+
+    try:
+        print("🌱 Sembrando 300 productos / 3,000 seriales...")
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, 300, 3000, historial=False)
+        cur.execute("SELECT serial_id, producto_id FROM seriales WHERE estado = 'ALMACEN' LIMIT 1")
+        serial_id, producto_id = cur.fetchone()
+        conn.commit()
+        cur_replica.execute('SELECT pg_is_in_recovery()')
+        comprobar("la réplica está en recuperación (hot standby)", cur_replica.fetchone()[0])
+        comprobar("el esquema llegó a la réplica", esperar(lambda: existe_en_replica(f'{args.esquema}.producto_stock')))
+
+        escritor, lector = nuevo_cliente(), nuevo_cliente()
+
+        # 1. Reportes a la réplica, el resto al primario
+        antes = lecturas_replica()
+        estado, fila = stock_de(lector, producto_id)
+        comprobar("GET /stock responde 200 con la réplica caída en la lista", estado == 200 and fila is not None)
+        comprobar("GET /stock lee de la réplica", lecturas_replica() > antes)
+        antes = lecturas_replica()
+        lector.get(f'/api/inventario/productos/{producto_id}')
+        comprobar("GET /productos/<id> (no etiquetada) lee del primario", lecturas_replica() == antes)
+        caida_stats = aplicacion.obtener_replicas()[0].estadisticas()
+        comprobar("la réplica caída figura fuera de uso", not caida_stats['disponible'] and caida_stats['caidas'] > 0)
+
+        # 2. Read-your-writes
+        cur_replica.execute('SELECT pg_wal_replay_pause()')
+        respuesta = escritor.put(f'/api/inventario/serial/{serial_id}', json={'estado': 'INSTALADO'})
+        comprobar("PUT /serial/<id> responde 200", respuesta.status_code == 200)
+        antes = lecturas_replica()
+        _, fila_escritor = stock_de(escritor, producto_id)
+        comprobar("la sesión que escribió lee del primario y ve su cambio",
+                  lecturas_replica() == antes and fila_escritor['instalados'] == fila['instalados'] + 1)
+
+        # 3. Réplica atrasada (replay pausado): todos al primario
+        time.sleep(1.5)
+        antes = lecturas_replica()
+        _, fila_lector = stock_de(lector, producto_id)
+        comprobar("con la réplica atrasada, otra sesión también lee del primario",
+                  lecturas_replica() == antes and fila_lector['instalados'] == fila['instalados'] + 1)
+        cur_replica.execute('SELECT pg_wal_replay_resume()')
+        time.sleep(1.0)
+        antes = lecturas_replica()
+        _, fila_lector = stock_de(lector, producto_id)
+        comprobar("al ponerse al día, las lecturas vuelven a la réplica con el dato nuevo",
+                  lecturas_replica() > antes and fila_lector['instalados'] == fila['instalados'] + 1)
+        time.sleep(2.0)
+        antes = lecturas_replica()
+        stock_de(escritor, producto_id)
+        comprobar("pasada la ventana de lectura propia, el escritor vuelve a la réplica", lecturas_replica() > antes)
+
+        print(f"📊 GET de reportes servidos por el primario: {aplicacion.estadisticas_replicas()['lecturas_primario']}")
+    finally:
+        cur_replica.execute('SELECT pg_is_wal_replay_paused()')
+        if cur_replica.fetchone()[0]:
+            cur_replica.execute('SELECT pg_wal_replay_resume()')
+        replica_directa.close()
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""Verifica los umbrales de reposición, el conjunto de stock bajo y las alertas.
+
+Siembra un esquema aislado con umbrales distintos por categoría y algunos
+productos con umbral propio, levanta gunicorn y comprueba que:
+  1. /stock_bajo coincide con el cálculo completo desde seriales con los
+     umbrales efectivos (COALESCE(producto, categoría)) y su plan usa el
+     índice parcial idx_producto_stock_bajo, en lugar de recorrer el catálogo,
+  2. cada cruce de umbral de un producto nuevo, por movimientos de seriales
+     o por cambios de umbral del producto y de su categoría, deja una alerta
+     en /alertas y llega como evento `alerta_stock`; movimientos que no
+     cruzan no dejan ninguna,
+  3. después de todo, /stock_bajo sigue coincidiendo y producto_stock pasa
+     la verificación (contadores y umbrales),
+y compara el tiempo de /stock_bajo contra la consulta anterior (nivel
+evaluado sobre todos los productos).
+
+Uso:
+    python benchmarks/verificar_umbrales.py [--productos 100000] [--seriales 2000000]
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# La consulta de /stock_bajo de antes (nivel evaluado sobre todo el catálogo),
+# con los umbrales efectivos para que devuelva el mismo conjunto (referencia de tiempo)
+CONSULTA_ANTERIOR = """
+SELECT p.producto_id, p.nombre, p.codigo_sku, tp.tipo_modelo, COALESCE(ps.almacen, 0) as stock_actual
+FROM productos p
+JOIN tipos_pieza tp ON p.tipo_pieza_id = tp.tipo_id
+LEFT JOIN producto_stock ps ON p.producto_id = ps.producto_id
+WHERE COALESCE(ps.almacen, 0) <= COALESCE(p.umbral_bajo, tp.umbral_bajo)
+ORDER BY stock_actual ASC;
+"""
+
+# Stock bajo calculado desde cero: seriales en ALMACEN contra el umbral efectivo
+STOCK_BAJO_REAL = """
+SELECT p.producto_id, COUNT(s.serial_id) AS almacen
+FROM productos p
+JOIN tipos_pieza tp ON tp.tipo_id = p.tipo_pieza_id
+LEFT JOIN seriales s ON s.producto_id = p.producto_id AND s.estado = 'ALMACEN'
+GROUP BY p.producto_id, p.umbral_bajo, tp.umbral_bajo
+HAVING COUNT(s.serial_id) <= COALESCE(p.umbral_bajo, tp.umbral_bajo)
+ORDER BY 2, 1;
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--productos', type=int, default=100000)
+    parser.add_argument('--seriales', type=int, default=2000000)
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--esquema', default='verificar_umbrales')
+    args = parser.parse_args()
+
+    from app import CONSULTA_STOCK_BAJO, get_db_connection
+    from bench_eventos import Suscriptor
+    from carga import Cliente, percentil, servidor
+    import datos_sinteticos
+    import producto_stock
+
+    fallas = []
+
+    def comprobar(nombre, condicion):
+        print(f"{'✅' if condicion else '❌'} {nombre}")
+        if not condicion:
+            fallas.append(nombre)
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+    cur = conn.cursor()
+
+    def stock_bajo_real():
+        cur.execute(STOCK_BAJO_REAL)
+        filas = [tuple(fila) for fila in cur.fetchall()]
+        conn.commit()
+        return filas
+
+    try:
+        print(f"🌱 Sembrando {args.productos:,} productos / {args.seriales:,} seriales...")
+        datos_sinteticos.crear_esquema(cur, args.esquema)
+        datos_sinteticos.sembrar(cur, args.productos, args.seriales, historial=False)
+        # El sembrado deja ~15% del catálogo sin unidades; aquí se repone, como
+        # un inventario en operación donde el stock bajo es la excepción
+        cur.execute("""
+            INSERT INTO seriales (producto_id, codigo_unico_serial, estado)
+            SELECT p.producto_id, 'REP-' || p.producto_id || '-' || g, 'ALMACEN'
+            FROM productos p CROSS JOIN generate_series(1, 20) g
+            WHERE NOT EXISTS (SELECT 1 FROM seriales s WHERE s.producto_id = p.producto_id);
+        """)
+        # Umbrales variados: por categoría (0..3 / +8) y propios en 1 de cada 50 productos
+        cur.execute('UPDATE tipos_pieza SET umbral_bajo = tipo_id % 4, umbral_medio = tipo_id % 4 + 8')
+        cur.execute('UPDATE productos SET umbral_bajo = producto_id % 7 WHERE producto_id % 50 = 0')
+        producto_stock.reconstruir(cur)
+        cur.execute('ANALYZE')
+        cur.execute('SELECT tipo_id FROM tipos_pieza ORDER BY tipo_id LIMIT 1')
+        tipo_id = cur.fetchone()[0]
+        conn.commit()
+
+        # 1. Conjunto de stock bajo: plan y tiempo de la consulta
+        cur.execute('EXPLAIN (FORMAT JSON) ' + CONSULTA_STOCK_BAJO)
+        indices = set(re.findall(r'"Index Name": "([^"]+)"', json.dumps(cur.fetchone()[0])))
+        # En el esquema copiado el índice tiene otro nombre: se reconoce por su condición
+        cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'producto_stock' "
+                    "AND schemaname = current_schema() AND indexdef LIKE '%%WHERE stock_bajo%%'")
+        parcial = {fila[0] for fila in cur.fetchall()}
+        conn.commit()
+        comprobar("el plan de /stock_bajo usa el índice parcial de stock bajo", bool(indices & parcial))
+
+        tiempos = {}
+        for nombre, consulta in (('sobre todo el catálogo', CONSULTA_ANTERIOR), ('indexada', CONSULTA_STOCK_BAJO)):
+            muestras = []
+            for _ in range(args.repeticiones):
+                inicio = time.perf_counter()
+                cur.execute(consulta)
+                filas = len(cur.fetchall())
+                muestras.append((time.perf_counter() - inicio) * 1000)
+            conn.commit()
+            tiempos[nombre] = (sorted(muestras), filas)
+        for nombre, (muestras, filas) in tiempos.items():
+            print(f"   ⏱️ consulta {nombre}: {filas:,} filas, p50 {percentil(muestras, 50):.1f} ms, "
+                  f"p95 {percentil(muestras, 95):.1f} ms")
+
+        with servidor(args.esquema, 2) as (host, puerto):
+            sesion = Cliente(host, puerto)
+            sesion.login()
+
+            def pedir(metodo, ruta, cuerpo=None):
+                try:
+                    estado, datos = sesion.pedir(metodo, ruta, cuerpo)
+                except (http.client.HTTPException, OSError):
+                    # La keep-alive venció mientras se calculaba el stock real; pedir() ya la cerró
+                    estado, datos = sesion.pedir(metodo, ruta, cuerpo)
+                return estado, json.loads(datos) if datos else None
+
+            estado, lista = pedir('GET', '/api/inventario/stock_bajo')
+            real = stock_bajo_real()
+            comprobar(f"/stock_bajo coincide con el cálculo desde seriales ({len(real):,} productos)",
+                      estado == 200 and [(f['producto_id'], f['stock_actual']) for f in lista] == real)
+
+            # 2. Cruces de umbral de un producto nuevo (categoría con umbrales 3 / 10)
+            pedir('PUT', f'/api/inventario/tipos_pieza/{tipo_id}/umbrales', {'umbral_bajo': 3, 'umbral_medio': 10})
+            suscriptor = Suscriptor(host, puerto, sesion.cookie)
+            suscriptor.start()
+            suscriptor.conectado.wait(10)
+            time.sleep(0.5)   # el LISTEN del worker arranca con el primer suscriptor
+
+            estado, creado = pedir('POST', '/api/inventario/productos', {
+                'nombre': 'Producto umbrales', 'tipo_pieza_id': tipo_id, 'codigo_sku': 'SKU-UMBRALES-1'})
+            producto_id = creado['producto_id']
+            estado, lista = pedir('GET', '/api/inventario/stock_bajo')
+            comprobar("un producto nuevo (sin stock) ya está en /stock_bajo",
+                      any(f['producto_id'] == producto_id for f in lista))
+
+            codigos = [f'UMB-{i}' for i in range(5)]
+            pedir('POST', '/api/inventario/seriales/lote', {'producto_id': producto_id, 'seriales': codigos})
+            cur.execute('SELECT serial_id FROM seriales WHERE producto_id = %s ORDER BY serial_id', (producto_id,))
+            seriales = [fila[0] for fila in cur.fetchall()]
+            conn.commit()
+            pedir('PUT', f'/api/inventario/serial/{seriales[0]}', {'estado': 'INSTALADO'})   # 4: MEDIO, sin cruce
+            pedir('PUT', f'/api/inventario/serial/{seriales[1]}', {'estado': 'INSTALADO'})   # 3: BAJO
+            pedir('PUT', f'/api/inventario/productos/{producto_id}', {
+                'nombre': 'Producto umbrales', 'marca': '', 'modelo': '', 'tipo_pieza_id': tipo_id,
+                'codigo_sku': 'SKU-UMBRALES-1', 'umbral_bajo': 1})                            # MEDIO
+            pedir('PUT', f'/api/inventario/tipos_pieza/{tipo_id}/umbrales',
+                  {'umbral_bajo': 5, 'umbral_medio': 12})                                    # propio: sin cruce
+            pedir('PUT', f'/api/inventario/productos/{producto_id}', {
+                'nombre': 'Producto umbrales', 'marca': '', 'modelo': '', 'tipo_pieza_id': tipo_id,
+                'codigo_sku': 'SKU-UMBRALES-1', 'umbral_bajo': None})                         # hereda 5: BAJO
+            for serial_id in seriales:
+                pedir('DELETE', f'/api/inventario/serial/{serial_id}')                          # total 0: SIN_STOCK
+
+            esperadas = [('SIN_STOCK', 'MEDIO'), ('MEDIO', 'BAJO'), ('BAJO', 'MEDIO'),
+                         ('MEDIO', 'BAJO'), ('BAJO', 'SIN_STOCK')]
+            estado, alertas = pedir('GET', f'/api/inventario/alertas?producto_id={producto_id}')
+            obtenidas = [(a['nivel_anterior'], a['nivel_nuevo']) for a in reversed(alertas['items'])]
+            comprobar(f"/alertas registra los {len(esperadas)} cruces, y solo esos: {obtenidas}",
+                      estado == 200 and obtenidas == esperadas)
+            estado, activas = pedir('GET', f'/api/inventario/alertas?producto_id={producto_id}&activas=1&limit=2')
+            comprobar("?activas=1 filtra las que dejaron el producto en BAJO / SIN_STOCK y pagina con `siguiente`",
+                      estado == 200 and [a['nivel_nuevo'] for a in activas['items']] == ['SIN_STOCK', 'BAJO']
+                      and activas['siguiente'] is not None)
+
+            limite = time.monotonic() + 10
+            while time.monotonic() < limite:
+                eventos = [datos for _, evento, datos in suscriptor.eventos
+                           if evento == 'alerta_stock' and datos['producto_id'] == producto_id]
+                if len(eventos) >= len(esperadas):
+                    break
+                time.sleep(0.1)
+            suscriptor.cerrar()
+            comprobar("cada alerta llegó como evento `alerta_stock`",
+                      [(e['nivel_anterior'], e['nivel_nuevo']) for e in eventos] == esperadas)
+
+            # 3. Consistencia después de los cambios de umbral
+            estado, lista = pedir('GET', '/api/inventario/stock_bajo')
+            comprobar("tras los cambios /stock_bajo sigue coincidiendo con el cálculo desde seriales",
+                      [(f['producto_id'], f['stock_actual']) for f in lista] == stock_bajo_real())
+            sesion.conexion.close()
+
+        comprobar("producto_stock verifica (contadores y umbrales efectivos)", producto_stock.verificar(cur))
+    finally:
+        conn.rollback()
+        datos_sinteticos.eliminar_esquema(cur, args.esquema)
+        conn.commit()
+        conn.close()
+
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == '__main__':
+    main()
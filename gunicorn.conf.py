@@ -0,0 +1,27 @@
+"""Hooks de gunicorn (se carga solo desde el directorio de trabajo).
+
+Los flags de arranque siguen en el Dockerfile; aquí solo se preparan los
+directorios compartidos por los workers: el de sus métricas de Prometheus
+(PROMETHEUS_MULTIPROC_DIR), para que /metrics las sume, y el de la caché de
+datos de referencia (CACHE_COMPARTIDA_DIR).
+"""
+import glob
+import os
+
+
+def on_starting(server):
+    """Arranque del master: borra las métricas y la caché de una corrida anterior
+    (la caché podría ser de otra base con los mismos números de versión)"""
+    for variable, patron in (('PROMETHEUS_MULTIPROC_DIR', '*.db'), ('CACHE_COMPARTIDA_DIR', '*.json*')):
+        directorio = os.environ.get(variable)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+            for archivo in glob.glob(os.path.join(directorio, patron)):
+                os.remove(archivo)
+
+
+def child_exit(server, worker):
+    """Un worker terminó: sus gauges "live" dejan de sumarse"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
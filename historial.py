@@ -0,0 +1,154 @@
+"""Mantenimiento de las particiones mensuales de historial_estados.
+
+La migración 0007_historial_particionado crea la tabla particionada por mes
+de fecha_cambio y las particiones hasta dos meses adelante. Este script
+crea las de los meses siguientes (correrlo una vez al mes, p. ej. por cron)
+y desacopla los meses viejos para que la tabla activa no crezca sin fin.
+
+Uso:
+    python historial.py particiones                   # lista particiones, filas y tamaño
+    python historial.py crear [--meses 3]             # asegura mes actual + N siguientes
+    python historial.py desacoplar --antes 2024-01    # saca los meses anteriores a ese
+        [--esquema-archivo historial_archivo]         #   ...y los mueve a ese esquema
+        [--eliminar]                                  #   ...o los borra definitivamente
+"""
+import argparse
+import re
+import sys
+from datetime import date
+
+from app import get_db_connection
+
+PATRON_PARTICION = re.compile(r'^historial_estados_(\d{4})(\d{2})$')
+
+
+def existe_tabla(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('historial_estados')")
+    fila = cur.fetchone()
+    if not fila or fila[0] != 'p':
+        print("❌ historial_estados no existe o no está particionada")
+        print("💡 Ejecuta: python migrar.py aplicar")
+        return False
+    return True
+
+
+def listar(cur):
+    """[(nombre, mes o None para la partición por defecto, filas estimadas, bytes)]"""
+    cur.execute("""
+        SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('historial_estados')
+        ORDER BY c.relname;
+    """)
+    particiones = []
+    for nombre, filas, tamano in cur.fetchall():
+        coincide = PATRON_PARTICION.match(nombre)
+        mes = date(int(coincide.group(1)), int(coincide.group(2)), 1) if coincide else None
+        particiones.append((nombre, mes, max(filas, 0), tamano))
+    return particiones
+
+
+def particiones(cur):
+    if not existe_tabla(cur):
+        return False
+    for nombre, mes, filas, tamano in listar(cur):
+        rango = mes.strftime('%Y-%m') if mes else 'resto'
+        print(f"   {nombre:<32} {rango:>7}  ~{filas:>12,} filas  {tamano / 1024 / 1024:>9.1f} MB")
+    cur.execute('SELECT COUNT(*) FROM "historial_estados_default"')
+    en_defecto = cur.fetchone()[0]
+    if en_defecto:
+        print(f"⚠️ {en_defecto:,} filas en la partición por defecto")
+        print("💡 Ejecuta: python historial.py crear")
+    return True
+
+
+def crear(cur, meses):
+    """Asegura el mes actual y los `meses` siguientes, y saca de la partición
+    por defecto las filas de cualquier mes que no tuviera partición."""
+    if not existe_tabla(cur):
+        return False
+    cur.execute("""
+        SELECT historial_asegurar_particion(mes::date)
+        FROM (
+            SELECT generate_series(date_trunc('month', CURRENT_DATE),
+                                   date_trunc('month', CURRENT_DATE) + %s * INTERVAL '1 month',
+                                   INTERVAL '1 month') AS mes
+            UNION
+            SELECT DISTINCT date_trunc('month', "fecha_cambio") FROM "historial_estados_default"
+        ) meses
+        ORDER BY mes;
+    """, (meses,))
+    print(f"✅ {cur.rowcount} particiones aseguradas")
+    return True
+
+
+def desacoplar(cur, antes, esquema_archivo, eliminar):
+    """Desacopla las particiones de meses anteriores a `antes` (date, día 1)"""
+    if not existe_tabla(cur):
+        return False
+    if antes > date.today().replace(day=1):
+        print("❌ No se puede desacoplar el mes actual ni meses futuros")
+        return False
+
+    viejas = [nombre for nombre, mes, _, _ in listar(cur) if mes and mes < antes]
+    if not viejas:
+        print(f"✅ No hay particiones anteriores a {antes:%Y-%m}")
+        return True
+
+    if not eliminar:
+        cur.execute(f'CREATE SCHEMA IF NOT EXISTS "{esquema_archivo}"')
+    for nombre in viejas:
+        # DETACH ... CONCURRENTLY no es posible con partición por defecto: el
+        # bloqueo sobre historial_estados dura lo que tarda este commit
+        cur.execute(f'ALTER TABLE "historial_estados" DETACH PARTITION "{nombre}"')
+        if eliminar:
+            cur.execute(f'DROP TABLE "{nombre}"')
+            print(f"   🗑️ {nombre} eliminada")
+        else:
+            cur.execute(f'ALTER TABLE "{nombre}" SET SCHEMA "{esquema_archivo}"')
+            print(f"   📦 {nombre} → {esquema_archivo}.{nombre}")
+    print(f"✅ {len(viejas)} particiones desacopladas")
+    return True
+
+
+def _mes(valor):
+    try:
+        anio, mes = valor.split('-')
+        return date(int(anio), int(mes), 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError("formato AAAA-MM")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('comando', choices=['particiones', 'crear', 'desacoplar'])
+    parser.add_argument('--meses', type=int, default=3, help='meses adelante que crea `crear`')
+    parser.add_argument('--antes', type=_mes, help='desacoplar los meses anteriores a AAAA-MM')
+    parser.add_argument('--esquema-archivo', default='historial_archivo')
+    parser.add_argument('--eliminar', action='store_true', help='borrar las particiones en vez de archivarlas')
+    args = parser.parse_args()
+    if args.comando == 'desacoplar' and not args.antes:
+        parser.error('desacoplar requiere --antes AAAA-MM')
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+
+    try:
+        cur = conn.cursor()
+        if args.comando == 'particiones':
+            ok = particiones(cur)
+        elif args.comando == 'crear':
+            ok = crear(cur, args.meses)
+        else:
+            ok = desacoplar(cur, args.antes, args.esquema_archivo, args.eliminar)
+        conn.commit()
+    finally:
+        conn.close()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
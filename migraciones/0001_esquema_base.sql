@@ -0,0 +1,50 @@
+-- ====================================================================
+-- ESQUEMA BASE: categorías, productos, seriales e historial de estados
+-- ====================================================================
+-- Idempotente: en una base existente solo agrega lo que falte.
+
+CREATE TABLE IF NOT EXISTS "tipos_pieza" (
+    "tipo_id" SERIAL PRIMARY KEY,
+    "tipo_modelo" VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "productos" (
+    "producto_id" SERIAL PRIMARY KEY,
+    "nombre" VARCHAR(200) NOT NULL,
+    "descripcion" TEXT,
+    "tipo_pieza_id" INTEGER NOT NULL REFERENCES "tipos_pieza" ("tipo_id"),
+    "codigo_sku" VARCHAR(100) NOT NULL UNIQUE,
+    "marca" VARCHAR(100),
+    "modelo" VARCHAR(100),
+    "fecha_registro" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    "fecha_actualizacion" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS "seriales" (
+    "serial_id" SERIAL PRIMARY KEY,
+    "producto_id" INTEGER NOT NULL REFERENCES "productos" ("producto_id"),
+    "codigo_unico_serial" VARCHAR(200) NOT NULL UNIQUE,
+    "estado" VARCHAR(20) NOT NULL DEFAULT 'ALMACEN',
+    "notas" TEXT,
+    "fecha_registro" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    "fecha_actualizacion" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS "historial_estados" (
+    "historial_id" SERIAL PRIMARY KEY,
+    "serial_id" INTEGER REFERENCES "seriales" ("serial_id"),
+    "estado_anterior" VARCHAR(20),
+    "estado_nuevo" VARCHAR(20),
+    "fecha_cambio" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    "notas" TEXT
+);
+
+-- Estados válidos de un serial (mismos valores que ESTADOS_SERIAL en app.py)
+DO $migracion$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'seriales_estado_valido') THEN
+        ALTER TABLE "seriales" ADD CONSTRAINT "seriales_estado_valido"
+            CHECK ("estado" IN ('ALMACEN', 'INSTALADO', 'DAÑADO', 'RETIRADO'));
+    END IF;
+END
+$migracion$;
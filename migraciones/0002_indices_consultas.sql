@@ -0,0 +1,20 @@
+-- ====================================================================
+-- ÍNDICES DE LAS CONSULTAS CALIENTES
+-- ====================================================================
+-- seriales.codigo_unico_serial y productos.codigo_sku ya son UNIQUE.
+
+-- Seriales de un producto, por estado (detalle, lotes, conteos por estado)
+CREATE INDEX IF NOT EXISTS idx_seriales_producto_estado
+    ON "seriales" ("producto_id", "estado");
+
+-- Historial de un serial (borrados en cascada y consultas de trazabilidad)
+CREATE INDEX IF NOT EXISTS idx_historial_serial_fecha
+    ON "historial_estados" ("serial_id", "fecha_cambio");
+
+-- Filtro por categoría en /stock y /productos/detallado
+CREATE INDEX IF NOT EXISTS idx_productos_tipo_pieza
+    ON "productos" ("tipo_pieza_id");
+
+ANALYZE "seriales";
+ANALYZE "historial_estados";
+ANALYZE "productos";
@@ -0,0 +1,35 @@
+-- ====================================================================
+-- RESUMEN DE STOCK POR PRODUCTO (producto_stock)
+-- ====================================================================
+-- Contadores por estado que la app mantiene en cada escritura sobre
+-- seriales. Se llena aquí la primera vez; después se revisa con
+-- `python producto_stock.py verificar`.
+
+CREATE TABLE IF NOT EXISTS "producto_stock" (
+    "producto_id" INTEGER PRIMARY KEY REFERENCES "productos" ("producto_id") ON DELETE CASCADE,
+    "almacen" INTEGER NOT NULL DEFAULT 0,
+    "instalado" INTEGER NOT NULL DEFAULT 0,
+    "danado" INTEGER NOT NULL DEFAULT 0,
+    "retirado" INTEGER NOT NULL DEFAULT 0,
+    "total" INTEGER NOT NULL DEFAULT 0,
+    "ultima_entrada" TIMESTAMP,
+    "ultima_actualizacion" TIMESTAMP
+);
+
+LOCK TABLE "seriales" IN SHARE MODE;
+
+INSERT INTO "producto_stock"
+    ("producto_id", "almacen", "instalado", "danado", "retirado", "total",
+     "ultima_entrada", "ultima_actualizacion")
+SELECT
+    s."producto_id",
+    COUNT(*) FILTER (WHERE s."estado" = 'ALMACEN'),
+    COUNT(*) FILTER (WHERE s."estado" = 'INSTALADO'),
+    COUNT(*) FILTER (WHERE s."estado" = 'DAÑADO'),
+    COUNT(*) FILTER (WHERE s."estado" = 'RETIRADO'),
+    COUNT(*),
+    MAX(s."fecha_registro"),
+    MAX(s."fecha_actualizacion")
+FROM "seriales" s
+GROUP BY s."producto_id"
+ON CONFLICT ("producto_id") DO NOTHING;
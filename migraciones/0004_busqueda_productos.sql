@@ -0,0 +1,40 @@
+-- ====================================================================
+-- BÚSQUEDA DE PRODUCTOS: índices trigram + búsqueda sin acentos
+-- ====================================================================
+-- Requiere las extensiones pg_trgm y unaccent (disponibles en Supabase y
+-- Render). Si el servidor no las tiene, solo se crea el índice de prefijo
+-- de seriales y /api/inventario/buscar sigue usando ILIKE.
+
+-- Búsqueda por prefijo de número de serie (los seriales se guardan en mayúsculas)
+CREATE INDEX IF NOT EXISTS idx_seriales_codigo_prefijo
+    ON "seriales" ("codigo_unico_serial" text_pattern_ops);
+
+DO $migracion$
+BEGIN
+    IF (SELECT COUNT(*) FROM pg_available_extensions WHERE name IN ('pg_trgm', 'unaccent')) < 2 THEN
+        RAISE NOTICE 'pg_trgm / unaccent no disponibles: la búsqueda usará ILIKE';
+        RETURN;
+    END IF;
+
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE EXTENSION IF NOT EXISTS unaccent;
+
+    -- unaccent() es STABLE; este envoltorio IMMUTABLE permite usarlo en índices
+    CREATE OR REPLACE FUNCTION sin_acentos(texto text)
+    RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT unaccent('unaccent'::regdictionary, texto) $$;
+
+    -- Texto normalizado (minúsculas, sin acentos) sobre el que se busca
+    CREATE OR REPLACE FUNCTION texto_busqueda_producto(nombre text, sku text, marca text, modelo text)
+    RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(sin_acentos(concat_ws(' ', nombre, sku, marca, modelo))) $$;
+
+    -- GIN trigram: sirve para LIKE '%término%' y para el operador de similitud <%
+    CREATE INDEX IF NOT EXISTS idx_productos_busqueda_trgm
+        ON "productos" USING gin (texto_busqueda_producto("nombre", "codigo_sku", "marca", "modelo") gin_trgm_ops);
+END
+$migracion$;
+
+ANALYZE "productos";
@@ -0,0 +1,16 @@
+-- ====================================================================
+-- SERIALES: índice único sobre el código normalizado
+-- ====================================================================
+-- La app normaliza los seriales con strip().upper() antes de guardarlos y
+-- las búsquedas por código (lector de barras) usan la misma expresión, así
+-- que este índice garantiza la unicidad aunque haya filas antiguas cargadas
+-- a mano y resuelve cada lookup con un index scan.
+--
+-- Si falla por duplicados, se pueden listar con:
+--   SELECT upper(btrim(codigo_unico_serial)), array_agg(serial_id)
+--   FROM seriales GROUP BY 1 HAVING COUNT(*) > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_seriales_codigo_normalizado
+    ON "seriales" (upper(btrim("codigo_unico_serial")));
+
+ANALYZE "seriales";
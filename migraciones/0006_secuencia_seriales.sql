@@ -0,0 +1,24 @@
+-- ====================================================================
+-- SECUENCIA DE SERIALES POR PRODUCTO (agregar_lote)
+-- ====================================================================
+-- Último número asignado a los seriales generados <SKU>-<número> de cada
+-- producto. agregar_lote reserva un bloque con un UPDATE de esta fila: el
+-- bloqueo de fila serializa a los workers que generan para el mismo
+-- producto y ningún número se repite.
+
+CREATE TABLE IF NOT EXISTS "producto_secuencia_serial" (
+    "producto_id" INTEGER PRIMARY KEY REFERENCES "productos" ("producto_id") ON DELETE CASCADE,
+    "ultimo_numero" BIGINT NOT NULL DEFAULT 0
+);
+
+-- Arranca desde el mayor sufijo numérico que ya exista para cada SKU
+INSERT INTO "producto_secuencia_serial" ("producto_id", "ultimo_numero")
+SELECT
+    p."producto_id",
+    MAX(substr(s."codigo_unico_serial", length(p."codigo_sku") + 2)::bigint)
+FROM "productos" p
+JOIN "seriales" s ON s."producto_id" = p."producto_id"
+WHERE left(s."codigo_unico_serial", length(p."codigo_sku") + 1) = p."codigo_sku" || '-'
+  AND substr(s."codigo_unico_serial", length(p."codigo_sku") + 2) ~ '^[0-9]{1,18}$'
+GROUP BY p."producto_id"
+ON CONFLICT ("producto_id") DO NOTHING;
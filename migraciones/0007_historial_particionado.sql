@@ -0,0 +1,125 @@
+-- ====================================================================
+-- HISTORIAL DE ESTADOS PARTICIONADO POR MES (historial_estados)
+-- ====================================================================
+-- Registro de solo inserción de cada alta, cambio de estado y baja de un
+-- serial, particionado por rango mensual de fecha_cambio:
+--   - las consultas por fecha (o por serial, acotadas a su fecha_registro)
+--     solo recorren las particiones del rango;
+--   - los meses viejos se desacoplan con `python historial.py desacoplar`
+--     y la tabla activa se mantiene chica.
+-- Guarda producto_id y código para que la trazabilidad sobreviva al
+-- borrado del serial (sin FK a seriales). La tabla anterior, si existe,
+-- se copia completa y se elimina.
+
+-- 1. Apartar la tabla anterior (no particionada)
+DO $migracion$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class
+               WHERE oid = to_regclass('historial_estados') AND relkind = 'r') THEN
+        ALTER TABLE "historial_estados" RENAME TO "historial_estados_legado";
+        ALTER INDEX IF EXISTS "historial_estados_pkey" RENAME TO "historial_estados_legado_pkey";
+        ALTER INDEX IF EXISTS "idx_historial_serial_fecha" RENAME TO "idx_historial_legado_serial_fecha";
+    END IF;
+END
+$migracion$;
+
+-- 2. Tabla particionada + partición por defecto (nunca falla una escritura)
+CREATE SEQUENCE IF NOT EXISTS "historial_estados_id_seq" AS BIGINT;
+
+CREATE TABLE IF NOT EXISTS "historial_estados" (
+    "historial_id" BIGINT NOT NULL DEFAULT nextval('historial_estados_id_seq'),
+    "serial_id" INTEGER,
+    "producto_id" INTEGER,
+    "codigo_unico_serial" VARCHAR(200),
+    "estado_anterior" VARCHAR(20),
+    "estado_nuevo" VARCHAR(20),
+    "fecha_cambio" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "notas" TEXT,
+    PRIMARY KEY ("historial_id", "fecha_cambio")
+) PARTITION BY RANGE ("fecha_cambio");
+
+ALTER SEQUENCE "historial_estados_id_seq" OWNED BY "historial_estados"."historial_id";
+
+CREATE TABLE IF NOT EXISTS "historial_estados_default" PARTITION OF "historial_estados" DEFAULT;
+
+-- Historial de un serial; por fecha alcanza con BRIN (las filas llegan en orden)
+CREATE INDEX IF NOT EXISTS idx_historial_serial_fecha
+    ON "historial_estados" ("serial_id", "fecha_cambio");
+CREATE INDEX IF NOT EXISTS idx_historial_fecha_brin
+    ON "historial_estados" USING brin ("fecha_cambio");
+
+-- 3. Crear (o completar) la partición de un mes, en el esquema donde está
+--    historial_estados. Si la partición por defecto ya recibió filas de
+--    ese mes, se mueven antes de adjuntarla.
+CREATE OR REPLACE FUNCTION historial_asegurar_particion(mes DATE) RETURNS TEXT AS $funcion$
+DECLARE
+    padre REGCLASS := 'historial_estados'::regclass;
+    esquema TEXT := (SELECT relnamespace::regnamespace::text FROM pg_class WHERE oid = padre);
+    desde DATE := date_trunc('month', mes);
+    hasta DATE := date_trunc('month', mes) + INTERVAL '1 month';
+    nombre TEXT := 'historial_estados_' || to_char(mes, 'YYYYMM');
+BEGIN
+    IF to_regclass(format('%s.%I', esquema, nombre)) IS NOT NULL THEN
+        RETURN nombre;
+    END IF;
+    EXECUTE format('CREATE TABLE %s.%I (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', esquema, nombre, padre);
+    EXECUTE format(
+        'WITH movidas AS (DELETE FROM %s.historial_estados_default
+                          WHERE fecha_cambio >= %L AND fecha_cambio < %L RETURNING *)
+         INSERT INTO %s.%I SELECT * FROM movidas', esquema, desde, hasta, esquema, nombre);
+    EXECUTE format('ALTER TABLE %s ATTACH PARTITION %s.%I FOR VALUES FROM (%L) TO (%L)',
+                   padre, esquema, nombre, desde, hasta);
+    RETURN nombre;
+END
+$funcion$ LANGUAGE plpgsql;
+
+-- 4. Solo inserción: UPDATE/DELETE/TRUNCATE sobre la tabla padre fallan.
+--    El mantenimiento trabaja partición por partición (historial.py).
+CREATE OR REPLACE FUNCTION historial_solo_insercion() RETURNS TRIGGER AS $funcion$
+BEGIN
+    RAISE EXCEPTION 'historial_estados es de solo inserción (% rechazado)', TG_OP;
+END
+$funcion$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS historial_solo_insercion ON "historial_estados";
+CREATE TRIGGER historial_solo_insercion
+    BEFORE UPDATE OR DELETE OR TRUNCATE ON "historial_estados"
+    FOR EACH STATEMENT EXECUTE FUNCTION historial_solo_insercion();
+
+-- 5. Particiones desde el primer mes con datos hasta dos meses adelante
+DO $migracion$
+DECLARE
+    primero TIMESTAMP := CURRENT_TIMESTAMP;
+BEGIN
+    IF to_regclass('historial_estados_legado') IS NOT NULL THEN
+        EXECUTE 'SELECT LEAST($1, MIN("fecha_cambio")) FROM "historial_estados_legado"'
+            INTO primero USING primero;
+    END IF;
+    PERFORM historial_asegurar_particion(mes::date)
+    FROM generate_series(date_trunc('month', primero),
+                         date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '2 months',
+                         INTERVAL '1 month') mes;
+END
+$migracion$;
+
+-- 6. Copiar la tabla anterior y eliminarla
+DO $migracion$
+BEGIN
+    IF to_regclass('historial_estados_legado') IS NULL THEN
+        RETURN;
+    END IF;
+    INSERT INTO "historial_estados"
+        ("historial_id", "serial_id", "producto_id", "codigo_unico_serial",
+         "estado_anterior", "estado_nuevo", "fecha_cambio", "notas")
+    SELECT h."historial_id", h."serial_id", s."producto_id", s."codigo_unico_serial",
+           h."estado_anterior", h."estado_nuevo", COALESCE(h."fecha_cambio", CURRENT_TIMESTAMP), h."notas"
+    FROM "historial_estados_legado" h
+    LEFT JOIN "seriales" s ON s."serial_id" = h."serial_id"
+    ORDER BY h."fecha_cambio", h."historial_id";
+    PERFORM setval('historial_estados_id_seq', COALESCE(MAX("historial_id"), 1), MAX("historial_id") IS NOT NULL)
+    FROM "historial_estados_legado";
+    DROP TABLE "historial_estados_legado";
+END
+$migracion$;
+
+ANALYZE "historial_estados";
@@ -0,0 +1,16 @@
+-- ====================================================================
+-- VERSIÓN DEL INVENTARIO (ETag / Last-Modified)
+-- ====================================================================
+-- Una sola fila. La app la incrementa después de confirmar cada escritura
+-- sobre /api/inventario/* y la lee antes de responder un GET: si el ETag
+-- del cliente coincide responde 304 sin ejecutar la consulta del endpoint.
+-- Es compartida por todos los workers, a diferencia de un contador en memoria.
+
+CREATE TABLE IF NOT EXISTS "inventario_version" (
+    "id" SMALLINT PRIMARY KEY DEFAULT 1 CHECK ("id" = 1),
+    "version" BIGINT NOT NULL DEFAULT 1,
+    "actualizado" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO "inventario_version" ("id") VALUES (1)
+ON CONFLICT ("id") DO NOTHING;
@@ -0,0 +1,11 @@
+-- ====================================================================
+-- VERSIÓN DE LOS DATOS DE REFERENCIA (caché de tipos_pieza / productos)
+-- ====================================================================
+-- Segundo contador en la fila de inventario_version. Solo lo suben las
+-- escrituras de categorías y productos (RUTAS_REFERENCIA en app.py), no los
+-- cambios de seriales: mientras no cambie, los workers reutilizan sus
+-- resultados cacheados de /tipos_pieza y /productos. Se lee en la misma
+-- consulta que la versión del ETag.
+
+ALTER TABLE "inventario_version"
+    ADD COLUMN IF NOT EXISTS "referencia" BIGINT NOT NULL DEFAULT 1;
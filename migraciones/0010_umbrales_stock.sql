@@ -0,0 +1,51 @@
+-- ====================================================================
+-- UMBRALES DE REPOSICIÓN Y ALERTAS DE STOCK
+-- ====================================================================
+-- Cada categoría define sus umbrales (BAJO: almacén <= umbral_bajo; MEDIO:
+-- almacén <= umbral_medio) y cada producto puede reemplazarlos (NULL: hereda
+-- de su categoría). La app copia el umbral efectivo a producto_stock: el
+-- conjunto de stock bajo queda en un índice parcial que se mantiene solo con
+-- cada movimiento, y cada cruce de umbral (entrar o salir de BAJO /
+-- SIN_STOCK) se registra en alertas_stock.
+
+ALTER TABLE "tipos_pieza"
+    ADD COLUMN IF NOT EXISTS "umbral_bajo" INTEGER NOT NULL DEFAULT 3 CHECK ("umbral_bajo" >= 0),
+    ADD COLUMN IF NOT EXISTS "umbral_medio" INTEGER NOT NULL DEFAULT 10 CHECK ("umbral_medio" >= 0);
+
+ALTER TABLE "productos"
+    ADD COLUMN IF NOT EXISTS "umbral_bajo" INTEGER CHECK ("umbral_bajo" >= 0),
+    ADD COLUMN IF NOT EXISTS "umbral_medio" INTEGER CHECK ("umbral_medio" >= 0);
+
+-- Umbrales efectivos (COALESCE(producto, categoría)), denormalizados. La
+-- marca stock_bajo es una columna (y no solo la condición del índice) para
+-- que el planner tenga estadísticas de cuántos productos están en el conjunto.
+ALTER TABLE "producto_stock"
+    ADD COLUMN IF NOT EXISTS "umbral_bajo" INTEGER NOT NULL DEFAULT 3,
+    ADD COLUMN IF NOT EXISTS "umbral_medio" INTEGER NOT NULL DEFAULT 10,
+    ADD COLUMN IF NOT EXISTS "stock_bajo" BOOLEAN
+        GENERATED ALWAYS AS ("almacen" <= "umbral_bajo") STORED;
+
+-- Una fila por producto, también para los que nunca tuvieron seriales
+-- (están en stock bajo y el índice parcial debe verlos)
+INSERT INTO "producto_stock" ("producto_id")
+SELECT "producto_id" FROM "productos"
+ON CONFLICT ("producto_id") DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS "idx_producto_stock_bajo"
+    ON "producto_stock" ("almacen", "producto_id")
+    WHERE "stock_bajo";
+
+CREATE TABLE IF NOT EXISTS "alertas_stock" (
+    "alerta_id" BIGSERIAL PRIMARY KEY,
+    "producto_id" INTEGER NOT NULL REFERENCES "productos" ("producto_id") ON DELETE CASCADE,
+    "nivel_anterior" VARCHAR(10) NOT NULL,
+    "nivel_nuevo" VARCHAR(10) NOT NULL,
+    "almacen" INTEGER NOT NULL,
+    "umbral_bajo" INTEGER NOT NULL,
+    "fecha" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS "idx_alertas_stock_fecha"
+    ON "alertas_stock" ("fecha" DESC, "alerta_id" DESC);
+CREATE INDEX IF NOT EXISTS "idx_alertas_stock_producto"
+    ON "alertas_stock" ("producto_id", "fecha" DESC, "alerta_id" DESC);
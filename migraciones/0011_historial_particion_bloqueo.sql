@@ -0,0 +1,41 @@
+-- ====================================================================
+-- CREAR PARTICIÓN DEL HISTORIAL SIN CARRERA CON LA PARTICIÓN POR DEFECTO
+-- ====================================================================
+-- historial_asegurar_particion (0007) movía las filas del mes desde
+-- historial_estados_default y después adjuntaba la partición. Una escritura
+-- de ese mes que entraba a la partición por defecto entre el DELETE y el
+-- ATTACH hacía fallar el ATTACH (la fila violaba la nueva restricción de la
+-- partición por defecto). Ahora se bloquea la tabla padre (SHARE ROW
+-- EXCLUSIVE, el mismo nivel que CREATE TRIGGER) antes de mover: las
+-- escrituras esperan a que termine la transacción y se enrutan con la
+-- partición nueva ya adjuntada. Bloquear solo la partición por defecto no
+-- alcanza: la fila ya está enrutada a ella cuando espera el lock. Solo
+-- bloquea cuando de verdad hay que crear la partición (los meses se crean
+-- por adelantado). Dos llamadas para el mismo mes se serializan en el mismo
+-- lock; la segunda encuentra la partición ya creada.
+
+CREATE OR REPLACE FUNCTION historial_asegurar_particion(mes DATE) RETURNS TEXT AS $funcion$
+DECLARE
+    padre REGCLASS := 'historial_estados'::regclass;
+    esquema TEXT := (SELECT relnamespace::regnamespace::text FROM pg_class WHERE oid = padre);
+    desde DATE := date_trunc('month', mes);
+    hasta DATE := date_trunc('month', mes) + INTERVAL '1 month';
+    nombre TEXT := 'historial_estados_' || to_char(mes, 'YYYYMM');
+BEGIN
+    IF to_regclass(format('%s.%I', esquema, nombre)) IS NOT NULL THEN
+        RETURN nombre;
+    END IF;
+    EXECUTE format('LOCK TABLE %s IN SHARE ROW EXCLUSIVE MODE', padre);
+    IF to_regclass(format('%s.%I', esquema, nombre)) IS NOT NULL THEN
+        RETURN nombre;
+    END IF;
+    EXECUTE format('CREATE TABLE %s.%I (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', esquema, nombre, padre);
+    EXECUTE format(
+        'WITH movidas AS (DELETE FROM %s.historial_estados_default
+                          WHERE fecha_cambio >= %L AND fecha_cambio < %L RETURNING *)
+         INSERT INTO %s.%I SELECT * FROM movidas', esquema, desde, hasta, esquema, nombre);
+    EXECUTE format('ALTER TABLE %s ATTACH PARTITION %s.%I FOR VALUES FROM (%L) TO (%L)',
+                   padre, esquema, nombre, desde, hasta);
+    RETURN nombre;
+END
+$funcion$ LANGUAGE plpgsql;
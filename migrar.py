@@ -0,0 +1,320 @@
+"""Migraciones versionadas del esquema (carpeta migraciones/).
+
+Cada archivo NNNN_nombre.sql es una migración; se aplican en orden, cada
+una en su propia transacción, y quedan registradas en esquema_migraciones
+con su checksum. Un advisory lock evita que dos procesos migren a la vez.
+
+Uso:
+    python migrar.py estado            # aplicadas / pendientes / modificadas
+    python migrar.py aplicar           # aplica las pendientes
+    python migrar.py verificar-planes  # falla si alguna consulta de la app
+                                       # planea un Seq Scan sobre seriales
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+import app as aplicacion
+from app import get_db_connection
+
+DIRECTORIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migraciones')
+PATRON_ARCHIVO = re.compile(r'^(\d{4})_([\w-]+)\.sql$')
+CLAVE_LOCK = 7_240_001  # pg_advisory_lock compartido por todos los procesos que migran
+
+DDL_CONTROL = """
+CREATE TABLE IF NOT EXISTS "esquema_migraciones" (
+    "version" VARCHAR(4) PRIMARY KEY,
+    "nombre" VARCHAR(200) NOT NULL,
+    "checksum" VARCHAR(64) NOT NULL,
+    "aplicada_en" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "duracion_ms" INTEGER
+);
+"""
+
+
+def listar_migraciones():
+    """[(version, nombre, sql, checksum)] ordenadas por versión"""
+    migraciones = []
+    for archivo in sorted(os.listdir(DIRECTORIO)):
+        coincidencia = PATRON_ARCHIVO.match(archivo)
+        if not coincidencia:
+            continue
+        with open(os.path.join(DIRECTORIO, archivo), encoding='utf-8') as f:
+            sql = f.read()
+        checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+        migraciones.append((coincidencia.group(1), coincidencia.group(2), sql, checksum))
+
+    versiones = [m[0] for m in migraciones]
+    repetidas = sorted({v for v in versiones if versiones.count(v) > 1})
+    if repetidas:
+        raise ValueError(f"Versiones de migración repetidas: {', '.join(repetidas)}")
+    return migraciones
+
+
+def aplicadas(cur):
+    """{version: checksum} de las migraciones ya registradas"""
+    cur.execute(DDL_CONTROL)
+    cur.execute('SELECT "version", "checksum" FROM "esquema_migraciones"')
+    return dict(cur.fetchall())
+
+
+def estado(conn):
+    cur = conn.cursor()
+    registradas = aplicadas(cur)
+    conn.commit()
+
+    pendientes = 0
+    for version, nombre, _, checksum in listar_migraciones():
+        if version not in registradas:
+            marca = '⏳ pendiente'
+            pendientes += 1
+        elif registradas[version] != checksum:
+            marca = '⚠️ modificada después de aplicarse'
+        else:
+            marca = '✅ aplicada'
+        print(f"   {version} {nombre:<32s} {marca}")
+    print(f"📋 {pendientes} migraciones pendientes")
+    return pendientes == 0
+
+
+def aplicar(conn):
+    cur = conn.cursor()
+    cur.execute('SELECT pg_advisory_lock(%s)', (CLAVE_LOCK,))
+    try:
+        registradas = aplicadas(cur)
+        conn.commit()
+
+        aplicadas_ahora = 0
+        for version, nombre, sql, checksum in listar_migraciones():
+            if version in registradas:
+                if registradas[version] != checksum:
+                    print(f"⚠️ {version}_{nombre} cambió después de aplicarse (no se vuelve a ejecutar)")
+                continue
+
+            print(f"🔧 Aplicando {version}_{nombre}...")
+            del conn.notices[:]
+            inicio = time.perf_counter()
+            try:
+                cur.execute(sql)
+                duracion_ms = int((time.perf_counter() - inicio) * 1000)
+                cur.execute("""
+                    INSERT INTO "esquema_migraciones" ("version", "nombre", "checksum", "duracion_ms")
+                    VALUES (%s, %s, %s, %s);
+                """, (version, nombre, checksum, duracion_ms))
+                # Los workers en marcha descartan lo que guardaron con el esquema anterior
+                aplicacion.publicar_invalidacion(cur, 'todo')
+                conn.commit()
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"❌ {version}_{nombre} falló: {e}")
+                return False
+            for aviso in conn.notices:
+                print(f"   {aviso.strip()}")
+            del conn.notices[:]
+            print(f"   ✅ {duracion_ms} ms")
+            aplicadas_ahora += 1
+
+        print(f"✅ Esquema al día ({aplicadas_ahora} migraciones aplicadas)")
+        return True
+    finally:
+        cur.execute('SELECT pg_advisory_unlock(%s)', (CLAVE_LOCK,))
+        conn.commit()
+
+
+# ====================================================================
+# VERIFICACIÓN DE PLANES: ningún endpoint debe recorrer seriales entera
+# ====================================================================
+_cursores_registradores = {}
+
+def _cursor_registrador(base):
+    """Subclase de `base` que anota cada sentencia ejecutada en su conexión"""
+    if base not in _cursores_registradores:
+        def execute(self, query, vars=None):
+            self.connection.sentencias.append(self.mogrify(query, vars).decode('utf-8'))
+            return base.execute(self, query, vars)
+        _cursores_registradores[base] = type(f'Registrador{base.__name__}', (base,), {'execute': execute})
+    return _cursores_registradores[base]
+
+
+class ConexionRegistradora(psycopg2.extensions.connection):
+    """Conexión que guarda el SQL de todo lo que ejecutan sus cursores"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sentencias = []
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _cursor_registrador(base)
+        return super().cursor(*args, **kwargs)
+
+
+@contextmanager
+def pool_registrador(esquema):
+    """Reemplaza el pool de la app por uno de ConexionRegistradora sobre `esquema`.
+
+    Entrega la lista (viva) de conexiones abiertas, para leer sus sentencias.
+    """
+    registradoras = []
+
+    def conectar():
+        conexion = get_db_connection(connection_factory=ConexionRegistradora)
+        if conexion is None:
+            return None
+        conexion.cursor().execute(f'SET search_path TO "{esquema}", public')
+        conexion.commit()
+        del conexion.sentencias[:]
+        registradoras.append(conexion)
+        return conexion
+
+    pool_original = aplicacion._pool, aplicacion._pool_pid
+    aplicacion._pool = aplicacion.PoolConexiones(minimo=1, maximo=2, conectar=conectar)
+    aplicacion._pool_pid = os.getpid()
+    try:
+        yield registradoras
+    finally:
+        aplicacion._pool.cerrar()
+        aplicacion._pool, aplicacion._pool_pid = pool_original
+        for conexion in registradoras:
+            conexion.close()
+
+
+def _recorrer_plan(nodo):
+    yield nodo
+    for hijo in nodo.get('Plans', []):
+        yield from _recorrer_plan(hijo)
+
+
+def ejercitar_endpoints(cliente, cur):
+    """Llama a cada endpoint con datos reales del esquema sembrado"""
+    cur.execute("""
+        SELECT s."producto_id", s."serial_id", s."codigo_unico_serial", p."codigo_sku", p."tipo_pieza_id"
+        FROM "seriales" s JOIN "productos" p USING ("producto_id")
+        ORDER BY s."serial_id" LIMIT 1;
+    """)
+    producto_id, serial_id, codigo, sku, tipo_id = cur.fetchone()
+    cur.execute('SELECT "serial_id" FROM "seriales" ORDER BY "serial_id" DESC LIMIT 1')
+    serial_borrable = cur.fetchone()[0]
+
+    llamadas = [
+        ('GET', '/api/inventario/stock', None),
+        ('GET', '/api/inventario/stock?limit=50&sort=-stock&nivel_stock=BAJO', None),
+        ('GET', f'/api/inventario/stock?limit=50&categoria={tipo_id}&q=Producto', None),
+        ('GET', '/api/inventario/estadisticas?fresco=1', None),
+        ('GET', '/api/inventario/tipos_pieza', None),
+        ('GET', '/api/inventario/productos', None),
+        ('GET', f'/api/inventario/productos/{producto_id}', None),
+        ('GET', '/api/inventario/productos/detallado', None),
+        ('GET', '/api/inventario/productos/detallado?limit=50&sort=marca', None),
+        ('GET', f'/api/inventario/seriales/{producto_id}', None),
+        ('GET', '/api/inventario/stock_bajo', None),
+        ('GET', f'/api/inventario/buscar?q={sku}', None),
+        ('GET', f'/api/inventario/buscar?q={codigo[:6]}', None),
+        ('GET', f'/api/inventario/serial/lookup?code={codigo}', None),
+        ('POST', '/api/inventario/serial/lookup', {'codes': [codigo, 'NO-EXISTE']}),
+        ('GET', f'/api/inventario/serial/{serial_id}/historial', None),
+        ('GET', f'/api/inventario/historial?producto_id={producto_id}&limit=50', None),
+        ('GET', '/api/inventario/historial?estado=DAÑADO&limit=50', None),
+        ('GET', '/api/inventario/alertas?limit=50', None),
+        ('GET', f'/api/inventario/alertas?producto_id={producto_id}&activas=1', None),
+        ('PUT', f'/api/inventario/tipos_pieza/{tipo_id}/umbrales', {'umbral_bajo': 5, 'umbral_medio': 12}),
+        ('POST', '/api/inventario/serial', {'producto_id': producto_id, 'codigo_unico_serial': 'VERIF-PLAN-1'}),
+        ('POST', '/api/inventario/seriales/lote', {'producto_id': producto_id, 'seriales': ['VERIF-PLAN-2', 'VERIF-PLAN-3']}),
+        ('POST', '/api/inventario/agregar_lote', {'producto_id': producto_id, 'cantidad': 5}),
+        ('PUT', f'/api/inventario/serial/{serial_id}', {'estado': 'INSTALADO'}),
+        ('POST', '/api/inventario/seriales/estado', {'seriales': [serial_id, codigo], 'estado': 'DAÑADO'}),
+        ('DELETE', f'/api/inventario/serial/{serial_borrable}', None),
+    ]
+    for metodo, ruta, cuerpo in llamadas:
+        respuesta = cliente.open(ruta, method=metodo, json=cuerpo)
+        if respuesta.status_code >= 400:
+            print(f"   ⚠️ {metodo} {ruta} respondió {respuesta.status_code}: {respuesta.get_data(as_text=True)[:200]}")
+
+
+def verificar_planes(conn, esquema, productos, seriales, mantener=False):
+    """Siembra un esquema aislado, ejercita los endpoints y revisa sus planes"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+    import datos_sinteticos
+
+    cur = conn.cursor()
+    try:
+        print(f"🌱 Sembrando {productos:,} productos / {seriales:,} seriales en '{esquema}'...")
+        datos_sinteticos.crear_esquema(cur, esquema)
+        datos_sinteticos.sembrar(cur, productos, seriales)
+        conn.commit()
+
+        # La app usa un pool propio cuyas conexiones apuntan al esquema sembrado
+        with pool_registrador(esquema) as registradoras:
+            cliente = aplicacion.app.test_client()
+            with cliente.session_transaction() as sesion:
+                sesion['user_id'] = 1
+                sesion['role'] = 'admin'
+            ejercitar_endpoints(cliente, cur)
+            sentencias = [sql for conexion in registradoras for sql in conexion.sentencias]
+
+        revisadas, problemas, vistas = 0, [], set()
+        for sql in sentencias:
+            normalizada = ' '.join(sql.split())
+            if normalizada in vistas or not re.match(r'^(SELECT|WITH|INSERT|UPDATE|DELETE)\b', normalizada, re.I):
+                continue
+            vistas.add(normalizada)
+            try:
+                cur.execute('EXPLAIN (FORMAT JSON) ' + sql)
+                plan = cur.fetchone()[0][0]['Plan']
+            except psycopg2.Error as e:
+                conn.rollback()
+                cur.execute(f'SET search_path TO "{esquema}", public')
+                print(f"   ⚠️ No se pudo explicar: {normalizada[:100]}... ({e.pgerror or e})")
+                continue
+            revisadas += 1
+            if any(n['Node Type'] == 'Seq Scan' and n.get('Relation Name') == 'seriales' for n in _recorrer_plan(plan)):
+                problemas.append(normalizada)
+
+        print(f"🔎 {revisadas} consultas revisadas")
+        for sql in problemas:
+            print(f"❌ Seq Scan sobre seriales: {sql[:300]}")
+        if not problemas:
+            print("✅ Ninguna consulta recorre seriales completa")
+        return not problemas
+    finally:
+        conn.rollback()
+        if not mantener:
+            datos_sinteticos.eliminar_esquema(cur, esquema)
+            conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('comando', choices=['estado', 'aplicar', 'verificar-planes'])
+    parser.add_argument('--esquema', default='verificacion_planes', help='esquema temporal de verificar-planes')
+    parser.add_argument('--productos', type=int, default=5000)
+    parser.add_argument('--seriales', type=int, default=500000)
+    parser.add_argument('--mantener', action='store_true', help='no borrar el esquema de verificación')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+
+    try:
+        if args.comando == 'estado':
+            ok = estado(conn)
+        elif args.comando == 'aplicar':
+            ok = aplicar(conn)
+        else:
+            ok = verificar_planes(conn, args.esquema, args.productos, args.seriales, args.mantener)
+    finally:
+        conn.close()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
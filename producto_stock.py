@@ -0,0 +1,151 @@
+"""Mantenimiento del resumen de stock por producto (tabla producto_stock).
+
+La app actualiza producto_stock en cada escritura sobre seriales. La tabla
+la crea la migración 0003_producto_stock (python migrar.py aplicar); este
+script la reconstruye desde cero a partir de seriales y verifica que los
+contadores coincidan con la realidad. Desde la migración 0010 también guarda
+el umbral efectivo de cada producto (una fila por producto, tenga o no
+seriales), que se verifica contra productos y tipos_pieza.
+
+Uso:
+    python producto_stock.py reconstruir  # recalcula todo desde seriales
+    python producto_stock.py verificar    # compara contra seriales (exit 1 si difiere)
+"""
+import argparse
+import sys
+
+from app import get_db_connection, notificar_evento
+
+# Conteo real desde seriales, con la misma forma que producto_stock
+CONTEO_REAL = """
+SELECT
+    s."producto_id",
+    COUNT(*) FILTER (WHERE s."estado" = 'ALMACEN') AS almacen,
+    COUNT(*) FILTER (WHERE s."estado" = 'INSTALADO') AS instalado,
+    COUNT(*) FILTER (WHERE s."estado" = 'DAÑADO') AS danado,
+    COUNT(*) FILTER (WHERE s."estado" = 'RETIRADO') AS retirado,
+    COUNT(*) AS total,
+    MAX(s."fecha_registro") AS ultima_entrada,
+    MAX(s."fecha_actualizacion") AS ultima_actualizacion
+FROM "seriales" s
+GROUP BY s."producto_id"
+"""
+
+
+UMBRALES_EFECTIVOS = 'COALESCE(p."umbral_bajo", tp."umbral_bajo"), COALESCE(p."umbral_medio", tp."umbral_medio")'
+
+
+def existe_tabla(cur):
+    cur.execute("SELECT to_regclass('producto_stock')")
+    if cur.fetchone()[0] is None:
+        print("❌ La tabla producto_stock no existe")
+        print("💡 Ejecuta: python migrar.py aplicar")
+        return False
+    return True
+
+
+def reconstruir(cur):
+    if not existe_tabla(cur):
+        return False
+    # Bloquea escrituras sobre seriales mientras se recalcula
+    cur.execute('LOCK TABLE "seriales" IN SHARE MODE')
+    cur.execute('DELETE FROM "producto_stock"')
+    cur.execute(f"""
+        INSERT INTO "producto_stock"
+            ("producto_id", "almacen", "instalado", "danado", "retirado", "total",
+             "ultima_entrada", "ultima_actualizacion", "umbral_bajo", "umbral_medio")
+        SELECT
+            p."producto_id",
+            COALESCE(real.almacen, 0), COALESCE(real.instalado, 0), COALESCE(real.danado, 0),
+            COALESCE(real.retirado, 0), COALESCE(real.total, 0),
+            real.ultima_entrada, real.ultima_actualizacion,
+            {UMBRALES_EFECTIVOS}
+        FROM "productos" p
+        JOIN "tipos_pieza" tp ON tp."tipo_id" = p."tipo_pieza_id"
+        LEFT JOIN ({CONTEO_REAL}) real ON real."producto_id" = p."producto_id";
+    """)
+    print(f"✅ producto_stock reconstruida: {cur.rowcount} productos")
+    # Los dashboards conectados a /api/inventario/eventos recargan al confirmar
+    notificar_evento(cur, 'recargar', {})
+    return True
+
+
+def verificar(cur):
+    if not existe_tabla(cur):
+        return False
+
+    cur.execute(f"""
+        SELECT
+            COALESCE(real."producto_id", ps."producto_id") AS producto_id,
+            real.almacen AS real_almacen, ps."almacen" AS resumen_almacen,
+            real.instalado AS real_instalado, ps."instalado" AS resumen_instalado,
+            real.danado AS real_danado, ps."danado" AS resumen_danado,
+            real.retirado AS real_retirado, ps."retirado" AS resumen_retirado,
+            real.total AS real_total, ps."total" AS resumen_total
+        FROM ({CONTEO_REAL}) real
+        FULL OUTER JOIN "producto_stock" ps ON ps."producto_id" = real."producto_id"
+        WHERE COALESCE(real.almacen, 0) <> COALESCE(ps."almacen", 0)
+           OR COALESCE(real.instalado, 0) <> COALESCE(ps."instalado", 0)
+           OR COALESCE(real.danado, 0) <> COALESCE(ps."danado", 0)
+           OR COALESCE(real.retirado, 0) <> COALESCE(ps."retirado", 0)
+           OR COALESCE(real.total, 0) <> COALESCE(ps."total", 0)
+        ORDER BY 1;
+    """)
+    diferencias = cur.fetchall()
+
+    # Fila faltante o umbral efectivo desactualizado: el índice de stock bajo no lo vería
+    cur.execute(f"""
+        SELECT p."producto_id"
+        FROM "productos" p
+        JOIN "tipos_pieza" tp ON tp."tipo_id" = p."tipo_pieza_id"
+        LEFT JOIN "producto_stock" ps ON ps."producto_id" = p."producto_id"
+        WHERE (ps."umbral_bajo", ps."umbral_medio") IS DISTINCT FROM ({UMBRALES_EFECTIVOS})
+        ORDER BY 1;
+    """)
+    umbrales = [fila[0] for fila in cur.fetchall()]
+    if umbrales:
+        print(f"❌ {len(umbrales)} productos sin fila o con umbrales desactualizados: "
+              f"{', '.join(map(str, umbrales[:20]))}{'...' if len(umbrales) > 20 else ''}")
+
+    if not diferencias and not umbrales:
+        print("✅ producto_stock coincide con seriales")
+        return True
+    if not diferencias:
+        print("💡 Ejecuta: python producto_stock.py reconstruir")
+        return False
+
+    print(f"❌ {len(diferencias)} productos con contadores distintos:")
+    for fila in diferencias[:50]:
+        producto_id = fila[0]
+        pares = zip(('almacen', 'instalado', 'danado', 'retirado', 'total'), fila[1::2], fila[2::2])
+        detalle = ", ".join(f"{nombre} {real or 0}≠{resumen or 0}" for nombre, real, resumen in pares
+                            if (real or 0) != (resumen or 0))
+        print(f"   producto {producto_id}: {detalle}")
+    print("💡 Ejecuta: python producto_stock.py reconstruir")
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('comando', choices=['reconstruir', 'verificar'])
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ No se pudo conectar a la base de datos")
+
+    try:
+        cur = conn.cursor()
+        if args.comando == 'reconstruir':
+            ok = reconstruir(cur)
+        else:
+            ok = verificar(cur)
+        conn.commit()
+    finally:
+        conn.close()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -89,7 +89,16 @@ let currentUser = null;
 let ALL_PRODUCT_MODELS = [];
 let productTypesCache = null;
 let inventoryCache = null;
+// Paginación del inventario: solo se guarda el cursor, no el catálogo completo
+const INVENTARIO_PAGE_SIZE = 50;
+let inventoryPage = { filtro: "", siguiente: null, total: 0, cargados: 0 };
 let sessionCheckerInterval = null;
+// Productos visibles en la tabla (producto_id -> fila de la API) para
+// parchearlos en su lugar cuando llega un evento de stock
+const productosEnTabla = new Map();
+let eventosInventario = null;
+let reintentoEventos = null;
+let recargaEstadisticas = null;
 let currentProductId = null;
 let currentSerialId = null;
 let selectedSerials = new Set();
@@ -315,6 +324,7 @@ async function secureLogin(username, password) {
             }, 600);
             
             startSessionChecker();
+            iniciarEventosInventario();
             console.log("✅ Login exitoso");
         } else {
             console.error(`❌ Error login: ${result.error}`);
@@ -369,6 +379,7 @@ async function secureLogout() {
         ALL_PRODUCT_MODELS = [];
         productTypesCache = null;
         inventoryCache = null;
+        respuestasCondicionales.clear();
         selectedSerials.clear();
         
         showLoginWithAnimation();
@@ -381,6 +392,7 @@ async function secureLogout() {
         }, 600);
         
         stopSessionChecker();
+        detenerEventosInventario();
         console.log("✅ Logout completado");
     }
 }
@@ -402,9 +414,125 @@ function stopSessionChecker() {
     }
 }
 
+// ====================================================================
+// EVENTOS DE STOCK EN TIEMPO REAL (SSE)
+// ====================================================================
+// El servidor empuja los contadores nuevos de cada producto modificado por
+// cualquier usuario; la fila se actualiza en su lugar, sin recargar la tabla.
+// Si la conexión se cortó pudieron perderse eventos: al reconectar se recarga.
+function iniciarEventosInventario() {
+    if (eventosInventario || typeof EventSource === 'undefined') return;
+
+    let conectadoAntes = false;
+    eventosInventario = new EventSource(`${INVENTARIO_URL}/eventos`, { withCredentials: true });
+
+    eventosInventario.onopen = () => {
+        if (conectadoAntes && currentUser) loadProductosDetallados(inventoryPage.filtro);
+        conectadoAntes = true;
+    };
+    eventosInventario.addEventListener('stock', (evento) => {
+        aplicarEventoStock(JSON.parse(evento.data).productos || []);
+    });
+    eventosInventario.addEventListener('producto_eliminado', (evento) => {
+        quitarFilaProducto(JSON.parse(evento.data).producto_id);
+    });
+    eventosInventario.addEventListener('recargar', () => {
+        if (currentUser) loadProductosDetallados(inventoryPage.filtro);
+    });
+    eventosInventario.onerror = () => {
+        // Tras un corte EventSource reintenta solo; si el servidor respondió
+        // un error (401, 503) la cierra y se reintenta más tarde
+        if (eventosInventario && eventosInventario.readyState === EventSource.CLOSED) {
+            detenerEventosInventario();
+            if (currentUser) reintentoEventos = setTimeout(iniciarEventosInventario, 5000 + Math.random() * 25000);
+        }
+    };
+}
+
+function detenerEventosInventario() {
+    if (reintentoEventos) {
+        clearTimeout(reintentoEventos);
+        reintentoEventos = null;
+    }
+    if (eventosInventario) {
+        eventosInventario.close();
+        eventosInventario = null;
+    }
+}
+
+function aplicarEventoStock(cambios) {
+    if (!inventoryTableBody) return;
+
+    let visibles = 0;
+    cambios.forEach(cambio => {
+        const producto = productosEnTabla.get(cambio.producto_id);
+        const row = inventoryTableBody.querySelector(`tr[data-producto-id="${cambio.producto_id}"]`);
+        if (!producto || !row) return;
+
+        Object.assign(producto, cambio);
+        row.innerHTML = htmlFilaProducto(producto);
+        visibles++;
+
+        if (typeof anime !== 'undefined') {
+            anime({
+                targets: row,
+                backgroundColor: ['rgba(0, 200, 255, 0.25)', 'rgba(0, 0, 0, 0)'],
+                duration: 1200,
+                easing: 'easeOutQuad'
+            });
+        }
+    });
+
+    // Los totales del tablero cambian aunque el producto no esté en pantalla
+    programarRecargaEstadisticas();
+    if (visibles) console.log(`📡 ${visibles} productos actualizados en vivo`);
+}
+
+function quitarFilaProducto(productoId) {
+    productosEnTabla.delete(productoId);
+    const row = inventoryTableBody?.querySelector(`tr[data-producto-id="${productoId}"]`);
+    if (row) {
+        row.remove();
+        inventoryPage.cargados = Math.max(0, inventoryPage.cargados - 1);
+        inventoryPage.total = Math.max(0, inventoryPage.total - 1);
+    }
+    programarRecargaEstadisticas();
+}
+
+// Una ráfaga de eventos (p. ej. un lote de 10,000 seriales) pide las
+// estadísticas una sola vez
+function programarRecargaEstadisticas() {
+    if (recargaEstadisticas) return;
+    recargaEstadisticas = setTimeout(async () => {
+        recargaEstadisticas = null;
+        try {
+            const response = await secureFetch(`${INVENTARIO_URL}/estadisticas`);
+            if (!response.ok) return;
+            const stats = await response.json();
+            updateStatistics(stats.total_modelos || 0, stats.modelos_stock_bajo || 0, stats.total_seriales || 0);
+        } catch (error) {
+            console.error("❌ Error al actualizar estadísticas:", error);
+        }
+    }, 1000);
+}
+
+// Respuestas GET con ETag: se reenvían como If-None-Match y, si el servidor
+// responde 304 (el inventario no cambió), se devuelve la copia guardada
+const respuestasCondicionales = new Map();
+const MAX_RESPUESTAS_CONDICIONALES = 50;
+
 async function secureFetch(url, options = {}) {
+    const metodo = (options.method || 'GET').toUpperCase();
+    const headers = new Headers(options.headers || {});
+    const guardada = metodo === 'GET' ? respuestasCondicionales.get(url) : null;
+    if (guardada) {
+        headers.set('If-None-Match', guardada.etag);
+        if (guardada.lastModified) headers.set('If-Modified-Since', guardada.lastModified);
+    }
+    
     const config = {
         ...options,
+        headers,
         credentials: 'include'
     };
     
@@ -417,6 +545,25 @@ async function secureFetch(url, options = {}) {
         throw new Error("Sesión expirada");
     }
     
+    if (response.status === 304 && guardada) {
+        console.log(`♻️ Sin cambios: ${url}`);
+        return new Response(guardada.cuerpo, { status: 200, headers: guardada.headers });
+    }
+    
+    const etag = response.headers.get('ETag');
+    if (metodo === 'GET' && response.ok && etag) {
+        respuestasCondicionales.delete(url);
+        if (respuestasCondicionales.size >= MAX_RESPUESTAS_CONDICIONALES) {
+            respuestasCondicionales.delete(respuestasCondicionales.keys().next().value);
+        }
+        respuestasCondicionales.set(url, {
+            etag,
+            lastModified: response.headers.get('Last-Modified'),
+            cuerpo: await response.clone().text(),
+            headers: { 'Content-Type': response.headers.get('Content-Type') || 'application/json' }
+        });
+    }
+    
     return response;
 }
 
@@ -470,28 +617,26 @@ async function loadProductosDetallados(filter = "") {
             `;
         }
 
-        const [productosResponse, statsResponse] = await Promise.all([
-            secureFetch(`${INVENTARIO_URL}/productos/detallado`),
+        inventoryPage = { filtro: filter, siguiente: null, total: 0, cargados: 0 };
+        productosEnTabla.clear();
+
+        const [pagina, statsResponse] = await Promise.all([
+            fetchPaginaProductos(filter, null),
             secureFetch(`${INVENTARIO_URL}/estadisticas`)
         ]);
 
-        if (!productosResponse.ok) {
-            throw new Error(`Error HTTP: ${productosResponse.status}`);
-        }
-
-        let productos = await productosResponse.json();
-        inventoryCache = productos;
-        renderProductosTabla(productos, filter);
+        if (inventoryTableBody) inventoryTableBody.innerHTML = "";
+        renderProductosTabla(pagina);
 
         if (statsResponse.ok) {
             const stats = await statsResponse.json();
             updateStatistics(
-                stats.total_modelos || productos.length,
+                stats.total_modelos || pagina.total,
                 stats.modelos_stock_bajo || 0,
                 stats.total_seriales || 0
             );
         } else {
-            updateStatisticsFromData(productos);
+            updateStatisticsFromData(pagina.items);
         }
 
     } catch (error) {
@@ -504,38 +649,64 @@ async function loadProductosDetallados(filter = "") {
     }
 }
 
+async function fetchPaginaProductos(filter, after) {
+    const params = new URLSearchParams({ limit: INVENTARIO_PAGE_SIZE });
+    if (filter) params.set("q", filter);
+    if (after) params.set("after", after);
+
+    const response = await secureFetch(`${INVENTARIO_URL}/productos/detallado?${params}`);
+    if (!response.ok) {
+        throw new Error(`Error HTTP: ${response.status}`);
+    }
+    return response.json();
+}
+
+async function cargarMasProductos() {
+    if (!inventoryPage.siguiente) return;
+
+    const boton = document.getElementById("loadMoreProductos");
+    if (boton) {
+        boton.disabled = true;
+        boton.innerHTML = `<div class="loading"></div> Cargando...`;
+    }
+
+    try {
+        const pagina = await fetchPaginaProductos(inventoryPage.filtro, inventoryPage.siguiente);
+        renderProductosTabla(pagina);
+    } catch (error) {
+        console.error("❌ Error al cargar más productos:", error);
+        if (boton) {
+            boton.disabled = false;
+            boton.innerHTML = `<i class="fas fa-redo"></i> Reintentar`;
+        }
+    }
+}
+
 function updateStatisticsFromData(productos) {
     let totalSeriales = 0;
     let lowStockCount = 0;
 
     productos.forEach(producto => {
         totalSeriales += producto.total || 0;
-        if ((producto.almacen || 0) <= 3) lowStockCount++;
+        if ((producto.almacen || 0) <= (producto.umbral_bajo ?? 3)) lowStockCount++;
     });
 
     updateStatistics(productos.length, lowStockCount, totalSeriales);
 }
 
-function renderProductosTabla(productos, filter = "") {
+// Agrega una página (ya filtrada por el servidor) al final de la tabla
+function renderProductosTabla(pagina) {
     if (!inventoryTableBody) return;
-    
-    if (filter) {
-        const lowerFilter = filter.toLowerCase();
-        productos = productos.filter(p =>
-            (p.marca && p.marca.toLowerCase().includes(lowerFilter)) ||
-            (p.modelo && p.modelo.toLowerCase().includes(lowerFilter)) ||
-            (p.nombre && p.nombre.toLowerCase().includes(lowerFilter)) ||
-            (p.codigo_sku && p.codigo_sku.toLowerCase().includes(lowerFilter)) ||
-            (p.categoria && p.categoria.toLowerCase().includes(lowerFilter))
-        );
-    }
-
-    inventoryTableBody.innerHTML = "";
-    let totalProductos = 0;
-    let totalSeriales = 0;
-    let lowStockCount = 0;
 
-    if (productos.length === 0) {
+    const productos = pagina.items || [];
+    const filaCargarMas = document.getElementById("loadMoreRow");
+    if (filaCargarMas) filaCargarMas.remove();
+
+    inventoryPage.siguiente = pagina.siguiente;
+    inventoryPage.total = pagina.total;
+    inventoryPage.cargados += productos.length;
+
+    if (inventoryPage.cargados === 0) {
         inventoryTableBody.innerHTML = `
             <tr>
                 <td colspan="6" style="text-align: center; padding: 40px;">
@@ -544,107 +715,14 @@ function renderProductosTabla(productos, filter = "") {
                 </td>
             </tr>
         `;
-        updateStatistics(0, 0, 0);
         return;
     }
 
     productos.forEach((producto, index) => {
         const row = document.createElement("tr");
-        const almacen = producto.almacen || 0;
-        const total = producto.total || 0;
-        
-        // Determinar nivel de stock
-        let stockClass = "stock-normal";
-        let stockIcon = "✓";
-        
-        if (almacen === 0) {
-            stockClass = "stock-agotado";
-            stockIcon = "✗";
-        } else if (almacen <= 3) {
-            stockClass = "stock-bajo";
-            stockIcon = "!";
-        } else if (almacen <= 10) {
-            stockClass = "stock-medio";
-            stockIcon = "~";
-        }
-        
-        totalProductos++;
-        totalSeriales += total;
-        if (almacen <= 3) lowStockCount++;
-
-        row.innerHTML = `
-            <td>
-                <strong>${producto.marca || 'Sin marca'}</strong>
-            </td>
-            <td>
-                <div class="producto-info">
-                    <div class="producto-modelo">${producto.modelo || producto.nombre}</div>
-                    ${producto.categoria ? `<div class="producto-categoria">${producto.categoria}</div>` : ''}
-                </div>
-            </td>
-            <td>
-                <div class="sku-display">
-                    <code>${producto.codigo_sku}</code>
-                </div>
-            </td>
-            <td>
-                <div class="stock-display ${stockClass}" 
-                     onclick="mostrarSerialesDetalle(${producto.producto_id}, '${(producto.modelo || producto.nombre).replace(/'/g, "\\'")}')">
-                    <span class="stock-icon">${stockIcon}</span>
-                    <span class="stock-number">${total}</span>
-                    <span class="stock-label">unidades</span>
-                    <i class="fas fa-eye stock-eye"></i>
-                </div>
-                <div class="stock-detalle">
-                    <small>${almacen} en almacén</small>
-                </div>
-            </td>
-            <td>
-                <div class="distribucion-estados">
-                    ${producto.almacen > 0 ? `
-                        <span class="estado-badge estado-almacen" title="En almacén">
-                            <i class="fas fa-warehouse"></i> ${producto.almacen}
-                        </span>
-                    ` : ''}
-                    ${producto.instalado > 0 ? `
-                        <span class="estado-badge estado-instalado" title="Instalados">
-                            <i class="fas fa-wrench"></i> ${producto.instalado}
-                        </span>
-                    ` : ''}
-                    ${producto.danado > 0 ? `
-                        <span class="estado-badge estado-danado" title="Dañados">
-                            <i class="fas fa-times-circle"></i> ${producto.danado}
-                        </span>
-                    ` : ''}
-                    ${producto.retirado > 0 ? `
-                        <span class="estado-badge estado-retirado" title="Retirados">
-                            <i class="fas fa-truck"></i> ${producto.retirado}
-                        </span>
-                    ` : ''}
-                </div>
-            </td>
-            <td>
-                <div class="acciones-rapidas">
-                    <button class="btn-accion btn-agregar" 
-                            onclick="agregarStockMultiple(${producto.producto_id}, '${(producto.modelo || producto.nombre).replace(/'/g, "\\'")}')"
-                            title="Agregar más unidades">
-                        <i class="fas fa-plus"></i>
-                    </button>
-                    <button class="btn-accion btn-editar"
-                            onclick="editarProducto(${producto.producto_id})"
-                            title="Editar producto">
-                        <i class="fas fa-edit"></i>
-                    </button>
-                    ${currentUser?.role === 'admin' ? `
-                    <button class="btn-accion btn-eliminar"
-                            onclick="eliminarProducto(${producto.producto_id}, '${(producto.modelo || producto.nombre).replace(/'/g, "\\'")}')"
-                            title="Eliminar producto">
-                        <i class="fas fa-trash"></i>
-                    </button>
-                    ` : ''}
-                </div>
-            </td>
-        `;
+        row.dataset.productoId = producto.producto_id;
+        row.innerHTML = htmlFilaProducto(producto);
+        productosEnTabla.set(producto.producto_id, producto);
 
         inventoryTableBody.appendChild(row);
         
@@ -660,7 +738,115 @@ function renderProductosTabla(productos, filter = "") {
         }
     });
 
-    updateStatistics(totalProductos, lowStockCount, totalSeriales);
+    if (inventoryPage.siguiente) {
+        const row = document.createElement("tr");
+        row.id = "loadMoreRow";
+        row.innerHTML = `
+            <td colspan="6" style="text-align: center; padding: 20px;">
+                <button class="btn" id="loadMoreProductos" onclick="cargarMasProductos()">
+                    <i class="fas fa-chevron-down"></i> Cargar más
+                    (${inventoryPage.cargados} de ${inventoryPage.total})
+                </button>
+            </td>
+        `;
+        inventoryTableBody.appendChild(row);
+    }
+}
+
+// Celdas de una fila del inventario (también al parchearla por un evento)
+function htmlFilaProducto(producto) {
+    const almacen = producto.almacen || 0;
+    const total = producto.total || 0;
+    
+    // Determinar nivel de stock con los umbrales del producto (o de su categoría);
+    // se recalcula aquí porque los eventos `stock` solo traen los contadores
+    let stockClass = "stock-normal";
+    let stockIcon = "✓";
+    
+    if (almacen === 0) {
+        stockClass = "stock-agotado";
+        stockIcon = "✗";
+    } else if (almacen <= (producto.umbral_bajo ?? 3)) {
+        stockClass = "stock-bajo";
+        stockIcon = "!";
+    } else if (almacen <= (producto.umbral_medio ?? 10)) {
+        stockClass = "stock-medio";
+        stockIcon = "~";
+    }
+
+    return `
+        <td>
+            <strong>${producto.marca || 'Sin marca'}</strong>
+        </td>
+        <td>
+            <div class="producto-info">
+                <div class="producto-modelo">${producto.modelo || producto.nombre}</div>
+                ${producto.categoria ? `<div class="producto-categoria">${producto.categoria}</div>` : ''}
+            </div>
+        </td>
+        <td>
+            <div class="sku-display">
+                <code>${producto.codigo_sku}</code>
+            </div>
+        </td>
+        <td>
+            <div class="stock-display ${stockClass}" 
+                 onclick="mostrarSerialesDetalle(${producto.producto_id}, '${(producto.modelo || producto.nombre).replace(/'/g, "\\'")}')">
+                <span class="stock-icon">${stockIcon}</span>
+                <span class="stock-number">${total}</span>
+                <span class="stock-label">unidades</span>
+                <i class="fas fa-eye stock-eye"></i>
+            </div>
+            <div class="stock-detalle">
+                <small>${almacen} en almacén</small>
+            </div>
+        </td>
+        <td>
+            <div class="distribucion-estados">
+                ${producto.almacen > 0 ? `
+                    <span class="estado-badge estado-almacen" title="En almacén">
+                        <i class="fas fa-warehouse"></i> ${producto.almacen}
+                    </span>
+                ` : ''}
+                ${producto.instalado > 0 ? `
+                    <span class="estado-badge estado-instalado" title="Instalados">
+                        <i class="fas fa-wrench"></i> ${producto.instalado}
+                    </span>
+                ` : ''}
+                ${producto.danado > 0 ? `
+                    <span class="estado-badge estado-danado" title="Dañados">
+                        <i class="fas fa-times-circle"></i> ${producto.danado}
+                    </span>
+                ` : ''}
+                ${producto.retirado > 0 ? `
+                    <span class="estado-badge estado-retirado" title="Retirados">
+                        <i class="fas fa-truck"></i> ${producto.retirado}
+                    </span>
+                ` : ''}
+            </div>
+        </td>
+        <td>
+            <div class="acciones-rapidas">
+                <button class="btn-accion btn-agregar" 
+                        onclick="agregarStockMultiple(${producto.producto_id}, '${(producto.modelo || producto.nombre).replace(/'/g, "\\'")}')"
+                        title="Agregar más unidades">
+                    <i class="fas fa-plus"></i>
+                </button>
+                <button class="btn-accion btn-editar"
+                        onclick="editarProducto(${producto.producto_id})"
+                        title="Editar producto">
+                    <i class="fas fa-edit"></i>
+                </button>
+                ${currentUser?.role === 'admin' ? `
+                <button class="btn-accion btn-eliminar"
+                        onclick="eliminarProducto(${producto.producto_id}, '${(producto.modelo || producto.nombre).replace(/'/g, "\\'")}')"
+                        title="Eliminar producto">
+                    <i class="fas fa-trash"></i>
+                </button>
+                ` : ''}
+            </div>
+        </td>
+    `;
 }
 
 function showInventoryError() {
@@ -701,9 +887,9 @@ function agregarStockMultiple(productoId, productoNombre) {
                             <i class="fas fa-boxes"></i> Cantidad de unidades
                         </label>
                         <input type="number" id="cantidadUnidades" class="form-control" 
-                               min="1" max="100" value="1" required>
+                               min="1" max="50000" value="1" required>
                         <small style="color: var(--color-text-secondary); font-size: 12px; margin-top: 5px;">
-                            Número de unidades físicas a agregar (máx. 100)
+                            Número de unidades físicas a agregar (máx. 50,000)
                         </small>
                     </div>
                     
@@ -1949,6 +2135,7 @@ document.addEventListener("DOMContentLoaded", async () => {
             loadComponentTypes();
             animateDashboardLogo();
             startSessionChecker();
+            iniciarEventosInventario();
         } else {
             console.log("❌ No hay sesión activa, mostrando login");
             // Asegurar que solo el login esté visible